@@ -22,16 +22,21 @@ export async function POST(request: NextRequest) {
       body: JSON.stringify(body),
     })
 
-    const data = await response.json()
-
-    if (!response.ok) {
+    if (!response.ok || !response.body) {
+      const data = await response.json()
       return NextResponse.json(
         data,
         { status: response.status }
       )
     }
 
-    return NextResponse.json(data)
+    // Pass the Server-Sent Events stream through as it arrives
+    return new Response(response.body, {
+      headers: {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+      },
+    })
   } catch (error) {
     console.error('AI chat error:', error)
     return NextResponse.json(
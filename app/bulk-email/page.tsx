@@ -21,6 +21,11 @@ interface BulkContact {
 }
 
 interface SendResult {
+  job_id: number
+  status: string  // Job status: queued, sending, completed or cancelled
+  pending_count: number
+  sending_count: number
+  percent_complete: number
   success_count: number
   error_count: number
   skipped_count: number
@@ -30,6 +35,10 @@ interface SendResult {
   message: string
 }
 
+// A queued send is finished once the outbox workers have delivered (or given up on) every message
+const isSendFinished = (result: SendResult) =>
+  result.status === 'completed' || result.status === 'cancelled'
+
 interface ScheduleResult {
   scheduled: boolean
   scheduled_email_id: number
@@ -107,6 +116,29 @@ export default function BulkEmailPage() {
   const [scheduleResult, setScheduleResult] = useState<ScheduleResult | null>(null)
   const [error, setError] = useState("")
 
+  // Poll a queued send until the outbox workers have finished it
+  const sendJobId = sendResult?.job_id
+  const sendFinished = !sendResult || isSendFinished(sendResult)
+  useEffect(() => {
+    if (!sendJobId || sendFinished) return
+
+    const timer = setTimeout(async () => {
+      try {
+        const token = localStorage.getItem('auth_token')
+        const res = await fetch(`${API_BASE_URL}/api/bulk-email/jobs/${sendJobId}`, {
+          headers: { 'Authorization': `Bearer ${token}` }
+        })
+        if (!res.ok) throw new Error('Failed to fetch send progress')
+        const progress = await res.json()
+        // Ignore progress for a result the user has dismissed or replaced
+        setSendResult(current => current?.job_id === sendJobId ? progress as SendResult : current)
+      } catch (err) {
+        console.error('Failed to fetch send progress:', err)
+      }
+    }, 2000)
+    return () => clearTimeout(timer)
+  }, [sendJobId, sendFinished, sendResult])
+
   // Load contacts on mount
   useEffect(() => {
     fetchContacts()
@@ -656,17 +688,28 @@ export default function BulkEmailPage() {
         {/* Send Result Banner */}
         {sendResult && (
           <div className={`mb-6 p-4 rounded-lg border ${
-            sendResult.error_count === 0 
-              ? 'bg-green-50 border-green-200' 
-              : 'bg-yellow-50 border-yellow-200'
+            !sendFinished
+              ? 'bg-blue-50 border-blue-200'
+              : sendResult.error_count === 0 
+                ? 'bg-green-50 border-green-200' 
+                : 'bg-yellow-50 border-yellow-200'
           }`}>
             <div className="flex items-start gap-3">
-              <CheckCircle className={`w-5 h-5 mt-0.5 ${
-                sendResult.error_count === 0 ? 'text-green-600' : 'text-yellow-600'
-              }`} />
+              {!sendFinished ? (
+                <Loader2 className="w-5 h-5 mt-0.5 text-blue-600 animate-spin" />
+              ) : (
+                <CheckCircle className={`w-5 h-5 mt-0.5 ${
+                  sendResult.error_count === 0 ? 'text-green-600' : 'text-yellow-600'
+                }`} />
+              )}
               <div className="flex-1">
                 <p className="font-medium">{sendResult.message}</p>
                 <div className="flex gap-4 mt-2 text-sm">
+                  {!sendFinished && (
+                    <span className="text-blue-700">
+                      Queued: {sendResult.pending_count + sendResult.sending_count} ({sendResult.percent_complete}% done)
+                    </span>
+                  )}
                   <span className="text-green-700">Sent: {sendResult.success_count}</span>
                   {sendResult.skipped_count > 0 && (
                     <span className="text-gray-600">Skipped: {sendResult.skipped_count}</span>
@@ -1264,6 +1307,9 @@ export default function BulkEmailPage() {
                                     {email.result.message || `Sent ${email.result.success_count} emails`}
                                   </p>
                                 )}
+                                {email.status === 'cancelled' && email.result?.message && (
+                                  <p className="text-xs text-gray-600 mt-1">{email.result.message}</p>
+                                )}
                                 {email.status === 'failed' && email.result && (
                                   <p className="text-xs text-red-600 mt-1">
                                     {email.result.error || 'Failed to send'}
@@ -1287,6 +1333,14 @@ export default function BulkEmailPage() {
                                     <Trash2 className="w-4 h-4" />
                                   </button>
                                 </div>
+                              ) : email.status === 'sending' ? (
+                                <button
+                                  onClick={() => cancelScheduledEmail(email.id)}
+                                  className="ml-3 p-1.5 text-gray-400 hover:text-red-600 hover:bg-red-50 rounded transition-colors"
+                                  title="Stop sending (emails already sent are not recalled)"
+                                >
+                                  <X className="w-4 h-4" />
+                                </button>
                               ) : (
                                 <button
                                   onClick={() => deleteScheduledEmail(email.id)}
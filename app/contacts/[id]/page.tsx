@@ -206,27 +206,24 @@ export default function ContactDetailPage({ params }: { params: { id: string } }
     
     try {
       setEmailsLoading(true)
-      const threads = await emailThreadAPI.getByContact(contact.id)
+      // Thread summaries don't include messages; the latest of every thread come in one request
+      const [threads, messages] = await Promise.all([
+        emailThreadAPI.getByContact(contact.id),
+        emailThreadAPI.getContactMessages(contact.id, 100)
+      ])
       console.log(`Loaded ${threads.length} email threads for contact ${contact.id}`)
-      threads.forEach((thread, index) => {
-        console.log(`Thread ${index}: ${thread.subject}, messages: ${thread.messages?.length || 0}`)
-      })
       setEmailThreads(threads)
       
-      // Convert threads to flat email messages for the existing UI
-      const allMessages: EmailMessage[] = []
-      threads.forEach(thread => {
-        thread.messages?.forEach(msg => {
-          allMessages.push({
-            id: msg.id.toString(),
-            to: msg.direction === 'outgoing' ? contact.email : user?.email || '',
-            subject: thread.subject,
-            message: msg.content,
-            timestamp: new Date(msg.created_at),
-            fromSelf: msg.direction === 'outgoing'
-          })
-        })
-      })
+      // Convert messages to flat email messages for the existing UI
+      const subjects = new Map(threads.map(thread => [thread.id, thread.subject]))
+      const allMessages: EmailMessage[] = messages.map(msg => ({
+        id: msg.id.toString(),
+        to: msg.direction === 'outgoing' ? contact.email : user?.email || '',
+        subject: subjects.get(msg.thread_id) || '',
+        message: msg.content,
+        timestamp: new Date(msg.created_at),
+        fromSelf: msg.direction === 'outgoing'
+      }))
       
       console.log(`Converted to ${allMessages.length} messages for display`)
       
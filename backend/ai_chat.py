@@ -1,153 +1,244 @@
 """
 AI Chat Service for interactive Q&A about CRM data
+Replies are streamed from AsyncOpenAI on the shared HTTP pool, so a chat never
+blocks the event loop. Each organization may have AI_CHAT_MAX_CONCURRENT_PER_ORG
+chats in flight per worker, and a reply that takes longer than
+AI_CHAT_TIMEOUT_SECONDS is cut off.
 """
 import os
 import json
-from typing import Dict, List, Optional, Any
+import time
+import asyncio
+import threading
+import weakref
+from collections import defaultdict
+from typing import AsyncIterator, Callable, Dict, List, Optional, Any, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, desc
-from openai import OpenAI
-from models import Task, Contact, Company, Activity, User
-from crud import get_tasks, get_contacts, get_companies, get_contact, get_company
+from openai_client import get_openai_client
+from models import Task, Contact, Company, Deal, Activity, User
+from entity_matcher import entity_matchers
+from retrieval_index import fit_passages, retrieval_indexes
+from ai_response_cache import cache_key, response_cache
 
-# Configure OpenAI - try multiple environment variable names
-openai_key = (
-    os.environ.get("OPENAI_API_KEY") or 
-    os.environ.get("OPENAI_KEY") or 
-    os.environ.get("OPEN_AI_KEY") or
-    os.environ.get("OPENAI")
-)
+AI_CHAT_MAX_CONCURRENT_PER_ORG = int(os.environ.get("AI_CHAT_MAX_CONCURRENT_PER_ORG", "4"))
+AI_CHAT_TIMEOUT_SECONDS = float(os.environ.get("AI_CHAT_TIMEOUT_SECONDS", "30"))
+AI_CHAT_PASSAGES = int(os.environ.get("AI_CHAT_PASSAGES", "8"))  # Note/update/email passages retrieved per question
+AI_CHAT_PASSAGE_TOKEN_BUDGET = int(os.environ.get("AI_CHAT_PASSAGE_TOKEN_BUDGET", "800"))
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=openai_key) if openai_key else None
-
-class AIChatService:
-    def __init__(self, db: Session, user_id: int, organization_id: int):
-        self.db = db
-        self.user_id = user_id
-        self.organization_id = organization_id
-    
-    def process_chat_message(self, message: str, context: str = "general", summary_data: Optional[Dict] = None) -> str:
-        """Process a chat message and return AI response with CRM context"""
-        try:
-            if not openai_client:
-                return "Sorry, AI chat is currently unavailable. Please check with your administrator."
-            
-            # Get relevant CRM data based on the message
-            crm_context = self._get_relevant_crm_data(message)
-            
-            # Build context-aware prompt
-            prompt = self._build_chat_prompt(message, crm_context, summary_data)
-            
-            response = openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are a helpful AI assistant for a CRM system. You have access to the user's tasks, contacts, and companies data. 
+SYSTEM_PROMPT = """You are a helpful AI assistant for a CRM system. You have access to the user's tasks, contacts, companies and deals data, and to excerpts of their notes, updates and emails. 
 
                         Answer questions about:
                         - Contact information (phone numbers, emails, companies)
                         - Task details and deadlines  
                         - Company information
+                        - Deal status and values
                         - Schedule and priorities
                         - General CRM guidance
 
                         Keep responses concise and helpful. If you don't have the specific information requested, say so clearly.
                         When providing contact info, format it nicely. Always be professional but friendly."""
-                    },
-                    {"role": "user", "content": prompt}
-                ],
+
+UNAVAILABLE_MESSAGE = "Sorry, AI chat is currently unavailable. Please check with your administrator."
+
+
+class ChatLimitExceeded(Exception):
+    """The organization already has AI_CHAT_MAX_CONCURRENT_PER_ORG chats in flight"""
+
+
+class OrgConcurrencyLimiter:
+    """At most `limit` AI chats in flight per organization (per worker)"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._in_flight: Dict[int, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def acquire(self, organization_id: int) -> Callable[[], None]:
+        """Take a slot now, without queueing (raises ChatLimitExceeded); returns its release, safe to call twice"""
+        with self._lock:
+            if self._in_flight[organization_id] >= self.limit:
+                raise ChatLimitExceeded(f"Organization {organization_id} has {self.limit} AI chats in progress")
+            self._in_flight[organization_id] += 1
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            with self._lock:
+                if not released:
+                    released = True
+                    self._in_flight[organization_id] -= 1
+        return release
+
+    def in_flight(self, organization_id: int) -> int:
+        return self._in_flight.get(organization_id, 0)
+
+
+chat_limiter = OrgConcurrencyLimiter(AI_CHAT_MAX_CONCURRENT_PER_ORG)
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """One Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def chat_error_message(error: Exception) -> str:
+    """What to tell the user when a chat fails"""
+    if isinstance(error, ChatLimitExceeded):
+        return "Sorry, too many AI chats are running for your organization right now. Please try again in a moment."
+    if isinstance(error, asyncio.TimeoutError):
+        return "Sorry, the AI took too long to respond. Please try again."
+    error_msg = str(error).lower()
+    if "invalid_api_key" in error_msg or "401" in error_msg:
+        return "Sorry, the AI chat service is not properly configured. Please contact your administrator to set up a valid OpenAI API key."
+    elif "insufficient_quota" in error_msg or "429" in error_msg:
+        return "Sorry, the AI service has reached its usage limit. Please try again later."
+    elif "model" in error_msg:
+        return "Sorry, there was an issue with the AI model configuration. Please contact support."
+    else:
+        return "Sorry, I couldn't process that request. Please try again."
+
+
+class AIChatService:
+    def __init__(self, db: Session, user_id: int, organization_id: int):
+        self.db = db
+        self.user_id = user_id
+        self.organization_id = organization_id
+    
+    def build_messages(self, message: str, summary_data: Optional[Dict] = None) -> Tuple[List[Dict[str, str]], str]:
+        """The chat completion messages for a question, with the CRM rows it mentions, and their response cache key"""
+        # Get relevant CRM data based on the message
+        crm_context = self._get_relevant_crm_data(message)
+        
+        # Build context-aware prompt
+        prompt = self._build_chat_prompt(message, crm_context, summary_data)
+        
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        return messages, cache_key(message, crm_context, summary_data)
+    
+    def _store_response(self, key: str, response: str) -> None:
+        if response and response != UNAVAILABLE_MESSAGE:
+            response_cache.put(self.organization_id, key, response)
+    
+    async def stream_reply(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """
+        Yield the reply's text as OpenAI produces it. Raises
+        asyncio.TimeoutError when the whole reply takes longer than
+        AI_CHAT_TIMEOUT_SECONDS.
+        """
+        openai_client = get_openai_client()
+        if not openai_client:
+            yield UNAVAILABLE_MESSAGE
+            return
+        
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + AI_CHAT_TIMEOUT_SECONDS
+        stream = await asyncio.wait_for(
+            openai_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
                 max_tokens=300,
-                temperature=0.3
-            )
-            
-            return response.choices[0].message.content.strip()
-            
+                temperature=0.3,
+                stream=True
+            ),
+            timeout=AI_CHAT_TIMEOUT_SECONDS
+        )
+        try:
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+    
+    async def stream_events(self, messages: List[Dict[str, str]], release: Callable[[], None], key: str) -> AsyncIterator[str]:
+        """The reply as Server-Sent Events: token events, then done (or error) with the full text; frees the chat slot at the end"""
+        parts = []
+        started = time.perf_counter()
+        try:
+            async for delta in self.stream_reply(messages):
+                parts.append(delta)
+                yield sse_event("token", {"delta": delta})
+            response = "".join(parts).strip()
+            print(f"AI Chat - Streamed {len(response)} chars in {time.perf_counter() - started:.1f}s")
+            self._store_response(key, response)
+            yield sse_event("done", {"response": response})
         except Exception as e:
-            print(f"AI Chat error: {e}")
-            error_msg = str(e).lower()
-            if "invalid_api_key" in error_msg or "401" in error_msg:
-                return "Sorry, the AI chat service is not properly configured. Please contact your administrator to set up a valid OpenAI API key."
-            elif "insufficient_quota" in error_msg or "429" in error_msg:
-                return "Sorry, the AI service has reached its usage limit. Please try again later."
-            elif "model" in error_msg:
-                return "Sorry, there was an issue with the AI model configuration. Please contact support."
-            else:
-                return "Sorry, I couldn't process that request. Please try again."
+            print(f"AI Chat error: {type(e).__name__}: {e}")
+            yield sse_event("error", {"response": chat_error_message(e), "partial": "".join(parts)})
+        finally:
+            release()
     
     def _get_relevant_crm_data(self, message: str) -> Dict[str, Any]:
-        """Extract relevant CRM data based on the user's message"""
+        """Load the CRM rows the message mentions (found by the organization's entity matcher)"""
         message_lower = message.lower()
         
         # Initialize data containers
         relevant_contacts = []
         relevant_companies = []
+        relevant_deals = []
         relevant_tasks = []
+        relevant_passages = []
         
         try:
-            # Get all data for searching (increased limits for large datasets)
-            all_contacts = get_contacts(self.db, self.organization_id, limit=10000)
-            all_companies = get_companies(self.db, self.organization_id, limit=10000) 
-            all_tasks = get_tasks(self.db, self.organization_id, limit=10000)
-            
-            print(f"AI Chat - Loaded {len(all_contacts)} contacts, {len(all_companies)} companies, {len(all_tasks)} tasks")
+            started = time.perf_counter()
+            matches = entity_matchers.get(self.db, self.organization_id).match(message, limit=5)
+            match_ms = (time.perf_counter() - started) * 1000
             
-            # Look for name mentions in the message
-            for contact in all_contacts:
-                first_name = contact.first_name.lower() if contact.first_name else ""
-                last_name = contact.last_name.lower() if contact.last_name else ""
-                full_name = f"{first_name} {last_name}".strip()
-                
-                if (first_name and first_name in message_lower) or \
-                   (last_name and last_name in message_lower) or \
-                   (full_name and full_name in message_lower):
-                    relevant_contacts.append(contact)
+            relevant_contacts = self._load_in_order(Contact, matches["contact"])
+            relevant_companies = self._load_in_order(Company, matches["company"])
+            relevant_deals = self._load_in_order(Deal, matches["deal"])
             
-            # Look for company mentions - more flexible matching
-            for company in all_companies:
-                if company.name:
-                    company_name_lower = company.name.lower()
-                    # Check if any word in the message matches any word in the company name
-                    message_words = message_lower.split()
-                    company_words = company_name_lower.split()
-                    
-                    # Direct substring match
-                    if company_name_lower in message_lower:
-                        relevant_companies.append(company)
-                    # Check if all significant words in search appear in company name
-                    elif len(message_words) > 0 and all(
-                        any(word in comp_word for comp_word in company_words) 
-                        for word in message_words 
-                        if len(word) > 2  # Skip small words like "is", "at", etc.
-                    ):
-                        relevant_companies.append(company)
-                    # Special case for partial matches (e.g., "KM" matches "KM Electric")
-                    elif any(word in company_words for word in message_words if len(word) >= 2):
-                        relevant_companies.append(company)
+            print(f"AI Chat - Matched {len(relevant_contacts)} contacts, {len(relevant_companies)} companies, "
+                  f"{len(relevant_deals)} deals in {match_ms:.1f}ms for query: {message}")
             
-            print(f"AI Chat - Found {len(relevant_companies)} relevant companies for query: {message}")
+            started = time.perf_counter()
+            relevant_passages = [
+                passage for _, passage in retrieval_indexes.get(self.db, self.organization_id).search(
+                    message, limit=AI_CHAT_PASSAGES, user_id=self.user_id
+                )
+            ]
+            print(f"AI Chat - Retrieved {len(relevant_passages)} passages in {(time.perf_counter() - started) * 1000:.1f}ms")
             
             # If asking about tasks, get relevant ones
             if any(word in message_lower for word in ['task', 'todo', 'due', 'deadline', 'meeting', 'call']):
-                # Get tasks for mentioned contacts or all recent tasks
+                tasks = self.db.query(Task).filter(Task.organization_id == self.organization_id)
                 if relevant_contacts:
-                    for contact in relevant_contacts:
-                        contact_tasks = [t for t in all_tasks if t.contact_id == contact.id]
-                        relevant_tasks.extend(contact_tasks)
+                    # Tasks for mentioned contacts
+                    tasks = tasks.filter(Task.contact_id.in_([contact.id for contact in relevant_contacts]))
                 else:
-                    # Get recent/urgent tasks
-                    relevant_tasks = [t for t in all_tasks if t.status in ['pending', 'in_progress']][:10]
+                    # Recent open tasks
+                    tasks = tasks.filter(Task.status.in_(['pending', 'in_progress']))
+                relevant_tasks = tasks.order_by(desc(Task.created_at)).limit(10).all()
             
         except Exception as e:
             print(f"Error getting CRM data: {e}")
         
         return {
-            "contacts": relevant_contacts[:5],  # Limit to prevent token overflow
-            "companies": relevant_companies[:5],
-            "tasks": relevant_tasks[:10]
+            "contacts": relevant_contacts,
+            "companies": relevant_companies,
+            "deals": relevant_deals,
+            "tasks": relevant_tasks,
+            "passages": relevant_passages
         }
     
+    def _load_in_order(self, model, ids: List[int]) -> List[Any]:
+        """Rows for the matched ids in match order (ids deleted since the matcher saw them drop out)"""
+        if not ids:
+            return []
+        rows = {row.id: row for row in self.db.query(model).filter(
+            model.organization_id == self.organization_id,
+            model.id.in_(ids)
+        )}
+        return [rows[entity_id] for entity_id in ids if entity_id in rows]
+    
     def _build_chat_prompt(self, message: str, crm_data: Dict[str, Any], summary_data: Optional[Dict] = None) -> str:
         """Build a comprehensive prompt with CRM context"""
         
@@ -192,6 +283,22 @@ class AIChatService:
                 prompt_parts.append(company_info)
             prompt_parts.append("")
         
+        # Add relevant deal information
+        if crm_data.get("deals"):
+            prompt_parts.append("RELEVANT DEALS:")
+            for deal in crm_data["deals"]:
+                deal_info = f"- {deal.title}"
+                if deal.value:
+                    deal_info += f" (Value: {deal.value:,.0f} {deal.currency or 'USD'})"
+                if deal.stage:
+                    deal_info += f" (Stage: {deal.stage.name})"
+                if deal.expected_close_date:
+                    deal_info += f" (Expected close: {deal.expected_close_date.date()})"
+                if deal.probability is not None:
+                    deal_info += f" (Probability: {deal.probability}%)"
+                prompt_parts.append(deal_info)
+            prompt_parts.append("")
+        
         # Add relevant task information
         if crm_data["tasks"]:
             prompt_parts.append("RELEVANT TASKS:")
@@ -208,6 +315,13 @@ class AIChatService:
                 prompt_parts.append(task_info)
             prompt_parts.append("")
         
+        # Add the notes, updates and emails that best match the question
+        passage_lines = fit_passages(crm_data.get("passages", []), AI_CHAT_PASSAGE_TOKEN_BUDGET)
+        if passage_lines:
+            prompt_parts.append("RELEVANT NOTES, UPDATES AND EMAILS:")
+            prompt_parts.extend(passage_lines)
+            prompt_parts.append("")
+        
         # Add summary context if available
         if summary_data:
             prompt_parts.append("DAILY SUMMARY CONTEXT:")
@@ -222,7 +336,28 @@ class AIChatService:
         
         return "\n".join(prompt_parts)
 
-def process_ai_chat(db: Session, user_id: int, organization_id: int, message: str, context: str = "general", summary_data: Optional[Dict] = None) -> str:
-    """Main function to process AI chat messages"""
+async def cached_events(response: str) -> AsyncIterator[str]:
+    """A cached reply as the same Server-Sent Events a streamed one produces"""
+    yield sse_event("token", {"delta": response})
+    yield sse_event("done", {"response": response, "cached": True})
+
+def stream_ai_chat(db: Session, user_id: int, organization_id: int, message: str, context: str = "general", summary_data: Optional[Dict] = None) -> AsyncIterator[str]:
+    """
+    Server-Sent Events for a chat message. Runs the CRM lookup now, while the
+    request's database session is open, and answers from the response cache
+    when it can. Otherwise takes one of the organization's chat slots (raises
+    ChatLimitExceeded when none is free); the returned iterator only talks to
+    OpenAI and frees the slot when it finishes.
+    """
     service = AIChatService(db, user_id, organization_id)
-    return service.process_chat_message(message, context, summary_data)
\ No newline at end of file
+    messages, key = service.build_messages(message, summary_data)
+    cached = response_cache.get(organization_id, key)
+    if cached is not None:
+        print(f"AI Chat - Answered from cache for organization {organization_id}")
+        return cached_events(cached)
+    
+    release = chat_limiter.acquire(organization_id)
+    events = service.stream_events(messages, release, key)
+    # A response that is never iterated (client gone before streaming began) frees the slot when collected
+    weakref.finalize(events, release)
+    return events
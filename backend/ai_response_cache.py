@@ -0,0 +1,127 @@
+"""
+AI chat response cache for NotHubSpot CRM
+Repeated questions ("what's overdue today?") are answered from memory instead
+of a new model call. An entry is keyed by the normalized question and a
+fingerprint of the CRM context retrieved for it (entity ids and updated_at,
+passage text, daily summary stats), so the same question over different data
+is a different entry. Each organization's entries live for
+AI_CHAT_CACHE_TTL_SECONDS, at most AI_CHAT_CACHE_MAX_ENTRIES per organization
+(least recently used evicted first), and are dropped when an ORM write touches
+the organization's contacts, companies, deals, tasks or updates.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import event
+
+from entity_matcher import tokenize
+from models import Company, Contact, Deal, DealUpdate, ProjectUpdate, Task
+
+AI_CHAT_CACHE_TTL_SECONDS = int(os.environ.get("AI_CHAT_CACHE_TTL_SECONDS", "600"))
+AI_CHAT_CACHE_MAX_ENTRIES = int(os.environ.get("AI_CHAT_CACHE_MAX_ENTRIES", "200"))
+
+STAT_NAMES = ("hits", "misses", "stores", "evictions", "expirations", "invalidations")
+
+
+def normalize_question(message: str) -> str:
+    """Case, punctuation and spacing don't make a different question"""
+    return " ".join(tokenize(message))
+
+
+def _stamp(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def context_fingerprint(crm_data: Dict[str, Any], summary_data: Optional[Dict] = None) -> str:
+    """Digest of what the model would be shown: which rows (and their versions), which passages, which stats"""
+    parts = {
+        kind: [[row.id, _stamp(getattr(row, "updated_at", None))] for row in crm_data.get(kind, [])]
+        for kind in ("contacts", "companies", "deals", "tasks")
+    }
+    parts["passages"] = [[list(passage.source), passage.label, passage.text] for passage in crm_data.get("passages", [])]
+    parts["summary"] = (summary_data or {}).get("quick_stats")
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def cache_key(message: str, crm_data: Dict[str, Any], summary_data: Optional[Dict] = None) -> str:
+    return f"{normalize_question(message)}|{context_fingerprint(crm_data, summary_data)}"
+
+
+class ResponseCache:
+    """Per-organization TTL + LRU cache of AI chat responses, with hit-rate counters"""
+
+    def __init__(self, ttl_seconds: int = AI_CHAT_CACHE_TTL_SECONDS, max_entries: int = AI_CHAT_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[int, "OrderedDict[str, Tuple[float, str]]"] = defaultdict(OrderedDict)
+        self._stats: Dict[int, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(STAT_NAMES, 0))
+        self._lock = threading.Lock()
+
+    def get(self, organization_id: int, key: str) -> Optional[str]:
+        with self._lock:
+            entries = self._entries[organization_id]
+            stats = self._stats[organization_id]
+            entry = entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del entries[key]
+                stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                stats["misses"] += 1
+                return None
+            entries.move_to_end(key)
+            stats["hits"] += 1
+            return entry[1]
+
+    def put(self, organization_id: int, key: str, response: str) -> None:
+        with self._lock:
+            entries = self._entries[organization_id]
+            stats = self._stats[organization_id]
+            entries[key] = (time.monotonic() + self.ttl_seconds, response)
+            entries.move_to_end(key)
+            stats["stores"] += 1
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                stats["evictions"] += 1
+
+    def invalidate(self, organization_id: Optional[int] = None) -> None:
+        """Drop one organization's responses (all when organization_id is None)"""
+        with self._lock:
+            for org_id in ([organization_id] if organization_id is not None else list(self._entries)):
+                if self._entries.get(org_id):
+                    self._entries[org_id].clear()
+                    self._stats[org_id]["invalidations"] += 1
+
+    def stats(self, organization_id: Optional[int] = None) -> Dict[str, Any]:
+        """Counters and hit rate for one organization, or summed over all"""
+        with self._lock:
+            org_ids = [organization_id] if organization_id is not None else list(self._stats)
+            totals = dict.fromkeys(STAT_NAMES, 0)
+            for org_id in org_ids:
+                for name, value in self._stats.get(org_id, {}).items():
+                    totals[name] += value
+            lookups = totals["hits"] + totals["misses"]
+            return {
+                **totals,
+                "entries": sum(len(self._entries.get(org_id, ())) for org_id in org_ids),
+                "hit_rate": round(totals["hits"] / lookups, 3) if lookups else None,
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries_per_org": self.max_entries,
+            }
+
+
+response_cache = ResponseCache()
+
+
+def _invalidate_organization(mapper, connection, target):
+    response_cache.invalidate(target.organization_id)
+
+
+for _model in (Contact, Company, Deal, Task, DealUpdate, ProjectUpdate):
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, _invalidate_organization)
@@ -1,198 +1,241 @@
 """
 AI Service for generating daily summaries and insights
+Summaries are generated once per user per day by a scheduler job and stored in
+daily_summaries, so the dashboard serves them immediately. The data behind a
+summary is collected with SQL aggregates, one section per table. A refresh
+re-collects only the sections whose tables changed since the last run and asks
+OpenAI for new insights only when something did.
 """
 import os
 import json
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any, Tuple
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc
-from openai import OpenAI
-from models import Task, Contact, Company, Activity, User, Deal
-from crud import get_tasks, get_contacts, get_companies, get_deals
+from sqlalchemy import and_, or_, desc, case, distinct, func
+from openai_client import get_openai_client, openai_key
+from models import Task, Contact, Company, User, Deal, DailySummary
 
-# Configure OpenAI - try multiple environment variable names
-openai_key = (
-    os.environ.get("OPENAI_API_KEY") or 
-    os.environ.get("OPENAI_KEY") or 
-    os.environ.get("OPEN_AI_KEY") or
-    os.environ.get("OPENAI")
-)
+DAILY_SUMMARY_HOUR = int(os.environ.get("DAILY_SUMMARY_HOUR", "6"))  # UTC hour the scheduler pre-generates summaries
+HIGH_VALUE_DEAL_THRESHOLD = 5000
+OPEN_TASK_STATUSES = ("pending", "in_progress")
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=openai_key) if openai_key else None
+# Tables each section is computed from; a section is re-collected when any of them changed
+SECTION_SOURCES = {
+    "tasks": (Task,),
+    "contacts": (Contact, Task),
+    "companies": (Company,),
+    "deals": (Deal,),
+}
 
 class DailySummaryService:
     def __init__(self, db: Session, user_id: int, organization_id: int):
         self.db = db
         self.user_id = int(user_id) if isinstance(user_id, str) else user_id
         self.organization_id = int(organization_id) if isinstance(organization_id, str) else organization_id
+        self.now = datetime.utcnow()
     
-    def generate_daily_summary(self) -> Dict[str, Any]:
-        """Generate a comprehensive daily summary for the user"""
+    async def get_daily_summary(self, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Today's stored summary, generated on first request if the scheduler
+        has not produced it yet. With refresh, sections whose data changed
+        since the last run are re-collected first.
+        """
         try:
-            print(f"Starting daily summary generation for user_id: {self.user_id}, org_id: {self.organization_id}")
-            
-            # Get user info for personalization
-            user = self.db.query(User).filter(User.id == self.user_id).first()
-            user_name = user.first_name if user and user.first_name else "there"
-            print(f"User found: {user_name}")
-            
-            # Collect data from last 24-48 hours
-            data = self._collect_summary_data()
-            print(f"Data collected successfully")
-            
-            # Generate AI insights with user name
-            ai_summary = self._generate_ai_insights(data, user_name)
-            print(f"AI insights generated")
-            
-            # Combine with structured data (remove recommendations)
-            summary = {
-                "generated_at": datetime.now(timezone.utc).isoformat(),
-                "user_id": self.user_id,
-                "data_summary": data,
-                "ai_insights": ai_summary,
-                "quick_stats": self._generate_quick_stats(data)
-            }
-            
-            print(f"Summary quick_stats: {summary['quick_stats']}")
-            return summary
+            stored = await run_in_threadpool(self._stored_summary)
+            if stored is None or refresh:
+                stored = await self.refresh_daily_summary(stored)
+            return await run_in_threadpool(self._response, stored)
             
         except Exception as e:
             import traceback
             print(f"Error generating daily summary: {e}")
-            print(f"Error type: {type(e).__name__}")
             print(f"Full traceback: {traceback.format_exc()}")
+            await run_in_threadpool(self.db.rollback)
             return self._fallback_summary()
     
-    def _collect_summary_data(self) -> Dict[str, Any]:
-        """Collect relevant data for the summary"""
-        now = datetime.now()
-        yesterday = now - timedelta(days=1)
-        week_ago = now - timedelta(days=7)
+    def _stored_summary(self) -> Optional[DailySummary]:
+        return self.db.query(DailySummary).filter(
+            DailySummary.user_id == self.user_id,
+            DailySummary.summary_date == self.now.date()
+        ).first()
+    
+    async def refresh_daily_summary(
+        self,
+        stored: Optional[DailySummary] = None,
+        section_cache: Optional[Dict[str, Tuple[Any, Dict[str, Any]]]] = None
+    ) -> DailySummary:
+        """
+        Bring today's summary up to date and store it.
         
-        # Get tasks
-        try:
-            all_tasks = get_tasks(self.db, self.organization_id, limit=10000)
-        except Exception as e:
-            print(f"Error getting tasks in daily summary: {e}")
-            all_tasks = []
+        Only sections whose source tables changed (row count, latest
+        updated_at, or tasks falling due) are re-collected, and the AI
+        insights are regenerated only if a section changed. section_cache
+        lets the scheduler share collected sections between users of one
+        organization. The queries run in the threadpool; only the OpenAI call
+        is awaited on the event loop.
+        """
+        signatures, sections, changed, ai_insights, user_name = await run_in_threadpool(
+            self._collect_changed_sections, stored, section_cache
+        )
         
-        # Categorize tasks
-        overdue_tasks = []
-        today_tasks = []
-        for t in all_tasks:
-            if t.due_date:
-                try:
-                    # Handle both string and datetime objects
-                    if isinstance(t.due_date, str):
-                        task_date = datetime.fromisoformat(t.due_date.replace('Z', '+00:00')).replace(tzinfo=None)
-                    else:
-                        task_date = t.due_date.replace(tzinfo=None) if t.due_date.tzinfo else t.due_date
-                    
-                    if task_date < now and t.status != 'completed':
-                        overdue_tasks.append(t)
-                    if task_date.date() == now.date():
-                        today_tasks.append(t)
-                except Exception as e:
-                    print(f"Error parsing due date for task {t.id}: {t.due_date} - {e}")
-                    continue
+        if changed or not ai_insights:
+            ai_insights = await self._generate_ai_insights(sections, user_name)
+            print(f"Daily summary for user {self.user_id}: re-collected {changed or 'nothing'}, insights regenerated")
         
-        pending_tasks = [t for t in all_tasks if t.status in ['pending', 'in_progress']]
+        return await run_in_threadpool(self._store_summary, stored, signatures, sections, ai_insights)
+    
+    def _collect_changed_sections(
+        self,
+        stored: Optional[DailySummary],
+        section_cache: Optional[Dict[str, Tuple[Any, Dict[str, Any]]]]
+    ) -> Tuple[Dict[str, Any], Dict[str, Any], List[str], Optional[str], str]:
+        """Re-collect the sections whose data changed; returns (signatures, sections, changed, stored insights, user name)"""
+        signatures = self._section_signatures()
+        sections = dict(stored.sections) if stored else {}
+        changed = [name for name in SECTION_SOURCES if stored is None or stored.signatures.get(name) != signatures[name]]
         
-        # Get recent activities (if available)
-        recent_activities = []
-        try:
-            recent_activities = self.db.query(Activity).filter(
-                Activity.created_at >= yesterday
-            ).order_by(desc(Activity.created_at)).limit(20).all()
-        except:
-            pass  # Activities table might not exist yet
+        for name in changed:
+            cached = (section_cache or {}).get(name)
+            if cached is not None and cached[0] == signatures[name]:
+                sections[name] = cached[1]
+            else:
+                sections[name] = getattr(self, f"_collect_{name}")()
+                if section_cache is not None:
+                    section_cache[name] = (signatures[name], sections[name])
         
-        # Get contacts that need attention
-        try:
-            all_contacts = get_contacts(self.db, self.organization_id, limit=10000)
-        except Exception as e:
-            print(f"Error getting contacts in daily summary: {e}")
-            all_contacts = []
+        ai_insights = stored.ai_insights if stored else None
+        user_name = "there"
+        if changed or not ai_insights:
+            user = self.db.query(User).filter(User.id == self.user_id).first()
+            user_name = user.first_name if user and user.first_name else "there"
+        return signatures, sections, changed, ai_insights, user_name
+    
+    def _store_summary(
+        self,
+        stored: Optional[DailySummary],
+        signatures: Dict[str, Any],
+        sections: Dict[str, Any],
+        ai_insights: str
+    ) -> DailySummary:
+        """Write today's summary row and commit"""
+        if stored is None:
+            stored = DailySummary(
+                organization_id=self.organization_id,
+                user_id=self.user_id,
+                summary_date=self.now.date()
+            )
+            self.db.add(stored)
+        if ai_insights != stored.ai_insights or stored.generated_at is None:
+            stored.ai_insights = ai_insights
+            stored.generated_at = self.now
         
-        # Find contacts with recent activity or tasks
-        contacts_with_tasks = []
-        for contact in all_contacts:
-            contact_tasks = [t for t in all_tasks if t.contact_id == contact.id]
-            if contact_tasks:
-                contacts_with_tasks.append({
-                    "contact": contact,
-                    "tasks": contact_tasks,
-                    "overdue_tasks": [t for t in contact_tasks if t in overdue_tasks]
-                })
+        stored.sections = sections
+        stored.signatures = signatures
+        stored.quick_stats = self._generate_quick_stats(sections)
+        stored.refreshed_at = self.now
+        self.db.commit()
+        return stored
+    
+    def _section_signatures(self) -> Dict[str, Any]:
+        """What each section's data looks like now: row count and latest change of every source table"""
+        table_signatures = {}
+        for model in {model for models in SECTION_SOURCES.values() for model in models}:
+            count, last_updated = self.db.query(func.count(model.id), func.max(model.updated_at)).filter(
+                model.organization_id == self.organization_id
+            ).one()
+            table_signatures[model] = [count, last_updated.isoformat() if last_updated else None]
         
-        # Get companies data
-        all_companies = []
-        active_companies = []
-        try:
-            all_companies = get_companies(self.db, self.organization_id, limit=10000)
-            print(f"Daily summary - Total companies: {len(all_companies)}")
-            active_companies = [c for c in all_companies if c.status == 'Active']
-            print(f"Daily summary - Active companies: {len(active_companies)}")
-            # Also print some sample company statuses for debugging
-            if all_companies:
-                sample_statuses = [c.status for c in all_companies[:10]]
-                print(f"Sample company statuses: {sample_statuses}")
-        except Exception as e:
-            print(f"Error getting companies in daily summary: {e}")
-            import traceback
-            print(f"Company error traceback: {traceback.format_exc()}")
+        # Tasks become overdue or due today as time passes without any write
+        open_past_due, due_today = self.db.query(
+            func.sum(case((and_(Task.due_date < self.now, Task.status != "completed"), 1), else_=0)),
+            func.sum(case((and_(Task.due_date >= self._day_start(), Task.due_date < self._day_start() + timedelta(days=1)), 1), else_=0))
+        ).filter(Task.organization_id == self.organization_id).one()
+        time_signature = [int(open_past_due or 0), int(due_today or 0)]
         
-        # Get deals data
-        try:
-            all_deals = get_deals(self.db, self.organization_id, limit=10000)
-        except Exception as e:
-            print(f"Error getting deals in daily summary: {e}")
-            all_deals = []
+        signatures = {}
+        for name, models in SECTION_SOURCES.items():
+            signatures[name] = [table_signatures[model] for model in models]
+            if Task in models:
+                signatures[name].append(time_signature)
+        return signatures
+    
+    def _day_start(self) -> datetime:
+        return datetime.combine(self.now.date(), datetime.min.time())
+    
+    def _collect_tasks(self) -> Dict[str, Any]:
+        """Task counts in one aggregate query, plus the first few overdue and due-today tasks"""
+        day_start = self._day_start()
+        day_end = day_start + timedelta(days=1)
+        overdue = and_(Task.due_date < self.now, Task.status != "completed")
+        today = and_(Task.due_date >= day_start, Task.due_date < day_end)
         
-        # Categorize deals by stage
-        deals_by_stage = {}
-        active_deals = []
-        high_value_deals = []
+        total, overdue_count, today_count, pending_count = self.db.query(
+            func.count(Task.id),
+            func.sum(case((overdue, 1), else_=0)),
+            func.sum(case((today, 1), else_=0)),
+            func.sum(case((Task.status.in_(OPEN_TASK_STATUSES), 1), else_=0))
+        ).filter(Task.organization_id == self.organization_id).one()
         
-        for deal in all_deals:
-            # Only include active deals
-            if deal.is_active:
-                active_deals.append(deal)
-                
-                # High value deals (>= $5000)
-                if deal.value >= 5000:
-                    high_value_deals.append(deal)
+        def task_list(condition) -> List[Dict[str, Any]]:
+            tasks = self.db.query(Task.id, Task.title, Task.due_date, Task.priority).filter(
+                Task.organization_id == self.organization_id, condition
+            ).order_by(Task.due_date).limit(5)
+            return [
+                {"id": task.id, "title": task.title, "due_date": task.due_date.isoformat() if task.due_date else None, "priority": task.priority}
+                for task in tasks
+            ]
         
         return {
-            "tasks": {
-                "total": len(all_tasks),
-                "overdue": overdue_tasks,
-                "today": today_tasks,
-                "pending": pending_tasks
-            },
-            "contacts": {
-                "total": len(all_contacts),
-                "with_tasks": contacts_with_tasks
-            },
-            "companies": {
-                "total": len(all_companies),
-                "active": active_companies
-            },
-            "deals": {
-                "total": len(all_deals),
-                "active": active_deals,
-                "high_value": high_value_deals
-            },
-            "activities": recent_activities,
-            "time_range": {
-                "from": yesterday.isoformat(),
-                "to": now.isoformat()
-            }
+            "total": total,
+            "overdue_count": int(overdue_count or 0),
+            "today_count": int(today_count or 0),
+            "pending_count": int(pending_count or 0),
+            "overdue": task_list(overdue),
+            "today": task_list(today),
         }
     
-    def _generate_ai_insights(self, data: Dict[str, Any], user_name: str = "there") -> str:
+    def _collect_contacts(self) -> Dict[str, Any]:
+        """Contact total and, through one grouped join, how many contacts have (overdue) tasks"""
+        total = self.db.query(func.count(Contact.id)).filter(Contact.organization_id == self.organization_id).scalar()
+        with_tasks, with_overdue_tasks = self.db.query(
+            func.count(distinct(Task.contact_id)),
+            func.count(distinct(case((and_(Task.due_date < self.now, Task.status != "completed"), Task.contact_id))))
+        ).join(Contact, Contact.id == Task.contact_id).filter(
+            Task.organization_id == self.organization_id,
+            Contact.organization_id == self.organization_id
+        ).one()
+        return {"total": total, "with_tasks": with_tasks, "with_overdue_tasks": with_overdue_tasks}
+    
+    def _collect_companies(self) -> Dict[str, Any]:
+        total, active = self.db.query(
+            func.count(Company.id),
+            func.sum(case((Company.status == "Active", 1), else_=0))
+        ).filter(Company.organization_id == self.organization_id).one()
+        return {"total": total, "active": int(active or 0)}
+    
+    def _collect_deals(self) -> Dict[str, Any]:
+        """Deal counts in one aggregate query, plus the top active high-value deals"""
+        high_value = and_(Deal.is_active == True, Deal.value >= HIGH_VALUE_DEAL_THRESHOLD)
+        total, active, high_value_count = self.db.query(
+            func.count(Deal.id),
+            func.sum(case((Deal.is_active == True, 1), else_=0)),
+            func.sum(case((high_value, 1), else_=0))
+        ).filter(Deal.organization_id == self.organization_id).one()
+        top_deals = self.db.query(Deal.id, Deal.title, Deal.value, Deal.probability).filter(
+            Deal.organization_id == self.organization_id, high_value
+        ).order_by(desc(Deal.value)).limit(5)
+        return {
+            "total": total,
+            "active": int(active or 0),
+            "high_value": int(high_value_count or 0),
+            "high_value_top": [
+                {"id": deal.id, "title": deal.title, "value": deal.value, "probability": deal.probability}
+                for deal in top_deals
+            ],
+        }
+    
+    async def _generate_ai_insights(self, data: Dict[str, Any], user_name: str = "there") -> str:
         """Use OpenAI to generate insights from the collected data"""
         if not openai_key:
             available_vars = [k for k in os.environ.keys() if 'openai' in k.lower() or 'open_ai' in k.lower()]
@@ -202,7 +245,7 @@ class DailySummaryService:
             # Prepare data for AI
             prompt = self._build_summary_prompt(data, user_name)
             
-            response = openai_client.chat.completions.create(
+            response = await get_openai_client().chat.completions.create(
                 model="gpt-4o-mini",  # Using the efficient model
                 messages=[
                     {
@@ -230,27 +273,26 @@ class DailySummaryService:
     
     def _build_summary_prompt(self, data: Dict[str, Any], user_name: str = "there") -> str:
         """Build the prompt for OpenAI"""
-        overdue_count = len(data["tasks"]["overdue"])
-        today_count = len(data["tasks"]["today"])
-        pending_count = len(data["tasks"]["pending"])
-        active_deals = len(data["deals"]["active"])
-        high_value_deals = len(data["deals"]["high_value"])
+        overdue_count = data["tasks"]["overdue_count"]
+        today_count = data["tasks"]["today_count"]
+        pending_count = data["tasks"]["pending_count"]
+        active_deals = data["deals"]["active"]
+        high_value_deals = data["deals"]["high_value"]
         
         # Build overdue task details
         overdue_details = []
-        for task in data["tasks"]["overdue"][:5]:  # Limit to top 5
-            due_str = task.due_date if isinstance(task.due_date, str) else task.due_date.isoformat() if task.due_date else "No due date"
-            overdue_details.append(f"- {task.title} (due: {due_str}, priority: {task.priority})")
+        for task in data["tasks"]["overdue"]:
+            overdue_details.append(f"- {task['title']} (due: {task['due_date'] or 'No due date'}, priority: {task['priority']})")
         
         # Build today's task details
         today_details = []
-        for task in data["tasks"]["today"][:5]:
-            today_details.append(f"- {task.title} (priority: {task.priority})")
+        for task in data["tasks"]["today"]:
+            today_details.append(f"- {task['title']} (priority: {task['priority']})")
         
         # Build deals insights
         deal_details = []
-        for deal in data["deals"]["high_value"][:5]:  # Top 5 high value deals
-            deal_details.append(f"- {deal.title} (${deal.value:,.0f}, {deal.probability}% probability)")
+        for deal in data["deals"]["high_value_top"]:
+            deal_details.append(f"- {deal['title']} (${deal['value']:,.0f}, {deal['probability']}% probability)")
         
         prompt = f"""
         Generate a daily summary for {user_name} (sales representative) based on this CRM data:
@@ -275,7 +317,7 @@ class DailySummaryService:
         TOP HIGH-VALUE DEALS:
         {chr(10).join(deal_details) if deal_details else "No high-value deals"}
 
-        COMPANIES: {data["companies"]["total"]} total, {len(data["companies"]["active"])} active
+        COMPANIES: {data["companies"]["total"]} total, {data["companies"]["active"]} active
 
         Please generate a concise daily summary with:
         1. Personalized greeting: "Good morning {user_name}!" (or afternoon/evening based on time)
@@ -290,13 +332,25 @@ class DailySummaryService:
     def _generate_quick_stats(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Generate quick statistics for the summary card"""
         return {
-            "overdue_tasks": len(data["tasks"]["overdue"]),
-            "today_tasks": len(data["tasks"]["today"]), 
+            "overdue_tasks": data["tasks"]["overdue_count"],
+            "today_tasks": data["tasks"]["today_count"], 
             "total_contacts": data["contacts"]["total"],
-            "active_deals": len(data["deals"]["active"]),
-            "active_companies": len(data["companies"]["active"])
+            "contacts_needing_attention": data["contacts"]["with_overdue_tasks"],
+            "active_deals": data["deals"]["active"],
+            "active_companies": data["companies"]["active"]
         }
     
+    def _response(self, stored: DailySummary) -> Dict[str, Any]:
+        generated_at = stored.generated_at.replace(tzinfo=timezone.utc) if stored.generated_at.tzinfo is None else stored.generated_at
+        refreshed_at = stored.refreshed_at.replace(tzinfo=timezone.utc) if stored.refreshed_at.tzinfo is None else stored.refreshed_at
+        return {
+            "generated_at": generated_at.isoformat(),
+            "refreshed_at": refreshed_at.isoformat(),
+            "user_id": self.user_id,
+            "data_summary": stored.sections,
+            "ai_insights": stored.ai_insights,
+            "quick_stats": stored.quick_stats
+        }
     
     def _fallback_summary(self) -> Dict[str, Any]:
         """Fallback summary when AI is unavailable"""
@@ -313,7 +367,38 @@ class DailySummaryService:
             }
         }
 
-def generate_daily_summary(db: Session, user_id: int, organization_id: int) -> Dict[str, Any]:
-    """Main function to generate daily summary"""
+async def generate_daily_summary(db: Session, user_id: int, organization_id: int, refresh: bool = False) -> Dict[str, Any]:
+    """Main function to get (or generate) today's daily summary"""
     service = DailySummaryService(db, user_id, organization_id)
-    return service.generate_daily_summary()
\ No newline at end of file
+    return await service.get_daily_summary(refresh=refresh)
+
+async def generate_all_daily_summaries(session_factory: Optional[Callable[[], Session]] = None) -> Dict[str, int]:
+    """Pre-generate today's summary for every active user (scheduler job); sections are collected once per organization"""
+    if session_factory is None:
+        from database import SessionLocal
+        session_factory = SessionLocal
+    
+    db = session_factory()
+    results = {"users": 0, "generated": 0, "failed": 0}
+    try:
+        users = db.query(User.id, User.organization_id).filter(User.is_active == True).order_by(User.organization_id, User.id).all()
+        today = datetime.utcnow().date()
+        existing = {
+            summary.user_id: summary for summary in db.query(DailySummary).filter(DailySummary.summary_date == today)
+        }
+        section_cache: Dict[str, Any] = {}
+        current_org = None
+        for user_id, organization_id in users:
+            if organization_id != current_org:
+                current_org, section_cache = organization_id, {}
+            results["users"] += 1
+            try:
+                await DailySummaryService(db, user_id, organization_id).refresh_daily_summary(existing.get(user_id), section_cache)
+                results["generated"] += 1
+            except Exception as e:
+                db.rollback()
+                results["failed"] += 1
+                print(f"Daily summary failed for user {user_id}: {e}")
+        return results
+    finally:
+        db.close()
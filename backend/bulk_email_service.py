@@ -1,20 +1,33 @@
 """
 Bulk email service for NotHubSpot CRM
-Handles sending emails to multiple contacts with throttling and tracking
+Handles sending emails to multiple contacts with batching and tracking
 """
 import asyncio
 import os
 import hashlib
 import hmac
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
+import httpx
 from sqlalchemy.orm import Session
 from models import Contact, EmailTracking, User
-from email_service import send_email
+from email_service import send_email, get_sendgrid_mail_send_url
+from http_clients import get_http_client
+from template_engine import BULK_EMAIL_VARIABLES, compile_template
 
 UNSUBSCRIBE_SECRET = os.environ.get("UNSUBSCRIBE_SECRET", "nhs-unsub-2026")
 BACKEND_URL = os.environ.get("BACKEND_URL", "https://nohubspot-production.up.railway.app")
 
+# SendGrid accepts at most 1,000 personalizations and 1,000 total recipients
+# (to + cc + bcc) per /v3/mail/send request
+SENDGRID_MAX_PERSONALIZATIONS = 1000
+SENDGRID_MAX_RECIPIENTS = 1000
+
+# Batch mode packs many contacts into one API call using per-recipient substitutions.
+# Set BULK_EMAIL_BATCH_MODE=false to fall back to one API call per contact.
+BULK_EMAIL_BATCH_MODE = os.environ.get("BULK_EMAIL_BATCH_MODE", "true").lower() == "true"
+BULK_EMAIL_MAX_RETRIES = int(os.environ.get("BULK_EMAIL_MAX_RETRIES", "3"))
+
 def generate_unsubscribe_token(contact_id: int, email: str) -> str:
     """Generate a simple HMAC token for unsubscribe verification"""
     message = f"{contact_id}:{email}"
@@ -37,9 +50,15 @@ async def send_bulk_email(
     from_name: Optional[str] = None,
     text_content: Optional[str] = None,
     bcc_email: Optional[str] = None,
+    batch_mode: Optional[bool] = None,
 ) -> dict:
     """
-    Send an email to multiple contacts with throttling.
+    Send an email to multiple contacts.
+    
+    In batch mode (the default, see BULK_EMAIL_BATCH_MODE) contacts are packed into
+    SendGrid personalizations, up to 1,000 per API call, with each contact's
+    variables and unsubscribe URL passed as substitutions. Otherwise one API call
+    is made per contact.
     
     Returns a dict with success_count, error_count, and errors list.
     """
@@ -59,6 +78,44 @@ async def send_bulk_email(
         }
     
     # Filter out placeholder emails and contacts without valid emails
+    valid_contacts, skipped = partition_sendable_contacts(contacts)
+    
+    # The shared SendGrid pool keeps connections warm across the whole campaign
+    success_count, errors = await send_to_contacts(
+        db=db,
+        client=get_http_client("sendgrid"),
+        organization_id=organization_id,
+        sender_user_id=sender_user_id,
+        contacts=valid_contacts,
+        subject=subject,
+        html_content=html_content,
+        text_content=text_content,
+        from_email=from_email,
+        from_name=from_name,
+        bcc_email=bcc_email,
+        batch_mode=batch_mode,
+    )
+    
+    # Commit tracking records
+    try:
+        db.commit()
+    except Exception as e:
+        print(f"Warning: Failed to commit tracking records: {e}")
+        db.rollback()
+    
+    return {
+        "success_count": success_count,
+        "error_count": len(errors),
+        "skipped_count": len(skipped),
+        "total": len(contacts),
+        "skipped": skipped[:20],  # Limit to first 20
+        "errors": errors[:20],  # Limit to first 20
+        "message": f"Sent {success_count} of {len(valid_contacts)} emails ({len(skipped)} skipped)"
+    }
+
+
+def partition_sendable_contacts(contacts: List[Contact]) -> Tuple[List[Contact], List[dict]]:
+    """Split contacts into those that can be emailed and skip entries (with reasons) for the rest"""
     valid_contacts = []
     skipped = []
     for contact in contacts:
@@ -70,88 +127,340 @@ async def send_bulk_email(
             skipped.append({"contact": f"{contact.first_name} {contact.last_name}", "reason": "Unsubscribed"})
         else:
             valid_contacts.append(contact)
+    return valid_contacts, skipped
+
+
+async def send_to_contacts(
+    db: Session,
+    client: httpx.AsyncClient,
+    organization_id: int,
+    sender_user_id: int,
+    contacts: List[Contact],
+    subject: str,
+    html_content: str,
+    text_content: Optional[str] = None,
+    from_email: Optional[str] = None,
+    from_name: Optional[str] = None,
+    bcc_email: Optional[str] = None,
+    batch_mode: Optional[bool] = None,
+    campaign_id: Optional[int] = None,
+) -> Tuple[int, List[dict]]:
+    """
+    Deliver an email to already-filtered contacts and queue their EmailTracking rows.
     
-    success_count = 0
-    error_count = 0
-    errors = []
+    Does not commit. Returns (success_count, errors); each error includes the
+    contact_id so callers can tell exactly which recipients failed.
+    """
+    if batch_mode is None:
+        batch_mode = BULK_EMAIL_BATCH_MODE
     
     # Load default sender settings
     SENDGRID_FROM_EMAIL = os.environ.get("SENDGRID_FROM_EMAIL", "noreply@nothubspot.app")
     SENDGRID_FROM_NAME = os.environ.get("SENDGRID_FROM_NAME", "NotHubSpot")
     
-    actual_from_email = from_email or SENDGRID_FROM_EMAIL
-    actual_from_name = from_name or SENDGRID_FROM_NAME
+    send = _send_batched if batch_mode else _send_individually
+    return await send(
+        db=db,
+        client=client,
+        organization_id=organization_id,
+        sender_user_id=sender_user_id,
+        contacts=contacts,
+        subject=subject,
+        html_content=html_content,
+        text_content=text_content,
+        from_email=from_email or SENDGRID_FROM_EMAIL,
+        from_name=from_name or SENDGRID_FROM_NAME,
+        bcc_email=bcc_email,
+        campaign_id=campaign_id,
+    )
+
+
+async def _send_individually(
+    db: Session,
+    client: httpx.AsyncClient,
+    organization_id: int,
+    sender_user_id: int,
+    contacts: List[Contact],
+    subject: str,
+    html_content: str,
+    text_content: Optional[str],
+    from_email: str,
+    from_name: str,
+    bcc_email: Optional[str],
+    campaign_id: Optional[int] = None,
+) -> Tuple[int, List[dict]]:
+    """Send one SendGrid API call per contact, throttled to avoid rate limits"""
+    success_count = 0
+    errors = []
+    
+    # Parse the templates once for the whole send
+    subject_template = compile_template(subject)
+    html_template = compile_template(html_content)
+    text_template = compile_template(text_content) if text_content else None
     
-    for i, contact in enumerate(valid_contacts):
+    for i, contact in enumerate(contacts):
         try:
-            # Personalize the HTML content with contact variables
-            personalized_html = personalize_content(html_content, contact)
-            personalized_subject = personalize_content(subject, contact)
-            personalized_text = personalize_content(text_content, contact) if text_content else None
+            # Personalize the content with contact variables
+            variables = get_template_variables(contact)
+            personalized_html = html_template.render(variables)
+            personalized_subject = subject_template.render(variables)
+            personalized_text = text_template.render(variables) if text_template else None
             
             success = await send_email(
                 to_email=contact.email,
                 subject=personalized_subject,
                 html_content=personalized_html,
                 text_content=personalized_text,
-                from_email=actual_from_email,
-                from_name=actual_from_name,
+                from_email=from_email,
+                from_name=from_name,
                 bcc_emails=[bcc_email] if bcc_email else None,
+                client=client,
             )
             
             if success:
                 success_count += 1
-                
-                # Create tracking record
-                try:
-                    tracking = EmailTracking(
-                        organization_id=organization_id,
-                        message_id=f"bulk_{datetime.utcnow().timestamp()}_{contact.id}",
-                        to_email=contact.email,
-                        from_email=actual_from_email,
-                        subject=personalized_subject,
-                        contact_id=contact.id,
-                        sent_by=sender_user_id,
-                        sent_at=datetime.utcnow(),
-                    )
-                    db.add(tracking)
-                except Exception as track_err:
-                    print(f"Warning: Failed to create tracking record for {contact.email}: {track_err}")
+                _add_tracking_record(
+                    db, organization_id, sender_user_id, contact, from_email, personalized_subject,
+                    message_id=f"bulk_{datetime.utcnow().timestamp()}_{contact.id}",
+                    campaign_id=campaign_id,
+                )
             else:
-                error_count += 1
                 errors.append({
+                    "contact_id": contact.id,
                     "contact": f"{contact.first_name} {contact.last_name}",
                     "email": contact.email,
                     "reason": "SendGrid delivery failed"
                 })
             
             # Throttle: wait 100ms between sends to avoid rate limits
-            if i < len(valid_contacts) - 1:
+            if i < len(contacts) - 1:
                 await asyncio.sleep(0.1)
                 
         except Exception as e:
-            error_count += 1
             errors.append({
+                "contact_id": contact.id,
                 "contact": f"{contact.first_name} {contact.last_name}",
                 "email": contact.email,
                 "reason": str(e)
             })
     
-    # Commit tracking records
-    try:
-        db.commit()
-    except Exception as e:
-        print(f"Warning: Failed to commit tracking records: {e}")
-        db.rollback()
+    return success_count, errors
+
+
+async def _send_batched(
+    db: Session,
+    client: httpx.AsyncClient,
+    organization_id: int,
+    sender_user_id: int,
+    contacts: List[Contact],
+    subject: str,
+    html_content: str,
+    text_content: Optional[str],
+    from_email: str,
+    from_name: str,
+    bcc_email: Optional[str],
+    campaign_id: Optional[int] = None,
+) -> Tuple[int, List[dict]]:
+    """Send contacts in batches of SendGrid personalizations, one API call per batch"""
+    success_count = 0
+    errors = []
+    
+    if not contacts:
+        return success_count, errors
     
+    SENDGRID_API_KEY = os.environ.get("SENDGRID_API_KEY", "")
+    if not SENDGRID_API_KEY:
+        print("ERROR: SENDGRID_API_KEY not configured, cannot send bulk email")
+        return 0, [{
+            "contact_id": contact.id,
+            "contact": f"{contact.first_name} {contact.last_name}",
+            "email": contact.email,
+            "reason": "SendGrid not configured"
+        } for contact in contacts]
+    
+    # Only send substitutions for variables the campaign actually uses, keyed
+    # by the placeholder text exactly as written in the content
+    subject_template = compile_template(subject)
+    used_placeholders = {}
+    for template in (subject_template, compile_template(html_content), compile_template(text_content or "")):
+        used_placeholders.update(
+            (token, name) for token, name in template.placeholders.items() if name in BULK_EMAIL_VARIABLES
+        )
+    
+    # Every personalization carries the BCC copy too, which counts toward the recipient cap
+    recipients_per_contact = 2 if bcc_email else 1
+    batch_size = min(SENDGRID_MAX_PERSONALIZATIONS, SENDGRID_MAX_RECIPIENTS // recipients_per_contact)
+    
+    content = []
+    if text_content:
+        content.append({"type": "text/plain", "value": text_content})
+    content.append({"type": "text/html", "value": html_content})
+    
+    for start in range(0, len(contacts), batch_size):
+        batch = contacts[start:start + batch_size]
+        sent_at = datetime.utcnow()
+        
+        personalizations = []
+        message_ids = {}
+        variables_by_contact = {}
+        for contact in batch:
+            variables = get_template_variables(contact)
+            variables_by_contact[contact.id] = variables
+            message_ids[contact.id] = f"bulk_{sent_at.timestamp()}_{contact.id}"
+            
+            personalization = {
+                "to": [{"email": contact.email}],
+                # custom_args are echoed back on SendGrid webhook events
+                "custom_args": {
+                    "nhs_message_id": message_ids[contact.id],
+                    "contact_id": str(contact.id),
+                },
+            }
+            if bcc_email and bcc_email.lower() != contact.email.lower():
+                personalization["bcc"] = [{"email": bcc_email}]
+            if used_placeholders:
+                personalization["substitutions"] = {
+                    token: variables[name] for token, name in used_placeholders.items()
+                }
+            personalizations.append(personalization)
+        
+        data = {
+            "personalizations": personalizations,
+            "from": {"email": from_email, "name": from_name},
+            "subject": subject,
+            "content": content,
+            # SendGrid click/open tracking stays disabled (see email_service.send_email)
+            "tracking_settings": {
+                "click_tracking": {"enable": False, "enable_text": False},
+                "open_tracking": {"enable": False},
+            },
+        }
+        
+        status_code, failure_reason = await _post_sendgrid_batch(client, data, SENDGRID_API_KEY)
+        
+        if status_code in (200, 201, 202):
+            success_count += len(batch)
+            for contact in batch:
+                _add_tracking_record(
+                    db, organization_id, sender_user_id, contact, from_email,
+                    subject_template.render(variables_by_contact[contact.id]),
+                    message_id=message_ids[contact.id],
+                    campaign_id=campaign_id,
+                )
+            print(f"Bulk email batch sent: {len(batch)} recipients")
+        elif status_code == 400 and len(batch) > 1:
+            # SendGrid rejects the whole request if any one recipient is invalid;
+            # retry this batch per contact so the valid recipients still go out
+            print(f"WARNING: Bulk email batch rejected ({failure_reason}), retrying individually")
+            batch_success, batch_errors = await _send_individually(
+                db=db,
+                client=client,
+                organization_id=organization_id,
+                sender_user_id=sender_user_id,
+                contacts=batch,
+                subject=subject,
+                html_content=html_content,
+                text_content=text_content,
+                from_email=from_email,
+                from_name=from_name,
+                bcc_email=bcc_email,
+                campaign_id=campaign_id,
+            )
+            success_count += batch_success
+            errors.extend(batch_errors)
+        else:
+            errors.extend({
+                "contact_id": contact.id,
+                "contact": f"{contact.first_name} {contact.last_name}",
+                "email": contact.email,
+                "reason": failure_reason or "SendGrid delivery failed"
+            } for contact in batch)
+    
+    return success_count, errors
+
+
+async def _post_sendgrid_batch(
+    client: httpx.AsyncClient,
+    data: dict,
+    api_key: str,
+) -> Tuple[Optional[int], Optional[str]]:
+    """
+    POST a mail/send payload, retrying rate limits and server errors with backoff.
+    
+    Returns (status_code, failure_reason); status_code is None if every attempt
+    raised a network error.
+    """
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    url = get_sendgrid_mail_send_url()
+    status_code, failure_reason = None, None
+    
+    for attempt in range(BULK_EMAIL_MAX_RETRIES + 1):
+        retry_after = 2 ** attempt
+        try:
+            response = await client.post(url, json=data, headers=headers)
+            status_code = response.status_code
+            if status_code in (200, 201, 202):
+                return status_code, None
+            failure_reason = f"SendGrid error {status_code}: {response.text[:200]}"
+            if status_code != 429 and status_code < 500:
+                return status_code, failure_reason
+            if response.headers.get("Retry-After", "").isdigit():
+                retry_after = int(response.headers["Retry-After"])
+        except httpx.HTTPError as e:
+            status_code, failure_reason = None, f"{type(e).__name__}: {e}"
+        
+        if attempt < BULK_EMAIL_MAX_RETRIES:
+            print(f"WARNING: Bulk email batch attempt {attempt + 1} failed ({failure_reason}), retrying in {retry_after}s")
+            await asyncio.sleep(retry_after)
+    
+    return status_code, failure_reason
+
+
+def _add_tracking_record(
+    db: Session,
+    organization_id: int,
+    sender_user_id: int,
+    contact: Contact,
+    from_email: str,
+    subject: str,
+    message_id: str,
+    campaign_id: Optional[int] = None,
+) -> None:
+    """Queue an EmailTracking row for a delivered email (committed by the caller)"""
+    try:
+        tracking = EmailTracking(
+            organization_id=organization_id,
+            message_id=message_id,
+            to_email=contact.email,
+            from_email=from_email,
+            subject=subject,
+            contact_id=contact.id,
+            sent_by=sender_user_id,
+            campaign_id=campaign_id,
+            sent_at=datetime.utcnow(),
+        )
+        db.add(tracking)
+    except Exception as track_err:
+        print(f"Warning: Failed to create tracking record for {contact.email}: {track_err}")
+
+
+def get_template_variables(contact: Contact) -> dict:
+    """Build the template variable values for a contact, including its unsubscribe URL"""
     return {
-        "success_count": success_count,
-        "error_count": error_count,
-        "skipped_count": len(skipped),
-        "total": len(contacts),
-        "skipped": skipped[:20],  # Limit to first 20
-        "errors": errors[:20],  # Limit to first 20
-        "message": f"Sent {success_count} of {len(valid_contacts)} emails ({len(skipped)} skipped)"
+        "contact.first_name": contact.first_name or "",
+        "contact.last_name": contact.last_name or "",
+        "contact.email": contact.email or "",
+        "contact.company_name": contact.company_name or "",
+        "contact.title": contact.title or "",
+        "contact.phone": contact.phone or "",
+        "first_name": contact.first_name or "",
+        "last_name": contact.last_name or "",
+        "email": contact.email or "",
+        "company_name": contact.company_name or "",
+        "unsubscribe_url": generate_unsubscribe_url(contact),
     }
 
 
@@ -160,24 +469,4 @@ def personalize_content(content: str, contact: Contact) -> str:
     if not content:
         return content
     
-    unsubscribe_url = generate_unsubscribe_url(contact)
-    
-    replacements = {
-        "{{contact.first_name}}": contact.first_name or "",
-        "{{contact.last_name}}": contact.last_name or "",
-        "{{contact.email}}": contact.email or "",
-        "{{contact.company_name}}": contact.company_name or "",
-        "{{contact.title}}": contact.title or "",
-        "{{contact.phone}}": contact.phone or "",
-        "{{first_name}}": contact.first_name or "",
-        "{{last_name}}": contact.last_name or "",
-        "{{email}}": contact.email or "",
-        "{{company_name}}": contact.company_name or "",
-        "{{unsubscribe_url}}": unsubscribe_url,
-    }
-    
-    result = content
-    for key, value in replacements.items():
-        result = result.replace(key, value)
-    
-    return result
+    return compile_template(content).render(get_template_variables(contact))
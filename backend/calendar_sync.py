@@ -0,0 +1,130 @@
+"""
+Provider calendar sync for NotHubSpot CRM
+Google Calendar (syncToken) and Microsoft Graph (calendarView delta) events
+are written to calendar_events, keyed by (source, created_by, external_id),
+so the CRM calendar views read one local table and never call a provider per
+request. Each page of provider events becomes one bulk upsert and one delete.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import CalendarEvent, Contact, EventAttendee
+
+# First sync (and resyncs after an expired token) covers this window
+CALENDAR_SYNC_PAST_DAYS = 30
+CALENDAR_SYNC_FUTURE_DAYS = 180
+
+# Columns a provider owns; CRM-only columns (event_type, reminder_minutes) keep their local values
+SYNCED_COLUMNS = (
+    "title", "description", "start_time", "end_time", "location",
+    "is_all_day", "status", "contact_id", "company_id",
+)
+
+
+def calendar_sync_window(now: Optional[datetime] = None):
+    now = now or datetime.utcnow()
+    return now - timedelta(days=CALENDAR_SYNC_PAST_DAYS), now + timedelta(days=CALENDAR_SYNC_FUTURE_DAYS)
+
+
+def event_row(
+    organization_id: int,
+    user_id: int,
+    source: str,
+    external_id: str,
+    title: Optional[str],
+    start_time: datetime,
+    end_time: datetime,
+    description: Optional[str] = None,
+    location: Optional[str] = None,
+    is_all_day: bool = False,
+    attendee_emails: Iterable[str] = (),
+) -> Dict[str, Any]:
+    """A calendar_events row for a provider event (attendee emails are resolved to a contact on upsert)"""
+    return {
+        "organization_id": organization_id,
+        "created_by": user_id,
+        "source": source,
+        "external_id": external_id,
+        "title": (title or "(No title)")[:255],
+        "description": description,
+        "start_time": start_time,
+        "end_time": end_time or start_time,
+        "location": (location or None) and location[:255],
+        "is_all_day": is_all_day,
+        "status": "scheduled",
+        "event_type": "meeting",
+        "attendee_emails": [email.strip().lower() for email in attendee_emails if email and "@" in email],
+    }
+
+
+def _link_contacts(db: Session, organization_id: int, rows: List[Dict[str, Any]]) -> None:
+    """Point each event at the first attendee who is a CRM contact (one query per page)"""
+    emails = {email for row in rows for email in row["attendee_emails"]}
+    contacts = {}
+    if emails:
+        for contact_id, email, company_id in db.query(Contact.id, Contact.email, Contact.company_id).filter(
+            Contact.organization_id == organization_id,
+            func.lower(Contact.email).in_(emails)
+        ).order_by(Contact.id.desc()):
+            contacts[email.lower()] = (contact_id, company_id)  # Lowest id wins
+    for row in rows:
+        match = next((contacts[email] for email in row.pop("attendee_emails") if email in contacts), (None, None))
+        row["contact_id"], row["company_id"] = match
+
+
+def upsert_calendar_events(db: Session, organization_id: int, rows: List[Dict[str, Any]]) -> int:
+    """Insert or update provider events in one statement (committed by the caller). Returns rows written."""
+    if not rows:
+        return 0
+    # A page can list the same event twice (e.g. changed twice between syncs); the last one wins
+    rows = list({(row["source"], row["created_by"], row["external_id"]): row for row in rows}.values())
+    _link_contacts(db, organization_id, rows)
+
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("postgresql", "sqlite"):
+        for row in rows:
+            event = db.query(CalendarEvent).filter(
+                CalendarEvent.source == row["source"],
+                CalendarEvent.created_by == row["created_by"],
+                CalendarEvent.external_id == row["external_id"]
+            ).first()
+            if event is None:
+                db.add(CalendarEvent(**row))
+            else:
+                for column in SYNCED_COLUMNS:
+                    setattr(event, column, row[column])
+        return len(rows)
+
+    table = CalendarEvent.__table__
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=["source", "created_by", "external_id"],
+        set_={
+            **{column: statement.excluded[column] for column in SYNCED_COLUMNS},
+            "updated_at": func.now(),
+        },
+    )
+    db.connection().execute(statement, rows)
+    return len(rows)
+
+
+def delete_calendar_events(db: Session, source: str, user_id: int, external_ids: Optional[List[str]] = None) -> int:
+    """Remove synced events (all of a user's events from source when external_ids is None)"""
+    if external_ids is not None and not external_ids:
+        return 0
+    query = db.query(CalendarEvent.id).filter(
+        CalendarEvent.source == source,
+        CalendarEvent.created_by == user_id
+    )
+    if external_ids is not None:
+        query = query.filter(CalendarEvent.external_id.in_(external_ids))
+    event_ids = [event_id for (event_id,) in query]
+    if not event_ids:
+        return 0
+    db.query(EventAttendee).filter(EventAttendee.event_id.in_(event_ids)).delete(synchronize_session=False)
+    return db.query(CalendarEvent).filter(CalendarEvent.id.in_(event_ids)).delete(synchronize_session=False)
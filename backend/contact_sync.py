@@ -0,0 +1,207 @@
+"""
+Address book import for NotHubSpot CRM
+Google People (syncToken) and Microsoft Graph (contacts delta) address books
+are imported into contacts and companies. Provider records are normalized
+(lowercased email, formatted phone) and written one page at a time: a page
+costs one lookup of its emails and company names, one bulk insert per table
+and one bulk update, instead of a query per contact.
+
+Contacts are matched on (organization_id, lower(email)) through the existing
+ix_contacts_org_lower_email index. Existing CRM values are never overwritten;
+an import only fills in fields that are still blank. Contacts removed from the
+address book stay in the CRM. Each page takes the organization's contact write
+lock (organization_locks) until the caller commits, so on Postgres a sync and
+a concurrent lead import can't both create the same contact or company.
+"""
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, func, insert, update
+from sqlalchemy.orm import Session
+
+from entity_matcher import entity_matchers
+from ai_response_cache import response_cache
+from models import Company, Contact
+from organization_locks import lock_organization
+from phone_utils import format_phone_number
+
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# Fields an import may fill in on an existing contact when the CRM value is blank
+FILLABLE_FIELDS = ("phone", "title", "company_id", "company_name")
+
+
+def normalize_email(value: Optional[str]) -> Optional[str]:
+    """Lowercased address, or None if it isn't one"""
+    if not value:
+        return None
+    email = value.strip().lower()
+    if email.startswith("mailto:"):
+        email = email[len("mailto:"):]
+    return email if EMAIL_PATTERN.match(email) else None
+
+
+def new_stats() -> Dict[str, Any]:
+    """Counters reported for one contacts sync"""
+    return {
+        "fetched": 0,
+        "created": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "skipped": 0,  # No usable email address
+        "companies_created": 0,
+        "pages": 0,
+        "full_sync": False,
+        "duration_ms": 0,
+    }
+
+
+def contact_row(
+    emails: Iterable[str],
+    first_name: Optional[str] = None,
+    last_name: Optional[str] = None,
+    display_name: Optional[str] = None,
+    phone: Optional[str] = None,
+    title: Optional[str] = None,
+    company_name: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """A normalized address book entry keyed by its first valid email, or None without one"""
+    email = next((normalized for normalized in map(normalize_email, emails) if normalized), None)
+    if not email:
+        return None
+    phone = format_phone_number(phone.strip()) if phone and phone.strip() else None
+    if not first_name and not last_name:
+        name_parts = (display_name or "").split()
+        first_name = name_parts[0] if name_parts else email.split("@")[0].title()
+        last_name = " ".join(name_parts[1:]) if len(name_parts) > 1 else ""
+    return {
+        "email": email,
+        "first_name": (first_name or "Unknown").strip()[:100],
+        "last_name": (last_name or "").strip()[:100] or "Contact",
+        "phone": phone[:50] if phone else None,
+        "title": (title or "").strip()[:100] or None,
+        "company_name": (company_name or "").strip()[:255] or None,
+    }
+
+
+def _resolve_companies(db: Session, organization_id: int, names: Iterable[str], stats: Dict[str, Any]) -> Dict[str, int]:
+    """Company id by lowercased name, creating the missing companies in one insert"""
+    wanted = {name.lower(): name for name in names}
+    if not wanted:
+        return {}
+
+    def lookup() -> Dict[str, int]:
+        found = {}
+        for company_id, name in db.query(Company.id, Company.name).filter(
+            Company.organization_id == organization_id,
+            func.lower(Company.name).in_(list(wanted))
+        ).order_by(Company.id.desc()):
+            found[name.lower()] = company_id  # Lowest id wins
+        return found
+
+    companies = lookup()
+    missing = [name for key, name in wanted.items() if key not in companies]
+    if missing:
+        db.execute(insert(Company), [
+            {"organization_id": organization_id, "name": name, "status": "Active", "contact_count": 0, "attachment_count": 0}
+            for name in missing
+        ])
+        stats["companies_created"] += len(missing)
+        entity_matchers.invalidate(organization_id)
+        response_cache.invalidate(organization_id)
+        companies = lookup()
+    return companies
+
+
+def upsert_contacts(
+    db: Session,
+    organization_id: int,
+    owner_id: int,
+    rows: List[Optional[Dict[str, Any]]],
+    stats: Dict[str, Any],
+) -> None:
+    """Create or fill in one page of address book entries (committed by the caller)"""
+    lock_organization(db, organization_id)
+    stats["pages"] += 1
+    stats["fetched"] += len(rows)
+    entries = {}
+    for row in rows:
+        if row is None:
+            stats["skipped"] += 1
+        else:
+            entries[row["email"]] = row  # Later entries for the same address win
+    if not entries:
+        return
+
+    companies = _resolve_companies(
+        db, organization_id, {row["company_name"] for row in entries.values() if row["company_name"]}, stats
+    )
+    for row in entries.values():
+        row["company_id"] = companies.get(row["company_name"].lower()) if row["company_name"] else None
+
+    existing = {}
+    for contact in db.query(
+        Contact.id, Contact.email, Contact.phone, Contact.title, Contact.company_id, Contact.company_name
+    ).filter(
+        Contact.organization_id == organization_id,
+        func.lower(Contact.email).in_(list(entries))
+    ).order_by(Contact.id.desc()):
+        existing[contact.email.lower()] = contact  # Lowest id wins, as in find_contact_by_email
+
+    new_rows, updates, company_counts = [], [], {}
+    for email, row in entries.items():
+        contact = existing.get(email)
+        if contact is None:
+            new_rows.append({
+                **row,
+                "organization_id": organization_id,
+                "status": "Active",
+                "owner_id": owner_id,
+                "shared_with_team": False,
+            })
+            if row["company_id"]:
+                company_counts[row["company_id"]] = company_counts.get(row["company_id"], 0) + 1
+            continue
+
+        changes = {field: row[field] for field in FILLABLE_FIELDS if row[field] and not getattr(contact, field)}
+        if changes.get("company_id") is None:
+            # Only link a company together with its name
+            changes.pop("company_name", None)
+            changes.pop("company_id", None)
+        if not changes:
+            stats["unchanged"] += 1
+            continue
+        if changes.get("company_id"):
+            company_counts[changes["company_id"]] = company_counts.get(changes["company_id"], 0) + 1
+        updates.append({
+            "contact_id": contact.id,
+            **{f"new_{field}": changes.get(field, getattr(contact, field)) for field in FILLABLE_FIELDS},
+        })
+
+    if new_rows:
+        db.execute(insert(Contact), new_rows)
+        stats["created"] += len(new_rows)
+        # Bulk inserts skip the ORM events that keep AI chat's name matcher and cached answers current
+        entity_matchers.invalidate(organization_id)
+        response_cache.invalidate(organization_id)
+    if updates:
+        db.connection().execute(
+            update(Contact).where(Contact.id == bindparam("contact_id")).values(
+                {field: bindparam(f"new_{field}") for field in FILLABLE_FIELDS}
+            ),
+            updates,
+        )
+        stats["updated"] += len(updates)
+    if company_counts:
+        db.connection().execute(
+            update(Company).where(Company.id == bindparam("company")).values(
+                contact_count=func.coalesce(Company.contact_count, 0) + bindparam("added")
+            ),
+            [{"company": company_id, "added": count} for company_id, count in company_counts.items()],
+        )
+
+
+def finish_stats(stats: Dict[str, Any], started: float) -> Dict[str, Any]:
+    stats["duration_ms"] = int((time.perf_counter() - started) * 1000)
+    return stats
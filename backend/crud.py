@@ -1,8 +1,9 @@
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import and_, or_, func, desc, asc, text
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
 from phone_utils import format_phone_number
+from email_threading import subject_hash
 
 from models import (
     Company, Contact, EmailThread, EmailMessage, 
@@ -415,7 +416,11 @@ def delete_task(db: Session, task_id: int, organization_id: int) -> bool:
 
 # Email Thread CRUD operations
 def create_email_thread(db: Session, thread: EmailThreadCreate, organization_id: int) -> EmailThread:
-    db_thread = EmailThread(**thread.dict(), organization_id=organization_id)
+    db_thread = EmailThread(
+        **thread.dict(),
+        organization_id=organization_id,
+        normalized_subject_hash=subject_hash(thread.subject)
+    )
     db.add(db_thread)
     db.commit()
     db.refresh(db_thread)
@@ -435,6 +440,43 @@ def get_email_threads(
     
     return query.order_by(desc(EmailThread.updated_at)).offset(skip).limit(limit).all()
 
+def get_email_thread_messages(
+    db: Session,
+    thread_id: int,
+    limit: int = 50,
+    before_id: Optional[int] = None
+) -> Tuple[List[EmailMessage], bool]:
+    """Newest-first page of a thread's messages, keyset-paginated on id. Returns (messages, has_more)."""
+    query = db.query(EmailMessage).filter(EmailMessage.thread_id == thread_id)
+    
+    if before_id:
+        query = query.filter(EmailMessage.id < before_id)
+    
+    messages = query.order_by(desc(EmailMessage.id)).limit(limit + 1).all()
+    return messages[:limit], len(messages) > limit
+
+def get_contact_email_messages(
+    db: Session,
+    organization_id: int,
+    contact_id: int,
+    per_thread: int = 100
+) -> List[EmailMessage]:
+    """The newest per_thread messages of each of a contact's threads, in one query, newest first"""
+    ranked = db.query(
+        EmailMessage.id.label("id"),
+        func.row_number().over(
+            partition_by=EmailMessage.thread_id,
+            order_by=desc(EmailMessage.id)
+        ).label("position")
+    ).join(EmailThread, EmailThread.id == EmailMessage.thread_id).filter(
+        EmailThread.organization_id == organization_id,
+        EmailThread.contact_id == contact_id
+    ).subquery()
+
+    return db.query(EmailMessage).join(ranked, ranked.c.id == EmailMessage.id).filter(
+        ranked.c.position <= per_thread
+    ).order_by(desc(EmailMessage.id)).all()
+
 def add_email_message(db: Session, thread_id: int, message: EmailMessageCreate, organization_id: int) -> EmailMessage:
     # Create message with thread_id
     message_data = message.dict()
@@ -674,7 +716,8 @@ def get_calendar_events(
     end_date: Optional[datetime] = None,
     contact_id: Optional[int] = None,
     company_id: Optional[int] = None,
-    event_type: Optional[str] = None
+    event_type: Optional[str] = None,
+    source: Optional[str] = None
 ) -> List[CalendarEvent]:
     query = db.query(CalendarEvent).filter(CalendarEvent.organization_id == organization_id)
     
@@ -699,14 +742,20 @@ def get_calendar_events(
         query = query.filter(CalendarEvent.company_id == company_id)
     if event_type:
         query = query.filter(CalendarEvent.event_type == event_type)
+    if source:
+        query = query.filter(CalendarEvent.source == source)
     
     return query.options(
-        joinedload(CalendarEvent.attendees)
+        joinedload(CalendarEvent.attendees),
+        joinedload(CalendarEvent.contact),
+        joinedload(CalendarEvent.company)
     ).order_by(CalendarEvent.start_time).offset(skip).limit(limit).all()
 
 def get_calendar_event(db: Session, event_id: int, organization_id: int) -> Optional[CalendarEvent]:
     return db.query(CalendarEvent).options(
-        joinedload(CalendarEvent.attendees)
+        joinedload(CalendarEvent.attendees),
+        joinedload(CalendarEvent.contact),
+        joinedload(CalendarEvent.company)
     ).filter(
         and_(CalendarEvent.id == event_id, CalendarEvent.organization_id == organization_id)
     ).first()
@@ -980,7 +1029,10 @@ def delete_calendar_event(db: Session, event_id: int, organization_id: int) -> b
 def get_upcoming_events(db: Session, organization_id: int, limit: int = 10) -> List[CalendarEvent]:
     """Get upcoming events for dashboard/daily summary"""
     current_time = datetime.utcnow()
-    return db.query(CalendarEvent).filter(
+    return db.query(CalendarEvent).options(
+        joinedload(CalendarEvent.contact),
+        joinedload(CalendarEvent.company)
+    ).filter(
         and_(
             CalendarEvent.organization_id == organization_id,
             CalendarEvent.start_time >= current_time,
@@ -988,6 +1040,24 @@ def get_upcoming_events(db: Session, organization_id: int, limit: int = 10) -> L
         )
     ).order_by(CalendarEvent.start_time).limit(limit).all()
 
+def get_busy_times(
+    db: Session,
+    organization_id: int,
+    start_date: datetime,
+    end_date: datetime,
+    user_ids: Optional[List[int]] = None
+) -> List[Tuple[int, datetime, datetime]]:
+    """(user_id, start, end) of scheduled events overlapping the range, CRM and synced calendars alike"""
+    query = db.query(CalendarEvent.created_by, CalendarEvent.start_time, CalendarEvent.end_time).filter(
+        CalendarEvent.organization_id == organization_id,
+        CalendarEvent.start_time < end_date,
+        CalendarEvent.end_time > start_date,
+        CalendarEvent.status == "scheduled"
+    )
+    if user_ids:
+        query = query.filter(CalendarEvent.created_by.in_(user_ids))
+    return query.order_by(CalendarEvent.created_by, CalendarEvent.start_time).all()
+
 def get_today_events(db: Session, organization_id: int) -> List[CalendarEvent]:
     """Get today's events for daily summary"""
     from datetime import date
@@ -0,0 +1,173 @@
+"""
+Email campaign analytics for NotHubSpot CRM
+A campaign is a BulkEmailJob (an immediate bulk send, or one queued from a
+ScheduledEmail). Counters are kept per campaign per day in
+email_campaign_stats and incremented as emails are sent and webhook events
+arrive, so reporting never scans email_tracking or email_events.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import BulkEmailJob, EmailCampaignStats
+
+STAT_FIELDS = (
+    "sent_count",
+    "open_count",
+    "unique_open_count",
+    "click_count",
+    "unique_click_count",
+    "bounce_count",
+    "unsubscribe_count",
+)
+
+# SendGrid event types that feed a campaign counter
+EVENT_STAT_FIELDS = {
+    "open": "open_count",
+    "click": "click_count",
+    "bounce": "bounce_count",
+    "unsubscribe": "unsubscribe_count",
+    "group_unsubscribe": "unsubscribe_count",
+}
+
+# (organization_id, campaign_id, day) -> {stat field: amount}
+StatIncrements = Dict[Tuple[int, int, date], Dict[str, int]]
+
+
+def new_increments() -> StatIncrements:
+    return defaultdict(lambda: defaultdict(int))
+
+
+def apply_stat_increments(db: Session, increments: StatIncrements) -> None:
+    """Add counters to email_campaign_stats with one upsert per campaign-day (committed by the caller)"""
+    rows = []
+    for (organization_id, campaign_id, day), counts in increments.items():
+        if not any(counts.values()):
+            continue
+        row = {"organization_id": organization_id, "campaign_id": campaign_id, "day": day}
+        row.update({field: counts.get(field, 0) for field in STAT_FIELDS})
+        rows.append(row)
+    if not rows:
+        return
+
+    table = EmailCampaignStats.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("postgresql", "sqlite"):
+        for row in rows:
+            stats = db.query(EmailCampaignStats).filter(
+                EmailCampaignStats.campaign_id == row["campaign_id"],
+                EmailCampaignStats.day == row["day"]
+            ).with_for_update().first()
+            if stats is None:
+                db.add(EmailCampaignStats(**row))
+            else:
+                for field in STAT_FIELDS:
+                    setattr(stats, field, (getattr(stats, field) or 0) + row[field])
+        return
+
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=["campaign_id", "day"],
+        set_={
+            **{field: table.c[field] + statement.excluded[field] for field in STAT_FIELDS},
+            "updated_at": func.now(),
+        },
+    )
+    db.connection().execute(statement, rows)
+
+
+def record_campaign_sends(db: Session, organization_id: int, campaign_id: int, count: int) -> None:
+    """Count delivered emails for a campaign (committed by the caller)"""
+    if not count:
+        return
+    increments = new_increments()
+    increments[(organization_id, campaign_id, datetime.utcnow().date())]["sent_count"] += count
+    apply_stat_increments(db, increments)
+
+
+def _summarize(counts: Dict[str, int]) -> Dict[str, object]:
+    summary = {field: counts.get(field, 0) or 0 for field in STAT_FIELDS}
+    sent = summary["sent_count"]
+    summary["open_rate"] = round(summary["unique_open_count"] / sent * 100, 1) if sent else 0.0
+    summary["click_rate"] = round(summary["unique_click_count"] / sent * 100, 1) if sent else 0.0
+    summary["bounce_rate"] = round(summary["bounce_count"] / sent * 100, 1) if sent else 0.0
+    summary["unsubscribe_rate"] = round(summary["unsubscribe_count"] / sent * 100, 1) if sent else 0.0
+    return summary
+
+
+def get_email_analytics(
+    db: Session,
+    organization_id: int,
+    days: int = 30,
+    campaign_id: Optional[int] = None,
+    limit: int = 50,
+) -> Dict[str, object]:
+    """
+    Engagement totals, a per-day series and per-campaign breakdown for an organization.
+
+    Reads only email_campaign_stats (one row per campaign per active day).
+    """
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    sums = [func.coalesce(func.sum(getattr(EmailCampaignStats, field)), 0).label(field) for field in STAT_FIELDS]
+
+    base = db.query(EmailCampaignStats).filter(
+        EmailCampaignStats.organization_id == organization_id,
+        EmailCampaignStats.day >= since
+    )
+    if campaign_id is not None:
+        base = base.filter(EmailCampaignStats.campaign_id == campaign_id)
+
+    daily_rows = base.with_entities(EmailCampaignStats.day, *sums).group_by(
+        EmailCampaignStats.day
+    ).order_by(EmailCampaignStats.day).all()
+
+    campaign_rows = base.with_entities(
+        EmailCampaignStats.campaign_id,
+        BulkEmailJob.subject,
+        BulkEmailJob.scheduled_email_id,
+        BulkEmailJob.status,
+        BulkEmailJob.total_count,
+        BulkEmailJob.created_at,
+        *sums
+    ).join(BulkEmailJob, BulkEmailJob.id == EmailCampaignStats.campaign_id).group_by(
+        EmailCampaignStats.campaign_id,
+        BulkEmailJob.subject,
+        BulkEmailJob.scheduled_email_id,
+        BulkEmailJob.status,
+        BulkEmailJob.total_count,
+        BulkEmailJob.created_at,
+    ).order_by(BulkEmailJob.created_at.desc()).limit(limit).all()
+
+    totals = defaultdict(int)
+    daily = []
+    for row in daily_rows:
+        counts = {field: getattr(row, field) for field in STAT_FIELDS}
+        for field, value in counts.items():
+            totals[field] += value
+        daily.append({"day": row.day.isoformat(), **_summarize(counts)})
+
+    campaigns = []
+    for row in campaign_rows:
+        campaigns.append({
+            "campaign_id": row.campaign_id,
+            "subject": row.subject,
+            "scheduled_email_id": row.scheduled_email_id,
+            "status": row.status,
+            "total_count": row.total_count,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+            **_summarize({field: getattr(row, field) for field in STAT_FIELDS}),
+        })
+
+    return {
+        "days": days,
+        "since": since.isoformat(),
+        "campaign_id": campaign_id,
+        "totals": _summarize(totals),
+        "daily": daily,
+        "campaigns": campaigns,
+    }
@@ -0,0 +1,486 @@
+"""
+Durable outbound email queue for NotHubSpot CRM
+Bulk sends are stored as one outbox row per recipient and delivered by a pool
+of async workers. Workers claim batches with SELECT ... FOR UPDATE SKIP LOCKED,
+so any number of workers across any number of replicas can drain the queue
+without two of them ever picking up the same message. Workers run on the API
+server's event loop, so their database work runs in worker threads and only
+the SendGrid requests are awaited on the loop.
+
+Scheduled emails use the same queue: once due, a scheduled email is claimed
+atomically and expanded into a job whose recipients are delivered in chunks by
+whichever workers are free.
+"""
+import asyncio
+import logging
+import os
+import socket
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import BulkEmailJob, EmailOutbox, Contact, ScheduledEmail
+from bulk_email_service import partition_sendable_contacts, send_to_contacts
+from email_analytics import record_campaign_sends
+from http_clients import get_http_client
+
+logger = logging.getLogger(__name__)
+
+# Number of outbox workers started in each app process (0 disables them)
+OUTBOX_WORKERS = int(os.environ.get("OUTBOX_WORKERS", "2"))
+# Messages claimed per worker iteration; sent as SendGrid personalization batches
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "500"))
+# How long an idle worker waits before polling the outbox again
+OUTBOX_POLL_SECONDS = float(os.environ.get("OUTBOX_POLL_SECONDS", "2"))
+# Delivery attempts per message before it is marked failed
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "5"))
+# First retry delay; doubles with every further attempt
+OUTBOX_RETRY_BASE_SECONDS = int(os.environ.get("OUTBOX_RETRY_BASE_SECONDS", "30"))
+# Rows left in "sending" longer than this belong to a worker that died mid-send
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", "900"))
+TERMINAL_STATUSES = ("sent", "failed", "skipped", "cancelled")
+
+_worker_tasks: List[asyncio.Task] = []
+_stop_event: Optional[asyncio.Event] = None
+
+
+def enqueue_bulk_email(
+    db: Session,
+    organization_id: int,
+    sender_user_id: int,
+    contact_ids: List[int],
+    subject: str,
+    html_content: str,
+    from_email: Optional[str] = None,
+    from_name: Optional[str] = None,
+    text_content: Optional[str] = None,
+    bcc_email: Optional[str] = None,
+    scheduled_email_id: Optional[int] = None,
+    commit: bool = True,
+) -> BulkEmailJob:
+    """
+    Queue a bulk email for background delivery.
+
+    Creates the job and one pending outbox row per sendable contact in a single
+    transaction. Nothing is sent here; the outbox workers pick the rows up.
+    Pass commit=False to make the enqueue part of the caller's transaction.
+    """
+    contacts = db.query(Contact).filter(
+        Contact.id.in_(contact_ids),
+        Contact.organization_id == organization_id
+    ).all()
+    valid_contacts, skipped = partition_sendable_contacts(contacts)
+
+    job = BulkEmailJob(
+        organization_id=organization_id,
+        created_by=sender_user_id,
+        scheduled_email_id=scheduled_email_id,
+        subject=subject,
+        html_content=html_content,
+        text_content=text_content,
+        from_email=from_email,
+        from_name=from_name,
+        bcc_email=bcc_email,
+        total_count=len(valid_contacts),
+        skipped=skipped,
+        status="queued" if valid_contacts else "completed",
+        completed_at=None if valid_contacts else datetime.utcnow(),
+    )
+    db.add(job)
+    db.flush()
+
+    now = datetime.utcnow()
+    db.bulk_insert_mappings(EmailOutbox, [
+        {
+            "job_id": job.id,
+            "organization_id": organization_id,
+            "contact_id": contact.id,
+            "to_email": contact.email,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+        }
+        for contact in valid_contacts
+    ])
+    if commit:
+        db.commit()
+        db.refresh(job)
+
+    logger.info(f"Queued bulk email job {job.id}: {len(valid_contacts)} recipients, {len(skipped)} skipped")
+    return job
+
+
+def claim_outbox_batch(db: Session, worker_id: str, batch_size: int = OUTBOX_BATCH_SIZE) -> List[EmailOutbox]:
+    """
+    Atomically claim up to batch_size due messages for this worker.
+
+    Rows locked by another worker's claim are skipped rather than waited on, and
+    claimed rows move to "sending" before the lock is released.
+    """
+    now = datetime.utcnow()
+    rows = db.query(EmailOutbox).filter(
+        EmailOutbox.status == "pending",
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.id).limit(batch_size).with_for_update(skip_locked=True).all()
+
+    if not rows:
+        db.rollback()
+        return []
+
+    for row in rows:
+        row.status = "sending"
+        row.claimed_by = worker_id
+        row.claimed_at = now
+        row.attempts = (row.attempts or 0) + 1
+
+    db.query(BulkEmailJob).filter(
+        BulkEmailJob.id.in_({row.job_id for row in rows}),
+        BulkEmailJob.status == "queued"
+    ).update({"status": "sending", "started_at": now}, synchronize_session=False)
+
+    claimed_ids = [row.id for row in rows]
+    db.commit()
+
+    # Reload the claimed rows in one query rather than refreshing each expired row
+    return db.query(EmailOutbox).filter(EmailOutbox.id.in_(claimed_ids)).order_by(EmailOutbox.id).all()
+
+
+async def deliver_outbox_batch(db: Session, client: httpx.AsyncClient, rows: List[EmailOutbox]) -> None:
+    """
+    Send claimed messages grouped by job and record each recipient's outcome.
+
+    Loading and recording run in a worker thread; only the SendGrid requests
+    run on the event loop.
+    """
+    batches = await asyncio.to_thread(_load_job_batches, db, rows)
+
+    outcomes = []
+    for job, sendable_rows, contacts_by_id in batches:
+        success_count, errors = 0, []
+        if sendable_rows:
+            success_count, errors = await send_to_contacts(
+                db=db,
+                client=client,
+                organization_id=job.organization_id,
+                sender_user_id=job.created_by,
+                contacts=[contacts_by_id[row.contact_id] for row in sendable_rows],
+                subject=job.subject,
+                html_content=job.html_content,
+                text_content=job.text_content,
+                from_email=job.from_email,
+                from_name=job.from_name,
+                bcc_email=job.bcc_email,
+                campaign_id=job.id,
+            )
+        outcomes.append((job, sendable_rows, success_count, errors))
+
+    await asyncio.to_thread(_record_outcomes, db, outcomes)
+
+
+def _load_job_batches(
+    db: Session, rows: List[EmailOutbox]
+) -> List[Tuple[BulkEmailJob, List[EmailOutbox], Dict[int, Contact]]]:
+    """(job, sendable rows, contacts by id) for each job in a claimed batch"""
+    rows_by_job = defaultdict(list)
+    for row in rows:
+        rows_by_job[row.job_id].append(row)
+
+    batches = []
+    for job_id, job_rows in rows_by_job.items():
+        job = db.query(BulkEmailJob).filter(BulkEmailJob.id == job_id).first()
+        contacts_by_id = {
+            contact.id: contact
+            for contact in db.query(Contact).filter(
+                Contact.id.in_([row.contact_id for row in job_rows if row.contact_id])
+            ).all()
+        }
+
+        # Re-check at send time: contacts may have been deleted or unsubscribed since enqueue
+        sendable_rows = []
+        for row in job_rows:
+            contact = contacts_by_id.get(row.contact_id)
+            if contact is None:
+                row.status, row.last_error = "skipped", "Contact deleted"
+            elif contact.unsubscribed:
+                row.status, row.last_error = "skipped", "Unsubscribed"
+            else:
+                sendable_rows.append(row)
+        batches.append((job, sendable_rows, contacts_by_id))
+    return batches
+
+
+def _record_outcomes(db: Session, outcomes: List[Tuple[BulkEmailJob, List[EmailOutbox], int, List[dict]]]) -> None:
+    """Store each sent batch's per-recipient statuses, then complete jobs with nothing left to send"""
+    now = datetime.utcnow()
+    for job, sendable_rows, success_count, errors in outcomes:
+        record_campaign_sends(db, job.organization_id, job.id, success_count)
+
+        errors_by_contact = {error["contact_id"]: error["reason"] for error in errors}
+        for row in sendable_rows:
+            if row.contact_id not in errors_by_contact:
+                row.status = "sent"
+                row.sent_at = now
+                row.last_error = None
+            elif row.attempts >= OUTBOX_MAX_ATTEMPTS:
+                row.status = "failed"
+                row.last_error = errors_by_contact[row.contact_id]
+            else:
+                row.status = "pending"
+                row.last_error = errors_by_contact[row.contact_id]
+                row.next_attempt_at = now + timedelta(
+                    seconds=OUTBOX_RETRY_BASE_SECONDS * 2 ** (row.attempts - 1)
+                )
+
+    # Tracking rows and outbox statuses are committed together
+    db.commit()
+
+    for job, _, _, _ in outcomes:
+        _complete_job_if_done(db, job)
+
+
+def _complete_job_if_done(db: Session, job: BulkEmailJob) -> None:
+    """Mark a job completed once none of its messages are pending or in flight"""
+    remaining = db.query(func.count(EmailOutbox.id)).filter(
+        EmailOutbox.job_id == job.id,
+        EmailOutbox.status.in_(["pending", "sending"])
+    ).scalar()
+    if remaining == 0 and job.status not in ("completed", "cancelled"):
+        job.status = "completed"
+        job.completed_at = datetime.utcnow()
+        if job.scheduled_email_id:
+            _finalize_scheduled_email(db, job)
+        db.commit()
+        logger.info(f"Bulk email job {job.id} completed")
+
+
+def _finalize_scheduled_email(db: Session, job: BulkEmailJob) -> None:
+    """Copy a finished job's outcome onto the scheduled email it was created from"""
+    scheduled = db.query(ScheduledEmail).filter(ScheduledEmail.id == job.scheduled_email_id).first()
+    if not scheduled:
+        return
+
+    progress = get_job_progress(db, job)
+    all_failed = progress["success_count"] == 0 and progress["error_count"] > 0
+    scheduled.status = "failed" if all_failed else "sent"
+    scheduled.sent_at = datetime.utcnow()
+    scheduled.result = {
+        "job_id": job.id,
+        "success_count": progress["success_count"],
+        "error_count": progress["error_count"],
+        "skipped_count": progress["skipped_count"],
+        "total": job.total_count,
+        "skipped": progress["skipped"],
+        "errors": progress["errors"],
+        "message": f"Sent {progress['success_count']} of {job.total_count} emails ({progress['skipped_count']} skipped)",
+    }
+
+
+def dispatch_due_scheduled_emails(db: Session, worker_id: str, limit: int = 20) -> List[dict]:
+    """
+    Claim due scheduled emails and queue them for delivery through the outbox.
+
+    Claiming uses SELECT ... FOR UPDATE SKIP LOCKED and the status change,
+    job and outbox rows commit in one transaction. Any number of schedulers
+    or API callers can run this concurrently without double-queuing a campaign.
+    """
+    now = datetime.utcnow()
+    due = db.query(ScheduledEmail).filter(
+        ScheduledEmail.status == "pending",
+        ScheduledEmail.scheduled_at <= now
+    ).order_by(ScheduledEmail.scheduled_at).limit(limit).with_for_update(skip_locked=True).all()
+
+    if not due:
+        db.rollback()
+        return []
+
+    results = []
+    jobs = []
+    for scheduled in due:
+        scheduled.status = "sending"
+        scheduled.claimed_by = worker_id
+        scheduled.claimed_at = now
+
+        job = enqueue_bulk_email(
+            db=db,
+            organization_id=scheduled.organization_id,
+            sender_user_id=scheduled.created_by,
+            contact_ids=scheduled.contact_ids or [],
+            subject=scheduled.subject,
+            html_content=scheduled.html_content,
+            from_email=scheduled.from_email,
+            from_name=scheduled.from_name,
+            text_content=scheduled.text_content,
+            bcc_email=scheduled.bcc_email,
+            scheduled_email_id=scheduled.id,
+            commit=False,
+        )
+        jobs.append(job)
+        results.append({"id": scheduled.id, "status": "queued", "job_id": job.id, "recipients": job.total_count})
+
+    db.commit()
+
+    # Campaigns with no sendable recipients are already complete
+    for job in jobs:
+        if job.status == "completed":
+            _finalize_scheduled_email(db, job)
+    db.commit()
+
+    logger.info(f"Worker {worker_id} queued {len(results)} scheduled email(s)")
+    return results
+
+
+def cancel_bulk_email_job(db: Session, job: BulkEmailJob) -> int:
+    """
+    Stop a queued job: its pending outbox messages are cancelled and the job
+    is marked cancelled. Messages a worker already claimed still finish.
+    Returns the number of messages cancelled; the caller commits.
+    """
+    cancelled = db.query(EmailOutbox).filter(
+        EmailOutbox.job_id == job.id,
+        EmailOutbox.status == "pending"
+    ).update({"status": "cancelled"}, synchronize_session=False)
+
+    if job.status != "completed":
+        job.status = "cancelled"
+        job.completed_at = datetime.utcnow()
+
+    logger.info(f"Cancelled bulk email job {job.id}: {cancelled} message(s) not sent")
+    return cancelled
+
+
+def recover_stale_outbox_rows(db: Session) -> int:
+    """
+    Release messages held by workers that died mid-send.
+
+    Whether such a message reached SendGrid is unknown, so it is marked failed
+    rather than retried; re-sending could deliver it twice.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=OUTBOX_LEASE_SECONDS)
+    stale = db.query(EmailOutbox).filter(
+        EmailOutbox.status == "sending",
+        EmailOutbox.claimed_at < cutoff
+    ).with_for_update(skip_locked=True).all()
+
+    if not stale:
+        db.rollback()
+        return 0
+
+    for row in stale:
+        row.status = "failed"
+        row.last_error = f"Delivery unknown: worker {row.claimed_by} stopped while sending"
+    job_ids = {row.job_id for row in stale}
+    db.commit()
+
+    for job_id in job_ids:
+        job = db.query(BulkEmailJob).filter(BulkEmailJob.id == job_id).first()
+        if job:
+            _complete_job_if_done(db, job)
+
+    logger.warning(f"Marked {len(stale)} stale outbox message(s) as failed")
+    return len(stale)
+
+
+def get_job_progress(db: Session, job: BulkEmailJob) -> dict:
+    """Summarize delivery progress for a job from its outbox rows"""
+    counts = dict(
+        db.query(EmailOutbox.status, func.count(EmailOutbox.id))
+        .filter(EmailOutbox.job_id == job.id)
+        .group_by(EmailOutbox.status)
+        .all()
+    )
+    errors = db.query(EmailOutbox.to_email, EmailOutbox.last_error, Contact.first_name, Contact.last_name).outerjoin(
+        Contact, Contact.id == EmailOutbox.contact_id
+    ).filter(
+        EmailOutbox.job_id == job.id,
+        EmailOutbox.status == "failed"
+    ).order_by(EmailOutbox.id).limit(20).all()
+
+    processed = sum(counts.get(status, 0) for status in TERMINAL_STATUSES)
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "subject": job.subject,
+        "total": job.total_count,
+        "pending_count": counts.get("pending", 0),
+        "sending_count": counts.get("sending", 0),
+        "success_count": counts.get("sent", 0),
+        "error_count": counts.get("failed", 0),
+        "skipped_count": len(job.skipped or []) + counts.get("skipped", 0),
+        "cancelled_count": counts.get("cancelled", 0),
+        "percent_complete": round(100 * processed / job.total_count, 1) if job.total_count else 100.0,
+        "skipped": (job.skipped or [])[:20],
+        "errors": [
+            {
+                # Same shape as the skipped entries; the contact may have been deleted since
+                "contact": f"{row.first_name} {row.last_name}" if row.first_name is not None else row.to_email,
+                "email": row.to_email,
+                "reason": row.last_error,
+            }
+            for row in errors
+        ],
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+    }
+
+
+async def run_outbox_worker(worker_id: str, stop_event: asyncio.Event) -> None:
+    """Claim and deliver outbox batches until stop_event is set"""
+    from database import SessionLocal
+
+    logger.info(f"Outbox worker {worker_id} started")
+    while not stop_event.is_set():
+        rows = []
+        db = SessionLocal()
+        try:
+            # Database work is synchronous; keep it off the event loop
+            rows = await asyncio.to_thread(claim_outbox_batch, db, worker_id)
+            if rows:
+                await deliver_outbox_batch(db, get_http_client("sendgrid"), rows)
+            else:
+                await asyncio.to_thread(recover_stale_outbox_rows, db)
+        except Exception as e:
+            logger.error(f"Outbox worker {worker_id} error: {e}", exc_info=True)
+        finally:
+            # Closing rolls back anything left uncommitted
+            await asyncio.to_thread(db.close)
+
+        # Keep draining while there is work; otherwise poll again after a pause
+        if not rows:
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    logger.info(f"Outbox worker {worker_id} stopped")
+
+
+def start_outbox_workers(worker_count: int = OUTBOX_WORKERS) -> None:
+    """Start the outbox worker pool on the running event loop"""
+    global _stop_event
+
+    if worker_count <= 0:
+        logger.info("Outbox workers disabled (OUTBOX_WORKERS=0)")
+        return
+
+    _stop_event = asyncio.Event()
+    process_id = f"{socket.gethostname()}:{os.getpid()}"
+    for n in range(worker_count):
+        task = asyncio.create_task(run_outbox_worker(f"{process_id}:{n}", _stop_event))
+        _worker_tasks.append(task)
+    logger.info(f"Started {worker_count} outbox worker(s)")
+
+
+async def stop_outbox_workers() -> None:
+    """Let each worker finish its current batch, then stop the pool"""
+    if _stop_event is None:
+        return
+
+    _stop_event.set()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
+    logger.info("Outbox workers stopped")
@@ -4,12 +4,17 @@ Email service for NotHubSpot CRM
 import os
 import base64
 import json
-from typing import Optional, List
+import asyncio
+from typing import Optional, List, Dict
 from datetime import datetime
 import uuid
 import httpx
+from http_clients import get_http_client
 from email_templates import get_welcome_email_html, get_welcome_email_text, get_password_reset_email_html, get_password_reset_email_text, get_invite_email_html, get_invite_email_text
 
+# Maximum number of calendar invite emails in flight at once
+CALENDAR_INVITE_CONCURRENCY = int(os.environ.get("CALENDAR_INVITE_CONCURRENCY", "5"))
+
 def generate_ics_content(
     event_title: str,
     event_description: str,
@@ -77,6 +82,11 @@ END:VCALENDAR"""
     
     return ics_content
 
+def get_sendgrid_mail_send_url() -> str:
+    """Return the SendGrid mail send endpoint (SENDGRID_API_URL overrides the host, e.g. for a local fake server)"""
+    base_url = os.environ.get("SENDGRID_API_URL", "https://api.sendgrid.com").rstrip("/")
+    return f"{base_url}/v3/mail/send"
+
 async def send_email(
     to_email: str,
     subject: str,
@@ -87,9 +97,13 @@ async def send_email(
     attachments: Optional[List[dict]] = None,
     cc_emails: Optional[List[str]] = None,
     bcc_emails: Optional[List[str]] = None,
-    disable_tracking: bool = True
+    disable_tracking: bool = True,
+    client: Optional[httpx.AsyncClient] = None
 ) -> bool:
-    """Send email via SendGrid"""
+    """Send email via SendGrid
+
+    Uses the shared SendGrid connection pool unless ``client`` is given.
+    """
     # Load environment variables at runtime instead of module import time
     SENDGRID_API_KEY = os.environ.get("SENDGRID_API_KEY", "")
     SENDGRID_FROM_EMAIL = os.environ.get("SENDGRID_FROM_EMAIL", "noreply@nothubspot.app")
@@ -106,7 +120,7 @@ async def send_email(
         print(f"Subject: {subject}")
         return False
     
-    url = "https://api.sendgrid.com/v3/mail/send"
+    url = get_sendgrid_mail_send_url()
     headers = {
         "Authorization": f"Bearer {SENDGRID_API_KEY}",
         "Content-Type": "application/json"
@@ -153,20 +167,20 @@ async def send_email(
         }
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data, headers=headers)
-            
-            if response.status_code in [200, 201, 202]:
-                cc_msg = f" (CC: {', '.join(cc_emails)})" if cc_emails else ""
-                bcc_msg = f" (BCC: {', '.join(bcc_emails)})" if bcc_emails else ""
-                print(f"Email sent successfully to {to_email}{cc_msg}{bcc_msg}")
-                return True
-            else:
-                print(f"ERROR: Failed to send email to {to_email}")
-                print(f"Status Code: {response.status_code}")
-                print(f"Response: {response.text}")
-                print(f"Request Data: {json.dumps(data, indent=2)}")
-                return False
+        client = client or get_http_client("sendgrid")
+        response = await client.post(url, json=data, headers=headers)
+        
+        if response.status_code in [200, 201, 202]:
+            cc_msg = f" (CC: {', '.join(cc_emails)})" if cc_emails else ""
+            bcc_msg = f" (BCC: {', '.join(bcc_emails)})" if bcc_emails else ""
+            print(f"Email sent successfully to {to_email}{cc_msg}{bcc_msg}")
+            return True
+        else:
+            print(f"ERROR: Failed to send email to {to_email}")
+            print(f"Status Code: {response.status_code}")
+            print(f"Response: {response.text}")
+            print(f"Request Data: {json.dumps(data, indent=2)}")
+            return False
     except Exception as e:
         print(f"ERROR: Exception while sending email to {to_email}")
         print(f"Exception Type: {type(e).__name__}")
@@ -270,10 +284,17 @@ async def send_calendar_invite(
     attendee_emails: List[str],
     organizer_email: str,
     organizer_name: str
-) -> bool:
-    """Send calendar invite to attendees with .ics attachment"""
+) -> Dict[str, bool]:
+    """Send calendar invite to attendees with .ics attachment
+
+    The .ics file and email body are rendered once and shared by every
+    attendee. Sends go out over a single pooled HTTP client, at most
+    CALENDAR_INVITE_CONCURRENCY at a time.
+
+    Returns a dict mapping each attendee email to whether its delivery succeeded.
+    """
     if not attendee_emails:
-        return True
+        return {}
     
     # Generate .ics file content
     ics_content = generate_ics_content(
@@ -342,23 +363,25 @@ A calendar file (.ics) is attached to this email. Open it to add this event to y
 This invitation was sent from NotHubSpot CRM.
     """
     
-    # Send email to each attendee
-    success_count = 0
-    for email in attendee_emails:
-        try:
-            success = await send_email(
-                to_email=email,
-                subject=subject,
-                html_content=html_content,
-                text_content=text_content,
-                from_email=organizer_email,
-                from_name=organizer_name,
-                attachments=attachments
-            )
-            if success:
-                success_count += 1
-        except Exception as e:
-            print(f"Failed to send calendar invite to {email}: {str(e)}")
-            continue
-    
-    return success_count == len(attendee_emails)
\ No newline at end of file
+    # Send to every attendee concurrently over the shared SendGrid pool
+    semaphore = asyncio.Semaphore(CALENDAR_INVITE_CONCURRENCY)
+    
+    async def send_one(email: str) -> bool:
+        async with semaphore:
+            try:
+                return await send_email(
+                    to_email=email,
+                    subject=subject,
+                    html_content=html_content,
+                    text_content=text_content,
+                    from_email=organizer_email,
+                    from_name=organizer_name,
+                    attachments=attachments
+                )
+            except Exception as e:
+                print(f"Failed to send calendar invite to {email}: {str(e)}")
+                return False
+    
+    results = await asyncio.gather(*(send_one(email) for email in attendee_emails))
+    
+    return dict(zip(attendee_emails, results))
@@ -5,17 +5,14 @@ from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
 from typing import List, Optional
 from datetime import datetime
-import re
 
 from models import EmailTemplate, User
 from schemas import EmailTemplateCreate, EmailTemplateUpdate
-
-# Variable detection regex pattern
-VARIABLE_PATTERN = r'\{\{([^}]+)\}\}'
+import template_engine
 
 def extract_variables(text: str) -> List[str]:
     """Extract template variables from text like {{contact.first_name}}"""
-    return list(set(re.findall(VARIABLE_PATTERN, text)))
+    return template_engine.extract_variables(text)
 
 def get_email_templates(
     db: Session,
@@ -195,28 +192,15 @@ def replace_template_variables(
     user_data: Optional[dict] = None
 ) -> str:
     """Replace template variables with actual data"""
-    result = template_text
-    
-    # Replace contact variables
-    if contact_data:
-        for key, value in contact_data.items():
-            pattern = f"{{{{contact.{key}}}}}"
-            result = result.replace(pattern, str(value) if value else "")
-    
-    # Replace company variables
-    if company_data:
-        for key, value in company_data.items():
-            pattern = f"{{{{company.{key}}}}}"
-            result = result.replace(pattern, str(value) if value else "")
-    
-    # Replace user variables
-    if user_data:
-        for key, value in user_data.items():
-            pattern = f"{{{{user.{key}}}}}"
-            result = result.replace(pattern, str(value) if value else "")
-    
-    # Replace system variables
-    result = result.replace("{{date}}", datetime.now().strftime("%B %d, %Y"))
-    result = result.replace("{{time}}", datetime.now().strftime("%I:%M %p"))
-    
-    return result
\ No newline at end of file
+    values = {}
+    for prefix, data in (("contact", contact_data), ("company", company_data), ("user", user_data)):
+        if data:
+            for key, value in data.items():
+                values[f"{prefix}.{key}"] = str(value) if value else ""
+    
+    # System variables
+    now = datetime.now()
+    values["date"] = now.strftime("%B %d, %Y")
+    values["time"] = now.strftime("%I:%M %p")
+    
+    return template_engine.render_template(template_text, values)
@@ -0,0 +1,100 @@
+"""
+Email thread matching for NotHubSpot CRM
+Resolves an email's contact through the lower(email) index and its thread
+through In-Reply-To/References headers, falling back to an indexed hash of the
+normalized subject. Each lookup is a single indexed query no matter how many
+threads a contact has.
+"""
+import hashlib
+import re
+from email.utils import getaddresses
+from typing import Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Contact, EmailMessage, EmailThread, User
+
+# Reply/forward prefixes, possibly stacked ("Re: Fwd: RE[2]: ...").
+# migrations/add_email_thread_matching.sql backfills existing threads with the
+# same normalization; keep the two in sync.
+SUBJECT_PREFIX_PATTERN = re.compile(r'^\s*((re|fwd?|aw|sv|wg)(\[\d+\])?\s*:\s*)+', re.IGNORECASE)
+WHITESPACE_PATTERN = re.compile(r'\s+')
+MESSAGE_ID_PATTERN = re.compile(r'<[^<>\s]+>')
+
+
+def normalize_subject(subject: Optional[str]) -> str:
+    """Strip reply/forward prefixes and collapse whitespace, lowercased"""
+    subject = SUBJECT_PREFIX_PATTERN.sub('', subject or '')
+    return WHITESPACE_PATTERN.sub(' ', subject).strip().lower()
+
+
+def subject_hash(subject: Optional[str]) -> str:
+    """Hash of the normalized subject, stored on EmailThread.normalized_subject_hash"""
+    return hashlib.md5(normalize_subject(subject).encode('utf-8')).hexdigest()
+
+
+def parse_message_ids(*headers: Optional[str]) -> List[str]:
+    """Message-IDs (with angle brackets) from In-Reply-To/References header values"""
+    ids = []
+    for header in headers:
+        for message_id in MESSAGE_ID_PATTERN.findall(header or ''):
+            if message_id not in ids:
+                ids.append(message_id)
+    return ids
+
+
+def parse_addresses(value: Optional[str]) -> List[str]:
+    """Lowercased addresses from a From/To header ("Name <a@b.com>, c@d.com")"""
+    return [address.lower() for _, address in getaddresses([value or '']) if '@' in address]
+
+
+def find_contact_by_email(db: Session, email: str, organization_id: int) -> Optional[Contact]:
+    """Case-insensitive contact lookup within one organization, served by the (organization_id, lower(email)) index"""
+    return db.query(Contact).filter(
+        Contact.organization_id == organization_id,
+        func.lower(Contact.email) == email.strip().lower()
+    ).order_by(Contact.id).first()
+
+
+def find_organization_for_addresses(db: Session, addresses: Iterable[str]) -> Optional[int]:
+    """Organization of the first CRM user among these addresses, if any"""
+    addresses = [address.lower() for address in addresses]
+    if not addresses:
+        return None
+    user = db.query(User.organization_id).filter(
+        func.lower(User.email).in_(addresses)
+    ).order_by(User.id).first()
+    return user.organization_id if user else None
+
+
+def find_thread(
+    db: Session,
+    organization_id: int,
+    contact_id: int,
+    subject: Optional[str],
+    in_reply_to: Optional[str] = None,
+    references: Optional[str] = None,
+) -> Optional[EmailThread]:
+    """
+    Find the thread an email belongs to.
+
+    Replies are matched through the Message-IDs they reference; otherwise the
+    most recently active thread with the contact on the same normalized subject.
+    """
+    referenced_ids = parse_message_ids(in_reply_to, references)
+    if referenced_ids:
+        thread = db.query(EmailThread).join(
+            EmailMessage, EmailMessage.thread_id == EmailThread.id
+        ).filter(
+            EmailThread.organization_id == organization_id,
+            EmailMessage.internet_message_id.in_(referenced_ids)
+        ).order_by(EmailMessage.id.desc()).first()
+        if thread:
+            return thread
+
+    return db.query(EmailThread).filter(
+        EmailThread.organization_id == organization_id,
+        EmailThread.contact_id == contact_id,
+        EmailThread.normalized_subject_hash == subject_hash(subject)
+    ).order_by(EmailThread.updated_at.desc()).first()
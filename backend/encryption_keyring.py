@@ -0,0 +1,180 @@
+"""
+Encryption keyring for NotHubSpot CRM integrations
+Fernet keys for stored OAuth tokens and client secrets are derived from
+SECRET_KEY with PBKDF2 (100,000 iterations). Each key is derived once per
+process and the Fernet/MultiFernet instances are cached, so encrypting or
+decrypting a token costs microseconds instead of tens of milliseconds.
+
+Key rotation: set SECRET_KEY to the new secret and list the old one(s) in
+PREVIOUS_SECRET_KEYS (comma separated). Values encrypted under any listed
+secret still decrypt; new values use SECRET_KEY. rotate_encrypted_columns
+re-encrypts stored values under SECRET_KEY in batches, after which the old
+secrets can be dropped.
+"""
+import base64
+import logging
+import os
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SECRET_KEY = "your-secret-key-here"
+KDF_ITERATIONS = 100000
+ROTATION_BATCH_SIZE = 500
+
+
+@lru_cache(maxsize=32)
+def derive_key(secret: str, salt: str) -> bytes:
+    """PBKDF2-HMAC-SHA256 Fernet key for a secret and salt (computed once per process)"""
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt.encode(),
+        iterations=KDF_ITERATIONS,
+    )
+    return base64.urlsafe_b64encode(kdf.derive(secret.encode()))
+
+
+@lru_cache(maxsize=32)
+def _fernets(secrets: Tuple[str, ...], salt: str) -> Tuple[Fernet, MultiFernet]:
+    keys = [Fernet(derive_key(secret, salt)) for secret in secrets]
+    return keys[0], MultiFernet(keys)
+
+
+class Keyring:
+    """Encrypts and decrypts one integration's stored secrets with cached, rotatable keys"""
+
+    def __init__(self, name: str, salt_env: str, default_salt: str):
+        self.name = name
+        self.salt_env = salt_env
+        self.default_salt = default_salt
+
+    @property
+    def salt(self) -> str:
+        return os.environ.get(self.salt_env, self.default_salt)
+
+    @staticmethod
+    def secrets() -> Tuple[str, ...]:
+        """SECRET_KEY first, then PREVIOUS_SECRET_KEYS in order"""
+        current = os.environ.get("SECRET_KEY", DEFAULT_SECRET_KEY)
+        previous = [s.strip() for s in os.environ.get("PREVIOUS_SECRET_KEYS", "").split(",") if s.strip()]
+        return (current, *[s for s in previous if s != current])
+
+    def primary_key(self) -> bytes:
+        return derive_key(self.secrets()[0], self.salt)
+
+    def _fernets(self) -> Tuple[Fernet, MultiFernet]:
+        # Environment lookups are cheap; derivation only happens for new secret/salt combinations
+        return _fernets(self.secrets(), self.salt)
+
+    def encrypt(self, data: str) -> str:
+        if not data:
+            return ""
+        token = self._fernets()[1].encrypt(data.encode())
+        return base64.urlsafe_b64encode(token).decode()
+
+    def decrypt(self, encrypted_data: str) -> Optional[str]:
+        if not encrypted_data:
+            return None
+        try:
+            token = base64.urlsafe_b64decode(encrypted_data.encode())
+            return self._fernets()[1].decrypt(token).decode()
+        except Exception as e:
+            print(f"Failed to decrypt {self.name} data: {e}")
+            return None
+
+    def rotate(self, encrypted_data: str) -> Optional[str]:
+        """
+        Re-encrypt a stored value under the primary key.
+
+        Returns None if it is already under the primary key; raises InvalidToken
+        if no configured key can decrypt it.
+        """
+        if not encrypted_data:
+            return None
+        primary, multi = self._fernets()
+        token = base64.urlsafe_b64decode(encrypted_data.encode())
+        try:
+            primary.decrypt(token)
+            return None
+        except InvalidToken:
+            pass
+        return base64.urlsafe_b64encode(multi.rotate(token)).decode()
+
+
+O365_KEYRING = Keyring("O365", "O365_ENCRYPTION_SALT", "nohubspot-o365-salt")
+GOOGLE_KEYRING = Keyring("Google", "GOOGLE_ENCRYPTION_SALT", "nohubspot-google-salt")
+
+
+def clear_key_cache() -> None:
+    """Forget derived keys (after changing SECRET_KEY or a salt in-process, e.g. in scripts)"""
+    derive_key.cache_clear()
+    _fernets.cache_clear()
+
+
+def _encrypted_columns():
+    """(model, keyring, encrypted column names) for every stored integration secret"""
+    from models import GoogleOrganizationConfig, GoogleUserConnection, O365OrganizationConfig, O365UserConnection
+
+    return [
+        (O365OrganizationConfig, O365_KEYRING, ("client_secret_encrypted",)),
+        (O365UserConnection, O365_KEYRING, ("access_token_encrypted", "refresh_token_encrypted")),
+        (GoogleOrganizationConfig, GOOGLE_KEYRING, ("client_secret_encrypted",)),
+        (GoogleUserConnection, GOOGLE_KEYRING, ("access_token_encrypted", "refresh_token_encrypted")),
+    ]
+
+
+def rotate_encrypted_columns(db: Session, batch_size: int = ROTATION_BATCH_SIZE) -> Dict[str, Dict[str, int]]:
+    """
+    Re-encrypt every stored integration secret under the current SECRET_KEY.
+
+    Rows are read in id order batch_size at a time and each batch is committed,
+    so the job can be interrupted and re-run; values already under the
+    current key are left alone.
+    """
+    results = {}
+    for model, keyring, columns in _encrypted_columns():
+        stats = {"rows": 0, "rotated": 0, "current": 0, "failed": 0}
+        last_id = 0
+        while True:
+            rows = db.query(model.id, *[getattr(model, column) for column in columns]).filter(
+                model.id > last_id
+            ).order_by(model.id).limit(batch_size).all()
+            if not rows:
+                break
+
+            updates = []
+            for row in rows:
+                stats["rows"] += 1
+                values = {}
+                for column in columns:
+                    encrypted = getattr(row, column)
+                    if not encrypted:
+                        continue
+                    try:
+                        rotated = keyring.rotate(encrypted)
+                    except (InvalidToken, ValueError):
+                        stats["failed"] += 1
+                        logger.warning(f"Cannot decrypt {model.__tablename__}.{column} for id {row.id} with any configured key")
+                        continue
+                    if rotated is None:
+                        stats["current"] += 1
+                    else:
+                        values[column] = rotated
+                        stats["rotated"] += 1
+                if values:
+                    updates.append({"id": row.id, **values})
+
+            if updates:
+                db.bulk_update_mappings(model, updates)
+            db.commit()
+            last_id = rows[-1].id
+
+        results[model.__tablename__] = stats
+    return results
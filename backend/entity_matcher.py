@@ -0,0 +1,199 @@
+"""
+CRM entity name matching for NotHubSpot CRM
+Each organization gets an in-memory token trie over its contact, company and
+deal names, so AI chat can find the entities a message mentions in
+milliseconds and load only those rows instead of scanning every contact,
+company and task.
+
+The trie is built on first use per organization (one narrow query per table)
+and kept current by ORM writes through mapper events. Core bulk writes and
+other worker processes are covered by invalidate() and a rebuild after
+ENTITY_MATCHER_TTL_SECONDS. A stale entry only yields an extra candidate id,
+which the caller drops when the row no longer matches or exists.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Company, Contact, Deal
+
+logger = logging.getLogger(__name__)
+
+ENTITY_MATCHER_TTL_SECONDS = int(os.environ.get("ENTITY_MATCHER_TTL_SECONDS", "300"))
+MAX_PHRASE_TOKENS = 8
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Words too common on their own to identify a company or deal
+STOP_TOKENS = {
+    "a", "an", "and", "at", "co", "company", "corp", "corporation", "for", "group", "in", "inc",
+    "llc", "ltd", "of", "on", "the", "to", "with", "deal", "project", "services", "solutions",
+}
+
+EntityRef = Tuple[str, int]  # ("contact" | "company" | "deal", id)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+def _phrases(kind: str, names: Iterable[Optional[str]]) -> Set[Tuple[str, ...]]:
+    """Token sequences an entity can be mentioned by"""
+    phrases = set()
+    for name in names:
+        tokens = tuple(tokenize(name))[:MAX_PHRASE_TOKENS]
+        if not tokens:
+            continue
+        if len(tokens) > 1 or len(tokens[0]) > 1:
+            phrases.add(tokens)
+        if kind != "contact" and len(tokens) > 1:
+            # "KM" finds "KM Electric"; "the" does not find "The Home Depot"
+            phrases.update((token,) for token in tokens if len(token) >= 2 and token not in STOP_TOKENS)
+    return phrases
+
+
+def _entity_names(kind: str, target) -> List[Optional[str]]:
+    if kind == "contact":
+        return [f"{target.first_name or ''} {target.last_name or ''}", target.first_name, target.last_name]
+    if kind == "company":
+        return [target.name]
+    return [target.title]
+
+
+class EntityMatcher:
+    """Token trie over one organization's contact, company and deal names"""
+
+    def __init__(self, organization_id: int):
+        self.organization_id = organization_id
+        self.built_at = time.monotonic()
+        self._root: Dict = {}
+        self._phrases: Dict[EntityRef, Set[Tuple[str, ...]]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, ref: EntityRef, names: Iterable[Optional[str]]) -> None:
+        with self._lock:
+            self._remove(ref)
+            phrases = _phrases(ref[0], names)
+            self._phrases[ref] = phrases
+            for phrase in phrases:
+                node = self._root
+                for token in phrase:
+                    node = node.setdefault(token, {})
+                node.setdefault(None, set()).add(ref)  # The None key holds the entities ending here
+
+    def remove(self, ref: EntityRef) -> None:
+        with self._lock:
+            self._remove(ref)
+
+    def _remove(self, ref: EntityRef) -> None:
+        for phrase in self._phrases.pop(ref, ()):
+            node = self._root
+            for token in phrase:
+                node = node.get(token)
+                if node is None:
+                    break
+            else:
+                node.get(None, set()).discard(ref)
+
+    def match(self, text: str, limit: int = 5) -> Dict[str, List[int]]:
+        """Entity ids mentioned in text per kind, longest mention first, then first mentioned"""
+        tokens = tokenize(text)
+        best: Dict[EntityRef, Tuple[int, int]] = {}
+        with self._lock:
+            for start in range(len(tokens)):
+                node = self._root
+                for end in range(start, min(start + MAX_PHRASE_TOKENS, len(tokens))):
+                    node = node.get(tokens[end])
+                    if node is None:
+                        break
+                    for ref in node.get(None, ()):
+                        score = (end - start + 1, -start)
+                        if ref not in best or score > best[ref]:
+                            best[ref] = score
+        matches: Dict[str, List[int]] = {"contact": [], "company": [], "deal": []}
+        for (kind, entity_id), _ in sorted(best.items(), key=lambda item: item[1], reverse=True):
+            if len(matches[kind]) < limit:
+                matches[kind].append(entity_id)
+        return matches
+
+    def __len__(self) -> int:
+        return len(self._phrases)
+
+
+def build_entity_matcher(db: Session, organization_id: int) -> EntityMatcher:
+    matcher = EntityMatcher(organization_id)
+    for contact_id, first_name, last_name in db.query(Contact.id, Contact.first_name, Contact.last_name).filter(
+        Contact.organization_id == organization_id
+    ):
+        matcher.add(("contact", contact_id), [f"{first_name or ''} {last_name or ''}", first_name, last_name])
+    for company_id, name in db.query(Company.id, Company.name).filter(Company.organization_id == organization_id):
+        matcher.add(("company", company_id), [name])
+    for deal_id, title in db.query(Deal.id, Deal.title).filter(Deal.organization_id == organization_id):
+        matcher.add(("deal", deal_id), [title])
+    return matcher
+
+
+class EntityMatcherRegistry:
+    """One EntityMatcher per organization, built lazily and rebuilt when stale"""
+
+    def __init__(self, ttl_seconds: int = ENTITY_MATCHER_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._matchers: Dict[int, EntityMatcher] = {}
+        self._build_locks: Dict[int, threading.Lock] = defaultdict(threading.Lock)
+
+    def get(self, db: Session, organization_id: int) -> EntityMatcher:
+        matcher = self._matchers.get(organization_id)
+        if matcher is not None and time.monotonic() - matcher.built_at < self.ttl_seconds:
+            return matcher
+        with self._build_locks[organization_id]:
+            matcher = self._matchers.get(organization_id)
+            if matcher is None or time.monotonic() - matcher.built_at >= self.ttl_seconds:
+                started = time.perf_counter()
+                matcher = build_entity_matcher(db, organization_id)
+                self._matchers[organization_id] = matcher
+                logger.info(f"Built entity matcher for organization {organization_id}: "
+                            f"{len(matcher)} entities in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return matcher
+
+    def invalidate(self, organization_id: Optional[int] = None) -> None:
+        """Drop one organization's matcher (all when organization_id is None); the next get() rebuilds it"""
+        if organization_id is None:
+            self._matchers.clear()
+        else:
+            self._matchers.pop(organization_id, None)
+
+    def record_write(self, kind: str, target, deleted: bool = False) -> None:
+        matcher = self._matchers.get(target.organization_id)
+        if matcher is None:
+            return
+        if deleted:
+            matcher.remove((kind, target.id))
+        else:
+            matcher.add((kind, target.id), _entity_names(kind, target))
+
+
+entity_matchers = EntityMatcherRegistry()
+
+
+def _listen(model, kind: str) -> None:
+    def saved(mapper, connection, target):
+        entity_matchers.record_write(kind, target)
+
+    def deleted(mapper, connection, target):
+        entity_matchers.record_write(kind, target, deleted=True)
+
+    event.listen(model, "after_insert", saved)
+    event.listen(model, "after_update", saved)
+    event.listen(model, "after_delete", deleted)
+
+
+_listen(Contact, "contact")
+_listen(Company, "company")
+_listen(Deal, "deal")
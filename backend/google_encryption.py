@@ -1,53 +1,21 @@
 """
 Encryption utilities for Google Workspace sensitive data
 """
-import os
-import base64
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from typing import Optional
 
+from encryption_keyring import GOOGLE_KEYRING
+
 def get_encryption_key() -> bytes:
-    """Generate or retrieve encryption key for Google data"""
-    # Use a combination of app secret and environment variable for key derivation
-    secret_key = os.environ.get("SECRET_KEY", "your-secret-key-here")
-    salt = os.environ.get("GOOGLE_ENCRYPTION_SALT", "nohubspot-google-salt").encode()
-    
-    # Derive a consistent key from the secret
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100000,
-    )
-    key = base64.urlsafe_b64encode(kdf.derive(secret_key.encode()))
-    return key
+    """Encryption key for Google data, derived from SECRET_KEY once per process"""
+    return GOOGLE_KEYRING.primary_key()
 
 def encrypt_sensitive_data(data: str) -> str:
     """Encrypt sensitive Google data (client secrets, tokens)"""
-    if not data:
-        return ""
-    
-    key = get_encryption_key()
-    f = Fernet(key)
-    encrypted_data = f.encrypt(data.encode())
-    return base64.urlsafe_b64encode(encrypted_data).decode()
+    return GOOGLE_KEYRING.encrypt(data)
 
 def decrypt_sensitive_data(encrypted_data: str) -> Optional[str]:
-    """Decrypt sensitive Google data"""
-    if not encrypted_data:
-        return None
-    
-    try:
-        key = get_encryption_key()
-        f = Fernet(key)
-        decoded_data = base64.urlsafe_b64decode(encrypted_data.encode())
-        decrypted_data = f.decrypt(decoded_data)
-        return decrypted_data.decode()
-    except Exception as e:
-        print(f"Failed to decrypt data: {e}")
-        return None
+    """Decrypt sensitive Google data (with the current or a previous SECRET_KEY)"""
+    return GOOGLE_KEYRING.decrypt(encrypted_data)
 
 def encrypt_client_secret(client_secret: str) -> str:
     """Encrypt Google OAuth client secret for storage"""
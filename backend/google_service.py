@@ -7,19 +7,27 @@ import asyncio
 import re
 import base64
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
+import logging
+import time
 import httpx
+from http_clients import get_http_client
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from email.utils import parseaddr
+from email.utils import getaddresses, parseaddr
 
 from models import GoogleOrganizationConfig, GoogleUserConnection, EmailThread, EmailMessage, Contact
+from calendar_sync import calendar_sync_window, delete_calendar_events, event_row, upsert_calendar_events
+from contact_sync import contact_row, finish_stats, new_stats, upsert_contacts
 from google_encryption import decrypt_client_secret, decrypt_access_token, decrypt_refresh_token, encrypt_access_token, encrypt_refresh_token
-from schemas import EmailMessageCreate
+from email_threading import parse_message_ids, subject_hash
+
+logger = logging.getLogger(__name__)
 
 # Google OAuth2 endpoints
 GOOGLE_OAUTH_AUTHORIZE_URL = "https://accounts.google.com/o/oauth2/v2/auth"
 GOOGLE_OAUTH_TOKEN_URL = "https://oauth2.googleapis.com/token"
-GOOGLE_API_BASE = "https://www.googleapis.com"
+GOOGLE_API_BASE = os.environ.get("GOOGLE_API_BASE_URL", "https://www.googleapis.com")
 GMAIL_API = f"{GOOGLE_API_BASE}/gmail/v1"
 CALENDAR_API = f"{GOOGLE_API_BASE}/calendar/v3"
 PEOPLE_API = f"{GOOGLE_API_BASE}/people/v1"
@@ -40,19 +48,28 @@ GOOGLE_SCOPES = [
     "https://www.googleapis.com/auth/contacts.readonly",
 ]
 
+GOOGLE_MAX_RETRIES = 3
+GMAIL_SYNC_PAGE_SIZE = int(os.environ.get("GMAIL_SYNC_PAGE_SIZE", "100"))
+GMAIL_SYNC_INITIAL_DAYS = 7  # How far back the first sync reaches
+GMAIL_FETCH_CONCURRENCY = int(os.environ.get("GMAIL_FETCH_CONCURRENCY", "10"))  # Message fetches in flight per mailbox
+CALENDAR_SYNC_PAGE_SIZE = int(os.environ.get("GOOGLE_CALENDAR_SYNC_PAGE_SIZE", "250"))
+CONTACTS_SYNC_PAGE_SIZE = int(os.environ.get("GOOGLE_CONTACTS_SYNC_PAGE_SIZE", "1000"))  # People API maximum
+CONTACT_PERSON_FIELDS = "names,emailAddresses,phoneNumbers,organizations"
+
 class GoogleService:
-    def __init__(self, user_connection: GoogleUserConnection, org_config: Optional[GoogleOrganizationConfig] = None):
+    def __init__(self, user_connection: GoogleUserConnection, org_config: Optional[GoogleOrganizationConfig] = None, client: Optional[httpx.AsyncClient] = None):
         self.user_connection = user_connection
         self.org_config = org_config
         self.access_token = None
-        self.client = httpx.AsyncClient()
+        # Shared Google APIs connection pool; it outlives this service, so it is not closed on exit
+        self.client = client or get_http_client("google")
         
     async def __aenter__(self):
         await self.ensure_valid_token()
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.client.aclose()
+        pass
         
     async def ensure_valid_token(self):
         """Ensure we have a valid access token, refreshing if necessary"""
@@ -108,6 +125,18 @@ class GoogleService:
             "Content-Type": "application/json"
         }
         
+    async def api_get(self, url: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        """GET from a Google API, waiting out rate limiting (429/503 with Retry-After)"""
+        for attempt in range(GOOGLE_MAX_RETRIES + 1):
+            response = await self.client.get(url, headers=self.get_headers(), params=params)
+            if response.status_code not in (429, 503) or attempt == GOOGLE_MAX_RETRIES:
+                return response
+            retry_after = response.headers.get("Retry-After", "")
+            delay = int(retry_after) if retry_after.isdigit() else 2 ** attempt
+            logger.info(f"Google API throttled {self.user_connection.google_email} ({response.status_code}), retrying in {delay}s")
+            await asyncio.sleep(delay)
+        return response
+        
     async def get_user_info(self):
         """Get user information from Google"""
         response = await self.client.get(
@@ -127,9 +156,8 @@ class GoogleService:
             "q": query
         }
         
-        response = await self.client.get(
+        response = await self.api_get(
             f"{GMAIL_API}/users/me/messages",
-            headers=self.get_headers(),
             params=params
         )
         
@@ -140,9 +168,8 @@ class GoogleService:
             
     async def get_message(self, message_id: str):
         """Get a specific Gmail message"""
-        response = await self.client.get(
-            f"{GMAIL_API}/users/me/messages/{message_id}",
-            headers=self.get_headers()
+        response = await self.api_get(
+            f"{GMAIL_API}/users/me/messages/{message_id}"
         )
         
         if response.status_code == 200:
@@ -197,9 +224,8 @@ class GoogleService:
             "orderBy": "startTime"
         }
         
-        response = await self.client.get(
+        response = await self.api_get(
             f"{CALENDAR_API}/calendars/primary/events",
-            headers=self.get_headers(),
             params=params
         )
         
@@ -208,6 +234,95 @@ class GoogleService:
         else:
             raise Exception(f"Failed to list calendar events: {response.status_code}")
             
+    async def sync_calendar_events(self, db: Session) -> int:
+        """
+        Sync the primary calendar into calendar_events.
+        
+        The first sync lists the sync window; later syncs pass the stored
+        nextSyncToken so Google returns only changed and cancelled events.
+        Every page is upserted in bulk and committed. Returns the number of
+        events written.
+        """
+        try:
+            synced_count = None
+            if self.user_connection.calendar_sync_token:
+                synced_count = await self._sync_calendar_pages(db, {"syncToken": self.user_connection.calendar_sync_token})
+            if synced_count is None:
+                # No token, or Google expired it: drop this calendar's copy and list the window again
+                delete_calendar_events(db, "google", self.user_connection.user_id)
+                time_min, time_max = calendar_sync_window()
+                synced_count = await self._sync_calendar_pages(db, {
+                    "timeMin": time_min.isoformat(timespec="seconds") + "Z",
+                    "timeMax": time_max.isoformat(timespec="seconds") + "Z",
+                })
+                
+            self.user_connection.last_calendar_sync = datetime.utcnow()
+            self.user_connection.last_sync_error = None
+            db.commit()
+            
+            return synced_count
+            
+        except Exception as e:
+            self.user_connection.sync_error_count = (self.user_connection.sync_error_count or 0) + 1
+            self.user_connection.last_sync_error = str(e)
+            raise
+            
+    async def _sync_calendar_pages(self, db: Session, params: Dict[str, Any]) -> Optional[int]:
+        """Follow events.list pages and store nextSyncToken; None if the sync token has expired"""
+        params = {**params, "singleEvents": True, "maxResults": CALENDAR_SYNC_PAGE_SIZE}
+        synced_count = 0
+        
+        while True:
+            response = await self.api_get(f"{CALENDAR_API}/calendars/primary/events", params=params)
+            if response.status_code == 410 and "syncToken" in params:
+                logger.info(f"Google Calendar sync token expired for {self.user_connection.google_email}, resyncing")
+                self.user_connection.calendar_sync_token = None
+                return None
+            if response.status_code != 200:
+                raise Exception(f"Failed to sync calendar events: {response.status_code} - {response.text[:200]}")
+                
+            page = response.json()
+            rows, cancelled = [], []
+            for item in page.get("items", []):
+                if item.get("status") == "cancelled":
+                    cancelled.append(item["id"])
+                elif item.get("start"):
+                    rows.append(self._calendar_event_row(item))
+            delete_calendar_events(db, "google", self.user_connection.user_id, cancelled)
+            synced_count += upsert_calendar_events(db, self.user_connection.organization_id, rows)
+            
+            if not page.get("nextPageToken"):
+                self.user_connection.calendar_sync_token = page.get("nextSyncToken")
+                db.commit()
+                return synced_count
+            db.commit()
+            params["pageToken"] = page["nextPageToken"]
+            
+    def _calendar_event_row(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """A calendar_events row for a Google Calendar event"""
+        is_all_day = "date" in item["start"]
+        start_time = self._calendar_time(item["start"])
+        return event_row(
+            organization_id=self.user_connection.organization_id,
+            user_id=self.user_connection.user_id,
+            source="google",
+            external_id=item["id"],
+            title=item.get("summary"),
+            start_time=start_time,
+            end_time=self._calendar_time(item["end"]) if item.get("end") else start_time,
+            description=item.get("description"),
+            location=item.get("location"),
+            is_all_day=is_all_day,
+            attendee_emails=[attendee.get("email") for attendee in item.get("attendees", []) if not attendee.get("self")],
+        )
+        
+    @staticmethod
+    def _calendar_time(value: Dict[str, str]) -> datetime:
+        """A Google event start/end as naive UTC (all-day events start at midnight)"""
+        if "dateTime" in value:
+            return datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00")).astimezone(timezone.utc).replace(tzinfo=None)
+        return datetime.fromisoformat(value["date"])
+        
     async def get_contacts(self, page_size: int = 100):
         """Get contacts from Google People API"""
         params = {
@@ -215,9 +330,8 @@ class GoogleService:
             "personFields": "names,emailAddresses,phoneNumbers,organizations,addresses"
         }
         
-        response = await self.client.get(
+        response = await self.api_get(
             f"{PEOPLE_API}/people/me/connections",
-            headers=self.get_headers(),
             params=params
         )
         
@@ -226,109 +340,428 @@ class GoogleService:
         else:
             raise Exception(f"Failed to get contacts: {response.status_code}")
             
-    async def sync_gmail_messages(self, db: Session, since_date: datetime = None):
-        """Sync Gmail messages to the CRM"""
-        if not since_date:
-            since_date = self.user_connection.last_gmail_sync or datetime.utcnow() - timedelta(days=7)
-            
-        # Build query based on privacy settings
-        query_parts = [f"after:{since_date.strftime('%Y/%m/%d')}"]
+    async def sync_contacts(self, db: Session) -> Dict[str, Any]:
+        """
+        Import the user's Google contacts into the CRM.
+        
+        Pages through people.connections; the first import reads the whole
+        address book and later ones pass the stored nextSyncToken so only
+        changed people come back. Every page is upserted in bulk and
+        committed. Returns the sync statistics.
+        """
+        started = time.perf_counter()
+        stats = new_stats()
         
-        if self.user_connection.sync_only_crm_contacts:
-            # This would need to be implemented with actual contact emails
-            pass
+        try:
+            params = {
+                "personFields": CONTACT_PERSON_FIELDS,
+                "pageSize": CONTACTS_SYNC_PAGE_SIZE,
+                "requestSyncToken": True,
+            }
+            if self.user_connection.contacts_sync_token:
+                params["syncToken"] = self.user_connection.contacts_sync_token
+            stats["full_sync"] = "syncToken" not in params
+                
+            while True:
+                response = await self.api_get(f"{PEOPLE_API}/people/me/connections", params=params)
+                if response.status_code == 410 and "syncToken" in params:
+                    # Sync tokens expire after a week; read the whole address book again
+                    logger.info(f"Google contacts sync token expired for {self.user_connection.google_email}, resyncing")
+                    params.pop("syncToken")
+                    params.pop("pageToken", None)
+                    stats["full_sync"] = True
+                    continue
+                if response.status_code != 200:
+                    raise Exception(f"Failed to sync contacts: {response.status_code} - {response.text[:200]}")
+                    
+                page = response.json()
+                rows = [
+                    self._contact_row(person) for person in page.get("connections", [])
+                    if not (person.get("metadata") or {}).get("deleted")
+                ]
+                upsert_contacts(db, self.user_connection.organization_id, self.user_connection.user_id, rows, stats)
+                
+                if not page.get("nextPageToken"):
+                    self.user_connection.contacts_sync_token = page.get("nextSyncToken")
+                    self.user_connection.last_contacts_sync = datetime.utcnow()
+                    db.commit()
+                    break
+                db.commit()
+                params["pageToken"] = page["nextPageToken"]
+                
+            finish_stats(stats, started)
+            logger.info(f"Google contacts sync for {self.user_connection.google_email}: {stats}")
+            return stats
             
-        # Exclude domains
-        for domain in self.user_connection.excluded_email_domains or []:
-            query_parts.append(f"-from:*@{domain} -to:*@{domain}")
+        except Exception as e:
+            self.user_connection.sync_error_count = (self.user_connection.sync_error_count or 0) + 1
+            self.user_connection.last_sync_error = str(e)
+            raise
             
-        # Exclude keywords
-        for keyword in self.user_connection.excluded_email_keywords or []:
-            query_parts.append(f'-"{keyword}"')
+    @staticmethod
+    def _contact_row(person: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """A normalized contact from a People API person (primary values first)"""
+        def primary_first(values):
+            return sorted(values or [], key=lambda value: not (value.get("metadata") or {}).get("primary"))
             
-        query = " ".join(query_parts)
+        name = next(iter(primary_first(person.get("names"))), {})
+        phone = next(iter(primary_first(person.get("phoneNumbers"))), {})
+        organization = next(iter(primary_first(person.get("organizations"))), {})
+        return contact_row(
+            emails=[email.get("value") for email in primary_first(person.get("emailAddresses"))],
+            first_name=name.get("givenName"),
+            last_name=name.get("familyName"),
+            display_name=name.get("displayName"),
+            phone=phone.get("canonicalForm") or phone.get("value"),
+            title=organization.get("title"),
+            company_name=organization.get("name"),
+        )
         
-        try:
-            messages = await self.list_messages(query=query, max_results=50)
+    async def get_profile(self) -> Dict[str, Any]:
+        """Get the mailbox profile (address, totals and current historyId)"""
+        response = await self.api_get(f"{GMAIL_API}/users/me/profile")
+        
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"Failed to get Gmail profile: {response.status_code}")
+            
+    async def sync_gmail_messages(self, db: Session, since_date: datetime = None) -> int:
+        """
+        Sync Gmail messages to the CRM.
+        
+        The first sync lists messages received since since_date; later syncs
+        read only what was added after the stored historyId through
+        users.history.list. Message bodies are fetched concurrently and every
+        page is written in bulk and committed. Returns the number of messages
+        stored.
+        """
+        if not since_date:
+            since_date = self.user_connection.last_gmail_sync or datetime.utcnow() - timedelta(days=GMAIL_SYNC_INITIAL_DAYS)
             
-            for msg_ref in messages:
-                msg = await self.get_message(msg_ref["id"])
-                await self._process_gmail_message(db, msg)
+        try:
+            synced_count, history_current = 0, False
+            if self.user_connection.gmail_history_id:
+                synced_count, history_current = await self._sync_gmail_history(db)
+            if not history_current:
+                # Messages stored from history pages are skipped by the full sync, so the counts add up
+                synced_count += await self._sync_gmail_full(db, since_date)
                 
             # Update last sync time
             self.user_connection.last_gmail_sync = datetime.utcnow()
+            self.user_connection.last_sync_error = None
+            db.commit()
+            
+            return synced_count
             
         except Exception as e:
-            self.user_connection.sync_error_count += 1
+            self.user_connection.sync_error_count = (self.user_connection.sync_error_count or 0) + 1
             self.user_connection.last_sync_error = str(e)
             raise
             
-    async def _process_gmail_message(self, db: Session, gmail_message: Dict[str, Any]):
-        """Process a Gmail message and save it to the CRM"""
-        # Extract message details
-        headers = {h["name"]: h["value"] for h in gmail_message["payload"].get("headers", [])}
-        
-        # Parse email addresses
-        from_email = parseaddr(headers.get("From", ""))[1]
-        to_emails = [parseaddr(addr.strip())[1] for addr in headers.get("To", "").split(",")]
-        
-        # Extract body
-        body = self._extract_body_from_gmail(gmail_message["payload"])
-        
-        # Check if we should sync this message
-        if not self._should_sync_message(from_email, to_emails):
-            return
-            
-        # Find or create thread
-        thread_id = headers.get("Message-ID", gmail_message["id"])
-        in_reply_to = headers.get("In-Reply-To")
-        
-        # Create email message
-        email_data = EmailMessageCreate(
-            sender_email=from_email,
-            recipient_emails=to_emails,
-            subject=headers.get("Subject", ""),
-            body=body,
-            thread_id=thread_id,
-            in_reply_to=in_reply_to,
-            message_id=gmail_message["id"],
-            sent_at=datetime.fromtimestamp(int(gmail_message["internalDate"]) / 1000),
-            source="gmail",
-            direction="inbound" if from_email != self.user_connection.google_email else "outbound"
-        )
+    async def _sync_gmail_full(self, db: Session, since_date: datetime) -> int:
+        """List messages since since_date page by page, then start history from the mailbox's current historyId"""
+        # Take the historyId before listing so nothing that arrives meanwhile is missed
+        history_id = (await self.get_profile()).get("historyId")
         
-        # Save to database (implementation would go here)
-        # This would involve finding/creating contacts, threads, etc.
-        
-    def _extract_body_from_gmail(self, payload: Dict[str, Any]) -> str:
-        """Extract body from Gmail message payload"""
-        body = ""
-        
-        if "parts" in payload:
-            for part in payload["parts"]:
-                if part["mimeType"] == "text/plain":
-                    data = part["body"]["data"]
-                    body = base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
-                    break
-        elif payload.get("body", {}).get("data"):
-            body = base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8", errors="ignore")
+        query_parts = [f"after:{since_date.strftime('%Y/%m/%d')}"]
+        for domain in self.user_connection.excluded_email_domains or []:
+            query_parts.append(f"-from:*@{domain} -to:*@{domain}")
+        for keyword in self.user_connection.excluded_email_keywords or []:
+            query_parts.append(f'-"{keyword}"')
+        if not self.user_connection.include_sent_emails:
+            query_parts.append("-in:sent")
             
-        return body
-        
-    def _should_sync_message(self, from_email: str, to_emails: List[str]) -> bool:
-        """Check if message should be synced based on privacy settings"""
-        all_emails = [from_email] + to_emails
+        params = {"q": " ".join(query_parts), "maxResults": GMAIL_SYNC_PAGE_SIZE}
+        synced_count = 0
         
-        # Check excluded domains
-        for email in all_emails:
-            domain = email.split("@")[-1] if "@" in email else ""
-            if domain in (self.user_connection.excluded_email_domains or []):
-                return False
+        while True:
+            response = await self.api_get(f"{GMAIL_API}/users/me/messages", params=params)
+            if response.status_code != 200:
+                raise Exception(f"Failed to list messages: {response.status_code} - {response.text[:200]}")
                 
-        # If sync_only_crm_contacts is enabled, would need to check if any email is in CRM
-        # This would require database lookup
+            page = response.json()
+            message_ids = [ref["id"] for ref in page.get("messages", [])]
+            synced_count += self._store_gmail_page(db, await self._fetch_messages(message_ids))
+            
+            if not page.get("nextPageToken"):
+                break
+            params["pageToken"] = page["nextPageToken"]
+            
+        self.user_connection.gmail_history_id = history_id
+        db.commit()
+        return synced_count
+        
+    async def _sync_gmail_history(self, db: Session) -> Tuple[int, bool]:
+        """
+        Store messages added since the stored historyId. Returns (stored, complete);
+        complete is False if Gmail no longer has that history and a full sync is needed.
+        """
+        params = {
+            "startHistoryId": self.user_connection.gmail_history_id,
+            "historyTypes": "messageAdded",
+            "maxResults": GMAIL_SYNC_PAGE_SIZE,
+        }
+        synced_count = 0
+        
+        while True:
+            response = await self.api_get(f"{GMAIL_API}/users/me/history", params=params)
+            if response.status_code == 404:
+                # History is only kept for about a week; fall back to a full sync
+                logger.info(
+                    f"Gmail historyId expired for {self.user_connection.google_email} "
+                    f"after {synced_count} messages, resyncing"
+                )
+                self.user_connection.gmail_history_id = None
+                return synced_count, False
+            if response.status_code != 200:
+                raise Exception(f"Failed to list history: {response.status_code} - {response.text[:200]}")
+                
+            page = response.json()
+            message_ids = []
+            for record in page.get("history", []):
+                for added in record.get("messagesAdded", []):
+                    message = added.get("message") or {}
+                    if message.get("id") and message["id"] not in message_ids and self._is_synced_label(message.get("labelIds")):
+                        message_ids.append(message["id"])
+            synced_count += self._store_gmail_page(db, await self._fetch_messages(message_ids))
+            
+            if not page.get("nextPageToken"):
+                # The final page carries the mailbox's latest historyId
+                if page.get("historyId"):
+                    self.user_connection.gmail_history_id = str(page["historyId"])
+                db.commit()
+                return synced_count, True
+            params["pageToken"] = page["nextPageToken"]
+            
+    async def _fetch_messages(self, message_ids: List[str]) -> List[Dict[str, Any]]:
+        """Fetch full messages concurrently, at most GMAIL_FETCH_CONCURRENCY at a time"""
+        semaphore = asyncio.Semaphore(GMAIL_FETCH_CONCURRENCY)
+        
+        async def fetch(message_id: str) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                response = await self.api_get(f"{GMAIL_API}/users/me/messages/{message_id}", params={"format": "full"})
+            if response.status_code == 404:
+                return None  # Deleted between listing and fetching
+            if response.status_code != 200:
+                raise Exception(f"Failed to get message: {response.status_code}")
+            return response.json()
+            
+        messages = await asyncio.gather(*(fetch(message_id) for message_id in message_ids))
+        return [message for message in messages if message is not None]
+        
+    def _store_gmail_page(self, db: Session, messages: List[Dict[str, Any]]) -> int:
+        """
+        Write one page of Gmail messages to the CRM and commit.
+        
+        Existing messages, contacts and threads for the whole page are each
+        resolved with one query; new rows are inserted in bulk.
+        """
+        connection = self.user_connection
+        organization_id = connection.organization_id
+        own_address = (connection.google_email or "").lower()
+        
+        candidates = []
+        for msg in messages:
+            if not self._is_synced_label(msg.get("labelIds")):
+                continue
+            headers = {h["name"].lower(): h["value"] for h in (msg.get("payload") or {}).get("headers", [])}
+            sender_name, sender_email = parseaddr(headers.get("from", ""))
+            sender_email = sender_email.lower()
+            if sender_email == own_address or "SENT" in (msg.get("labelIds") or []):
+                if not connection.include_sent_emails:
+                    continue
+                direction = "outgoing"
+                recipients = getaddresses([headers.get("to", "")])
+                contact_name, contact_email = recipients[0] if recipients else ("", "")
+            else:
+                direction = "incoming"
+                contact_name, contact_email = sender_name, sender_email
+            contact_email = contact_email.strip().lower()
+            subject = headers.get("subject") or "No Subject"
+            if not contact_email or contact_email == own_address or self._is_excluded(contact_email, subject):
+                continue
+            candidates.append({
+                "msg": msg,
+                "headers": headers,
+                "direction": direction,
+                "sender_name": sender_name,
+                "contact_email": contact_email,
+                "contact_name": contact_name,
+                "subject": subject,
+            })
+        if not candidates:
+            return 0
+            
+        # Skip messages already synced
+        existing_ids = {
+            message_id for (message_id,) in db.query(EmailMessage.message_id).filter(
+                EmailMessage.message_id.in_([f"gmail_{c['msg']['id']}" for c in candidates])
+            )
+        }
+        candidates = [c for c in candidates if f"gmail_{c['msg']['id']}" not in existing_ids]
+        if not candidates:
+            return 0
+            
+        # Resolve contacts for the whole page
+        contacts = {}
+        for contact in db.query(Contact).filter(
+            Contact.organization_id == organization_id,
+            func.lower(Contact.email).in_({c["contact_email"] for c in candidates})
+        ).order_by(Contact.id.desc()):
+            contacts[contact.email.lower()] = contact  # Lowest id wins, as in find_contact_by_email
+            
+        new_contacts = []
+        for c in candidates:
+            if c["contact_email"] in contacts or connection.sync_only_crm_contacts:
+                continue
+            name_parts = c["contact_name"].split() if c["contact_name"] else []
+            contact = Contact(
+                first_name=name_parts[0] if name_parts else "Unknown",
+                last_name=" ".join(name_parts[1:]) if len(name_parts) > 1 else "Contact",
+                email=c["contact_email"],
+                organization_id=organization_id,
+                status="Active",
+                owner_id=connection.user_id,  # Set owner to the user who created via sync
+                shared_with_team=False  # Private by default
+            )
+            contacts[c["contact_email"]] = contact
+            new_contacts.append(contact)
+        if new_contacts:
+            db.add_all(new_contacts)
+            db.flush()
+            
+        candidates = [c for c in candidates if c["contact_email"] in contacts]
+        if not candidates:
+            db.commit()
+            return 0
+            
+        # Threads already holding a message this page replies to
+        referenced_threads = {}
+        referenced_ids = {
+            message_id
+            for c in candidates
+            for message_id in parse_message_ids(c["headers"].get("in-reply-to"), c["headers"].get("references"))
+        }
+        if referenced_ids:
+            for internet_message_id, thread in db.query(EmailMessage.internet_message_id, EmailThread).join(
+                EmailThread, EmailThread.id == EmailMessage.thread_id
+            ).filter(
+                EmailThread.organization_id == organization_id,
+                EmailMessage.internet_message_id.in_(referenced_ids)
+            ):
+                referenced_threads[internet_message_id] = thread
+                
+        # Threads by (contact, normalized subject)
+        subject_threads = {}
+        for thread in db.query(EmailThread).filter(
+            EmailThread.organization_id == organization_id,
+            EmailThread.contact_id.in_({contacts[c["contact_email"]].id for c in candidates}),
+            EmailThread.normalized_subject_hash.in_({subject_hash(c["subject"]) for c in candidates})
+        ).order_by(EmailThread.updated_at.asc()):
+            subject_threads[(thread.contact_id, thread.normalized_subject_hash)] = thread  # Most recent wins
+            
+        # Oldest first, so replies within the page find the thread their parent started
+        # and each thread's preview ends on its newest message
+        candidates.sort(key=lambda c: int(c["msg"].get("internalDate") or 0))
+        new_threads = []
+        for c in candidates:
+            contact = contacts[c["contact_email"]]
+            key = (contact.id, subject_hash(c["subject"]))
+            thread = next(
+                (referenced_threads[message_id]
+                 for message_id in parse_message_ids(c["headers"].get("in-reply-to"), c["headers"].get("references"))
+                 if message_id in referenced_threads),
+                None
+            ) or subject_threads.get(key)
+            if thread is None:
+                thread = EmailThread(
+                    subject=c["subject"],
+                    normalized_subject_hash=key[1],
+                    contact_id=contact.id,
+                    organization_id=organization_id,
+                    message_count=0,
+                    owner_id=connection.user_id,  # Set owner to the user who synced the email
+                    is_private=True  # Private by default
+                )
+                new_threads.append(thread)
+            subject_threads[key] = thread
+            if c["headers"].get("message-id"):
+                referenced_threads[c["headers"]["message-id"]] = thread
+            c["thread"] = thread
+        if new_threads:
+            db.add_all(new_threads)
+            db.flush()
+            
+        new_messages = []
+        now = datetime.utcnow()
+        for c in candidates:
+            msg, thread = c["msg"], c["thread"]
+            body = self._extract_body_from_gmail(msg.get("payload") or {}) or msg.get("snippet", "")
+            
+            new_messages.append({
+                "thread_id": thread.id,
+                "sender": (c["sender_name"] or c["headers"].get("from") or "Unknown") if c["direction"] == "incoming" else (connection.google_display_name or connection.google_email),
+                "content": body,
+                "direction": c["direction"],
+                "message_id": f"gmail_{msg['id']}",
+                "internet_message_id": c["headers"].get("message-id"),
+                "created_at": self._gmail_message_time(msg),
+            })
+            
+            # Update thread
+            thread.message_count = (thread.message_count or 0) + 1
+            preview = re.sub(r'\s+', ' ', body).strip()
+            thread.preview = preview[:100] + ("..." if len(preview) > 100 else "")
+            thread.updated_at = now
+            
+        db.bulk_insert_mappings(EmailMessage, new_messages)
+        db.commit()
+        return len(new_messages)
+        
+    @staticmethod
+    def _is_synced_label(label_ids: Optional[List[str]]) -> bool:
+        """Drafts, spam and trash never reach the CRM"""
+        return not set(label_ids or []) & {"DRAFT", "SPAM", "TRASH"}
+        
+    def _is_excluded(self, contact_email: str, subject: str) -> bool:
+        """Apply the connection's excluded domains and keywords"""
+        excluded_domains = [d.lower() for d in self.user_connection.excluded_email_domains or []]
+        if excluded_domains and contact_email.split("@")[-1] in excluded_domains:
+            return True
+        keywords = self.user_connection.excluded_email_keywords or []
+        if keywords:
+            subject = subject.lower()
+            if any(keyword.lower() in subject for keyword in keywords):
+                return True
+        return False
+        
+    @staticmethod
+    def _gmail_message_time(msg: Dict[str, Any]) -> datetime:
+        """When Gmail received the message, as naive UTC"""
+        internal_date = msg.get("internalDate")
+        if not internal_date:
+            return datetime.utcnow()
+        return datetime.utcfromtimestamp(int(internal_date) / 1000)
         
-        return True
+    def _extract_body_from_gmail(self, payload: Dict[str, Any]) -> str:
+        """Extract the body from a Gmail message payload, preferring text/plain over HTML"""
+        parts = {}
+        pending = [payload]
+        while pending:
+            part = pending.pop(0)
+            pending.extend(part.get("parts") or [])
+            mime_type = part.get("mimeType", "")
+            data = (part.get("body") or {}).get("data")
+            if data and mime_type in ("text/plain", "text/html") and mime_type not in parts:
+                parts[mime_type] = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)).decode("utf-8", errors="ignore")
+                
+        if "text/plain" in parts:
+            return parts["text/plain"]
+        if "text/html" in parts:
+            text = re.sub('<[^<]+?>', '', parts["text/html"])
+            return re.sub(r'\s+', ' ', text).strip()
+        return ""
 
 # Utility functions for OAuth flow
 def get_google_auth_url(redirect_uri: str, state: str) -> str:
@@ -362,10 +795,9 @@ async def exchange_code_for_tokens(code: str, redirect_uri: str) -> Dict[str, An
         "grant_type": "authorization_code"
     }
     
-    async with httpx.AsyncClient() as client:
-        response = await client.post(GOOGLE_OAUTH_TOKEN_URL, data=data)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Failed to exchange code: {response.status_code} - {response.text}")
\ No newline at end of file
+    response = await get_http_client("google").post(GOOGLE_OAUTH_TOKEN_URL, data=data)
+    
+    if response.status_code == 200:
+        return response.json()
+    else:
+        raise Exception(f"Failed to exchange code: {response.status_code} - {response.text}")
\ No newline at end of file
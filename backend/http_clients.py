@@ -0,0 +1,151 @@
+"""
+Shared outbound HTTP clients for NotHubSpot CRM
+One pooled httpx client per upstream (SendGrid, Microsoft Graph, Google APIs,
+OpenAI) with keep-alive, a per-upstream connection limit and timeouts, so
+requests reuse warm TLS connections instead of handshaking every time.
+
+Clients are opened in the FastAPI lifespan and closed on shutdown. Async
+clients are bound to the event loop that created them, so code running its
+own loop (e.g. a scheduler job under asyncio.run) gets separate clients for
+that loop and should call close_http_clients() before the loop ends.
+
+Tests and scripts can swap in a mock for any upstream:
+
+    with http_clients.override("sendgrid", httpx.AsyncClient(transport=httpx.MockTransport(handler))):
+        ...
+"""
+import asyncio
+import logging
+import os
+import weakref
+from contextlib import contextmanager
+from typing import Dict, Iterator, NamedTuple, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamSettings(NamedTuple):
+    max_connections: int
+    max_keepalive_connections: int
+    timeout: float
+    connect_timeout: float = 10.0
+
+
+# Defaults per upstream; each limit can be overridden with <NAME>_HTTP_MAX_CONNECTIONS / <NAME>_HTTP_TIMEOUT
+UPSTREAMS: Dict[str, UpstreamSettings] = {
+    "sendgrid": UpstreamSettings(max_connections=50, max_keepalive_connections=20, timeout=60.0),
+    "graph": UpstreamSettings(max_connections=50, max_keepalive_connections=20, timeout=60.0),
+    "google": UpstreamSettings(max_connections=50, max_keepalive_connections=20, timeout=60.0),
+    "openai": UpstreamSettings(max_connections=20, max_keepalive_connections=10, timeout=120.0),
+    "default": UpstreamSettings(max_connections=20, max_keepalive_connections=10, timeout=30.0),
+}
+
+KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+
+
+def _http2_enabled() -> bool:
+    """HTTP/2 is opt-in (HTTP_CLIENT_HTTP2=true); h2 comes with the httpx[http2] requirement"""
+    if os.environ.get("HTTP_CLIENT_HTTP2", "false").lower() != "true":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP_CLIENT_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+        return False
+    return True
+
+
+def upstream_settings(name: str) -> UpstreamSettings:
+    settings = UPSTREAMS.get(name, UPSTREAMS["default"])
+    prefix = name.upper()
+    max_connections = int(os.environ.get(f"{prefix}_HTTP_MAX_CONNECTIONS", settings.max_connections))
+    return settings._replace(
+        max_connections=max_connections,
+        max_keepalive_connections=min(settings.max_keepalive_connections, max_connections),
+        timeout=float(os.environ.get(f"{prefix}_HTTP_TIMEOUT", settings.timeout)),
+    )
+
+
+def _client_options(name: str) -> dict:
+    settings = upstream_settings(name)
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive_connections,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        "timeout": httpx.Timeout(settings.timeout, connect=settings.connect_timeout),
+        "http2": _http2_enabled(),
+    }
+
+
+class HTTPClientRegistry:
+    """Pooled httpx clients by upstream name, one set per event loop"""
+
+    def __init__(self):
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+        self._sync_clients: Dict[str, httpx.Client] = {}
+        self._overrides: Dict[str, httpx.AsyncClient] = {}
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """The pooled async client for an upstream on the running event loop"""
+        if name in self._overrides:
+            return self._overrides[name]
+        clients = self._async_clients.setdefault(asyncio.get_running_loop(), {})
+        client = clients.get(name)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(**_client_options(name))
+            clients[name] = client
+        return client
+
+    def get_sync(self, name: str) -> httpx.Client:
+        """A pooled blocking client for an upstream (for SDKs that take an httpx.Client); lives for the process"""
+        client = self._sync_clients.get(name)
+        if client is None or client.is_closed:
+            client = httpx.Client(**_client_options(name))
+            self._sync_clients[name] = client
+        return client
+
+    def open(self, *names: str) -> None:
+        """Create clients for the running loop up front (all known upstreams by default)"""
+        for name in names or UPSTREAMS:
+            self.get(name)
+
+    async def aclose(self) -> None:
+        """Close the async clients belonging to the running event loop"""
+        clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.aclose()
+
+    @contextmanager
+    def override(self, name: str, client: httpx.AsyncClient) -> Iterator[httpx.AsyncClient]:
+        """Serve client for an upstream (on every loop) until the block exits"""
+        previous: Optional[httpx.AsyncClient] = self._overrides.get(name)
+        self._overrides[name] = client
+        try:
+            yield client
+        finally:
+            if previous is None:
+                self._overrides.pop(name, None)
+            else:
+                self._overrides[name] = previous
+
+
+http_clients = HTTPClientRegistry()
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """Shared pooled client for an upstream: sendgrid, graph, google, openai or default"""
+    return http_clients.get(name)
+
+
+def open_http_clients() -> None:
+    """Open the pooled clients on the running loop (FastAPI lifespan startup)"""
+    http_clients.open()
+
+
+async def close_http_clients() -> None:
+    """Close the running loop's pooled clients (lifespan shutdown, or the end of a job's own loop)"""
+    await http_clients.aclose()
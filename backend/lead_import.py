@@ -0,0 +1,417 @@
+"""
+Lead import for NotHubSpot CRM
+People pushed by Clay, LinkedIn Sales Navigator automations and Apollo.io are
+imported a batch at a time (Surfe enrichment events update a single contact). Every row is validated and normalized first; the
+batch then costs one lookup each of its company names, emails and names, one
+bulk insert per table, one bulk update and a single commit, instead of a few
+lookups and commits per person.
+
+Companies are matched on (organization_id, lower(name)) and contacts on
+(organization_id, lower(email)) through the ix_companies_org_lower_name and
+ix_contacts_org_lower_email indexes, then on first name, last name and company
+name. A matched contact only has its blank phone, title and company filled in.
+Existing rows can hold duplicates, so there is no unique key to upsert against;
+on Postgres an organization's imports instead take a transaction-scoped
+advisory lock (organization_locks), so two concurrent pushes, or a push and an
+address book sync, can't both create the same company or contact.
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, insert, tuple_, update
+from sqlalchemy.orm import Session
+
+from ai_response_cache import response_cache
+from entity_matcher import entity_matchers
+from models import Company, Contact, LeadImportLog, LeadSourceIntegration
+from organization_locks import lock_organization
+from phone_utils import format_phone_number
+from retrieval_index import retrieval_indexes
+from schemas import (
+    ApolloPersonPayload, ClayPersonPayload, CompanyCreate, ContactCreate, LinkedInPersonPayload, SurfeEnrichedPerson,
+)
+
+# Fields an import may fill in on an existing contact when the CRM value is blank
+FILLABLE_FIELDS = ("phone", "title", "company_id", "company_name")
+
+
+def extract_people(source: str, body: Dict[str, Any]) -> Tuple[str, List[dict]]:
+    """(event type, person dicts) from a webhook body in any of the formats a source sends"""
+    event_type = "import"
+    if source == "apollo":
+        # Apollo native format: { "event": "contact.created", "data": { ... } }
+        event_type = body.get("event", "import")
+        if "data" in body and isinstance(body["data"], dict):
+            return event_type, [body["data"]]
+    if "people" in body and isinstance(body["people"], list):
+        return event_type, body["people"]
+    if "person" in body and isinstance(body["person"], dict):
+        return event_type, [body["person"]]
+    # Treat the whole body as a single person (flat rows from Clay, CSV rows via Zapier)
+    return event_type, [body]
+
+
+def _split_name(full_name: Optional[str]) -> Tuple[str, str]:
+    parts = (full_name or "").strip().split(" ", 1)
+    return parts[0], parts[1] if len(parts) > 1 else ""
+
+
+def clay_lead(raw: dict) -> Optional[Dict[str, Any]]:
+    p = ClayPersonPayload(**raw)
+    first = (p.first_name or "").strip()
+    last = (p.last_name or "").strip()
+    if not first and not last:
+        return None
+    return _lead(
+        first, last, p.email, p.phone, p.title, p.company_name,
+        notes=f"Imported from Clay. LinkedIn: {p.linkedin_url}" if p.linkedin_url else "Imported from Clay",
+        website=p.company_website or p.company_domain,
+        industry=p.company_industry,
+        city=p.company_city,
+        state=p.company_state,
+    )
+
+
+def linkedin_lead(raw: dict) -> Optional[Dict[str, Any]]:
+    p = LinkedInPersonPayload(**raw)
+    # Sales Navigator exports carry a "Full Name" column instead
+    first = (p.first_name or "").strip()
+    last = (p.last_name or "").strip()
+    if not first and not last and p.full_name:
+        first, last = _split_name(p.full_name)
+    if not first and not last:
+        return None
+
+    notes_parts = []
+    if p.headline:
+        notes_parts.append(f"Headline: {p.headline}")
+    if p.linkedin_url:
+        notes_parts.append(f"LinkedIn: {p.linkedin_url}")
+    if p.location:
+        notes_parts.append(f"Location: {p.location}")
+    if p.company_size:
+        notes_parts.append(f"Company size: {p.company_size}")
+    notes = "Imported from LinkedIn Sales Navigator. " + " | ".join(notes_parts) if notes_parts else "Imported from LinkedIn Sales Navigator"
+
+    return _lead(
+        first, last, p.email, p.phone, p.title, p.company_name,
+        notes=notes,
+        website=p.company_website,
+        industry=p.company_industry,
+    )
+
+
+def apollo_lead(raw: dict) -> Optional[Dict[str, Any]]:
+    p = ApolloPersonPayload(**raw)
+    first = (p.first_name or "").strip()
+    last = (p.last_name or "").strip()
+    if not first and not last and p.name:
+        first, last = _split_name(p.name)
+    if not first and not last:
+        return None
+
+    notes_parts = ["Imported from Apollo.io"]
+    if p.apollo_id:
+        notes_parts.append(f"Apollo ID: {p.apollo_id}")
+    if p.stage:
+        notes_parts.append(f"Apollo Stage: {p.stage}")
+    if p.owner_email:
+        notes_parts.append(f"Apollo Owner: {p.owner_email}")
+    if p.seniority:
+        notes_parts.append(f"Seniority: {p.seniority}")
+    if p.department:
+        notes_parts.append(f"Department: {p.department}")
+    if p.linkedin_url:
+        notes_parts.append(f"LinkedIn: {p.linkedin_url}")
+    location_parts = [x for x in [p.city, p.state, p.country] if x]
+    if location_parts:
+        notes_parts.append(f"Location: {', '.join(location_parts)}")
+    if p.company_employee_count:
+        notes_parts.append(f"Company size: {p.company_employee_count}")
+
+    return _lead(
+        first, last, p.email,
+        (p.mobile_phone or p.phone or "").strip() or None,  # Prefer mobile
+        p.title,
+        (p.company_name or p.organization_name or "").strip() or None,
+        notes=" | ".join(notes_parts),
+        website=(p.company_website or p.company_domain or "").strip() or None,
+        industry=p.company_industry,
+        city=p.company_city,
+        state=p.company_state,
+    )
+
+
+LEAD_PARSERS: Dict[str, Callable[[dict], Optional[Dict[str, Any]]]] = {
+    "clay": clay_lead,
+    "linkedin": linkedin_lead,
+    "apollo": apollo_lead,
+}
+
+
+def _lead(first: str, last: str, email: Optional[str], phone: Optional[str], title: Optional[str],
+          company_name: Optional[str], notes: str, **company_fields) -> Dict[str, Any]:
+    """Validated contact and company rows for one person (raises on invalid data, as create_contact would)"""
+    contact = ContactCreate(
+        first_name=first or "Unknown",
+        last_name=last or "Lead",
+        email=email,
+        phone=phone,
+        title=title,
+        company_name=company_name,
+        status="Lead",
+        notes=notes,
+    ).dict()
+    if contact["phone"]:
+        contact["phone"] = format_phone_number(contact["phone"])
+    company = CompanyCreate(name=company_name, status="Lead", **company_fields).dict() if company_name else None
+    return {"contact": contact, "company": company}
+
+
+def _resolve_companies(db: Session, organization_id: int, leads: List[Dict[str, Any]]) -> Tuple[Dict[str, int], int]:
+    """(company id by lowercased name, companies created), creating the missing ones in one insert"""
+    wanted = {}
+    for lead in leads:
+        if lead["company"]:
+            wanted.setdefault(lead["company"]["name"].lower(), lead["company"])  # First row's details win
+    if not wanted:
+        return {}, 0
+
+    companies = {}
+    for company_id, name in db.query(Company.id, Company.name).filter(
+        Company.organization_id == organization_id,
+        func.lower(Company.name).in_(list(wanted))
+    ).order_by(Company.id.desc()):
+        companies[name.lower()] = company_id  # Lowest id wins
+
+    missing = [key for key in wanted if key not in companies]
+    if missing:
+        created = db.execute(
+            insert(Company).returning(Company.id, sort_by_parameter_order=True),
+            [{**wanted[key], "organization_id": organization_id, "contact_count": 0, "attachment_count": 0} for key in missing]
+        ).scalars().all()
+        companies.update(zip(missing, created))
+    return companies, len(missing)
+
+
+def _existing_contacts(db: Session, organization_id: int, contacts: List[Dict[str, Any]]):
+    """Existing contacts by lowercased email, and contact ids by (first, last, company) and (first, last)"""
+    by_email = {}
+    emails = list({contact["email"].lower() for contact in contacts if contact["email"]})
+    if emails:
+        for contact in db.query(
+            Contact.id, Contact.email, Contact.phone, Contact.title, Contact.company_id, Contact.company_name
+        ).filter(
+            Contact.organization_id == organization_id,
+            func.lower(Contact.email).in_(emails)
+        ).order_by(Contact.id.desc()):
+            by_email[contact.email.lower()] = contact._asdict()  # Lowest id wins
+
+    by_name = {}
+    names = list({(contact["first_name"], contact["last_name"]) for contact in contacts})
+    if not names:
+        return by_email, by_name
+    for contact_id, first, last, company_name in db.query(
+        Contact.id, Contact.first_name, Contact.last_name, Contact.company_name
+    ).filter(
+        Contact.organization_id == organization_id,
+        tuple_(Contact.first_name, Contact.last_name).in_(names)
+    ).order_by(Contact.id.desc()):
+        by_name[(first, last, company_name)] = contact_id
+        by_name[(first, last)] = contact_id
+    return by_email, by_name
+
+
+def _fill_blanks(target: Dict[str, Any], contact: Dict[str, Any]) -> bool:
+    """Copy phone, title and company onto target where it has none; True when something changed"""
+    changed = False
+    for field in ("phone", "title"):
+        if contact[field] and not target[field]:
+            target[field] = contact[field]
+            changed = True
+    if contact["company_id"] and not target["company_id"]:
+        target["company_id"] = contact["company_id"]
+        target["company_name"] = contact["company_name"]
+        changed = True
+    return changed
+
+
+def import_leads(db: Session, integration: LeadSourceIntegration, source: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Import a webhook body's people for integration's organization and log each
+    row. Flushes but does not commit: the caller commits once, so a failure
+    leaves nothing half imported.
+    """
+    organization_id = integration.organization_id
+    event_type, people_raw = extract_people(source, body)
+    parse = LEAD_PARSERS[source]
+    result = {"status": "ok", "created": 0, "updated": 0, "skipped": 0, "errors": 0, "total_received": len(people_raw)}
+
+    logs: List[Dict[str, Any]] = []
+
+    def log(raw, action, contact_id=None, company_id=None, error=None):
+        logs.append({
+            "organization_id": organization_id, "source": source, "event_type": event_type, "raw_payload": raw,
+            "contact_id": contact_id, "company_id": company_id, "action": action, "error_message": error,
+        })
+
+    leads, lead_raws = [], []
+    for raw in people_raw:
+        try:
+            lead = parse(raw)
+        except Exception as e:
+            log(raw, "error", error=str(e))
+            result["errors"] += 1
+            continue
+        if lead is None:
+            log(raw, "skipped", error="No name provided")
+            result["skipped"] += 1
+            continue
+        leads.append(lead)
+        lead_raws.append(raw)
+
+    lock_organization(db, organization_id)
+    companies, companies_created = _resolve_companies(db, organization_id, leads)
+    for lead in leads:
+        lead["contact"]["company_id"] = companies[lead["company"]["name"].lower()] if lead["company"] else None
+    by_email, by_name = _existing_contacts(db, organization_id, [lead["contact"] for lead in leads])
+
+    # Each lead resolves to an existing contact id or an index into new_rows
+    new_rows: List[Dict[str, Any]] = []
+    new_by_email: Dict[str, int] = {}
+    new_by_name: Dict[tuple, int] = {}
+    changed: Dict[int, Dict[str, Any]] = {}
+    resolved = []
+    for lead in leads:
+        contact = lead["contact"]
+        email = contact["email"].lower() if contact["email"] else None
+        name_key = (contact["first_name"], contact["last_name"], contact["company_name"]) if contact["company_name"] \
+            else (contact["first_name"], contact["last_name"])
+        if email in by_email:
+            existing = by_email[email]
+            if _fill_blanks(existing, contact):
+                changed[existing["id"]] = existing
+            resolved.append(("updated", existing["id"], None))
+        elif email in new_by_email:
+            _fill_blanks(new_rows[new_by_email[email]], contact)
+            resolved.append(("updated", None, new_by_email[email]))
+        elif name_key in by_name:
+            resolved.append(("skipped", by_name[name_key], None))
+        elif name_key in new_by_name:
+            resolved.append(("skipped", None, new_by_name[name_key]))
+        else:
+            index = len(new_rows)
+            new_rows.append({**contact, "organization_id": organization_id})
+            if email:
+                new_by_email[email] = index
+            new_by_name[(contact["first_name"], contact["last_name"], contact["company_name"])] = index
+            new_by_name.setdefault((contact["first_name"], contact["last_name"]), index)
+            resolved.append(("created", None, index))
+
+    new_ids = []
+    if new_rows:
+        new_ids = db.execute(insert(Contact).returning(Contact.id, sort_by_parameter_order=True), new_rows).scalars().all()
+    if changed:
+        db.connection().execute(
+            update(Contact).where(Contact.id == bindparam("contact_id")).values(
+                {field: bindparam(f"new_{field}") for field in FILLABLE_FIELDS}
+            ),
+            [{"contact_id": contact_id, **{f"new_{field}": row[field] for field in FILLABLE_FIELDS}}
+             for contact_id, row in changed.items()],
+        )
+
+    company_counts: Dict[int, int] = {}
+    for row in new_rows:
+        if row["company_id"]:
+            company_counts[row["company_id"]] = company_counts.get(row["company_id"], 0) + 1
+    if company_counts:
+        db.connection().execute(
+            update(Company).where(Company.id == bindparam("company")).values(
+                contact_count=func.coalesce(Company.contact_count, 0) + bindparam("added")
+            ),
+            [{"company": company_id, "added": count} for company_id, count in company_counts.items()],
+        )
+
+    for raw, lead, (action, contact_id, index) in zip(lead_raws, leads, resolved):
+        log(raw, action, contact_id if index is None else new_ids[index], lead["contact"]["company_id"])
+        if action in ("created", "updated"):
+            result[action] += 1
+    if logs:
+        db.execute(insert(LeadImportLog.__table__), logs)
+
+    if new_rows or changed or companies_created:
+        # Bulk writes skip the ORM events that keep AI chat's matcher, passages and cached answers current
+        entity_matchers.invalidate(organization_id)
+        retrieval_indexes.invalidate(organization_id)
+        response_cache.invalidate(organization_id)
+
+    setattr(integration, f"{source}_last_import_at", datetime.utcnow())
+    setattr(integration, f"{source}_total_imported", (getattr(integration, f"{source}_total_imported") or 0) + result["created"])
+    db.flush()
+    return result
+
+
+def import_surfe_enrichment(db: Session, integration: LeadSourceIntegration, body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fill in a contact's blank email, phone and title from a Surfe
+    person.enrichment.completed event and log it. The caller commits.
+    """
+    organization_id = integration.organization_id
+    event_type = body.get("eventType", "")
+    person_data = body.get("data", {}).get("person", {})
+
+    # The externalID field of the Surfe request is the NHS contact ID
+    contact = None
+    try:
+        contact = db.query(Contact).filter(
+            Contact.id == int(person_data.get("externalID")),
+            Contact.organization_id == organization_id
+        ).first()
+    except (ValueError, TypeError):
+        pass
+
+    action, error = "skipped", None
+    try:
+        p = SurfeEnrichedPerson(**person_data)
+        changed = False
+
+        if contact:
+            # Update email if we got a valid one and contact doesn't have one
+            if p.emails and not contact.email:
+                valid_emails = [e.email for e in p.emails if e.validationStatus == "VALID" and e.email]
+                if valid_emails:
+                    contact.email = valid_emails[0]
+                    changed = True
+
+            # Update phone if missing
+            if p.mobilePhones and not contact.phone:
+                best_phone = sorted(p.mobilePhones, key=lambda x: x.confidenceScore or 0, reverse=True)
+                if best_phone and best_phone[0].mobilePhone:
+                    contact.phone = best_phone[0].mobilePhone
+                    changed = True
+
+            # Update title if missing
+            if p.jobTitle and not contact.title:
+                contact.title = p.jobTitle
+                changed = True
+
+            if changed:
+                action = "updated"
+
+        integration.surfe_last_enrichment_at = datetime.utcnow()
+        if action == "updated":
+            integration.surfe_total_enriched = (integration.surfe_total_enriched or 0) + 1
+    except Exception as e:
+        action, error = "error", str(e)
+
+    db.add(LeadImportLog(
+        organization_id=organization_id,
+        source="surfe",
+        event_type=event_type,
+        raw_payload=body,
+        contact_id=contact.id if contact and action != "error" else None,
+        action=action,
+        error_message=error,
+    ))
+    db.flush()
+    return {"status": "ok", "action": action}
@@ -0,0 +1,284 @@
+"""
+Background lead-source imports for NotHubSpot CRM
+Clay, Surfe, LinkedIn and Apollo webhooks only authenticate the caller, store
+the raw payload as a lead_import_batches row and answer 202 with its id, so a
+large push never holds the provider's request open (and never gets retried
+for being slow). A pool of workers claims queued batches with SELECT ... FOR
+UPDATE SKIP LOCKED, as the email outbox workers do, and runs the upserts.
+
+Each batch is keyed by (organization, source, provider event ID). A retried
+delivery of the same event finds the existing batch instead of queuing the
+import again. Sources that send no event ID are keyed by a digest of the body
+and the UTC day, so same-day retries are free while a deliberate re-push on a
+later day is imported again. Imports are upserts in one transaction, so a
+batch whose worker died mid-import is simply queued again.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from lead_import import import_leads, import_surfe_enrichment
+from models import LeadImportBatch, LeadSourceIntegration
+
+logger = logging.getLogger(__name__)
+
+# Number of lead import workers started in each app process (0 disables them)
+LEAD_IMPORT_WORKERS = int(os.environ.get("LEAD_IMPORT_WORKERS", "2"))
+# How long an idle worker waits before polling for queued batches again
+LEAD_IMPORT_POLL_SECONDS = float(os.environ.get("LEAD_IMPORT_POLL_SECONDS", "2"))
+# Import attempts per batch before it is marked failed
+LEAD_IMPORT_MAX_ATTEMPTS = int(os.environ.get("LEAD_IMPORT_MAX_ATTEMPTS", "3"))
+# First retry delay; doubles with every further attempt
+LEAD_IMPORT_RETRY_BASE_SECONDS = int(os.environ.get("LEAD_IMPORT_RETRY_BASE_SECONDS", "30"))
+# Batches left in "processing" longer than this belong to a worker that died mid-import
+LEAD_IMPORT_LEASE_SECONDS = int(os.environ.get("LEAD_IMPORT_LEASE_SECONDS", "600"))
+
+# Headers and top-level body fields that carry a provider's event ID
+EVENT_ID_HEADERS = ("X-Event-Id", "Idempotency-Key")
+EVENT_ID_FIELDS = ("event_id", "eventId", "eventID")
+
+_worker_tasks: List[asyncio.Task] = []
+_stop_event: Optional[asyncio.Event] = None
+
+
+def webhook_event_id(headers: Mapping[str, str], body: Dict[str, Any], raw_body: bytes) -> str:
+    """The provider's event ID for a delivery, or a digest of its body for the day"""
+    for header in EVENT_ID_HEADERS:
+        if headers.get(header):
+            return headers[header][:255]
+    for field in EVENT_ID_FIELDS:
+        if body.get(field):
+            return str(body[field])[:255]
+    # Apollo's native envelope: { "id": ..., "event": "contact.created", "data": {...} }
+    if "event" in body and isinstance(body.get("data"), dict) and body.get("id"):
+        return str(body["id"])[:255]
+    return f"sha256:{hashlib.sha256(raw_body).hexdigest()}:{datetime.utcnow().date().isoformat()}"
+
+
+def stage_lead_import(db: Session, organization_id: int, source: str, event_id: str,
+                      payload: Dict[str, Any]) -> Tuple[LeadImportBatch, bool]:
+    """
+    Queue a webhook payload for import and commit. Returns (batch, duplicate);
+    a repeated event returns the batch queued the first time.
+    """
+    row = {
+        "organization_id": organization_id,
+        "source": source,
+        "event_id": event_id,
+        "payload": payload,
+        "status": "queued",
+        "attempts": 0,
+        "next_attempt_at": datetime.utcnow(),
+    }
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        # ON CONFLICT DO NOTHING also covers two concurrent deliveries of the same event
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        inserted_id = db.execute(
+            insert(LeadImportBatch.__table__).values(**row).on_conflict_do_nothing(
+                index_elements=["organization_id", "source", "event_id"]
+            ).returning(LeadImportBatch.__table__.c.id)
+        ).scalar()
+    else:
+        exists = db.query(LeadImportBatch.id).filter_by(
+            organization_id=organization_id, source=source, event_id=event_id
+        ).first()
+        inserted_id = None
+        if not exists:
+            batch = LeadImportBatch(**row)
+            db.add(batch)
+            db.flush()
+            inserted_id = batch.id
+    db.commit()
+
+    batch = db.query(LeadImportBatch).filter(
+        LeadImportBatch.organization_id == organization_id,
+        LeadImportBatch.source == source,
+        LeadImportBatch.event_id == event_id
+    ).first()
+    return batch, inserted_id is None
+
+
+def claim_lead_import_batch(db: Session, worker_id: str) -> Optional[LeadImportBatch]:
+    """
+    Atomically claim the oldest due queued batch for this worker.
+
+    A batch locked by another worker's claim is skipped rather than waited on,
+    and the claimed batch moves to "processing" before the lock is released.
+    """
+    now = datetime.utcnow()
+    batch = db.query(LeadImportBatch).filter(
+        LeadImportBatch.status == "queued",
+        LeadImportBatch.next_attempt_at <= now
+    ).order_by(LeadImportBatch.id).limit(1).with_for_update(skip_locked=True).first()
+
+    if batch is None:
+        db.rollback()
+        return None
+
+    # Conditional on the status too, for databases where FOR UPDATE is a no-op (SQLite)
+    claimed = db.query(LeadImportBatch).filter(
+        LeadImportBatch.id == batch.id,
+        LeadImportBatch.status == "queued"
+    ).update({
+        "status": "processing",
+        "attempts": LeadImportBatch.attempts + 1,
+        "claimed_by": worker_id,
+        "claimed_at": now,
+    }, synchronize_session=False)
+    db.commit()
+    if not claimed:
+        return None
+    db.refresh(batch)
+    return batch
+
+
+def process_lead_import_batch(db: Session, batch: LeadImportBatch) -> None:
+    """Run a claimed batch's import and record the outcome; the import and its completion commit together"""
+    batch_id = batch.id
+    try:
+        integration = db.query(LeadSourceIntegration).filter(
+            LeadSourceIntegration.organization_id == batch.organization_id
+        ).first()
+        if integration is None:
+            raise ValueError(f"Organization {batch.organization_id} has no lead source integration")
+        if batch.source == "surfe":
+            result = import_surfe_enrichment(db, integration, batch.payload)
+        else:
+            result = import_leads(db, integration, batch.source, batch.payload)
+        batch.status = "completed"
+        batch.result = result
+        batch.last_error = None
+        batch.completed_at = datetime.utcnow()
+        db.commit()
+        logger.info(f"Lead import batch {batch_id} ({batch.source}) completed: {result}")
+    except Exception as e:
+        db.rollback()
+        batch = db.query(LeadImportBatch).filter(LeadImportBatch.id == batch_id).first()
+        batch.last_error = str(e)[:1000]
+        if batch.attempts >= LEAD_IMPORT_MAX_ATTEMPTS:
+            batch.status = "failed"
+            batch.completed_at = datetime.utcnow()
+            logger.error(f"Lead import batch {batch_id} failed after {batch.attempts} attempt(s): {e}")
+        else:
+            batch.status = "queued"
+            batch.next_attempt_at = datetime.utcnow() + timedelta(
+                seconds=LEAD_IMPORT_RETRY_BASE_SECONDS * 2 ** (batch.attempts - 1)
+            )
+            logger.warning(f"Lead import batch {batch_id} attempt {batch.attempts} failed, will retry: {e}")
+        db.commit()
+
+
+def recover_stale_lead_imports(db: Session) -> int:
+    """
+    Queue batches held by workers that died mid-import again.
+
+    An import commits together with its batch's completion, so a stale batch
+    wrote nothing and is safe to run again. A batch that has already used all
+    its attempts is marked failed instead, so one that kills its worker (out
+    of memory, a crash, a timeout) is not retried forever.
+    """
+    now = datetime.utcnow()
+    stale = db.query(LeadImportBatch).filter(
+        LeadImportBatch.status == "processing",
+        LeadImportBatch.claimed_at < now - timedelta(seconds=LEAD_IMPORT_LEASE_SECONDS)
+    )
+    failed = stale.filter(LeadImportBatch.attempts >= LEAD_IMPORT_MAX_ATTEMPTS).update({
+        "status": "failed",
+        "last_error": "Worker stopped during the import",
+        "completed_at": now,
+    }, synchronize_session=False)
+    recovered = stale.filter(LeadImportBatch.attempts < LEAD_IMPORT_MAX_ATTEMPTS).update(
+        {"status": "queued", "next_attempt_at": now}, synchronize_session=False
+    )
+    db.commit()
+    if failed:
+        logger.error(f"Marked {failed} stale lead import batch(es) failed after {LEAD_IMPORT_MAX_ATTEMPTS} attempt(s)")
+    if recovered:
+        logger.warning(f"Queued {recovered} stale lead import batch(es) again")
+    return recovered
+
+
+def get_lead_import_status(batch: LeadImportBatch) -> Dict[str, Any]:
+    """A batch's progress as returned by the import-status endpoint"""
+    return {
+        "batch_id": batch.id,
+        "source": batch.source,
+        "event_id": batch.event_id,
+        "status": batch.status,
+        "attempts": batch.attempts,
+        "result": batch.result,
+        "error": batch.last_error,
+        "created_at": batch.created_at.isoformat() if batch.created_at else None,
+        "completed_at": batch.completed_at.isoformat() if batch.completed_at else None,
+    }
+
+
+def run_next_lead_import(worker_id: str) -> bool:
+    """Claim and import one batch (or recover stale ones when none is due); True when a batch was imported"""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        batch = claim_lead_import_batch(db, worker_id)
+        if batch is None:
+            recover_stale_lead_imports(db)
+            return False
+        process_lead_import_batch(db, batch)
+        return True
+    finally:
+        db.close()
+
+
+async def run_lead_import_worker(worker_id: str, stop_event: asyncio.Event) -> None:
+    """Import queued batches until stop_event is set"""
+    logger.info(f"Lead import worker {worker_id} started")
+    while not stop_event.is_set():
+        imported = False
+        try:
+            # Imports are synchronous database work; keep them off the event loop
+            imported = await asyncio.to_thread(run_next_lead_import, worker_id)
+        except Exception as e:
+            logger.error(f"Lead import worker {worker_id} error: {e}", exc_info=True)
+
+        # Keep draining while there is work; otherwise poll again after a pause
+        if not imported:
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=LEAD_IMPORT_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    logger.info(f"Lead import worker {worker_id} stopped")
+
+
+def start_lead_import_workers(worker_count: int = LEAD_IMPORT_WORKERS) -> None:
+    """Start the lead import worker pool on the running event loop"""
+    global _stop_event
+
+    if worker_count <= 0:
+        logger.info("Lead import workers disabled (LEAD_IMPORT_WORKERS=0)")
+        return
+
+    _stop_event = asyncio.Event()
+    process_id = f"{socket.gethostname()}:{os.getpid()}"
+    for n in range(worker_count):
+        task = asyncio.create_task(run_lead_import_worker(f"{process_id}:{n}", _stop_event))
+        _worker_tasks.append(task)
+    logger.info(f"Started {worker_count} lead import worker(s)")
+
+
+async def stop_lead_import_workers() -> None:
+    """Let each worker finish its current batch, then stop the pool"""
+    if _stop_event is None:
+        return
+
+    _stop_event.set()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
+    logger.info("Lead import workers stopped")
@@ -0,0 +1,87 @@
+"""
+Inbound API keys for lead-source webhooks in NotHubSpot CRM
+The Clay, LinkedIn and Apollo keys NHS generates are stored only as SHA-256
+digests, each with a unique index, so authenticating a webhook is one indexed
+lookup of the presented key's digest and a leaked database holds no usable
+keys. Resolved digests are cached in process for
+LEAD_SOURCE_KEY_CACHE_TTL_SECONDS, so a stream of webhook calls usually costs
+no query at all. Rotating a key or changing an integration's settings
+invalidates the organization's entries here; other processes pick the change
+up when their entries expire.
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import LeadSourceIntegration
+
+LEAD_SOURCE_KEY_CACHE_TTL_SECONDS = int(os.environ.get("LEAD_SOURCE_KEY_CACHE_TTL_SECONDS", "60"))
+
+# Digest column and enabled flag per source
+KEY_COLUMNS = {
+    "clay": (LeadSourceIntegration.clay_api_key_hash, LeadSourceIntegration.clay_enabled),
+    "linkedin": (LeadSourceIntegration.linkedin_webhook_api_key_hash, LeadSourceIntegration.linkedin_enabled),
+    "apollo": (LeadSourceIntegration.apollo_api_key_hash, LeadSourceIntegration.apollo_enabled),
+}
+
+
+def hash_api_key(api_key: str) -> str:
+    """Hex SHA-256 of a key, as stored in the *_api_key_hash columns"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+class ApiKeyCache:
+    """Organization id by (source, key digest), with a TTL; only successful lookups are cached"""
+
+    def __init__(self, ttl_seconds: int = LEAD_SOURCE_KEY_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, source: str, digest: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get((source, digest))
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[(source, digest)]
+                return None
+            return entry[1]
+
+    def put(self, source: str, digest: str, organization_id: int) -> None:
+        with self._lock:
+            self._entries[(source, digest)] = (time.monotonic() + self.ttl_seconds, organization_id)
+
+    def invalidate(self, organization_id: Optional[int] = None) -> None:
+        """Forget one organization's keys (all when organization_id is None)"""
+        with self._lock:
+            if organization_id is None:
+                self._entries.clear()
+            else:
+                for key in [key for key, (_, org_id) in self._entries.items() if org_id == organization_id]:
+                    del self._entries[key]
+
+
+api_key_cache = ApiKeyCache()
+
+
+def resolve_api_key(db: Session, source: str, api_key: str) -> Optional[int]:
+    """Organization whose enabled integration for source has this key, or None"""
+    digest = hash_api_key(api_key)
+    organization_id = api_key_cache.get(source, digest)
+    if organization_id is not None:
+        return organization_id
+
+    hash_column, enabled_column = KEY_COLUMNS[source]
+    row = db.query(LeadSourceIntegration.organization_id).filter(
+        hash_column == digest,
+        enabled_column == True
+    ).first()
+    if row is None:
+        return None
+    api_key_cache.put(source, digest, row.organization_id)
+    return row.organization_id
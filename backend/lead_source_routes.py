@@ -11,6 +11,10 @@ Endpoints:
   POST   /api/webhooks/linkedin/import          - LinkedIn Sales Navigator webhook (Bearer key auth)
   POST   /api/webhooks/apollo/import            - Apollo.io webhook (Bearer key auth)
   GET    /api/lead-source/logs                  - Recent import audit log
+  GET    /api/lead-source/imports/{batch_id}    - Status of a queued webhook import
+
+Webhooks only authenticate and queue the payload (202 with a batch_id); the
+lead import workers in lead_import_queue.py run the imports.
 """
 
 import secrets
@@ -18,7 +22,6 @@ import hmac
 import hashlib
 import logging
 import json
-from datetime import datetime
 from typing import Optional, List
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Header, status
@@ -26,21 +29,22 @@ from sqlalchemy.orm import Session
 
 from database import get_db
 from models import (
-    LeadSourceIntegration, LeadImportLog,
-    Contact, Company, Organization, User
+    LeadSourceIntegration, LeadImportLog, LeadImportBatch,
+    Contact, Organization, User
 )
 from schemas import (
     LeadSourceIntegrationResponse, LeadSourceIntegrationUpdate,
     GenerateApiKeyResponse,
-    ClayWebhookPayload, ClayPersonPayload,
-    SurfeWebhookPayload, SurfeEnrichedPerson,
-    LinkedInWebhookPayload, LinkedInPersonPayload,
-    ApolloWebhookPayload, ApolloPersonPayload,
+    ClayWebhookPayload,
+    SurfeWebhookPayload,
+    LinkedInWebhookPayload,
+    ApolloWebhookPayload,
     LeadImportLogResponse,
-    ContactCreate, CompanyCreate,
 )
 from auth import get_current_active_user, get_current_admin_user
-from crud import create_contact, create_company, get_companies, get_contacts
+from crud import get_companies, get_contacts
+from lead_import_queue import get_lead_import_status, stage_lead_import, webhook_event_id
+from lead_source_keys import api_key_cache, hash_api_key, resolve_api_key
 
 logger = logging.getLogger(__name__)
 
@@ -64,152 +68,47 @@ def _get_or_create_integration(db: Session, organization_id: int) -> LeadSourceI
 
 
 # ─────────────────────────────────────────────
-# Helper: upsert Company by name / domain
-# ─────────────────────────────────────────────
-
-def _upsert_company(db: Session, org_id: int, name: str,
-                    website: Optional[str] = None,
-                    industry: Optional[str] = None,
-                    city: Optional[str] = None,
-                    state: Optional[str] = None) -> Optional[Company]:
-    if not name:
-        return None
-    existing = db.query(Company).filter(
-        Company.organization_id == org_id,
-        Company.name == name
-    ).first()
-    if existing:
-        return existing
-    company_data = CompanyCreate(
-        name=name,
-        website=website,
-        industry=industry,
-        city=city,
-        state=state,
-        status="Lead"
-    )
-    return create_company(db, company_data, org_id)
-
-
-# ─────────────────────────────────────────────
-# Helper: upsert Contact by email or name+company
-# ─────────────────────────────────────────────
-
-def _upsert_contact(db: Session, org_id: int,
-                    first_name: str, last_name: str,
-                    email: Optional[str] = None,
-                    phone: Optional[str] = None,
-                    title: Optional[str] = None,
-                    company_id: Optional[int] = None,
-                    company_name: Optional[str] = None,
-                    notes: Optional[str] = None) -> tuple:
-    """Returns (contact, action) where action is 'created' | 'updated' | 'skipped'."""
-    # Try to find by email first (most reliable dedup key)
-    if email:
-        existing = db.query(Contact).filter(
-            Contact.organization_id == org_id,
-            Contact.email == email
-        ).first()
-        if existing:
-            # Enrich missing fields on existing contact
-            changed = False
-            if not existing.phone and phone:
-                existing.phone = phone
-                changed = True
-            if not existing.title and title:
-                existing.title = title
-                changed = True
-            if not existing.company_id and company_id:
-                existing.company_id = company_id
-                existing.company_name = company_name
-                changed = True
-            if changed:
-                db.commit()
-                db.refresh(existing)
-            return existing, "updated"
-
-    # Fallback: find by name + company
-    query = db.query(Contact).filter(
-        Contact.organization_id == org_id,
-        Contact.first_name == first_name,
-        Contact.last_name == last_name,
-    )
-    if company_name:
-        query = query.filter(Contact.company_name == company_name)
-    existing = query.first()
-    if existing:
-        return existing, "skipped"
-
-    # Create new contact
-    contact_data = ContactCreate(
-        first_name=first_name,
-        last_name=last_name,
-        email=email,
-        phone=phone,
-        title=title,
-        company_id=company_id,
-        company_name=company_name,
-        status="Lead",
-        notes=notes,
-    )
-    new_contact = create_contact(db, contact_data, org_id)
-    return new_contact, "created"
-
-
-# ─────────────────────────────────────────────
-# Helper: log an import event
+# Helper: queue a webhook payload for background import
 # ─────────────────────────────────────────────
 
-def _log_import(db: Session, org_id: int, source: str,
-                event_type: Optional[str], raw_payload: dict,
-                contact_id: Optional[int], company_id: Optional[int],
-                action: str, error: Optional[str] = None):
-    log = LeadImportLog(
-        organization_id=org_id,
-        source=source,
-        event_type=event_type,
-        raw_payload=raw_payload,
-        contact_id=contact_id,
-        company_id=company_id,
-        action=action,
-        error_message=error,
-    )
-    db.add(log)
-    db.commit()
+def _accept_import(db: Session, request: Request, org_id: int, source: str,
+                   body: dict, raw_body: bytes) -> dict:
+    """Stage the payload and answer 202 with its batch ID (a retried event returns the original batch)."""
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="JSON body must be an object")
+    event_id = webhook_event_id(request.headers, body, raw_body)
+    batch, duplicate = stage_lead_import(db, org_id, source, event_id, body)
+    return {
+        "status": "accepted",
+        "batch_id": batch.id,
+        "duplicate": duplicate,
+        "status_url": f"/api/lead-source/imports/{batch.id}",
+    }
 
 
 # ─────────────────────────────────────────────
 # Helper: resolve org from inbound API key
 # ─────────────────────────────────────────────
 
-def _get_org_from_clay_key(db: Session, api_key: str) -> LeadSourceIntegration:
-    row = db.query(LeadSourceIntegration).filter(
-        LeadSourceIntegration.clay_api_key == api_key,
-        LeadSourceIntegration.clay_enabled == True
-    ).first()
-    if not row:
+def _get_org_from_clay_key(db: Session, api_key: str) -> int:
+    org_id = resolve_api_key(db, "clay", api_key)
+    if org_id is None:
         raise HTTPException(status_code=401, detail="Invalid or disabled Clay API key")
-    return row
+    return org_id
 
 
-def _get_org_from_linkedin_key(db: Session, api_key: str) -> LeadSourceIntegration:
-    row = db.query(LeadSourceIntegration).filter(
-        LeadSourceIntegration.linkedin_webhook_api_key == api_key,
-        LeadSourceIntegration.linkedin_enabled == True
-    ).first()
-    if not row:
+def _get_org_from_linkedin_key(db: Session, api_key: str) -> int:
+    org_id = resolve_api_key(db, "linkedin", api_key)
+    if org_id is None:
         raise HTTPException(status_code=401, detail="Invalid or disabled LinkedIn API key")
-    return row
+    return org_id
 
 
-def _get_org_from_apollo_key(db: Session, api_key: str) -> LeadSourceIntegration:
-    row = db.query(LeadSourceIntegration).filter(
-        LeadSourceIntegration.apollo_api_key == api_key,
-        LeadSourceIntegration.apollo_enabled == True
-    ).first()
-    if not row:
+def _get_org_from_apollo_key(db: Session, api_key: str) -> int:
+    org_id = resolve_api_key(db, "apollo", api_key)
+    if org_id is None:
         raise HTTPException(status_code=401, detail="Invalid or disabled Apollo API key")
-    return row
+    return org_id
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -249,6 +148,8 @@ async def update_lead_source_settings(
 
     db.commit()
     db.refresh(row)
+    # A disabled integration's key must stop working now, not when its cache entry expires
+    api_key_cache.invalidate(current_user.organization_id)
     return row
 
 
@@ -271,20 +172,24 @@ async def generate_api_key(
 
     base_url = str(request.base_url).rstrip("/")
 
+    # Only the digest is stored; the key itself is returned once below
+    key_hash = hash_api_key(new_key)
     if source == "clay":
-        row.clay_api_key = new_key
+        row.clay_api_key_hash = key_hash
         row.clay_enabled = True
         webhook_url = f"{base_url}/api/webhooks/clay/import"
     elif source == "apollo":
-        row.apollo_api_key = new_key
+        row.apollo_api_key_hash = key_hash
         row.apollo_enabled = True
         webhook_url = f"{base_url}/api/webhooks/apollo/import"
     else:
-        row.linkedin_webhook_api_key = new_key
+        row.linkedin_webhook_api_key_hash = key_hash
         row.linkedin_enabled = True
         webhook_url = f"{base_url}/api/webhooks/linkedin/import"
 
     db.commit()
+    # The replaced key stops working at once in this process
+    api_key_cache.invalidate(current_user.organization_id)
 
     return GenerateApiKeyResponse(
         source=source,
@@ -310,11 +215,27 @@ async def get_import_logs(
     return logs
 
 
+@router.get("/api/lead-source/imports/{batch_id}")
+async def get_import_status(
+    batch_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Return the progress of a webhook payload queued for import, and its counts once imported."""
+    batch = db.query(LeadImportBatch).filter(
+        LeadImportBatch.id == batch_id,
+        LeadImportBatch.organization_id == current_user.organization_id
+    ).first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="Import batch not found")
+    return get_lead_import_status(batch)
+
+
 # ═══════════════════════════════════════════════════════════════
 # CLAY WEBHOOK  POST /api/webhooks/clay/import
 # ═══════════════════════════════════════════════════════════════
 
-@router.post("/api/webhooks/clay/import")
+@router.post("/api/webhooks/clay/import", status_code=status.HTTP_202_ACCEPTED)
 async def clay_import_webhook(
     request: Request,
     authorization: Optional[str] = Header(None),
@@ -324,7 +245,8 @@ async def clay_import_webhook(
     Receives enriched leads pushed from Clay via the HTTP API action.
 
     Authentication: Bearer token in Authorization header.
-    The token is the clay_api_key generated in /api/lead-source/generate-key/clay.
+    The token is the Clay key generated in /api/lead-source/generate-key/clay
+    (only its SHA-256 digest is stored).
 
     Clay HTTP API action configuration:
       Method: POST
@@ -336,93 +258,23 @@ async def clay_import_webhook(
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing Bearer token")
     api_key = authorization.removeprefix("Bearer ").strip()
-    integration = _get_org_from_clay_key(db, api_key)
-    org_id = integration.organization_id
+    org_id = _get_org_from_clay_key(db, api_key)
 
     # --- Parse body ---
+    raw_body = await request.body()
     try:
-        body = await request.json()
+        body = json.loads(raw_body)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON body")
 
-    # Normalise to a list of person dicts
-    people_raw: List[dict] = []
-    if "people" in body and isinstance(body["people"], list):
-        people_raw = body["people"]
-    elif "person" in body and isinstance(body["person"], dict):
-        people_raw = [body["person"]]
-    else:
-        # Treat the whole body as a single person (Clay sometimes sends flat rows)
-        people_raw = [body]
-
-    created_count = 0
-    updated_count = 0
-
-    for raw in people_raw:
-        try:
-            p = ClayPersonPayload(**raw)
-
-            # Resolve name
-            first = (p.first_name or "").strip()
-            last = (p.last_name or "").strip()
-            if not first and not last:
-                _log_import(db, org_id, "clay", "import", raw, None, None, "skipped",
-                            "No name provided")
-                continue
-
-            # Upsert company
-            company = _upsert_company(
-                db, org_id,
-                name=p.company_name or "",
-                website=p.company_website or p.company_domain,
-                industry=p.company_industry,
-                city=p.company_city,
-                state=p.company_state,
-            )
-
-            # Upsert contact
-            contact, action = _upsert_contact(
-                db, org_id,
-                first_name=first or "Unknown",
-                last_name=last or "Lead",
-                email=p.email,
-                phone=p.phone,
-                title=p.title,
-                company_id=company.id if company else None,
-                company_name=p.company_name,
-                notes=f"Imported from Clay. LinkedIn: {p.linkedin_url}" if p.linkedin_url else "Imported from Clay",
-            )
-
-            _log_import(db, org_id, "clay", "import", raw,
-                        contact.id, company.id if company else None, action)
-
-            if action == "created":
-                created_count += 1
-            elif action == "updated":
-                updated_count += 1
-
-        except Exception as e:
-            logger.error(f"Clay import error for row: {e}")
-            _log_import(db, org_id, "clay", "import", raw, None, None, "error", str(e))
-
-    # Update stats
-    integration.clay_last_import_at = datetime.utcnow()
-    integration.clay_total_imported += created_count
-    db.commit()
-
-    return {
-        "status": "ok",
-        "created": created_count,
-        "updated": updated_count,
-        "total_received": len(people_raw),
-    }
+    return _accept_import(db, request, org_id, "clay", body, raw_body)
 
 
 # ═══════════════════════════════════════════════════════════════
 # SURFE WEBHOOK  POST /api/webhooks/surfe/enrichment
 # ═══════════════════════════════════════════════════════════════
 
-@router.post("/api/webhooks/surfe/enrichment")
+@router.post("/api/webhooks/surfe/enrichment", status_code=status.HTTP_202_ACCEPTED)
 async def surfe_enrichment_webhook(
     request: Request,
     x_surfe_signature: Optional[str] = Header(None, alias="X-Surfe-Signature"),
@@ -480,7 +332,7 @@ async def surfe_enrichment_webhook(
             pass
 
     if not org_id:
-        # Can't route without an org — log and return 200 to prevent Surfe retries
+        # Can't route without an org — log and acknowledge to prevent Surfe retries
         logger.warning(f"Surfe webhook: could not resolve org from externalID={external_id}")
         return {"status": "ok", "message": "Could not resolve organization from externalID"}
 
@@ -495,57 +347,15 @@ async def surfe_enrichment_webhook(
         if not hmac.compare_digest(expected, x_surfe_signature):
             raise HTTPException(status_code=401, detail="Invalid Surfe webhook signature")
 
-    # --- Enrich the contact ---
-    action = "skipped"
-    try:
-        p = SurfeEnrichedPerson(**person_data)
-        changed = False
-
-        if contact:
-            # Update email if we got a valid one and contact doesn't have one
-            if p.emails and not contact.email:
-                valid_emails = [e.email for e in p.emails if e.validationStatus == "VALID" and e.email]
-                if valid_emails:
-                    contact.email = valid_emails[0]
-                    changed = True
-
-            # Update phone if missing
-            if p.mobilePhones and not contact.phone:
-                best_phone = sorted(p.mobilePhones, key=lambda x: x.confidenceScore or 0, reverse=True)
-                if best_phone and best_phone[0].mobilePhone:
-                    contact.phone = best_phone[0].mobilePhone
-                    changed = True
-
-            # Update title if missing
-            if p.jobTitle and not contact.title:
-                contact.title = p.jobTitle
-                changed = True
-
-            if changed:
-                db.commit()
-                db.refresh(contact)
-                action = "updated"
-
-        _log_import(db, org_id, "surfe", event_type, body,
-                    contact.id if contact else None, None, action)
-
-        integration.surfe_last_enrichment_at = datetime.utcnow()
-        if action == "updated":
-            integration.surfe_total_enriched += 1
-        db.commit()
-
-    except Exception as e:
-        logger.error(f"Surfe enrichment error: {e}")
-        _log_import(db, org_id, "surfe", event_type, body, None, None, "error", str(e))
-
-    return {"status": "ok", "action": action}
+    # --- Queue the enrichment ---
+    return _accept_import(db, request, org_id, "surfe", body, raw_body)
 
 
 # ═══════════════════════════════════════════════════════════════
 # LINKEDIN SALES NAVIGATOR WEBHOOK  POST /api/webhooks/linkedin/import
 # ═══════════════════════════════════════════════════════════════
 
-@router.post("/api/webhooks/linkedin/import")
+@router.post("/api/webhooks/linkedin/import", status_code=status.HTTP_202_ACCEPTED)
 async def linkedin_import_webhook(
     request: Request,
     authorization: Optional[str] = Header(None),
@@ -558,8 +368,8 @@ async def linkedin_import_webhook(
       - LinkedIn Sales Navigator CSV export processed by Clay
 
     Authentication: Bearer token in Authorization header.
-    The token is the linkedin_webhook_api_key generated in
-    /api/lead-source/generate-key/linkedin.
+    The token is the LinkedIn key generated in
+    /api/lead-source/generate-key/linkedin (only its SHA-256 digest is stored).
 
     Expected body:
       { "person": { ... } }   or   { "people": [ {...}, ... ] }
@@ -571,107 +381,23 @@ async def linkedin_import_webhook(
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing Bearer token")
     api_key = authorization.removeprefix("Bearer ").strip()
-    integration = _get_org_from_linkedin_key(db, api_key)
-    org_id = integration.organization_id
+    org_id = _get_org_from_linkedin_key(db, api_key)
 
     # --- Parse body ---
+    raw_body = await request.body()
     try:
-        body = await request.json()
+        body = json.loads(raw_body)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON body")
 
-    # Normalise to list
-    people_raw: List[dict] = []
-    if "people" in body and isinstance(body["people"], list):
-        people_raw = body["people"]
-    elif "person" in body and isinstance(body["person"], dict):
-        people_raw = [body["person"]]
-    else:
-        people_raw = [body]
-
-    created_count = 0
-    updated_count = 0
-
-    for raw in people_raw:
-        try:
-            p = LinkedInPersonPayload(**raw)
-
-            # Resolve name — handle "Full Name" field from Sales Nav exports
-            first = (p.first_name or "").strip()
-            last = (p.last_name or "").strip()
-            if not first and not last and p.full_name:
-                parts = p.full_name.strip().split(" ", 1)
-                first = parts[0]
-                last = parts[1] if len(parts) > 1 else ""
-
-            if not first and not last:
-                _log_import(db, org_id, "linkedin", "import", raw, None, None, "skipped",
-                            "No name provided")
-                continue
-
-            # Build notes from LinkedIn-specific fields
-            notes_parts = []
-            if p.headline:
-                notes_parts.append(f"Headline: {p.headline}")
-            if p.linkedin_url:
-                notes_parts.append(f"LinkedIn: {p.linkedin_url}")
-            if p.location:
-                notes_parts.append(f"Location: {p.location}")
-            if p.company_size:
-                notes_parts.append(f"Company size: {p.company_size}")
-            notes = "Imported from LinkedIn Sales Navigator. " + " | ".join(notes_parts) if notes_parts else "Imported from LinkedIn Sales Navigator"
-
-            # Upsert company
-            company = _upsert_company(
-                db, org_id,
-                name=p.company_name or "",
-                website=p.company_website,
-                industry=p.company_industry,
-            )
-
-            # Upsert contact
-            contact, action = _upsert_contact(
-                db, org_id,
-                first_name=first or "Unknown",
-                last_name=last or "Lead",
-                email=p.email,
-                phone=p.phone,
-                title=p.title,
-                company_id=company.id if company else None,
-                company_name=p.company_name,
-                notes=notes,
-            )
-
-            _log_import(db, org_id, "linkedin", "import", raw,
-                        contact.id, company.id if company else None, action)
-
-            if action == "created":
-                created_count += 1
-            elif action == "updated":
-                updated_count += 1
-
-        except Exception as e:
-            logger.error(f"LinkedIn import error for row: {e}")
-            _log_import(db, org_id, "linkedin", "import", raw, None, None, "error", str(e))
-
-    # Update stats
-    integration.linkedin_last_import_at = datetime.utcnow()
-    integration.linkedin_total_imported += created_count
-    db.commit()
-
-    return {
-        "status": "ok",
-        "created": created_count,
-        "updated": updated_count,
-        "total_received": len(people_raw),
-    }
+    return _accept_import(db, request, org_id, "linkedin", body, raw_body)
 
 
 # ═══════════════════════════════════════════════════════════════
 # APOLLO.IO WEBHOOK  POST /api/webhooks/apollo/import
 # ═══════════════════════════════════════════════════════════════
 
-@router.post("/api/webhooks/apollo/import")
+@router.post("/api/webhooks/apollo/import", status_code=status.HTTP_202_ACCEPTED)
 async def apollo_import_webhook(
     request: Request,
     authorization: Optional[str] = Header(None),
@@ -684,7 +410,8 @@ async def apollo_import_webhook(
       3. A manual CSV export processed and POSTed by a salesperson's automation
 
     Authentication: Bearer token in Authorization header.
-    The token is the apollo_api_key generated in /api/lead-source/generate-key/apollo.
+    The token is the Apollo key generated in /api/lead-source/generate-key/apollo
+    (only its SHA-256 digest is stored).
 
     Apollo Webhook Setup (in Apollo → Settings → Integrations → Webhooks):
       URL:    https://<your-domain>/api/webhooks/apollo/import
@@ -716,123 +443,13 @@ async def apollo_import_webhook(
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing Bearer token")
     api_key = authorization.removeprefix("Bearer ").strip()
-    integration = _get_org_from_apollo_key(db, api_key)
-    org_id = integration.organization_id
+    org_id = _get_org_from_apollo_key(db, api_key)
 
     # --- Parse body ---
+    raw_body = await request.body()
     try:
-        body = await request.json()
+        body = json.loads(raw_body)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON body")
 
-    # Normalise to a list of raw person dicts.
-    # Apollo native format: { "event": "contact.created", "data": { ... } }
-    # Batch / Zapier format: { "people": [...] } or { "person": {...} }
-    people_raw: List[dict] = []
-    event_type = body.get("event", "import")
-
-    if "data" in body and isinstance(body["data"], dict):
-        # Apollo native single-contact webhook
-        people_raw = [body["data"]]
-    elif "people" in body and isinstance(body["people"], list):
-        people_raw = body["people"]
-    elif "person" in body and isinstance(body["person"], dict):
-        people_raw = [body["person"]]
-    else:
-        # Flat body — treat as single person (CSV row via Zapier)
-        people_raw = [body]
-
-    created_count = 0
-    updated_count = 0
-
-    for raw in people_raw:
-        try:
-            p = ApolloPersonPayload(**raw)
-
-            # ── Resolve name ──────────────────────────────────────────
-            first = (p.first_name or "").strip()
-            last = (p.last_name or "").strip()
-            if not first and not last and p.name:
-                parts = p.name.strip().split(" ", 1)
-                first = parts[0]
-                last = parts[1] if len(parts) > 1 else ""
-
-            if not first and not last:
-                _log_import(db, org_id, "apollo", event_type, raw, None, None, "skipped",
-                            "No name provided")
-                continue
-
-            # ── Resolve phone (prefer mobile) ─────────────────────────
-            phone = (p.mobile_phone or p.phone or "").strip() or None
-
-            # ── Resolve company name (Apollo uses organization_name) ───
-            company_name = (p.company_name or p.organization_name or "").strip() or None
-            company_website = (p.company_website or p.company_domain or "").strip() or None
-
-            # ── Build notes from Apollo-specific fields ────────────────
-            notes_parts = ["Imported from Apollo.io"]
-            if p.apollo_id:
-                notes_parts.append(f"Apollo ID: {p.apollo_id}")
-            if p.stage:
-                notes_parts.append(f"Apollo Stage: {p.stage}")
-            if p.owner_email:
-                notes_parts.append(f"Apollo Owner: {p.owner_email}")
-            if p.seniority:
-                notes_parts.append(f"Seniority: {p.seniority}")
-            if p.department:
-                notes_parts.append(f"Department: {p.department}")
-            if p.linkedin_url:
-                notes_parts.append(f"LinkedIn: {p.linkedin_url}")
-            location_parts = [x for x in [p.city, p.state, p.country] if x]
-            if location_parts:
-                notes_parts.append(f"Location: {', '.join(location_parts)}")
-            if p.company_employee_count:
-                notes_parts.append(f"Company size: {p.company_employee_count}")
-            notes = " | ".join(notes_parts)
-
-            # ── Upsert company ─────────────────────────────────────────
-            company = _upsert_company(
-                db, org_id,
-                name=company_name or "",
-                website=company_website,
-                industry=p.company_industry,
-                city=p.company_city,
-                state=p.company_state,
-            )
-
-            # ── Upsert contact ─────────────────────────────────────────
-            contact, action = _upsert_contact(
-                db, org_id,
-                first_name=first or "Unknown",
-                last_name=last or "Lead",
-                email=p.email,
-                phone=phone,
-                title=p.title,
-                company_id=company.id if company else None,
-                company_name=company_name,
-                notes=notes,
-            )
-
-            _log_import(db, org_id, "apollo", event_type, raw,
-                        contact.id, company.id if company else None, action)
-
-            if action == "created":
-                created_count += 1
-            elif action == "updated":
-                updated_count += 1
-
-        except Exception as e:
-            logger.error(f"Apollo import error for row: {e}")
-            _log_import(db, org_id, "apollo", event_type, raw, None, None, "error", str(e))
-
-    # Update stats
-    integration.apollo_last_import_at = datetime.utcnow()
-    integration.apollo_total_imported += created_count
-    db.commit()
-
-    return {
-        "status": "ok",
-        "created": created_count,
-        "updated": updated_count,
-        "total_received": len(people_raw),
-    }
+    return _accept_import(db, request, org_id, "apollo", body, raw_body)
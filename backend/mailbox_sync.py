@@ -0,0 +1,286 @@
+"""
+Background mailbox sync for NotHubSpot CRM
+The scheduler leader syncs every active O365 and Google mailbox (mail and
+calendar) on an interval.
+Mailboxes sync concurrently under a global limit and a per-organization limit,
+queued round-robin across organizations so one large tenant cannot starve the
+others. Each connection's last outcome, duration and lag are kept in
+mailbox_sync_status.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import chain, zip_longest
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from models import GoogleUserConnection, MailboxSyncStatus, O365UserConnection
+
+logger = logging.getLogger(__name__)
+
+MAILBOX_SYNC_INTERVAL_MINUTES = int(os.environ.get("MAILBOX_SYNC_INTERVAL_MINUTES", "5"))
+# Mailboxes syncing at once across all organizations, and within one organization
+MAILBOX_SYNC_CONCURRENCY = int(os.environ.get("MAILBOX_SYNC_CONCURRENCY", "8"))
+MAILBOX_SYNC_PER_ORG_CONCURRENCY = int(os.environ.get("MAILBOX_SYNC_PER_ORG_CONCURRENCY", "2"))
+MAILBOX_SYNC_TIMEOUT_SECONDS = int(os.environ.get("MAILBOX_SYNC_TIMEOUT_SECONDS", "600"))
+# Failing mailboxes are retried after interval * 2^(failures - 1), capped here
+MAILBOX_SYNC_MAX_BACKOFF_MINUTES = 240
+
+# (provider, connection_id, organization_id)
+MailboxRef = Tuple[str, int, int]
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Drop tzinfo so Postgres timestamptz values compare with datetime.utcnow()"""
+    return value.replace(tzinfo=None) if value is not None and value.tzinfo is not None else value
+
+
+def _active_connections(db: Session, organization_id: Optional[int] = None) -> Dict[str, List[Any]]:
+    """Connections with mail or calendar sync turned on, per provider"""
+    o365 = db.query(O365UserConnection).filter(
+        O365UserConnection.is_active == True,
+        or_(O365UserConnection.sync_email_enabled == True, O365UserConnection.sync_calendar_enabled == True)
+    )
+    google = db.query(GoogleUserConnection).filter(
+        GoogleUserConnection.connection_status == "active",
+        or_(GoogleUserConnection.sync_gmail_enabled == True, GoogleUserConnection.sync_calendar_enabled == True)
+    )
+    if organization_id is not None:
+        o365 = o365.filter(O365UserConnection.organization_id == organization_id)
+        google = google.filter(GoogleUserConnection.organization_id == organization_id)
+    return {"o365": o365.all(), "google": google.all()}
+
+
+def fair_order(mailboxes: List[MailboxRef]) -> List[MailboxRef]:
+    """Interleave mailboxes round-robin across organizations, keeping each organization's order"""
+    by_org: Dict[int, List[MailboxRef]] = defaultdict(list)
+    for mailbox in mailboxes:
+        by_org[mailbox[2]].append(mailbox)
+    rounds = zip_longest(*by_org.values())
+    return [mailbox for mailbox in chain.from_iterable(rounds) if mailbox is not None]
+
+
+def list_due_mailboxes(db: Session, now: Optional[datetime] = None) -> Tuple[List[MailboxRef], int]:
+    """
+    Mailboxes to sync this round, most out-of-date first within each organization.
+
+    Returns the fair-ordered mailboxes and how many were skipped while backing off.
+    """
+    now = now or datetime.utcnow()
+    statuses = {
+        (row.provider, row.connection_id): row
+        for row in db.query(
+            MailboxSyncStatus.provider,
+            MailboxSyncStatus.connection_id,
+            MailboxSyncStatus.last_success_at,
+            MailboxSyncStatus.next_sync_at,
+        )
+    }
+
+    due = []
+    backing_off = 0
+    for provider, connections in _active_connections(db).items():
+        for connection in connections:
+            status = statuses.get((provider, connection.id))
+            if status is not None and status.next_sync_at is not None and _naive(status.next_sync_at) > now:
+                backing_off += 1
+                continue
+            last_success = _naive(status.last_success_at) if status is not None else None
+            due.append((last_success or datetime.min, (provider, connection.id, connection.organization_id)))
+
+    due.sort(key=lambda item: item[0])
+    return fair_order([mailbox for _, mailbox in due]), backing_off
+
+
+def _get_status(db: Session, provider: str, connection: Any) -> MailboxSyncStatus:
+    status = db.query(MailboxSyncStatus).filter(
+        MailboxSyncStatus.provider == provider,
+        MailboxSyncStatus.connection_id == connection.id
+    ).first()
+    if status is None:
+        status = MailboxSyncStatus(provider=provider, connection_id=connection.id, consecutive_failures=0)
+        db.add(status)
+    status.organization_id = connection.organization_id
+    status.user_id = connection.user_id
+    status.email = connection.o365_email if provider == "o365" else connection.google_email
+    return status
+
+
+async def _run_provider_sync(db: Session, provider: str, connection: Any) -> int:
+    """Sync one mailbox's mail and calendar with its provider's service; returns the number of items synced"""
+    synced_count = 0
+    if provider == "o365":
+        from o365_service import O365Service
+        if connection.org_config is None:
+            raise Exception("O365 not configured")
+        async with O365Service(connection, connection.org_config) as service:
+            if connection.sync_email_enabled:
+                synced_count += await service.sync_emails_to_crm(db, connection.organization_id, since=connection.last_sync_at)
+            if connection.sync_calendar_enabled:
+                synced_count += await service.sync_calendar_events(db)
+        return synced_count
+
+    from google_service import GoogleService
+    async with GoogleService(connection) as service:
+        if connection.sync_gmail_enabled:
+            synced_count += await service.sync_gmail_messages(db, since_date=connection.last_gmail_sync)
+        if connection.sync_calendar_enabled:
+            synced_count += await service.sync_calendar_events(db)
+    return synced_count
+
+
+async def sync_mailbox(provider: str, connection_id: int, session_factory: Callable[[], Session]) -> Dict[str, Any]:
+    """Sync one connection in its own session and record the outcome in mailbox_sync_status"""
+    model = O365UserConnection if provider == "o365" else GoogleUserConnection
+    db = session_factory()
+    try:
+        connection = db.get(model, connection_id)
+        if connection is None:
+            return {"provider": provider, "connection_id": connection_id, "status": "missing"}
+
+        status = _get_status(db, provider, connection)
+        status.status = "running"
+        status.last_started_at = datetime.utcnow()
+        db.commit()
+
+        started = time.monotonic()
+        try:
+            synced = await asyncio.wait_for(
+                _run_provider_sync(db, provider, connection),
+                timeout=MAILBOX_SYNC_TIMEOUT_SECONDS
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            error = str(e) or e.__class__.__name__
+            logger.warning(f"Mailbox sync failed for {provider} connection {connection_id}: {error}")
+
+            # The provider services record their own errors, but the rollback discarded them
+            if provider == "o365":
+                connection.last_sync_success = False
+                connection.last_error_message = error
+            else:
+                connection.sync_error_count = (connection.sync_error_count or 0) + 1
+                connection.last_sync_error = error
+
+            status.consecutive_failures = (status.consecutive_failures or 0) + 1
+            backoff = min(
+                MAILBOX_SYNC_INTERVAL_MINUTES * 2 ** (status.consecutive_failures - 1),
+                MAILBOX_SYNC_MAX_BACKOFF_MINUTES
+            )
+            status.status = "error"
+            status.last_error = error[:2000]
+            status.next_sync_at = datetime.utcnow() + timedelta(minutes=backoff)
+            synced = 0
+        else:
+            status.status = "success"
+            status.last_success_at = datetime.utcnow()
+            status.last_synced_count = synced
+            status.consecutive_failures = 0
+            status.next_sync_at = None
+            status.last_error = None
+
+        status.last_finished_at = datetime.utcnow()
+        status.last_duration_ms = int((time.monotonic() - started) * 1000)
+        db.commit()
+        return {
+            "provider": provider,
+            "connection_id": connection_id,
+            "status": status.status,
+            "synced": synced,
+            "duration_ms": status.last_duration_ms,
+        }
+    finally:
+        db.close()
+
+
+async def sync_all_mailboxes(
+    session_factory: Optional[Callable[[], Session]] = None,
+    concurrency: int = MAILBOX_SYNC_CONCURRENCY,
+    per_org_concurrency: int = MAILBOX_SYNC_PER_ORG_CONCURRENCY,
+) -> Dict[str, Any]:
+    """Sync every due mailbox across all organizations. Returns a summary for the job history."""
+    if session_factory is None:
+        from database import SessionLocal
+        session_factory = SessionLocal
+
+    db = session_factory()
+    try:
+        mailboxes, backing_off = list_due_mailboxes(db)
+    finally:
+        db.close()
+
+    # Tasks queue in fair order; a busy organization waits on its own semaphore
+    # without holding a global slot, so other organizations keep moving
+    global_slots = asyncio.Semaphore(concurrency)
+    org_slots: Dict[int, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(per_org_concurrency))
+
+    async def run(mailbox: MailboxRef) -> Dict[str, Any]:
+        provider, connection_id, organization_id = mailbox
+        async with org_slots[organization_id]:
+            async with global_slots:
+                return await sync_mailbox(provider, connection_id, session_factory)
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(run(mailbox) for mailbox in mailboxes), return_exceptions=True)
+
+    summary = {"mailboxes": len(mailboxes), "succeeded": 0, "failed": 0, "synced": 0, "backing_off": backing_off}
+    for mailbox, result in zip(mailboxes, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Mailbox sync crashed for {mailbox[0]} connection {mailbox[1]}: {result}")
+            summary["failed"] += 1
+        elif result["status"] == "success":
+            summary["succeeded"] += 1
+            summary["synced"] += result["synced"] or 0
+        elif result["status"] == "error":
+            summary["failed"] += 1
+    summary["duration_ms"] = int((time.monotonic() - started) * 1000)
+    return summary
+
+
+def get_mailbox_sync_overview(db: Session, organization_id: int) -> Dict[str, Any]:
+    """Sync status and lag for every mailbox in an organization"""
+    now = datetime.utcnow()
+    statuses = {
+        (row.provider, row.connection_id): row
+        for row in db.query(MailboxSyncStatus).filter(MailboxSyncStatus.organization_id == organization_id)
+    }
+
+    mailboxes = []
+    for provider, connections in _active_connections(db, organization_id).items():
+        for connection in connections:
+            status = statuses.get((provider, connection.id))
+            last_success = _naive(status.last_success_at) if status else None
+            mailboxes.append({
+                "provider": provider,
+                "connection_id": connection.id,
+                "user_id": connection.user_id,
+                "email": connection.o365_email if provider == "o365" else connection.google_email,
+                "status": status.status if status else "pending",
+                "last_started_at": status.last_started_at if status else None,
+                "last_success_at": status.last_success_at if status else None,
+                "lag_seconds": int((now - last_success).total_seconds()) if last_success else None,
+                "last_duration_ms": status.last_duration_ms if status else None,
+                "last_synced_count": status.last_synced_count if status else None,
+                "consecutive_failures": status.consecutive_failures if status else 0,
+                "next_sync_at": status.next_sync_at if status else None,
+                "last_error": status.last_error if status else None,
+            })
+
+    lags = [mailbox["lag_seconds"] for mailbox in mailboxes if mailbox["lag_seconds"] is not None]
+    durations = [mailbox["last_duration_ms"] for mailbox in mailboxes if mailbox["last_duration_ms"] is not None]
+    mailboxes.sort(key=lambda mailbox: (mailbox["lag_seconds"] is not None, -(mailbox["lag_seconds"] or 0)))
+    return {
+        "interval_minutes": MAILBOX_SYNC_INTERVAL_MINUTES,
+        "total": len(mailboxes),
+        "failing": sum(1 for mailbox in mailboxes if mailbox["status"] == "error"),
+        "never_synced": sum(1 for mailbox in mailboxes if mailbox["last_success_at"] is None),
+        "max_lag_seconds": max(lags) if lags else None,
+        "avg_duration_ms": int(sum(durations) / len(durations)) if durations else None,
+        "mailboxes": mailboxes,
+    }
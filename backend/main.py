@@ -49,12 +49,12 @@ def rate_limit_check(client_ip: str, endpoint: str, max_requests: int = 30, wind
 
 from database import get_db, SessionLocal, engine
 import models
-from models import Base, Company, Contact, Task, EmailThread, EmailMessage, Attachment, Activity, EmailSignature, Organization, User, UserInvite, PasswordResetToken, CalendarEvent, EventAttendee, O365OrganizationConfig, O365UserConnection, GoogleOrganizationConfig, GoogleUserConnection, PipelineStage, Deal, EmailTracking, EmailEvent, EmailSharingPermission, ProjectStage, Project, ProjectType, ProjectUpdate, DealUpdate, ScheduledEmail, EmailTemplate, TimeEntry, ProjectMemberRate, InvoiceRule
+from models import Base, Company, Contact, Task, EmailThread, EmailMessage, Attachment, Activity, EmailSignature, Organization, User, UserInvite, PasswordResetToken, CalendarEvent, EventAttendee, O365OrganizationConfig, O365UserConnection, GoogleOrganizationConfig, GoogleUserConnection, PipelineStage, Deal, EmailTracking, EmailEvent, EmailSharingPermission, ProjectStage, Project, ProjectType, ProjectUpdate, DealUpdate, ScheduledEmail, EmailTemplate, TimeEntry, ProjectMemberRate, InvoiceRule, BulkEmailJob
 from schemas import (
     CompanyCreate, CompanyResponse, CompanyUpdate, CompanyPaginatedResponse,
     ContactCreate, ContactResponse, ContactUpdate,
     TaskCreate, TaskResponse, TaskUpdate,
-    EmailThreadCreate, EmailThreadResponse,
+    EmailThreadCreate, EmailThreadResponse, EmailThreadSummary, EmailMessagePage,
     EmailMessageCreate, EmailMessageResponse, AttachmentCreate, AttachmentResponse,
     EmailSignatureCreate, EmailSignatureResponse, EmailSignatureUpdate,
     ActivityCreate, ActivityResponse, DashboardStats, BulkUploadResult,
@@ -78,7 +78,7 @@ from schemas import (
     ProjectStageCreate, ProjectStageResponse, ProjectStageUpdate,
     ProjectCreate, ProjectResponse, ProjectUpdate, PROJECT_TYPES,
     ProjectTypeCreate, ProjectTypeResponse, ProjectTypeUpdate,
-    EmailTrackingCreate, EmailTrackingResponse, EmailEventCreate, EmailEventResponse, SendGridEvent,
+    EmailTrackingCreate, EmailTrackingResponse, EmailEventCreate, EmailEventResponse,
     ContactPrivacyUpdate, EmailThreadSharingUpdate, EmailSharingPermissionCreate, EmailSharingPermissionResponse,
     EmailPrivacySettings, EmailPrivacySettingsUpdate,
     DocumentFolderCreate, DocumentFolderUpdate, DocumentFolderResponse,
@@ -92,14 +92,14 @@ from crud import (
     create_company, get_companies, get_company, update_company, delete_company,
     create_contact, get_contacts, get_contact, update_contact, delete_contact,
     create_task, get_tasks, get_task, update_task, delete_task,
-    create_email_thread, get_email_threads, add_email_message,
+    create_email_thread, get_email_threads, get_email_thread_messages, get_contact_email_messages, add_email_message,
     create_attachment, get_attachments,
     get_email_signature, create_or_update_email_signature,
     bulk_create_companies, bulk_create_contacts,
     create_activity, get_recent_activities,
     get_dashboard_stats,
     create_calendar_event, get_calendar_events, get_calendar_event, 
-    update_calendar_event, delete_calendar_event, get_upcoming_events, get_today_events,
+    update_calendar_event, delete_calendar_event, get_upcoming_events, get_today_events, get_busy_times,
     is_org_owner, get_o365_org_config, create_o365_org_config, update_o365_org_config, delete_o365_org_config,
     get_o365_user_connection, get_o365_user_connections_by_org, update_o365_user_connection, delete_o365_user_connection,
     get_google_org_config, create_google_org_config, update_google_org_config, delete_google_org_config,
@@ -134,9 +134,15 @@ from auth import (
 from email_service import send_welcome_email, send_password_reset_email, send_calendar_invite, send_invite_email
 # email_template_crud not used - using inline template routes instead
 from ai_service import generate_daily_summary
-from bulk_email_service import send_bulk_email
+from email_outbox import enqueue_bulk_email, cancel_bulk_email_job, get_job_progress, dispatch_due_scheduled_emails, start_outbox_workers, stop_outbox_workers
+from lead_import_queue import start_lead_import_workers, stop_lead_import_workers
+from template_engine import find_unknown_variables
+from sendgrid_events import ingest_sendgrid_events
+from email_analytics import get_email_analytics, apply_stat_increments, new_increments
+from email_threading import find_contact_by_email, find_organization_for_addresses, find_thread, parse_addresses, subject_hash
+from calendar_sync import delete_calendar_events
 from password_utils import generate_temporary_password
-from ai_chat import process_ai_chat
+from ai_chat import ChatLimitExceeded, stream_ai_chat
 from o365_service import O365Service, get_oauth_url, exchange_code_for_tokens
 from o365_encryption import encrypt_access_token, encrypt_refresh_token, decrypt_client_secret, encrypt_client_secret
 from run_migrations import run_migrations
@@ -389,20 +395,29 @@ except Exception as e:
 # Initialize background scheduler
 from scheduler import init_scheduler, shutdown_scheduler
 from contextlib import asynccontextmanager
+from http_clients import open_http_clients, close_http_clients
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifespan"""
     # Startup
     logging.info("STARTUP: FastAPI lifespan startup initiated")
+    open_http_clients()
     logging.info("STARTUP: Initializing scheduler...")
     init_scheduler()
     logging.info("STARTUP: Scheduler initialized successfully")
+    logging.info("STARTUP: Starting outbox email workers...")
+    start_outbox_workers()
+    logging.info("STARTUP: Starting lead import workers...")
+    start_lead_import_workers()
     logging.info("STARTUP: Application ready to serve requests!")
     yield
     # Shutdown
     logging.info("SHUTDOWN: Application shutdown initiated")
+    await stop_outbox_workers()
+    await stop_lead_import_workers()
     shutdown_scheduler()
+    await close_http_clients()
     logging.info("SHUTDOWN: Application shutdown complete")
 
 app = FastAPI(
@@ -1225,15 +1240,18 @@ async def get_dashboard_statistics(
 
 @app.get("/api/dashboard/daily-summary")
 async def get_daily_summary(
+    refresh: bool = False,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Generate AI-powered daily summary for the user"""
+    """Today's AI-powered daily summary for the user; refresh=true re-collects what changed since the last run"""
     try:
-        summary = generate_daily_summary(
+        # The summary's queries run in the threadpool; only the OpenAI call is awaited here
+        summary = await generate_daily_summary(
             db=db,
             user_id=current_user.id,
-            organization_id=current_user.organization_id
+            organization_id=current_user.organization_id,
+            refresh=refresh
         )
         return summary
     except Exception as e:
@@ -1243,6 +1261,14 @@ async def get_daily_summary(
         )
 
 # Calendar endpoints
+def populate_event_names(event):
+    """Fill contact_name/company_name from the eagerly loaded relationships"""
+    if event.contact:
+        event.contact_name = f"{event.contact.first_name} {event.contact.last_name}"
+    if event.company:
+        event.company_name = event.company.name
+    return event
+
 @app.post("/api/calendar/events", response_model=CalendarEventResponse)
 async def create_new_calendar_event(
     event: CalendarEventCreate,
@@ -1272,6 +1298,7 @@ async def read_calendar_events(
     contact_id: Optional[int] = None,
     company_id: Optional[int] = None,
     event_type: Optional[str] = None,
+    source: Optional[str] = None,  # crm, google, o365
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -1287,19 +1314,11 @@ async def read_calendar_events(
     
     events = get_calendar_events(
         db, current_user.organization_id, skip, limit,
-        start_datetime, end_datetime, contact_id, company_id, event_type
+        start_datetime, end_datetime, contact_id, company_id, event_type, source
     )
     
-    # Populate related names
     for event in events:
-        if event.contact_id:
-            contact = get_contact(db, event.contact_id, current_user.organization_id)
-            if contact:
-                event.contact_name = f"{contact.first_name} {contact.last_name}"
-        if event.company_id:
-            company = get_company(db, event.company_id, current_user.organization_id)
-            if company:
-                event.company_name = company.name
+        populate_event_names(event)
     
     return events
 
@@ -1313,17 +1332,7 @@ async def read_calendar_event(
     if not event:
         raise HTTPException(status_code=404, detail="Calendar event not found")
     
-    # Populate related names
-    if event.contact_id:
-        contact = get_contact(db, event.contact_id, current_user.organization_id)
-        if contact:
-            event.contact_name = f"{contact.first_name} {contact.last_name}"
-    if event.company_id:
-        company = get_company(db, event.company_id, current_user.organization_id)
-        if company:
-            event.company_name = company.name
-    
-    return event
+    return populate_event_names(event)
 
 @app.put("/api/calendar/events/{event_id}", response_model=CalendarEventResponse)
 async def update_existing_calendar_event(
@@ -1379,19 +1388,41 @@ async def read_upcoming_events(
     """Get upcoming events for dashboard"""
     events = get_upcoming_events(db, current_user.organization_id, limit)
     
-    # Populate related names
     for event in events:
-        if event.contact_id:
-            contact = get_contact(db, event.contact_id, current_user.organization_id)
-            if contact:
-                event.contact_name = f"{contact.first_name} {contact.last_name}"
-        if event.company_id:
-            company = get_company(db, event.company_id, current_user.organization_id)
-            if company:
-                event.company_name = company.name
+        populate_event_names(event)
     
     return events
 
+@app.get("/api/calendar/availability")
+async def read_calendar_availability(
+    start_date: str,
+    end_date: str,
+    user_ids: Optional[str] = None,  # Comma-separated user IDs; all users by default
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Busy times per user from CRM events and synced Google/O365 calendars"""
+    from datetime import datetime
+    
+    start_datetime = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+    end_datetime = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+    try:
+        requested_ids = [int(user_id) for user_id in user_ids.split(",") if user_id.strip()] if user_ids else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="user_ids must be a comma-separated list of user IDs")
+    
+    busy = {}
+    for user_id, start_time, end_time in get_busy_times(
+        db, current_user.organization_id, start_datetime, end_datetime, requested_ids
+    ):
+        busy.setdefault(user_id, []).append({"start": start_time, "end": end_time})
+    
+    return {
+        "start_date": start_datetime,
+        "end_date": end_datetime,
+        "busy": [{"user_id": user_id, "busy": blocks} for user_id, blocks in busy.items()]
+    }
+
 @app.post("/api/calendar/events/{event_id}/send-invite")
 async def send_calendar_event_invite(
     event_id: int,
@@ -1404,15 +1435,27 @@ async def send_calendar_event_invite(
     if not event:
         raise HTTPException(status_code=404, detail="Calendar event not found")
     
-    # Get attendee contact information
+    # Get attendee contact information in a single query
+    contact_ids = [attendee.contact_id for attendee in event.attendees]
+    contacts_by_id = {
+        contact.id: contact
+        for contact in db.query(Contact).filter(
+            Contact.id.in_(contact_ids),
+            Contact.organization_id == current_user.organization_id
+        ).all()
+    } if contact_ids else {}
+    
     attendee_emails = []
     attendee_names = []
+    invited_attendees = []  # (attendee, email) pairs that will receive an invite
     
     for attendee in event.attendees:
-        contact = db.query(Contact).filter(Contact.id == attendee.contact_id).first()
+        contact = contacts_by_id.get(attendee.contact_id)
         if contact and contact.email:
-            attendee_emails.append(contact.email)
-            attendee_names.append(f"{contact.first_name} {contact.last_name}")
+            if contact.email not in attendee_emails:
+                attendee_emails.append(contact.email)
+                attendee_names.append(f"{contact.first_name} {contact.last_name}")
+            invited_attendees.append((attendee, contact.email))
     
     if not attendee_emails:
         raise HTTPException(status_code=400, detail="No attendees with email addresses found")
@@ -1424,7 +1467,7 @@ async def send_calendar_event_invite(
     
     try:
         # Send calendar invites
-        success = await send_calendar_invite(
+        delivery_results = await send_calendar_invite(
             event_title=event.title,
             event_description=event.description or "",
             start_time=event.start_time,
@@ -1435,33 +1478,43 @@ async def send_calendar_event_invite(
             organizer_name=organizer_name
         )
         
-        if success:
-            # Update attendee records to mark invites as sent
-            from datetime import datetime
-            for attendee in event.attendees:
+        # Record invite status per attendee based on their own delivery result
+        sent_at = datetime.utcnow()
+        for attendee, email in invited_attendees:
+            if delivery_results.get(email):
                 attendee.invite_sent = True
-                attendee.invite_sent_at = datetime.utcnow()
-            
-            db.commit()
-            
-            # # Create activity log - disabled automatic tracking
-            # create_activity(
-            #     db,
-            #     title="Calendar Invites Sent",
-            #     description=f"Sent calendar invites for '{event.title}' to {len(attendee_emails)} attendees",
-            #     type="calendar",
-            #     entity_id=str(event.id),
-            #     organization_id=current_user.organization_id
-            # )
-            
-            return {
-                "success": True,
-                "message": f"Calendar invites sent to {len(attendee_emails)} attendees",
-                "attendees_notified": attendee_names
-            }
-        else:
+                attendee.invite_sent_at = sent_at
+        
+        db.commit()
+        
+        delivered = [email for email in attendee_emails if delivery_results.get(email)]
+        failed = [email for email in attendee_emails if not delivery_results.get(email)]
+        
+        if not delivered:
             raise HTTPException(status_code=500, detail="Failed to send calendar invites")
+        
+        # # Create activity log - disabled automatic tracking
+        # create_activity(
+        #     db,
+        #     title="Calendar Invites Sent",
+        #     description=f"Sent calendar invites for '{event.title}' to {len(delivered)} attendees",
+        #     type="calendar",
+        #     entity_id=str(event.id),
+        #     organization_id=current_user.organization_id
+        # )
+        
+        return {
+            "success": not failed,
+            "message": f"Calendar invites sent to {len(delivered)} of {len(attendee_emails)} attendees",
+            "attendees_notified": [
+                name for name, email in zip(attendee_names, attendee_emails)
+                if delivery_results.get(email)
+            ],
+            "failed_emails": failed
+        }
             
+    except HTTPException:
+        raise
     except Exception as e:
         logging.info(f"Error sending calendar invites: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to send calendar invites: {str(e)}")
@@ -1823,10 +1876,8 @@ async def ai_chat(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Interactive AI chat for CRM questions"""
+    """Interactive AI chat for CRM questions, streamed as Server-Sent Events (token events, then done or error)"""
     try:
-        logging.info(f"AI Chat request received: {request}")
-        
         message = request.get("message", "")
         context = request.get("context", "general")
         summary_data = request.get("summary_data")
@@ -1839,25 +1890,31 @@ async def ai_chat(
                 detail="Message cannot be empty"
             )
         
-        response = process_ai_chat(
-            db=db,
-            user_id=current_user.id,
-            organization_id=current_user.organization_id,
-            message=message,
-            context=context,
-            summary_data=summary_data
-        )
-        
-        logging.info(f"AI Chat response: {response}")
+        try:
+            events = stream_ai_chat(
+                db=db,
+                user_id=current_user.id,
+                organization_id=current_user.organization_id,
+                message=message,
+                context=context,
+                summary_data=summary_data
+            )
+        except ChatLimitExceeded:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many AI chats in progress for your organization. Please try again in a moment."
+            )
         
-        return {"response": response}
+        return StreamingResponse(
+            events,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
         
     except HTTPException:
         raise
     except Exception as e:
-        logging.info(f"AI Chat error: {str(e)}")
-        import traceback
-        traceback.logging.info_exc()
+        logging.error(f"AI Chat error: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process AI chat: {str(e)}"
@@ -4283,48 +4340,13 @@ async def delete_deal_update(
 # Email Tracking endpoints
 @app.post("/api/email-tracking/webhook")
 async def process_sendgrid_webhook(
-    event: SendGridEvent,
+    request: Request,
     db: Session = Depends(get_db)
 ):
-    """Process SendGrid webhook events"""
+    """Process SendGrid webhook events (SendGrid posts a JSON array of events)"""
     try:
-        # Find the email tracking record by message ID
-        tracking = db.query(EmailTracking).filter(
-            EmailTracking.message_id == event.sg_message_id
-        ).first()
-        
-        if not tracking:
-            # Create a new tracking record if it doesn't exist
-            # This might happen if the webhook arrives before our tracking record is created
-            logging.info(f"Email tracking not found for message ID: {event.sg_message_id}")
-            return {"status": "skipped", "reason": "tracking_not_found"}
-        
-        # Create event record
-        email_event = EmailEvent(
-            tracking_id=tracking.id,
-            event_type=event.event,
-            timestamp=datetime.fromtimestamp(event.timestamp),
-            ip_address=event.ip,
-            user_agent=event.useragent,
-            url=event.url,
-            raw_data=event.dict()
-        )
-        db.add(email_event)
-        
-        # Update tracking metrics based on event type
-        if event.event == "open":
-            tracking.open_count += 1
-            if not tracking.opened_at:
-                tracking.opened_at = datetime.fromtimestamp(event.timestamp)
-                
-        elif event.event == "click":
-            tracking.click_count += 1
-            if not tracking.first_clicked_at:
-                tracking.first_clicked_at = datetime.fromtimestamp(event.timestamp)
-        
-        db.commit()
-        
-        return {"status": "processed", "event_type": event.event}
+        payload = await request.json()
+        return ingest_sendgrid_events(db, payload)
         
     except Exception as e:
         logging.info(f"Error processing SendGrid webhook: {str(e)}")
@@ -4363,6 +4385,7 @@ async def get_email_tracking_list(
     skip: int = 0,
     limit: int = 100,
     contact_id: Optional[int] = None,
+    campaign_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -4374,22 +4397,51 @@ async def get_email_tracking_list(
     if contact_id:
         query = query.filter(EmailTracking.contact_id == contact_id)
     
+    if campaign_id:
+        query = query.filter(EmailTracking.campaign_id == campaign_id)
+    
     trackings = query.order_by(EmailTracking.sent_at.desc()).offset(skip).limit(limit).all()
     
-    # Populate response fields
+    # Populate response fields, loading senders and contacts for the whole page at once
+    sender_ids = {tracking.sent_by for tracking in trackings}
+    contact_ids = {tracking.contact_id for tracking in trackings if tracking.contact_id}
+    sender_names = {
+        user.id: f"{user.first_name} {user.last_name}"
+        for user in db.query(User).filter(User.id.in_(sender_ids)).all()
+    } if sender_ids else {}
+    contact_names = {
+        contact.id: f"{contact.first_name} {contact.last_name}"
+        for contact in db.query(Contact).filter(Contact.id.in_(contact_ids)).all()
+    } if contact_ids else {}
+    
     for tracking in trackings:
-        sender = db.query(User).filter(User.id == tracking.sent_by).first()
-        if sender:
-            tracking.sender_name = f"{sender.first_name} {sender.last_name}"
-        
-        if tracking.contact_id:
-            contact = db.query(Contact).filter(Contact.id == tracking.contact_id).first()
-            if contact:
-                tracking.contact_name = f"{contact.first_name} {contact.last_name}"
+        tracking.sender_name = sender_names.get(tracking.sent_by)
+        tracking.contact_name = contact_names.get(tracking.contact_id)
     
     return trackings
 
 
+@app.get("/api/email-analytics")
+async def get_email_analytics_endpoint(
+    days: int = 30,
+    campaign_id: Optional[int] = None,
+    limit: int = 50,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Bulk email engagement (sent, opens, clicks, bounces, unsubscribes) per campaign and per day"""
+    if days < 1 or days > 365:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 365")
+    
+    return get_email_analytics(
+        db,
+        organization_id=current_user.organization_id,
+        days=days,
+        campaign_id=campaign_id,
+        limit=min(max(limit, 1), 200),
+    )
+
+
 @app.get("/api/email-tracking/{tracking_id}", response_model=EmailTrackingResponse)
 async def get_email_tracking(
     tracking_id: int,
@@ -4442,7 +4494,7 @@ async def get_email_events(
 
 
 # Email Thread endpoints
-@app.get("/api/email-threads", response_model=List[EmailThreadResponse])
+@app.get("/api/email-threads", response_model=List[EmailThreadSummary])
 async def get_email_threads_list(
     skip: int = 0,
     limit: int = 100,
@@ -4450,7 +4502,7 @@ async def get_email_threads_list(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get email threads for the organization"""
+    """Get email thread summaries for the organization (messages are paged via /messages)"""
     threads = get_email_threads(
         db, 
         current_user.organization_id,
@@ -4476,6 +4528,36 @@ async def create_email_thread_endpoint(
     return db_thread
 
 
+@app.get("/api/email-threads/{thread_id}/messages", response_model=EmailMessagePage)
+async def get_thread_messages(
+    thread_id: int,
+    limit: int = 50,
+    before_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get a page of a thread's messages, newest first; pass next_before_id to get older ones"""
+    thread_exists = db.query(EmailThread.id).filter(
+        EmailThread.id == thread_id,
+        EmailThread.organization_id == current_user.organization_id
+    ).first()
+    
+    if not thread_exists:
+        raise HTTPException(status_code=404, detail="Email thread not found")
+    
+    messages, has_more = get_email_thread_messages(
+        db,
+        thread_id,
+        limit=min(max(limit, 1), 200),
+        before_id=before_id
+    )
+    return {
+        "messages": messages,
+        "has_more": has_more,
+        "next_before_id": messages[-1].id if has_more else None,
+    }
+
+
 @app.post("/api/email-threads/{thread_id}/messages", response_model=EmailMessageResponse)
 async def add_message_to_thread(
     thread_id: int,
@@ -4502,13 +4584,13 @@ async def add_message_to_thread(
     return db_message
 
 
-@app.get("/api/contacts/{contact_id}/email-threads", response_model=List[EmailThreadResponse])
+@app.get("/api/contacts/{contact_id}/email-threads", response_model=List[EmailThreadSummary])
 async def get_contact_email_threads(
     contact_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get all email threads for a specific contact"""
+    """Get email thread summaries for a specific contact"""
     # Verify contact belongs to organization
     contact = db.query(Contact).filter(
         Contact.id == contact_id,
@@ -4526,6 +4608,30 @@ async def get_contact_email_threads(
     return threads
 
 
+@app.get("/api/contacts/{contact_id}/email-messages", response_model=List[EmailMessageResponse])
+async def get_contact_email_messages_list(
+    contact_id: int,
+    per_thread: int = 100,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get the latest messages of all of a contact's threads at once, newest first"""
+    contact = db.query(Contact.id).filter(
+        Contact.id == contact_id,
+        Contact.organization_id == current_user.organization_id
+    ).first()
+    
+    if not contact:
+        raise HTTPException(status_code=404, detail="Contact not found")
+    
+    return get_contact_email_messages(
+        db,
+        current_user.organization_id,
+        contact_id,
+        per_thread=min(max(per_thread, 1), 200)
+    )
+
+
 # Email Privacy and Sharing Endpoints
 @app.patch("/api/contacts/{contact_id}/privacy")
 async def update_contact_privacy(
@@ -4844,7 +4950,7 @@ async def sync_o365_emails(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Manually trigger O365 email sync"""
+    """Manually trigger O365 email (and calendar) sync"""
     connection = db.query(O365UserConnection).filter(
         O365UserConnection.user_id == current_user.id,
         O365UserConnection.is_active == True
@@ -4864,11 +4970,15 @@ async def sync_o365_emails(
                 current_user.organization_id,
                 since=connection.last_sync_at
             )
+            calendar_synced_count = 0
+            if connection.sync_calendar_enabled:
+                calendar_synced_count = await service.sync_calendar_events(db)
             db.commit()
             
         return {
             "success": True,
             "synced_count": synced_count,
+            "calendar_synced_count": calendar_synced_count,
             "last_sync": connection.last_sync_at
         }
         
@@ -4877,6 +4987,41 @@ async def sync_o365_emails(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/o365/sync/contacts")
+async def sync_o365_contacts(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Import the user's Outlook contacts into the CRM"""
+    connection = db.query(O365UserConnection).filter(
+        O365UserConnection.user_id == current_user.id,
+        O365UserConnection.is_active == True
+    ).first()
+    
+    if not connection:
+        raise HTTPException(status_code=400, detail="No active O365 connection")
+    if not connection.sync_contacts_enabled:
+        raise HTTPException(status_code=400, detail="Contact sync is disabled for this connection")
+    
+    org_config = get_o365_org_config(db, current_user.organization_id)
+    if not org_config:
+        raise HTTPException(status_code=400, detail="O365 not configured")
+    
+    try:
+        async with O365Service(connection, org_config) as service:
+            stats = await service.sync_contacts(db)
+            
+        return {
+            "success": True,
+            "stats": stats,
+            "last_sync": connection.last_contacts_sync
+        }
+        
+    except Exception as e:
+        logging.info(f"O365 contacts sync error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.delete("/api/o365/disconnect")
 async def disconnect_o365(
     current_user: User = Depends(get_current_active_user),
@@ -4888,6 +5033,8 @@ async def disconnect_o365(
     ).first()
     
     if connection:
+        # Synced events would never be updated again
+        delete_calendar_events(db, "o365", current_user.id)
         db.delete(connection)
         db.commit()
         
@@ -5082,18 +5229,16 @@ async def sync_google_data(
             synced_items = {}
             
             if sync_type in ["gmail", "all"] and connection.sync_gmail_enabled:
-                await service.sync_gmail_messages(
+                synced_items["gmail"] = await service.sync_gmail_messages(
                     db, 
                     since_date=connection.last_gmail_sync
                 )
-                synced_items["gmail"] = "completed"
             
-            # Additional sync types can be implemented here
-            # if sync_type in ["calendar", "all"] and connection.sync_calendar_enabled:
-            #     synced_items["calendar"] = await service.sync_calendar_events(db)
+            if sync_type in ["calendar", "all"] and connection.sync_calendar_enabled:
+                synced_items["calendar"] = await service.sync_calendar_events(db)
             
-            # if sync_type in ["contacts", "all"] and connection.sync_contacts_enabled:
-            #     synced_items["contacts"] = await service.sync_contacts(db)
+            if sync_type in ["contacts", "all"] and connection.sync_contacts_enabled:
+                synced_items["contacts"] = await service.sync_contacts(db)
         
         db.commit()
         
@@ -5126,6 +5271,8 @@ async def disconnect_google(
     ).first()
     
     if connection:
+        # Synced events would never be updated again
+        delete_calendar_events(db, "google", current_user.id)
         db.delete(connection)
         db.commit()
         
@@ -5147,18 +5294,36 @@ async def process_inbound_email(
             raise HTTPException(status_code=401, detail="Invalid webhook secret")
     
     body = await request.json()
+    headers = body.get("headers") or {}
+    if not isinstance(headers, dict):
+        headers = {}
     
-    from_email = body.get("from_email", "")
+    from_addresses = parse_addresses(body.get("from_email", ""))
+    from_email = from_addresses[0] if from_addresses else ""
     to_email = body.get("to_email", "")
     subject = body.get("subject", "")
     content = body.get("content", "")
+    internet_message_id = body.get("message_id") or headers.get("Message-ID")
+    in_reply_to = body.get("in_reply_to") or headers.get("In-Reply-To")
+    references = body.get("references") or headers.get("References")
     
     logging.info(f"Processing inbound email from {from_email} to {to_email}")
     
-    # Find contact by email
-    contact = db.query(Contact).filter(
-        Contact.email == from_email
-    ).first()
+    if not from_email:
+        return {"error": "Missing sender address"}
+    
+    # The organization is the one whose user the email was sent to, or else the
+    # sender's when a CRM user sent it. Contacts are only ever matched within it,
+    # so mail between outside addresses is never filed under another tenant.
+    organization_id = (
+        find_organization_for_addresses(db, parse_addresses(to_email))
+        or find_organization_for_addresses(db, [from_email])
+    )
+    if organization_id is None:
+        logging.warning(f"Inbound email from {from_email} to {to_email} matches no CRM user, ignoring")
+        return {"error": "No CRM user among the sender or recipients"}
+    
+    contact = find_contact_by_email(db, from_email, organization_id)
     
     if not contact:
         logging.info(f"No contact found for email {from_email}, creating new contact")
@@ -5167,40 +5332,32 @@ async def process_inbound_email(
         first_name = email_parts[0].title() if email_parts else "Unknown"
         last_name = email_parts[1].title() if len(email_parts) > 1 else "Contact"
         
-        # Create contact - find first organization (improve this later)
-        first_org = db.query(Organization).first()
-        if not first_org:
-            return {"error": "No organization found to assign contact"}
-        
         contact = Contact(
             first_name=first_name,
             last_name=last_name,
             email=from_email,
-            organization_id=first_org.id,
+            organization_id=organization_id,
             status="Active"
         )
         db.add(contact)
         db.commit()
         db.refresh(contact)
     
-    # Find or create email thread
-    threads = db.query(EmailThread).filter(
-        EmailThread.contact_id == contact.id,
-        EmailThread.organization_id == contact.organization_id
-    ).all()
-    
-    # Look for existing thread with same subject
-    thread = None
-    clean_subject = subject.replace("Re: ", "").replace("RE: ", "").strip()
-    for t in threads:
-        if t.subject.replace("Re: ", "").replace("RE: ", "").strip() == clean_subject:
-            thread = t
-            break
+    # Find or create email thread: replies by referenced Message-ID, otherwise by subject
+    thread = find_thread(
+        db,
+        organization_id=contact.organization_id,
+        contact_id=contact.id,
+        subject=subject,
+        in_reply_to=in_reply_to,
+        references=references,
+    )
     
     if not thread:
         # Create new thread
         thread = EmailThread(
-            subject=subject,
+            subject=subject or "(no subject)",
+            normalized_subject_hash=subject_hash(subject),
             contact_id=contact.id,
             organization_id=contact.organization_id,
             message_count=0
@@ -5215,7 +5372,8 @@ async def process_inbound_email(
         sender=f"{contact.first_name} {contact.last_name}",
         content=content,
         direction="incoming",
-        message_id=f"inbound_{int(time.time())}_{thread.id}"
+        message_id=f"inbound_{int(time.time())}_{thread.id}",
+        internet_message_id=internet_message_id
     )
     db.add(message)
     
@@ -5262,6 +5420,93 @@ async def standardize_phone_numbers_endpoint(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/admin/scheduler/jobs")
+async def scheduler_job_history(
+    job_id: Optional[str] = None,
+    limit: int = 50,
+    current_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Background scheduler status: which process is leader, per-job run statistics,
+    and the most recent job runs.
+    """
+    from scheduler import get_scheduler_status
+    from sqlalchemy import func
+    
+    summary_rows = db.query(
+        models.SchedulerJobRun.job_id,
+        func.count(models.SchedulerJobRun.id),
+        func.avg(models.SchedulerJobRun.duration_ms),
+        func.max(models.SchedulerJobRun.duration_ms),
+        func.max(models.SchedulerJobRun.started_at),
+    ).group_by(models.SchedulerJobRun.job_id).all()
+    
+    runs_query = db.query(models.SchedulerJobRun)
+    if job_id:
+        runs_query = runs_query.filter(models.SchedulerJobRun.job_id == job_id)
+    runs = runs_query.order_by(models.SchedulerJobRun.started_at.desc()).limit(min(limit, 500)).all()
+    
+    latest_run = db.query(models.SchedulerJobRun).order_by(models.SchedulerJobRun.started_at.desc()).first()
+    
+    return {
+        "this_process": get_scheduler_status(),
+        "latest_run_worker": latest_run.worker_id if latest_run else None,
+        "jobs": [
+            {
+                "job_id": row[0],
+                "run_count": row[1],
+                "avg_duration_ms": round(float(row[2]), 1) if row[2] is not None else None,
+                "max_duration_ms": row[3],
+                "last_started_at": row[4].isoformat() if row[4] else None,
+            }
+            for row in summary_rows
+        ],
+        "runs": [
+            {
+                "id": run.id,
+                "job_id": run.job_id,
+                "job_name": run.job_name,
+                "worker_id": run.worker_id,
+                "status": run.status,
+                "started_at": run.started_at.isoformat() if run.started_at else None,
+                "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+                "duration_ms": run.duration_ms,
+                "result": run.result,
+                "error_message": run.error_message,
+            }
+            for run in runs
+        ],
+    }
+
+
+@app.get("/api/admin/mailbox-sync")
+async def mailbox_sync_status(
+    current_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Background mailbox sync status for the organization: per-connection result,
+    duration and lag since the last successful sync, most behind first.
+    """
+    from mailbox_sync import get_mailbox_sync_overview
+
+    return get_mailbox_sync_overview(db, current_user.organization_id)
+
+
+@app.get("/api/admin/ai-chat/cache")
+async def ai_chat_cache_stats(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    AI chat response cache for the organization: hits, misses, hit rate,
+    evictions, expirations and invalidations since the process started.
+    """
+    from ai_response_cache import response_cache
+
+    return response_cache.stats(current_user.organization_id)
+
+
 @app.get("/api/admin/find-duplicates")
 async def find_duplicates_endpoint(
     record_type: str,
@@ -5378,6 +5623,8 @@ async def bulk_email_send(
     if not request.html_content:
         raise HTTPException(status_code=400, detail="HTML content is required")
     
+    unknown_variables = find_unknown_variables(request.subject, request.html_content, request.text_content)
+    
     # If scheduled_at is provided, save for later instead of sending now
     if request.scheduled_at:
         try:
@@ -5409,11 +5656,12 @@ async def bulk_email_send(
             "scheduled_email_id": scheduled_email.id,
             "scheduled_at": scheduled_email.scheduled_at.isoformat().replace('+00:00', 'Z') if scheduled_email.scheduled_at.tzinfo else scheduled_email.scheduled_at.isoformat() + 'Z',
             "contact_count": len(request.contact_ids),
+            "unknown_variables": unknown_variables,
             "message": f"Email scheduled for {scheduled_email.scheduled_at.strftime('%B %d, %Y at %I:%M %p')} to {len(request.contact_ids)} contacts"
         }
     
-    # Send immediately
-    result = await send_bulk_email(
+    # Send now: queue one outbox message per recipient; the outbox workers deliver them
+    job = enqueue_bulk_email(
         db=db,
         organization_id=current_user.organization_id,
         sender_user_id=current_user.id,
@@ -5426,7 +5674,31 @@ async def bulk_email_send(
         bcc_email=request.bcc_email,
     )
     
-    return result
+    progress = get_job_progress(db, job)
+    progress["queued"] = True
+    progress["unknown_variables"] = unknown_variables
+    progress["message"] = f"Queued {job.total_count} emails for delivery ({len(job.skipped or [])} skipped)"
+    return progress
+
+
+@app.get("/api/bulk-email/jobs/{job_id}")
+async def bulk_email_job_progress(
+    job_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get delivery progress for a queued bulk email job"""
+    job = db.query(BulkEmailJob).filter(
+        BulkEmailJob.id == job_id,
+        BulkEmailJob.organization_id == current_user.organization_id
+    ).first()
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Bulk email job not found")
+    
+    progress = get_job_progress(db, job)
+    progress["message"] = f"Sent {progress['success_count']} of {job.total_count} emails ({progress['skipped_count']} skipped)"
+    return progress
 
 
 @app.get("/api/bulk-email/scheduled")
@@ -5562,7 +5834,11 @@ async def bulk_email_cancel_scheduled(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Cancel or delete a scheduled email. Pending emails are cancelled, cancelled/sent/failed emails are deleted."""
+    """
+    Cancel or delete a scheduled email. Pending emails are cancelled, as are
+    emails already sending (their undelivered messages are dropped);
+    cancelled/sent/failed emails are deleted.
+    """
     scheduled = db.query(ScheduledEmail).filter(
         ScheduledEmail.id == scheduled_id,
         ScheduledEmail.organization_id == current_user.organization_id
@@ -5575,7 +5851,23 @@ async def bulk_email_cancel_scheduled(
         scheduled.status = "cancelled"
         db.commit()
         return {"message": "Scheduled email cancelled", "id": scheduled_id}
+    elif scheduled.status == "sending":
+        # Already dispatched: stop the outbox messages that have not gone out yet
+        job = db.query(BulkEmailJob).filter(BulkEmailJob.scheduled_email_id == scheduled.id).first()
+        cancelled = cancel_bulk_email_job(db, job) if job else 0
+        scheduled.status = "cancelled"
+        scheduled.result = {
+            "job_id": job.id if job else None,
+            "cancelled_count": cancelled,
+            "message": f"Cancelled while sending; {cancelled} emails were not sent",
+        }
+        db.commit()
+        return {"message": "Scheduled email cancelled", "id": scheduled_id, "cancelled_count": cancelled}
     elif scheduled.status in ["cancelled", "sent", "failed"]:
+        # Jobs keep their delivery history; only their link to this email goes
+        db.query(BulkEmailJob).filter(
+            BulkEmailJob.scheduled_email_id == scheduled.id
+        ).update({"scheduled_email_id": None}, synchronize_session=False)
         db.delete(scheduled)
         db.commit()
         return {"message": "Scheduled email deleted", "id": scheduled_id}
@@ -5587,48 +5879,14 @@ async def bulk_email_cancel_scheduled(
 async def bulk_email_process_scheduled(
     db: Session = Depends(get_db)
 ):
-    """Process pending scheduled emails that are due. Called by cron/scheduler."""
-    now = datetime.utcnow()
-    
-    pending = db.query(ScheduledEmail).filter(
-        ScheduledEmail.status == "pending",
-        ScheduledEmail.scheduled_at <= now
-    ).all()
-    
-    results = []
-    for scheduled in pending:
-        try:
-            scheduled.status = "sending"
-            db.commit()
-            
-            result = await send_bulk_email(
-                db=db,
-                organization_id=scheduled.organization_id,
-                sender_user_id=scheduled.created_by,
-                contact_ids=scheduled.contact_ids,
-                subject=scheduled.subject,
-                html_content=scheduled.html_content,
-                from_email=scheduled.from_email,
-                from_name=scheduled.from_name,
-                text_content=scheduled.text_content,
-                bcc_email=scheduled.bcc_email,
-            )
-            
-            scheduled.status = "sent"
-            scheduled.sent_at = datetime.utcnow()
-            scheduled.result = result
-            db.commit()
-            
-            results.append({"id": scheduled.id, "status": "sent", "result": result})
-            logging.info(f"Scheduled email {scheduled.id} sent successfully: {result['message']}")
-            
-        except Exception as e:
-            scheduled.status = "failed"
-            scheduled.result = {"error": str(e)}
-            db.commit()
-            results.append({"id": scheduled.id, "status": "failed", "error": str(e)})
-            logging.error(f"Scheduled email {scheduled.id} failed: {e}")
+    """Queue pending scheduled emails that are due. Called by cron/scheduler.
     
+    Each scheduled email is claimed atomically, so this is safe to call while the
+    background scheduler is running in other workers or replicas.
+    """
+    import socket
+    worker_id = f"api:{socket.gethostname()}:{os.getpid()}"
+    results = dispatch_due_scheduled_emails(db, worker_id=worker_id)
     return {"processed": len(results), "results": results}
 
 @app.get("/api/bulk-email/contacts")
@@ -5741,6 +5999,8 @@ async def create_email_template_endpoint(
         "html_content": template.html_content,
         "created_at": template.created_at.isoformat() if template.created_at else None,
         "updated_at": template.updated_at.isoformat() if template.updated_at else None,
+        # Placeholders bulk email cannot fill in (they would be sent as-is)
+        "unknown_variables": find_unknown_variables(template.subject, template.html_content),
     }
 
 @app.get("/api/email-templates/{template_id}")
@@ -5804,6 +6064,7 @@ async def update_email_template_endpoint(
         "html_content": template.html_content,
         "created_at": template.created_at.isoformat() if template.created_at else None,
         "updated_at": template.updated_at.isoformat() if template.updated_at else None,
+        "unknown_variables": find_unknown_variables(template.subject, template.html_content),
     }
 
 @app.delete("/api/email-templates/{template_id}")
@@ -5869,6 +6130,16 @@ async def unsubscribe_contact(
     ).first()
     
     if contact:
+        if not contact.unsubscribed:
+            # Attribute the unsubscribe to the most recent campaign sent to this contact
+            latest = db.query(EmailTracking.organization_id, EmailTracking.campaign_id).filter(
+                EmailTracking.contact_id == contact.id,
+                EmailTracking.campaign_id.isnot(None)
+            ).order_by(EmailTracking.sent_at.desc()).first()
+            if latest:
+                increments = new_increments()
+                increments[(latest.organization_id, latest.campaign_id, datetime.utcnow().date())]["unsubscribe_count"] += 1
+                apply_stat_increments(db, increments)
         contact.unsubscribed = True
         db.commit()
         logging.info(f"Contact {email} (ID: {cid}) unsubscribed from bulk emails")
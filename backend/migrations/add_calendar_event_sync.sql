@@ -0,0 +1,21 @@
+-- Migration: Incremental provider calendar sync
+-- Google Calendar and Graph events are upserted into calendar_events keyed by
+-- (source, created_by, external_id); connections keep their sync token / deltaLink
+-- Applied automatically by run_migrations.py on next server startup
+
+ALTER TABLE calendar_events
+    ADD COLUMN IF NOT EXISTS source VARCHAR(20) NOT NULL DEFAULT 'crm',
+    ADD COLUMN IF NOT EXISTS external_id VARCHAR(255);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_calendar_events_source_user_external_id
+    ON calendar_events (source, created_by, external_id);
+
+CREATE INDEX IF NOT EXISTS ix_calendar_events_org_start_time
+    ON calendar_events (organization_id, start_time);
+
+ALTER TABLE google_user_connections
+    ADD COLUMN IF NOT EXISTS calendar_sync_token TEXT;
+
+ALTER TABLE o365_user_connections
+    ADD COLUMN IF NOT EXISTS calendar_delta_link TEXT,
+    ADD COLUMN IF NOT EXISTS last_calendar_sync TIMESTAMP WITH TIME ZONE;
@@ -0,0 +1,13 @@
+-- Migration: Incremental address book import
+-- Google People and Graph contacts imports resume from a stored sync token / deltaLink
+-- Applied automatically by run_migrations.py on next server startup
+
+ALTER TABLE google_user_connections
+    ADD COLUMN IF NOT EXISTS contacts_sync_token TEXT;
+
+ALTER TABLE o365_user_connections
+    ADD COLUMN IF NOT EXISTS contacts_delta_link TEXT,
+    ADD COLUMN IF NOT EXISTS last_contacts_sync TIMESTAMP WITH TIME ZONE;
+
+CREATE INDEX IF NOT EXISTS ix_companies_org_lower_name
+    ON companies (organization_id, lower(name));
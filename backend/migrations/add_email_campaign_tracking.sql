@@ -0,0 +1,9 @@
+-- Migration: Link tracked emails to the bulk email campaign that sent them
+-- email_campaign_stats itself is a new table and is created by create_all
+-- Applied automatically by run_migrations.py on next server startup
+
+ALTER TABLE email_tracking
+    ADD COLUMN IF NOT EXISTS campaign_id INTEGER REFERENCES bulk_email_jobs(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS ix_email_tracking_campaign_id
+    ON email_tracking (campaign_id);
@@ -0,0 +1,11 @@
+-- Migration: Store SendGrid's sg_event_id on email events
+-- SendGrid redelivers webhook batches on timeouts; the unique index lets the
+-- batched webhook drop duplicates with INSERT ... ON CONFLICT DO NOTHING
+-- Applied automatically by run_migrations.py on next server startup
+
+ALTER TABLE email_events
+    ADD COLUMN IF NOT EXISTS sg_event_id VARCHAR(100);
+
+-- Same name Postgres gives the column's UNIQUE constraint on fresh databases
+CREATE UNIQUE INDEX IF NOT EXISTS email_events_sg_event_id_key
+    ON email_events (sg_event_id);
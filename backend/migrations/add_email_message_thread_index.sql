@@ -0,0 +1,6 @@
+-- Migration: Index for paging a thread's messages
+-- Serves GET /api/email-threads/{id}/messages (keyset pagination on id)
+-- Applied automatically by run_migrations.py on next server startup
+
+CREATE INDEX IF NOT EXISTS ix_email_messages_thread_id_id
+    ON email_messages (thread_id, id);
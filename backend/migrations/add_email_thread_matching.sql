@@ -0,0 +1,27 @@
+-- Migration: Indexed contact and thread resolution for inbound email
+-- Contacts are looked up by lower(email) within an organization, threads by
+-- the Message-IDs a reply references or by a hash of the normalized subject
+-- Applied automatically by run_migrations.py on next server startup
+
+CREATE INDEX IF NOT EXISTS ix_contacts_org_lower_email
+    ON contacts (organization_id, lower(email));
+
+ALTER TABLE email_threads
+    ADD COLUMN IF NOT EXISTS normalized_subject_hash VARCHAR(32);
+
+-- Same normalization as email_threading.normalize_subject: strip stacked
+-- reply/forward prefixes, collapse whitespace, trim, lowercase
+UPDATE email_threads
+SET normalized_subject_hash = md5(lower(btrim(regexp_replace(
+        regexp_replace(subject, '^\s*((re|fwd?|aw|sv|wg)(\[\d+\])?\s*:\s*)+', '', 'i'),
+        '\s+', ' ', 'g'))))
+WHERE normalized_subject_hash IS NULL;
+
+CREATE INDEX IF NOT EXISTS ix_email_threads_contact_subject_hash
+    ON email_threads (contact_id, normalized_subject_hash);
+
+ALTER TABLE email_messages
+    ADD COLUMN IF NOT EXISTS internet_message_id VARCHAR(512);
+
+CREATE INDEX IF NOT EXISTS ix_email_messages_internet_message_id
+    ON email_messages (internet_message_id);
@@ -0,0 +1,6 @@
+-- Migration: Store the Gmail historyId per Google connection
+-- Gmail sync resumes from users.history.list instead of re-listing by date
+-- Applied automatically by run_migrations.py on next server startup
+
+ALTER TABLE google_user_connections
+    ADD COLUMN IF NOT EXISTS gmail_history_id VARCHAR(64);
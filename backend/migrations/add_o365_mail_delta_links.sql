@@ -0,0 +1,6 @@
+-- Migration: Store Microsoft Graph mail delta links per O365 connection
+-- Mail sync resumes each folder from its deltaLink instead of re-listing by date
+-- Applied automatically by run_migrations.py on next server startup
+
+ALTER TABLE o365_user_connections
+    ADD COLUMN IF NOT EXISTS mail_delta_links JSON;
@@ -0,0 +1,14 @@
+-- Migration: Track which worker claimed a scheduled email
+-- Lets scheduled emails be claimed atomically across workers/replicas and
+-- recovered if a worker dies after claiming
+-- Applied automatically by run_migrations.py on next server startup
+
+ALTER TABLE scheduled_emails
+    ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(255);
+
+ALTER TABLE scheduled_emails
+    ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITH TIME ZONE;
+
+-- Index for the due-email poll (status = 'pending' AND scheduled_at <= now)
+CREATE INDEX IF NOT EXISTS ix_scheduled_emails_status_scheduled_at
+    ON scheduled_emails (status, scheduled_at);
@@ -0,0 +1,41 @@
+-- Migration: Store inbound lead-source API keys as SHA-256 digests
+-- Webhook authentication hashes the presented Bearer key and looks the digest
+-- up through a unique index. Existing keys keep working: their digests are
+-- computed here and the plaintext values are cleared. The plaintext columns
+-- stay (empty) because earlier migrations index them on fresh databases.
+-- Applied automatically by run_migrations.py on next server startup
+
+ALTER TABLE lead_source_integrations
+    ADD COLUMN IF NOT EXISTS clay_api_key_hash VARCHAR(64),
+    ADD COLUMN IF NOT EXISTS linkedin_webhook_api_key_hash VARCHAR(64),
+    ADD COLUMN IF NOT EXISTS apollo_api_key_hash VARCHAR(64);
+
+UPDATE lead_source_integrations
+    SET clay_api_key_hash = encode(sha256(convert_to(clay_api_key, 'UTF8')), 'hex')
+    WHERE clay_api_key IS NOT NULL AND clay_api_key_hash IS NULL;
+
+UPDATE lead_source_integrations
+    SET linkedin_webhook_api_key_hash = encode(sha256(convert_to(linkedin_webhook_api_key, 'UTF8')), 'hex')
+    WHERE linkedin_webhook_api_key IS NOT NULL AND linkedin_webhook_api_key_hash IS NULL;
+
+UPDATE lead_source_integrations
+    SET apollo_api_key_hash = encode(sha256(convert_to(apollo_api_key, 'UTF8')), 'hex')
+    WHERE apollo_api_key IS NOT NULL AND apollo_api_key_hash IS NULL;
+
+UPDATE lead_source_integrations
+    SET clay_api_key = NULL, linkedin_webhook_api_key = NULL, apollo_api_key = NULL
+    WHERE clay_api_key IS NOT NULL OR linkedin_webhook_api_key IS NOT NULL OR apollo_api_key IS NOT NULL;
+
+DROP INDEX IF EXISTS idx_lsi_clay_api_key;
+DROP INDEX IF EXISTS idx_lsi_linkedin_api_key;
+DROP INDEX IF EXISTS idx_lsi_apollo_api_key;
+
+-- Same names SQLAlchemy gives the unique indexes on fresh databases
+CREATE UNIQUE INDEX IF NOT EXISTS ix_lead_source_integrations_clay_api_key_hash
+    ON lead_source_integrations (clay_api_key_hash);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_lead_source_integrations_linkedin_webhook_api_key_hash
+    ON lead_source_integrations (linkedin_webhook_api_key_hash);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_lead_source_integrations_apollo_api_key_hash
+    ON lead_source_integrations (apollo_api_key_hash);
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, Float, Enum, cast, UniqueConstraint, LargeBinary
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Boolean, ForeignKey, JSON, Float, Enum, cast, UniqueConstraint, LargeBinary, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -34,10 +34,91 @@ class ScheduledEmail(Base):
     scheduled_at = Column(DateTime(timezone=True), nullable=False)  # When to send (stored in UTC)
     schedule_timezone = Column(String(50))  # User's selected timezone e.g. America/Chicago
     status = Column(String(50), default="pending")  # pending, sending, sent, failed, cancelled
+    claimed_by = Column(String(255))  # Worker that claimed this email for sending
+    claimed_at = Column(DateTime(timezone=True))  # When it was claimed (lease start)
     sent_at = Column(DateTime(timezone=True))  # When actually sent
     result = Column(JSON)  # Send results (success_count, error_count, etc.)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_scheduled_emails_status_scheduled_at", "status", "scheduled_at"),
+    )
+
+
+class BulkEmailJob(Base):
+    """A bulk email campaign queued for delivery through the outbox"""
+    __tablename__ = "bulk_email_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False, index=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    scheduled_email_id = Column(Integer, ForeignKey("scheduled_emails.id"), nullable=True)  # Set when queued from a scheduled email
+    subject = Column(Text, nullable=False)
+    html_content = Column(Text, nullable=False)
+    text_content = Column(Text)
+    from_email = Column(String(255))
+    from_name = Column(String(255))
+    bcc_email = Column(String(255))
+    total_count = Column(Integer, default=0)  # Recipients queued (excludes skipped contacts)
+    skipped = Column(JSON)  # Contacts skipped at enqueue time (no email, unsubscribed, ...)
+    status = Column(String(50), default="queued")  # queued, sending, completed, cancelled
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    completed_at = Column(DateTime(timezone=True))
+    
+    # Relationships
+    outbox_messages = relationship("EmailOutbox", back_populates="job", cascade="all, delete-orphan")
+
+
+class EmailOutbox(Base):
+    """One outbound email per recipient, claimed and delivered by the outbox workers"""
+    __tablename__ = "email_outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("bulk_email_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False)
+    contact_id = Column(Integer, ForeignKey("contacts.id", ondelete="SET NULL"), nullable=True)
+    to_email = Column(String(255), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, sending, sent, failed, skipped, cancelled
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    claimed_by = Column(String(255))  # Worker that currently holds / last held this message
+    claimed_at = Column(DateTime(timezone=True))
+    sent_at = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    job = relationship("BulkEmailJob", back_populates="outbox_messages")
+    
+    __table_args__ = (
+        # Workers poll for due pending rows; keep that lookup index-only
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+
+class EmailCampaignStats(Base):
+    """Per-day engagement counters for a bulk email campaign, kept current as sends and events arrive"""
+    __tablename__ = "email_campaign_stats"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False)
+    campaign_id = Column(Integer, ForeignKey("bulk_email_jobs.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=False)  # UTC day the send or event happened
+    sent_count = Column(Integer, nullable=False, default=0)
+    open_count = Column(Integer, nullable=False, default=0)
+    unique_open_count = Column(Integer, nullable=False, default=0)  # Recipients whose first open was this day
+    click_count = Column(Integer, nullable=False, default=0)
+    unique_click_count = Column(Integer, nullable=False, default=0)
+    bounce_count = Column(Integer, nullable=False, default=0)
+    unsubscribe_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("campaign_id", "day", name="uq_email_campaign_stats_campaign_day"),
+        Index("ix_email_campaign_stats_org_day", "organization_id", "day"),
+    )
 
 
 class EmailTemplate(Base):
@@ -178,6 +259,9 @@ class Company(Base):
             return f"{self.primary_account_owner.first_name} {self.primary_account_owner.last_name}"
         return None
 
+# Case-insensitive company name matching (address book import) within an organization
+Index("ix_companies_org_lower_name", Company.organization_id, func.lower(Company.name))
+
 class Contact(Base):
     __tablename__ = "contacts"
     
@@ -222,6 +306,9 @@ class Contact(Base):
             return f"{self.primary_account_owner.first_name} {self.primary_account_owner.last_name}"
         return None
 
+# Case-insensitive email lookups (inbound mail, sync) within an organization
+Index("ix_contacts_org_lower_email", Contact.organization_id, func.lower(Contact.email))
+
 class EmailThread(Base):
     __tablename__ = "email_threads"
     
@@ -231,6 +318,7 @@ class EmailThread(Base):
     contact_id = Column(Integer, ForeignKey("contacts.id"), nullable=False)
     message_count = Column(Integer, default=0)
     preview = Column(Text)
+    normalized_subject_hash = Column(String(32))  # md5 of email_threading.normalize_subject(subject)
     
     # Privacy settings
     is_private = Column(Boolean, default=True)  # Private by default
@@ -245,6 +333,11 @@ class EmailThread(Base):
     messages = relationship("EmailMessage", back_populates="thread", cascade="all, delete-orphan")
     owner = relationship("User", foreign_keys=[owner_id])
     sharing_permissions = relationship("EmailSharingPermission", back_populates="email_thread", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Subject-based thread matching for a contact
+        Index("ix_email_threads_contact_subject_hash", "contact_id", "normalized_subject_hash"),
+    )
 
 class EmailMessage(Base):
     __tablename__ = "email_messages"
@@ -255,10 +348,16 @@ class EmailMessage(Base):
     content = Column(Text, nullable=False)
     direction = Column(String(20), nullable=False)  # incoming, outgoing
     message_id = Column(String(255))  # External email service message ID
+    internet_message_id = Column(String(512), index=True)  # RFC 5322 Message-ID header, e.g. <abc@mail.example.com>
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     thread = relationship("EmailThread", back_populates="messages")
+    
+    __table_args__ = (
+        # Keyset pagination of a thread's messages
+        Index("ix_email_messages_thread_id_id", "thread_id", "id"),
+    )
 
 class Task(Base):
     __tablename__ = "tasks"
@@ -373,6 +472,10 @@ class CalendarEvent(Base):
     reminder_minutes = Column(Integer, default=15)  # 0=no reminder, 15=15min before, etc.
     status = Column(String(50), default="scheduled")  # scheduled, completed, cancelled
     
+    # Provider sync: events copied from a connected calendar carry the provider's event ID
+    source = Column(String(20), default="crm", nullable=False)  # crm, google, o365
+    external_id = Column(String(255))
+    
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -383,6 +486,12 @@ class CalendarEvent(Base):
     contact = relationship("Contact")
     company = relationship("Company")
     attendees = relationship("EventAttendee", back_populates="event", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # One row per provider event per user calendar; CRM events have no external_id
+        Index("ix_calendar_events_source_user_external_id", "source", "created_by", "external_id", unique=True),
+        Index("ix_calendar_events_org_start_time", "organization_id", "start_time"),
+    )
 
 class EventAttendee(Base):
     __tablename__ = "event_attendees"
@@ -470,6 +579,11 @@ class O365UserConnection(Base):
     last_sync_at = Column(DateTime(timezone=True))
     last_sync_success = Column(Boolean, default=False)
     last_error_message = Column(Text)
+    mail_delta_links = Column(JSON)  # Graph deltaLink per mail folder, e.g. {"inbox": "...", "sentitems": "..."}
+    calendar_delta_link = Column(Text)  # Graph calendarView deltaLink the next calendar sync resumes from
+    last_calendar_sync = Column(DateTime(timezone=True))
+    contacts_delta_link = Column(Text)  # Graph contacts deltaLink the next contacts import resumes from
+    last_contacts_sync = Column(DateTime(timezone=True))
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -545,8 +659,11 @@ class GoogleUserConnection(Base):
     
     # Sync Status
     last_gmail_sync = Column(DateTime(timezone=True))
+    gmail_history_id = Column(String(64))  # Gmail mailbox historyId the next incremental sync starts from
     last_calendar_sync = Column(DateTime(timezone=True))
+    calendar_sync_token = Column(Text)  # Google Calendar nextSyncToken for the primary calendar
     last_contacts_sync = Column(DateTime(timezone=True))
+    contacts_sync_token = Column(Text)  # People API nextSyncToken for the user's connections
     last_drive_sync = Column(DateTime(timezone=True))
     sync_error_count = Column(Integer, default=0)
     last_sync_error = Column(Text)
@@ -777,6 +894,7 @@ class EmailTracking(Base):
     # Related entities
     contact_id = Column(Integer, ForeignKey("contacts.id"), nullable=True)
     sent_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    campaign_id = Column(Integer, ForeignKey("bulk_email_jobs.id", ondelete="SET NULL"), nullable=True, index=True)  # Bulk send this email belongs to
     
     # Tracking metrics
     sent_at = Column(DateTime(timezone=True), nullable=False)
@@ -805,6 +923,9 @@ class EmailEvent(Base):
     id = Column(Integer, primary_key=True, index=True)
     tracking_id = Column(Integer, ForeignKey("email_tracking.id"), nullable=False, index=True)
     
+    # SendGrid's unique event ID, used to drop redelivered webhook events
+    sg_event_id = Column(String(100), nullable=True, unique=True)
+    
     # Event details
     event_type = Column(String(50), nullable=False)  # open, click, bounce, spam, unsubscribe
     timestamp = Column(DateTime(timezone=True), nullable=False)
@@ -1065,7 +1186,8 @@ class LeadSourceIntegration(Base):
 
     # --- Clay Integration ---
     clay_enabled = Column(Boolean, default=False)
-    clay_api_key = Column(String(255), nullable=True)          # Key NHS generates; Clay uses this to POST to us
+    clay_api_key = Column(String(255), nullable=True)          # Deprecated - plaintext, cleared by hash_lead_source_api_keys.sql
+    clay_api_key_hash = Column(String(64), nullable=True, unique=True, index=True)  # SHA-256 of the key NHS generates; Clay uses the key to POST to us
     clay_webhook_url = Column(String(500), nullable=True)      # Auto-generated URL shown to user
     clay_last_import_at = Column(DateTime(timezone=True), nullable=True)
     clay_total_imported = Column(Integer, default=0)
@@ -1079,13 +1201,15 @@ class LeadSourceIntegration(Base):
 
     # --- LinkedIn Sales Navigator Integration ---
     linkedin_enabled = Column(Boolean, default=False)
-    linkedin_webhook_api_key = Column(String(255), nullable=True)  # Key NHS generates; used by browser ext / Zapier
+    linkedin_webhook_api_key = Column(String(255), nullable=True)  # Deprecated - plaintext, cleared by hash_lead_source_api_keys.sql
+    linkedin_webhook_api_key_hash = Column(String(64), nullable=True, unique=True, index=True)  # SHA-256 of the key NHS generates; used by browser ext / Zapier
     linkedin_last_import_at = Column(DateTime(timezone=True), nullable=True)
     linkedin_total_imported = Column(Integer, default=0)
 
     # --- Apollo.io Integration ---
     apollo_enabled = Column(Boolean, default=False)
-    apollo_api_key = Column(String(255), nullable=True)          # Key NHS generates; Apollo uses this to POST to us
+    apollo_api_key = Column(String(255), nullable=True)          # Deprecated - plaintext, cleared by hash_lead_source_api_keys.sql
+    apollo_api_key_hash = Column(String(64), nullable=True, unique=True, index=True)  # SHA-256 of the key NHS generates; Apollo uses the key to POST to us
     apollo_webhook_url = Column(String(500), nullable=True)      # Auto-generated URL shown to user
     apollo_last_import_at = Column(DateTime(timezone=True), nullable=True)
     apollo_total_imported = Column(Integer, default=0)
@@ -1123,3 +1247,108 @@ class LeadImportLog(Base):
     organization = relationship("Organization")
     contact = relationship("Contact")
     company = relationship("Company")
+
+
+class LeadImportBatch(Base):
+    """
+    A lead-source webhook payload accepted for background import.
+    Webhooks store the raw payload here and return 202; the lead import workers
+    claim queued batches and run the upserts.
+    """
+    __tablename__ = "lead_import_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False, index=True)
+    source = Column(String(50), nullable=False)              # clay | surfe | linkedin | apollo
+    event_id = Column(String(255), nullable=False)           # Provider event ID, or a digest of the body
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), nullable=False, default="queued")  # queued, processing, completed, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    claimed_by = Column(String(255))                         # Worker that currently holds / last held this batch
+    claimed_at = Column(DateTime(timezone=True))
+    result = Column(JSON)                                    # Counts returned by the import
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        # A provider retry of the same event is a no-op
+        UniqueConstraint("organization_id", "source", "event_id", name="uq_lead_import_batches_event"),
+        Index("ix_lead_import_batches_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+
+# ============================================================
+# Background Scheduler Models
+# ============================================================
+
+class SchedulerJobRun(Base):
+    """
+    History of background scheduler job runs.
+    Written by the elected scheduler leader so admins can see when jobs ran and how long they took.
+    """
+    __tablename__ = "scheduler_job_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(100), nullable=False)           # e.g. process_scheduled_emails
+    job_name = Column(String(255), nullable=True)
+    worker_id = Column(String(255), nullable=True)         # host:pid of the process that ran it
+    status = Column(String(20), nullable=False, default="running")  # running | success | error
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    duration_ms = Column(Integer, nullable=True)
+    result = Column(JSON, nullable=True)                   # Job return value, if JSON-serializable
+    error_message = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_scheduler_job_runs_job_started", "job_id", "started_at"),
+    )
+
+
+class MailboxSyncStatus(Base):
+    """
+    Background mailbox sync state, one row per O365 or Google connection.
+    Written by the mailbox sync job so admins can see how far behind each mailbox is.
+    """
+    __tablename__ = "mailbox_sync_status"
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String(20), nullable=False)          # o365 | google
+    connection_id = Column(Integer, nullable=False)        # O365UserConnection.id / GoogleUserConnection.id
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    email = Column(String(255), nullable=True)
+    status = Column(String(20), nullable=False, default="pending")  # pending | running | success | error
+    last_started_at = Column(DateTime(timezone=True), nullable=True)
+    last_finished_at = Column(DateTime(timezone=True), nullable=True)
+    last_success_at = Column(DateTime(timezone=True), nullable=True)
+    last_duration_ms = Column(Integer, nullable=True)
+    last_synced_count = Column(Integer, nullable=True)
+    consecutive_failures = Column(Integer, nullable=False, default=0)
+    next_sync_at = Column(DateTime(timezone=True), nullable=True)  # Backoff after failures
+    last_error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("provider", "connection_id", name="uq_mailbox_sync_status_connection"),
+    )
+
+
+class DailySummary(Base):
+    """A user's AI daily summary for one day, generated by the scheduler and served as stored"""
+    __tablename__ = "daily_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    summary_date = Column(Date, nullable=False)
+    sections = Column(JSON, nullable=False)        # Aggregates per section: tasks, contacts, companies, deals
+    signatures = Column(JSON, nullable=False)      # Per section, what its data looked like when computed
+    quick_stats = Column(JSON, nullable=False)
+    ai_insights = Column(Text, nullable=True)
+    generated_at = Column(DateTime(timezone=True), nullable=False)   # Last time the AI insights were written
+    refreshed_at = Column(DateTime(timezone=True), nullable=False)   # Last time the sections were checked
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "summary_date", name="uq_daily_summaries_user_date"),
+    )
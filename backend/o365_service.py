@@ -4,19 +4,29 @@ Office 365 Integration Service using Microsoft Graph API
 import os
 import json
 import asyncio
+import logging
 import re
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import httpx
+from http_clients import get_http_client
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from models import O365OrganizationConfig, O365UserConnection, EmailThread, EmailMessage, Contact
 from o365_encryption import decrypt_client_secret, decrypt_access_token, decrypt_refresh_token, encrypt_access_token, encrypt_refresh_token
 from schemas import EmailMessageCreate
+from email_threading import subject_hash
+from calendar_sync import calendar_sync_window, delete_calendar_events, event_row, upsert_calendar_events
+from contact_sync import contact_row, finish_stats, new_stats, upsert_contacts
+
+logger = logging.getLogger(__name__)
 
 # Microsoft OAuth2 endpoints
 MICROSOFT_AUTHORITY = "https://login.microsoftonline.com"
-MICROSOFT_GRAPH_API = "https://graph.microsoft.com/v1.0"
+# Overridable so sync can be exercised against a local Graph stub
+MICROSOFT_GRAPH_API = os.environ.get("MICROSOFT_GRAPH_API_URL", "https://graph.microsoft.com/v1.0")
 OAUTH_REDIRECT_URI = os.environ.get("O365_REDIRECT_URI", "https://nohubspot-production.up.railway.app/api/auth/microsoft/callback")
 
 # O365 Configuration from environment
@@ -24,19 +34,30 @@ O365_CLIENT_ID = os.environ.get("O365_CLIENT_ID")
 O365_TENANT_ID = os.environ.get("O365_TENANT_ID")
 O365_CLIENT_SECRET = os.environ.get("O365_CLIENT_SECRET")
 
+# Mail sync: folders synced through Graph delta queries, and their direction in the CRM
+MAIL_SYNC_FOLDERS = {"inbox": "incoming", "sentitems": "outgoing"}
+MAIL_SYNC_PAGE_SIZE = int(os.environ.get("O365_MAIL_SYNC_PAGE_SIZE", "100"))
+MAIL_SYNC_INITIAL_DAYS = 7  # How far back the first sync of a folder reaches
+MAIL_MESSAGE_FIELDS = "id,subject,from,toRecipients,receivedDateTime,sentDateTime,body,isRead,conversationId,internetMessageId"
+GRAPH_MAX_RETRIES = 3
+CALENDAR_SYNC_PAGE_SIZE = int(os.environ.get("O365_CALENDAR_SYNC_PAGE_SIZE", "100"))
+CONTACTS_SYNC_PAGE_SIZE = int(os.environ.get("O365_CONTACTS_SYNC_PAGE_SIZE", "500"))
+CONTACT_FIELDS = "givenName,surname,displayName,emailAddresses,businessPhones,mobilePhone,jobTitle,companyName"
+
 class O365Service:
-    def __init__(self, user_connection: O365UserConnection, org_config: O365OrganizationConfig):
+    def __init__(self, user_connection: O365UserConnection, org_config: O365OrganizationConfig, client: Optional[httpx.AsyncClient] = None):
         self.user_connection = user_connection
         self.org_config = org_config
         self.access_token = None
-        self.client = httpx.AsyncClient()
+        # Shared Graph connection pool; it outlives this service, so it is not closed on exit
+        self.client = client or get_http_client("graph")
         
     async def __aenter__(self):
         await self.ensure_valid_token()
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.client.aclose()
+        pass
         
     async def ensure_valid_token(self):
         """Ensure we have a valid access token, refreshing if necessary"""
@@ -109,7 +130,7 @@ class O365Service:
             "$top": limit,
             "$skip": skip,
             "$orderby": "receivedDateTime desc",
-            "$select": "id,subject,from,toRecipients,receivedDateTime,sentDateTime,body,isRead,conversationId"
+            "$select": "id,subject,from,toRecipients,receivedDateTime,sentDateTime,body,isRead,conversationId,internetMessageId"
         }
         
         if since:
@@ -164,25 +185,38 @@ class O365Service:
         else:
             raise Exception(f"Failed to send email: {response.status_code} - {response.text}")
             
+    async def graph_get(self, url: str, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """GET from Graph, waiting out throttling (429/503 with Retry-After)"""
+        request_headers = self.get_headers()
+        request_headers.update(headers or {})
+        
+        for attempt in range(GRAPH_MAX_RETRIES + 1):
+            response = await self.client.get(url, headers=request_headers, params=params)
+            if response.status_code not in (429, 503) or attempt == GRAPH_MAX_RETRIES:
+                return response
+            retry_after = response.headers.get("Retry-After", "")
+            delay = int(retry_after) if retry_after.isdigit() else 2 ** attempt
+            logger.info(f"Graph throttled {self.user_connection.o365_email} ({response.status_code}), retrying in {delay}s")
+            await asyncio.sleep(delay)
+        return response
+    
     async def sync_emails_to_crm(self, db: Session, organization_id: int, since: Optional[datetime] = None):
-        """Sync emails from O365 to CRM"""
+        """
+        Sync inbox and sent items to the CRM with Graph delta queries.
+        
+        Each folder resumes from the deltaLink stored on the connection, so only
+        new and changed messages are fetched. All pages are followed and every
+        page is written in bulk and committed. since only bounds the first sync
+        of a folder (or a resync after Graph expires the delta token).
+        """
         if not since:
-            since = self.user_connection.last_sync_at or datetime.utcnow() - timedelta(days=7)
-            
+            since = self.user_connection.last_sync_at or datetime.utcnow() - timedelta(days=MAIL_SYNC_INITIAL_DAYS)
+        
         synced_count = 0
         
         try:
-            # Sync inbox messages
-            inbox_messages = await self.list_messages("inbox", limit=100, since=since)
-            for msg in inbox_messages:
-                await self._process_email_to_crm(db, msg, "incoming", organization_id)
-                synced_count += 1
-                
-            # Sync sent messages
-            sent_messages = await self.get_sent_messages(limit=100, since=since)
-            for msg in sent_messages:
-                await self._process_email_to_crm(db, msg, "outgoing", organization_id)
-                synced_count += 1
+            for folder, direction in MAIL_SYNC_FOLDERS.items():
+                synced_count += await self._sync_folder(db, organization_id, folder, direction, since)
                 
             # Update sync status
             self.user_connection.last_sync_at = datetime.utcnow()
@@ -195,66 +229,229 @@ class O365Service:
             self.user_connection.last_sync_success = False
             self.user_connection.last_error_message = str(e)
             raise
+    
+    async def _sync_folder(self, db: Session, organization_id: int, folder: str, direction: str, since: datetime) -> int:
+        """Follow a folder's delta pages to the end and store the new deltaLink"""
+        delta_links = dict(self.user_connection.mail_delta_links or {})
+        url = delta_links.get(folder)
+        params = None
+        if not url:
+            url = f"{MICROSOFT_GRAPH_API}/me/mailFolders/{folder}/messages/delta"
+            params = {
+                "$select": MAIL_MESSAGE_FIELDS,
+                "$filter": f"receivedDateTime ge {since.replace(tzinfo=None).isoformat(timespec='seconds')}Z",
+            }
+        
+        headers = {"Prefer": f"odata.maxpagesize={MAIL_SYNC_PAGE_SIZE}"}
+        synced_count = 0
+        
+        while url:
+            response = await self.graph_get(url, params=params, headers=headers)
             
-    async def _process_email_to_crm(self, db: Session, msg: Dict[str, Any], direction: str, organization_id: int):
-        """Process a single email and add to CRM with privacy controls"""
-        # Extract email addresses
-        if direction == "incoming":
-            from_email = msg.get("from", {}).get("emailAddress", {}).get("address", "")
-            contact_email = from_email
-        else:
-            # For outgoing, find the contact from recipients
-            recipients = msg.get("toRecipients", [])
-            if recipients:
-                contact_email = recipients[0].get("emailAddress", {}).get("address", "")
-            else:
-                return  # Skip if no recipients
-        
-        # Check if email should be synced based on privacy settings
-        if self.user_connection.sync_only_crm_contacts:
-            # Check if contact exists in CRM
-            existing_contact = db.query(Contact).filter(
-                Contact.email == contact_email,
-                Contact.organization_id == organization_id
-            ).first()
+            if response.status_code == 410 and folder in delta_links:
+                # Delta token expired; start this folder over from the since window.
+                # Pages stored so far stay counted: the resync skips messages already
+                # stored, so it only counts what those pages had not covered.
+                logger.info(
+                    f"O365 delta token expired for {self.user_connection.o365_email} {folder} "
+                    f"after {synced_count} messages, resyncing"
+                )
+                delta_links.pop(folder)
+                self.user_connection.mail_delta_links = delta_links
+                return synced_count + await self._sync_folder(db, organization_id, folder, direction, since)
+            if response.status_code != 200:
+                raise Exception(f"Failed to sync {folder}: {response.status_code} - {response.text[:200]}")
             
-            if not existing_contact and not self.user_connection.auto_create_contacts:
-                # Skip this email - contact doesn't exist and auto-create is disabled
-                return
+            page = response.json()
+            messages = [msg for msg in page.get("value", []) if "@removed" not in msg]
+            synced_count += self._store_message_page(db, messages, direction, organization_id)
+            
+            # nextLink/deltaLink already carry the query, so later requests take no params
+            params = None
+            url = page.get("@odata.nextLink")
+            if not url and page.get("@odata.deltaLink"):
+                delta_links[folder] = page["@odata.deltaLink"]
+                self.user_connection.mail_delta_links = delta_links
+                db.commit()
         
-        # Check excluded domains
-        if self.user_connection.excluded_domains:
-            email_domain = contact_email.split('@')[-1].lower()
-            if email_domain in [d.lower() for d in self.user_connection.excluded_domains]:
-                return  # Skip emails from excluded domains
+        return synced_count
+    
+    async def sync_calendar_events(self, db: Session) -> int:
+        """
+        Sync the default calendar into calendar_events with a calendarView delta query.
         
-        # Check excluded keywords in subject
-        if self.user_connection.excluded_keywords:
-            subject = msg.get("subject", "").lower()
-            for keyword in self.user_connection.excluded_keywords:
-                if keyword.lower() in subject:
-                    return  # Skip emails with excluded keywords
-                
-        # Find or create contact
-        contact = db.query(Contact).filter(
-            Contact.email == contact_email,
-            Contact.organization_id == organization_id
-        ).first()
-        
-        if not contact:
-            # Create basic contact
-            # For incoming emails, use the sender's name. For outgoing, use recipient's name
-            if direction == "incoming":
-                contact_name = msg.get("from", {}).get("emailAddress", {}).get("name", "")
-            else:
-                # For outgoing emails, get the recipient's name
-                recipients = msg.get("toRecipients", [])
-                if recipients:
-                    contact_name = recipients[0].get("emailAddress", {}).get("name", "")
-                else:
-                    contact_name = ""
+        The first sync covers the sync window; later syncs resume from the
+        stored deltaLink so only new, changed and removed events are fetched.
+        Every page is upserted in bulk and committed. Returns the number of
+        events written.
+        """
+        user_id = self.user_connection.user_id
+        url = self.user_connection.calendar_delta_link
+        params = None
+        if not url:
+            # Nothing to resume from: drop this calendar's copy and list the window again
+            delete_calendar_events(db, "o365", user_id)
+            time_min, time_max = calendar_sync_window()
+            url = f"{MICROSOFT_GRAPH_API}/me/calendarView/delta"
+            params = {
+                "startDateTime": time_min.isoformat(timespec="seconds") + "Z",
+                "endDateTime": time_max.isoformat(timespec="seconds") + "Z",
+            }
+        
+        headers = {"Prefer": f'odata.maxpagesize={CALENDAR_SYNC_PAGE_SIZE}, outlook.timezone="UTC"'}
+        synced_count = 0
+        
+        while url:
+            response = await self.graph_get(url, params=params, headers=headers)
+            
+            if response.status_code == 410 and self.user_connection.calendar_delta_link:
+                logger.info(f"O365 calendar delta token expired for {self.user_connection.o365_email}, resyncing")
+                self.user_connection.calendar_delta_link = None
+                return await self.sync_calendar_events(db)
+            if response.status_code != 200:
+                raise Exception(f"Failed to sync calendar: {response.status_code} - {response.text[:200]}")
+            
+            page = response.json()
+            rows, removed = [], []
+            for item in page.get("value", []):
+                if "@removed" in item or item.get("isCancelled"):
+                    removed.append(item["id"])
+                elif item.get("start"):
+                    rows.append(self._calendar_event_row(item))
+            delete_calendar_events(db, "o365", user_id, removed)
+            synced_count += upsert_calendar_events(db, self.user_connection.organization_id, rows)
+            
+            params = None
+            url = page.get("@odata.nextLink")
+            if not url:
+                self.user_connection.calendar_delta_link = page.get("@odata.deltaLink")
+                self.user_connection.last_calendar_sync = datetime.utcnow()
+            db.commit()
+        
+        return synced_count
+    
+    def _calendar_event_row(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """A calendar_events row for a Graph event"""
+        start_time = self._calendar_time(item["start"])
+        return event_row(
+            organization_id=self.user_connection.organization_id,
+            user_id=self.user_connection.user_id,
+            source="o365",
+            external_id=item["id"],
+            title=item.get("subject"),
+            start_time=start_time,
+            end_time=self._calendar_time(item["end"]) if item.get("end") else start_time,
+            description=item.get("bodyPreview"),
+            location=(item.get("location") or {}).get("displayName"),
+            is_all_day=bool(item.get("isAllDay")),
+            # Graph can send "address": null (e.g. for rooms or deleted users); skip those attendees
+            attendee_emails=[
+                address
+                for address in (((attendee.get("emailAddress") or {}).get("address") or "") for attendee in item.get("attendees") or [])
+                if address and address.lower() != (self.user_connection.o365_email or "").lower()
+            ],
+        )
+    
+    @staticmethod
+    def _calendar_time(value: Dict[str, str]) -> datetime:
+        """A Graph dateTimeTimeZone (requested in UTC) as naive UTC"""
+        return datetime.fromisoformat(value["dateTime"][:26].rstrip("Z"))
+    
+    async def sync_contacts(self, db: Session) -> Dict[str, Any]:
+        """
+        Import the user's Outlook contacts into the CRM with a contacts delta query.
+        
+        The first import reads the whole default contacts folder; later ones
+        resume from the stored deltaLink so only new and changed contacts are
+        fetched. Every page is upserted in bulk and committed. Returns the sync
+        statistics.
+        """
+        started = time.perf_counter()
+        stats = new_stats()
+        url = self.user_connection.contacts_delta_link
+        params = None
+        if not url:
+            url = f"{MICROSOFT_GRAPH_API}/me/contacts/delta"
+            params = {"$select": CONTACT_FIELDS}
+        stats["full_sync"] = params is not None
+        headers = {"Prefer": f"odata.maxpagesize={CONTACTS_SYNC_PAGE_SIZE}"}
+        
+        while url:
+            response = await self.graph_get(url, params=params, headers=headers)
+            
+            if response.status_code == 410 and params is None and self.user_connection.contacts_delta_link:
+                logger.info(f"O365 contacts delta token expired for {self.user_connection.o365_email}, resyncing")
+                self.user_connection.contacts_delta_link = None
+                return await self.sync_contacts(db)
+            if response.status_code != 200:
+                raise Exception(f"Failed to sync contacts: {response.status_code} - {response.text[:200]}")
+            
+            page = response.json()
+            rows = [self._contact_row(item) for item in page.get("value", []) if "@removed" not in item]
+            upsert_contacts(db, self.user_connection.organization_id, self.user_connection.user_id, rows, stats)
             
-            # Parse the name
+            params = None
+            url = page.get("@odata.nextLink")
+            if not url:
+                self.user_connection.contacts_delta_link = page.get("@odata.deltaLink")
+                self.user_connection.last_contacts_sync = datetime.utcnow()
+            db.commit()
+        
+        finish_stats(stats, started)
+        logger.info(f"O365 contacts sync for {self.user_connection.o365_email}: {stats}")
+        return stats
+    
+    @staticmethod
+    def _contact_row(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """A normalized contact from a Graph contact"""
+        return contact_row(
+            emails=[(address or {}).get("address") for address in item.get("emailAddresses") or []],
+            first_name=item.get("givenName"),
+            last_name=item.get("surname"),
+            display_name=item.get("displayName"),
+            phone=item.get("mobilePhone") or next(iter(item.get("businessPhones") or []), None),
+            title=item.get("jobTitle"),
+            company_name=item.get("companyName"),
+        )
+    
+    def _store_message_page(self, db: Session, messages: List[Dict[str, Any]], direction: str, organization_id: int) -> int:
+        """
+        Write one page of Graph messages to the CRM and commit.
+        
+        Existing messages, contacts and threads for the whole page are each
+        resolved with one query; new rows are inserted in bulk.
+        """
+        candidates = []
+        for msg in messages:
+            contact_email, contact_name = self._contact_address(msg, direction)
+            if contact_email and not self._is_excluded(contact_email, msg.get("subject") or ""):
+                candidates.append((msg, contact_email, contact_name))
+        if not candidates:
+            return 0
+        
+        # Skip messages already synced
+        message_ids = [f"o365_{msg['id']}" for msg, _, _ in candidates]
+        existing_ids = {
+            message_id for (message_id,) in db.query(EmailMessage.message_id).filter(
+                EmailMessage.message_id.in_(message_ids)
+            )
+        }
+        candidates = [c for c in candidates if f"o365_{c[0]['id']}" not in existing_ids]
+        
+        # Resolve contacts for the whole page
+        emails = {contact_email for _, contact_email, _ in candidates}
+        contacts = {}
+        for contact in db.query(Contact).filter(
+            Contact.organization_id == organization_id,
+            func.lower(Contact.email).in_(emails)
+        ).order_by(Contact.id.desc()):
+            contacts[contact.email.lower()] = contact  # Lowest id wins, as in find_contact_by_email
+        
+        create_contacts = not self.user_connection.sync_only_crm_contacts or self.user_connection.auto_create_contacts
+        new_contacts = []
+        for _, contact_email, contact_name in candidates:
+            if contact_email in contacts or not create_contacts:
+                continue
             name_parts = contact_name.split() if contact_name else []
             contact = Contact(
                 first_name=name_parts[0] if name_parts else "Unknown",
@@ -265,67 +462,119 @@ class O365Service:
                 owner_id=self.user_connection.user_id,  # Set owner to the user who created via sync
                 shared_with_team=False  # Private by default
             )
-            db.add(contact)
+            contacts[contact_email] = contact
+            new_contacts.append(contact)
+        if new_contacts:
+            db.add_all(new_contacts)
+            db.flush()
+        
+        candidates = [c for c in candidates if c[1] in contacts]
+        if not candidates:
             db.commit()
-            db.refresh(contact)
-            
-        # Find or create thread
-        subject = msg.get("subject", "No Subject")
-        clean_subject = subject.replace("Re: ", "").replace("RE: ", "").strip()
-        
-        thread = db.query(EmailThread).filter(
-            EmailThread.contact_id == contact.id,
-            EmailThread.organization_id == organization_id
-        ).filter(
-            EmailThread.subject.ilike(f"%{clean_subject}%")
-        ).first()
-        
-        if not thread:
+            return 0
+        
+        # Resolve threads for the whole page by (contact, normalized subject)
+        thread_keys = {
+            (contacts[contact_email].id, subject_hash(msg.get("subject") or "No Subject"))
+            for msg, contact_email, _ in candidates
+        }
+        threads = {}
+        for thread in db.query(EmailThread).filter(
+            EmailThread.organization_id == organization_id,
+            EmailThread.contact_id.in_({contact_id for contact_id, _ in thread_keys}),
+            EmailThread.normalized_subject_hash.in_({subject_key for _, subject_key in thread_keys})
+        ).order_by(EmailThread.updated_at.asc()):
+            threads[(thread.contact_id, thread.normalized_subject_hash)] = thread  # Most recent wins
+        
+        new_threads = []
+        for msg, contact_email, _ in candidates:
+            subject = msg.get("subject") or "No Subject"
+            key = (contacts[contact_email].id, subject_hash(subject))
+            if key in threads:
+                continue
             thread = EmailThread(
                 subject=subject,
-                contact_id=contact.id,
+                normalized_subject_hash=key[1],
+                contact_id=key[0],
                 organization_id=organization_id,
                 message_count=0,
                 owner_id=self.user_connection.user_id,  # Set owner to the user who synced the email
                 is_private=True  # Private by default
             )
-            db.add(thread)
-            db.commit()
-            db.refresh(thread)
-            
-        # Check if message already exists (by message ID)
-        o365_message_id = msg.get("id")
-        existing = db.query(EmailMessage).filter(
-            EmailMessage.message_id == f"o365_{o365_message_id}"
-        ).first()
-        
-        if not existing:
-            # Add message to thread
-            body_content = msg.get("body", {}).get("content", "")
-            
-            # Strip HTML tags for preview (basic implementation)
-            text_content = re.sub('<[^<]+?>', '', body_content)
-            text_content = re.sub(r'\s+', ' ', text_content).strip()
-            # Also decode HTML entities
-            text_content = text_content.replace('&nbsp;', ' ').replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&').replace('&#39;', "'").replace('&quot;', '"')
+            threads[key] = thread
+            new_threads.append(thread)
+        if new_threads:
+            db.add_all(new_threads)
+            db.flush()
+        
+        # Oldest first, so each thread's preview ends on its newest message
+        candidates.sort(key=lambda c: self._message_time(c[0]))
+        new_messages = []
+        now = datetime.utcnow()
+        for msg, contact_email, _ in candidates:
+            thread = threads[(contacts[contact_email].id, subject_hash(msg.get("subject") or "No Subject"))]
+            body_content = (msg.get("body") or {}).get("content", "")
+            text_content = self._html_to_text(body_content)
+            sender_name = (msg.get("from") or {}).get("emailAddress", {}).get("name", "Unknown")
             
-            sender_name = msg.get("from", {}).get("emailAddress", {}).get("name", "Unknown")
-            
-            message = EmailMessage(
-                thread_id=thread.id,
-                sender=sender_name if direction == "incoming" else self.user_connection.o365_display_name,
-                content=body_content,
-                direction=direction,
-                message_id=f"o365_{o365_message_id}"
-            )
-            db.add(message)
+            new_messages.append({
+                "thread_id": thread.id,
+                "sender": sender_name if direction == "incoming" else self.user_connection.o365_display_name,
+                "content": body_content,
+                "direction": direction,
+                "message_id": f"o365_{msg['id']}",
+                "internet_message_id": msg.get("internetMessageId"),
+                "created_at": self._message_time(msg),
+            })
             
             # Update thread
-            thread.message_count += 1
+            thread.message_count = (thread.message_count or 0) + 1
             thread.preview = text_content[:100] + ("..." if len(text_content) > 100 else "")
-            thread.updated_at = datetime.utcnow().replace(tzinfo=None)
-            
-            db.commit()
+            thread.updated_at = now
+        
+        db.bulk_insert_mappings(EmailMessage, new_messages)
+        db.commit()
+        return len(new_messages)
+    
+    @staticmethod
+    def _contact_address(msg: Dict[str, Any], direction: str) -> Tuple[Optional[str], str]:
+        """(lowercased email, display name) of the CRM contact a message is with"""
+        if direction == "incoming":
+            address = (msg.get("from") or {}).get("emailAddress", {})
+        else:
+            # For outgoing, the contact is the first recipient
+            recipients = msg.get("toRecipients") or []
+            address = recipients[0].get("emailAddress", {}) if recipients else {}
+        email = (address.get("address") or "").strip().lower()
+        return (email or None), address.get("name", "")
+    
+    def _is_excluded(self, contact_email: str, subject: str) -> bool:
+        """Apply the connection's excluded domains and subject keywords"""
+        if self.user_connection.excluded_domains:
+            email_domain = contact_email.split('@')[-1]
+            if email_domain in [d.lower() for d in self.user_connection.excluded_domains]:
+                return True
+        if self.user_connection.excluded_keywords:
+            subject = subject.lower()
+            if any(keyword.lower() in subject for keyword in self.user_connection.excluded_keywords):
+                return True
+        return False
+    
+    @staticmethod
+    def _message_time(msg: Dict[str, Any]) -> datetime:
+        """When a Graph message was received (or sent), as naive UTC"""
+        value = msg.get("receivedDateTime") or msg.get("sentDateTime")
+        if not value:
+            return datetime.utcnow()
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc).replace(tzinfo=None)
+    
+    @staticmethod
+    def _html_to_text(body_content: str) -> str:
+        """Strip HTML tags for preview (basic implementation)"""
+        text_content = re.sub('<[^<]+?>', '', body_content)
+        text_content = re.sub(r'\s+', ' ', text_content).strip()
+        # Also decode HTML entities
+        return text_content.replace('&nbsp;', ' ').replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&').replace('&#39;', "'").replace('&quot;', '"')
 
 
 async def get_oauth_url(client_id: str, tenant_id: str, redirect_uri: str) -> str:
@@ -372,9 +621,8 @@ async def exchange_code_for_tokens(
         "grant_type": "authorization_code"
     }
     
-    async with httpx.AsyncClient() as client:
-        response = await client.post(token_url, data=data)
-        
+    response = await get_http_client("default").post(token_url, data=data)
+    
     if response.status_code == 200:
         return response.json()
     else:
@@ -0,0 +1,41 @@
+"""
+Shared OpenAI client for NotHubSpot CRM
+AI chat and daily summaries call OpenAI through AsyncOpenAI on the pooled
+"openai" httpx client of the running event loop, so a completion never blocks
+the loop and requests reuse warm connections. OPENAI_BASE_URL (read by the
+SDK) points the client at another endpoint, e.g. a local fake model server.
+"""
+import asyncio
+import os
+import weakref
+from typing import Optional
+
+from openai import AsyncOpenAI
+
+from http_clients import http_clients
+
+# Configure OpenAI - try multiple environment variable names
+openai_key = (
+    os.environ.get("OPENAI_API_KEY") or
+    os.environ.get("OPENAI_KEY") or
+    os.environ.get("OPEN_AI_KEY") or
+    os.environ.get("OPENAI")
+)
+
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "2"))
+
+# Per event loop: the pooled httpx client and the AsyncOpenAI wrapping it
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, tuple]" = weakref.WeakKeyDictionary()
+
+
+def get_openai_client() -> Optional[AsyncOpenAI]:
+    """AsyncOpenAI on the running loop's shared HTTP pool, or None when no API key is configured"""
+    if not openai_key:
+        return None
+    http_client = http_clients.get("openai")
+    loop = asyncio.get_running_loop()
+    cached = _clients.get(loop)
+    if cached is None or cached[0] is not http_client:
+        cached = (http_client, AsyncOpenAI(api_key=openai_key, http_client=http_client, max_retries=OPENAI_MAX_RETRIES))
+        _clients[loop] = cached
+    return cached[1]
@@ -0,0 +1,22 @@
+"""
+Per-organization write locks for NotHubSpot CRM
+Lead import and address book sync both look contacts and companies up by
+lower(email) and lower(name) and then bulk insert the missing ones. Existing
+rows can hold duplicates, so there is no unique key to upsert against; instead
+both take the same transaction-scoped Postgres advisory lock for the
+organization, which serializes them against each other until commit.
+"""
+import os
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Arbitrary application-wide advisory lock key, paired with the organization id
+CONTACT_WRITE_LOCK_KEY = int(os.environ.get("LEAD_IMPORT_LOCK_KEY", "7243020"))
+
+
+def lock_organization(db: Session, organization_id: int) -> None:
+    """Serialize an organization's contact and company writes until commit (Postgres only)"""
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:key, :organization_id)"),
+                   {"key": CONTACT_WRITE_LOCK_KEY, "organization_id": organization_id})
@@ -0,0 +1,365 @@
+"""
+Note and email retrieval for NotHubSpot CRM AI chat
+Each organization gets an in-memory BM25 index over passages of contact notes,
+deal notes, deal updates, project updates and email bodies, so AI chat can add
+the few passages most relevant to a question to its prompt. Scoring walks only
+the posting lists of the question's terms, so a search takes milliseconds and
+needs no embedding service.
+
+Like the entity matcher, the index is built on first use per organization and
+kept current by ORM writes through mapper events. Core bulk writes (mailbox
+sync) and other worker processes are covered by a rebuild after
+RETRIEVAL_INDEX_TTL_SECONDS. Email passages carry their thread's privacy, so a
+search only returns emails the asking user may see.
+"""
+import heapq
+import html
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from entity_matcher import tokenize
+from models import Contact, Deal, DealUpdate, EmailMessage, EmailThread, Project, ProjectUpdate
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_INDEX_TTL_SECONDS = int(os.environ.get("RETRIEVAL_INDEX_TTL_SECONDS", "900"))
+RETRIEVAL_MAX_EMAILS = int(os.environ.get("RETRIEVAL_MAX_EMAILS", "5000"))  # Newest email bodies indexed per organization
+PASSAGE_WORDS = 120
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+# Terms in more than this share of passages barely move BM25 scores but dominate its cost; they are skipped
+# unless the query has nothing rarer
+COMMON_TERM_SHARE = 0.2
+
+TAG_PATTERN = re.compile(r"<[^>]+>")
+SPACE_PATTERN = re.compile(r"\s+")
+
+STOP_WORDS = {
+    "a", "about", "all", "am", "an", "and", "any", "are", "as", "at", "be", "been", "but", "by", "can", "did", "do",
+    "does", "for", "from", "had", "has", "have", "he", "her", "him", "his", "how", "i", "if", "in", "is", "it", "its",
+    "me", "my", "no", "not", "of", "on", "or", "our", "she", "so", "than", "that", "the", "their", "them", "then",
+    "there", "they", "this", "to", "up", "us", "was", "we", "were", "what", "when", "where", "which", "who", "why",
+    "will", "with", "would", "you", "your", "tell", "show", "give", "know", "re", "fw", "fwd",
+}
+
+SourceRef = Tuple[str, int]  # ("contact_note" | "deal_note" | "deal_update" | "project_update" | "email", id)
+
+
+class Passage(NamedTuple):
+    source: SourceRef
+    label: str  # Where the passage comes from, e.g. "Deal update on Acme renewal: Pricing agreed"
+    text: str
+    thread_id: Optional[int] = None  # Email passages: the thread whose privacy applies
+
+
+def index_terms(text: Optional[str]) -> List[str]:
+    return [token for token in tokenize(text) if token not in STOP_WORDS and len(token) > 1]
+
+
+def clean_text(text: Optional[str]) -> str:
+    """Plain text from notes or (HTML) email bodies"""
+    return SPACE_PATTERN.sub(" ", html.unescape(TAG_PATTERN.sub(" ", text or ""))).strip()
+
+
+def split_passages(text: str) -> List[str]:
+    words = text.split()
+    return [" ".join(words[start:start + PASSAGE_WORDS]) for start in range(0, len(words), PASSAGE_WORDS)]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough OpenAI token count (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+def thread_visibility(owner_id: Optional[int], is_private: Optional[bool], shared_with) -> Optional[FrozenSet[int]]:
+    """Users who may see a thread's emails; None when everyone in the organization may"""
+    if owner_id is None or not is_private:
+        return None
+    return frozenset([owner_id, *(int(user_id) for user_id in (shared_with or []))])
+
+
+def _date(value) -> str:
+    return f" ({value.date().isoformat()})" if value else ""
+
+
+class RetrievalIndex:
+    """BM25 index over one organization's note, update and email passages"""
+
+    def __init__(self, organization_id: int):
+        self.organization_id = organization_id
+        self.built_at = time.monotonic()
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)  # term -> passage id -> BM25 term weight
+        self._passages: Dict[int, Passage] = {}
+        self._lengths: Dict[int, int] = {}
+        self._terms: Dict[int, Tuple[str, ...]] = {}
+        self._by_source: Dict[SourceRef, List[int]] = {}
+        self._thread_visibility: Dict[int, Optional[FrozenSet[int]]] = {}
+        self._total_length = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def add(self, source: SourceRef, label: str, text: Optional[str], thread_id: Optional[int] = None) -> None:
+        """Index (or re-index) a source's text as passages; empty text just removes it"""
+        passages = split_passages(clean_text(text))
+        with self._lock:
+            self._remove(source)
+            ids = []
+            for passage_text in passages:
+                terms = Counter(index_terms(f"{label} {passage_text}"))
+                if not terms:
+                    continue
+                passage_id = self._next_id
+                self._next_id += 1
+                length = sum(terms.values())
+                self._passages[passage_id] = Passage(source, label, passage_text, thread_id)
+                self._lengths[passage_id] = length
+                self._terms[passage_id] = tuple(terms)
+                self._total_length += length
+                # Length normalization uses the average passage length when the passage is added; the
+                # drift as the index grows is small and the periodic rebuild resets it
+                norm = K1 * (1 - B + B * length / (self._total_length / len(self._passages)))
+                for term, frequency in terms.items():
+                    self._postings[term][passage_id] = frequency * (K1 + 1) / (frequency + norm)
+                ids.append(passage_id)
+            if ids:
+                self._by_source[source] = ids
+
+    def remove(self, source: SourceRef) -> None:
+        with self._lock:
+            self._remove(source)
+
+    def _remove(self, source: SourceRef) -> None:
+        for passage_id in self._by_source.pop(source, ()):
+            for term in self._terms.pop(passage_id):
+                postings = self._postings[term]
+                postings.pop(passage_id, None)
+                if not postings:
+                    del self._postings[term]
+            self._total_length -= self._lengths.pop(passage_id)
+            del self._passages[passage_id]
+
+    def set_thread_visibility(self, thread_id: int, visible_to: Optional[FrozenSet[int]]) -> None:
+        self._thread_visibility[thread_id] = visible_to
+
+    def _visible(self, passage: Passage, user_id: Optional[int]) -> bool:
+        if passage.thread_id is None:
+            return True
+        visible_to = self._thread_visibility.get(passage.thread_id)
+        return visible_to is None or user_id in visible_to
+
+    def search(self, query: str, limit: int = 8, user_id: Optional[int] = None) -> List[Tuple[float, Passage]]:
+        """The best BM25 matches for query that user_id may see, best first"""
+        with self._lock:
+            count = len(self._passages)
+            if not count:
+                return []
+            scores: Dict[int, float] = {}
+            term_postings = [self._postings[term] for term in set(index_terms(query)) if term in self._postings]
+            rare = [postings for postings in term_postings if len(postings) <= count * COMMON_TERM_SHARE]
+            for postings in rare or term_postings:
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                get = scores.get
+                for passage_id, weight in postings.items():
+                    scores[passage_id] = get(passage_id, 0.0) + idf * weight
+            
+            # Visibility is checked on the best candidates first; only a mostly hidden top falls back to a full pass
+            candidates = heapq.nlargest(limit * 4, scores.items(), key=lambda item: item[1])
+            results = [(score, self._passages[passage_id]) for passage_id, score in candidates
+                       if self._visible(self._passages[passage_id], user_id)]
+            if len(results) < limit and len(candidates) < len(scores):
+                results = [(score, self._passages[passage_id]) for passage_id, score in scores.items()
+                           if self._visible(self._passages[passage_id], user_id)]
+                results = heapq.nlargest(limit, results, key=lambda item: item[0])
+            return results[:limit]
+
+    def __len__(self) -> int:
+        return len(self._passages)
+
+
+def fit_passages(passages: Iterable[Passage], token_budget: int) -> List[str]:
+    """Prompt lines for passages, best first, until the token budget is spent (the last one may be cut short)"""
+    lines, remaining = [], token_budget
+    for passage in passages:
+        line = f"- {passage.label}: {passage.text}"
+        tokens = estimate_tokens(line)
+        if tokens > remaining:
+            if remaining >= 40:
+                lines.append(line[:remaining * 4].rsplit(" ", 1)[0] + " ...")
+            break
+        lines.append(line)
+        remaining -= tokens
+    return lines
+
+
+def contact_note_label(first_name, last_name) -> str:
+    return f"Notes on contact {first_name or ''} {last_name or ''}".rstrip()
+
+
+def deal_note_label(title) -> str:
+    return f"Notes on deal {title}"
+
+
+def update_label(kind: str, parent_title, title, created_at) -> str:
+    return f"{kind} update on {parent_title or 'unknown'}{_date(created_at)}: {title}"
+
+
+def email_label(sender, subject, created_at) -> str:
+    return f"Email from {sender} re \"{subject}\"{_date(created_at)}"
+
+
+def build_retrieval_index(db: Session, organization_id: int) -> RetrievalIndex:
+    index = RetrievalIndex(organization_id)
+    for contact_id, first_name, last_name, notes in db.query(
+        Contact.id, Contact.first_name, Contact.last_name, Contact.notes
+    ).filter(Contact.organization_id == organization_id, Contact.notes.isnot(None), Contact.notes != ""):
+        index.add(("contact_note", contact_id), contact_note_label(first_name, last_name), notes)
+    for deal_id, title, notes in db.query(Deal.id, Deal.title, Deal.notes).filter(
+        Deal.organization_id == organization_id, Deal.notes.isnot(None), Deal.notes != ""
+    ):
+        index.add(("deal_note", deal_id), deal_note_label(title), notes)
+    for update_id, deal_title, title, description, created_at in db.query(
+        DealUpdate.id, Deal.title, DealUpdate.title, DealUpdate.description, DealUpdate.created_at
+    ).join(Deal, Deal.id == DealUpdate.deal_id).filter(DealUpdate.organization_id == organization_id):
+        index.add(("deal_update", update_id), update_label("Deal", deal_title, title, created_at), description or title)
+    for update_id, project_title, title, description, created_at in db.query(
+        ProjectUpdate.id, Project.title, ProjectUpdate.title, ProjectUpdate.description, ProjectUpdate.created_at
+    ).join(Project, Project.id == ProjectUpdate.project_id).filter(ProjectUpdate.organization_id == organization_id):
+        index.add(("project_update", update_id), update_label("Project", project_title, title, created_at), description or title)
+    for thread_id, owner_id, is_private, shared_with in db.query(
+        EmailThread.id, EmailThread.owner_id, EmailThread.is_private, EmailThread.shared_with
+    ).filter(EmailThread.organization_id == organization_id):
+        index.set_thread_visibility(thread_id, thread_visibility(owner_id, is_private, shared_with))
+    for message_id, thread_id, subject, sender, content, created_at in db.query(
+        EmailMessage.id, EmailMessage.thread_id, EmailThread.subject, EmailMessage.sender, EmailMessage.content, EmailMessage.created_at
+    ).join(EmailThread, EmailThread.id == EmailMessage.thread_id).filter(
+        EmailThread.organization_id == organization_id
+    ).order_by(EmailMessage.id.desc()).limit(RETRIEVAL_MAX_EMAILS):
+        index.add(("email", message_id), email_label(sender, subject, created_at), content, thread_id)
+    return index
+
+
+class RetrievalIndexRegistry:
+    """One RetrievalIndex per organization, built lazily and rebuilt when stale"""
+
+    def __init__(self, ttl_seconds: int = RETRIEVAL_INDEX_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._indexes: Dict[int, RetrievalIndex] = {}
+        self._build_locks: Dict[int, threading.Lock] = defaultdict(threading.Lock)
+
+    def get(self, db: Session, organization_id: int) -> RetrievalIndex:
+        index = self._indexes.get(organization_id)
+        if index is not None and time.monotonic() - index.built_at < self.ttl_seconds:
+            return index
+        with self._build_locks[organization_id]:
+            index = self._indexes.get(organization_id)
+            if index is None or time.monotonic() - index.built_at >= self.ttl_seconds:
+                started = time.perf_counter()
+                index = build_retrieval_index(db, organization_id)
+                self._indexes[organization_id] = index
+                logger.info(f"Built retrieval index for organization {organization_id}: "
+                            f"{len(index)} passages in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return index
+
+    def loaded(self, organization_id: Optional[int]) -> Optional[RetrievalIndex]:
+        """The organization's index if one is built (writes to other organizations need no work)"""
+        return self._indexes.get(organization_id)
+
+    def all_loaded(self) -> List[RetrievalIndex]:
+        return list(self._indexes.values())
+
+    def invalidate(self, organization_id: Optional[int] = None) -> None:
+        """Drop one organization's index (all when organization_id is None); the next get() rebuilds it"""
+        if organization_id is None:
+            self._indexes.clear()
+        else:
+            self._indexes.pop(organization_id, None)
+
+
+retrieval_indexes = RetrievalIndexRegistry()
+
+
+def _changed(target, *attributes: str) -> bool:
+    state = inspect(target)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+
+def _contact_saved(mapper, connection, target):
+    index = retrieval_indexes.loaded(target.organization_id)
+    if index is not None and _changed(target, "notes", "first_name", "last_name"):
+        index.add(("contact_note", target.id), contact_note_label(target.first_name, target.last_name), target.notes)
+
+
+def _deal_saved(mapper, connection, target):
+    index = retrieval_indexes.loaded(target.organization_id)
+    if index is not None and _changed(target, "notes", "title"):
+        index.add(("deal_note", target.id), deal_note_label(target.title), target.notes)
+
+
+def _deal_update_saved(mapper, connection, target):
+    index = retrieval_indexes.loaded(target.organization_id)
+    if index is not None:
+        deal_title = connection.execute(select(Deal.title).where(Deal.id == target.deal_id)).scalar()
+        index.add(("deal_update", target.id), update_label("Deal", deal_title, target.title, target.created_at),
+                  target.description or target.title)
+
+
+def _project_update_saved(mapper, connection, target):
+    index = retrieval_indexes.loaded(target.organization_id)
+    if index is not None:
+        project_title = connection.execute(select(Project.title).where(Project.id == target.project_id)).scalar()
+        index.add(("project_update", target.id), update_label("Project", project_title, target.title, target.created_at),
+                  target.description or target.title)
+
+
+def _email_saved(mapper, connection, target):
+    if not retrieval_indexes.all_loaded():
+        return
+    thread = connection.execute(
+        select(EmailThread.organization_id, EmailThread.subject).where(EmailThread.id == target.thread_id)
+    ).first()
+    index = retrieval_indexes.loaded(thread.organization_id if thread else None)
+    if index is not None:
+        index.add(("email", target.id), email_label(target.sender, thread.subject, target.created_at), target.content, target.thread_id)
+
+
+def _thread_saved(mapper, connection, target):
+    index = retrieval_indexes.loaded(target.organization_id)
+    if index is not None:
+        index.set_thread_visibility(target.id, thread_visibility(target.owner_id, target.is_private, target.shared_with))
+
+
+def _listen_delete(model, kind: str) -> None:
+    def deleted(mapper, connection, target):
+        index = retrieval_indexes.loaded(target.organization_id)
+        if index is not None:
+            index.remove((kind, target.id))
+    event.listen(model, "after_delete", deleted)
+
+
+def _email_deleted(mapper, connection, target):
+    # Messages carry no organization_id (and the thread may already be gone); removing an unknown source is a no-op
+    for index in retrieval_indexes.all_loaded():
+        index.remove(("email", target.id))
+
+
+for _model, _saved in ((Contact, _contact_saved), (Deal, _deal_saved), (DealUpdate, _deal_update_saved),
+                       (ProjectUpdate, _project_update_saved), (EmailMessage, _email_saved), (EmailThread, _thread_saved)):
+    event.listen(_model, "after_insert", _saved)
+    event.listen(_model, "after_update", _saved)
+
+_listen_delete(Contact, "contact_note")
+_listen_delete(Deal, "deal_note")
+_listen_delete(DealUpdate, "deal_update")
+_listen_delete(ProjectUpdate, "project_update")
+event.listen(EmailMessage, "after_delete", _email_deleted)
@@ -7,6 +7,11 @@ from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 import logging
 from scripts.standardize_phone_numbers import standardize_phone_numbers
+from scheduler_leader import LeaderElection, WORKER_ID
+from datetime import datetime, timedelta
+import asyncio
+import functools
+import time
 import os
 
 logger = logging.getLogger(__name__)
@@ -14,17 +19,93 @@ logger = logging.getLogger(__name__)
 # Initialize scheduler
 scheduler = BackgroundScheduler()
 
+# Every worker runs a scheduler, but only the elected leader executes the jobs
+leader_election = None
+
+# How often non-leaders retry for leadership (and the leader re-checks its lock)
+LEADER_ELECTION_INTERVAL_SECONDS = int(os.getenv("SCHEDULER_LEADER_INTERVAL_SECONDS", "15"))
+# Job run history older than this is pruned nightly
+JOB_RUN_RETENTION_DAYS = int(os.getenv("SCHEDULER_JOB_RUN_RETENTION_DAYS", "14"))
+
+
+def leader_only(job_id, job_name):
+    """Run the wrapped job only on the scheduler leader, recording each run in scheduler_job_runs."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if leader_election is None or not leader_election.is_leader:
+                return None
+            
+            from database import SessionLocal
+            from models import SchedulerJobRun
+            
+            db = SessionLocal()
+            run = None
+            try:
+                run = SchedulerJobRun(
+                    job_id=job_id,
+                    job_name=job_name,
+                    worker_id=WORKER_ID,
+                    status="running",
+                    started_at=datetime.utcnow(),
+                )
+                db.add(run)
+                db.commit()
+            except Exception as e:
+                logger.error(f"Failed to record start of job {job_id}: {e}")
+                db.rollback()
+                run = None
+            
+            started = time.monotonic()
+            status, result, error_message = "success", None, None
+            try:
+                result = func(*args, **kwargs)
+                return result
+            except Exception as e:
+                status, error_message = "error", str(e)
+                raise
+            finally:
+                if run is not None:
+                    try:
+                        run.status = status
+                        run.finished_at = datetime.utcnow()
+                        run.duration_ms = int((time.monotonic() - started) * 1000)
+                        run.result = result if isinstance(result, (dict, list)) else None
+                        run.error_message = error_message
+                        db.commit()
+                    except Exception as e:
+                        logger.error(f"Failed to record result of job {job_id}: {e}")
+                        db.rollback()
+                db.close()
+        return wrapper
+    return decorator
+
+
 def init_scheduler():
     """Initialize and start the background scheduler with all scheduled jobs."""
+    global leader_election
     
     # Only start scheduler if not in test/development mode
     if os.getenv("DISABLE_SCHEDULER", "false").lower() == "true":
         logger.info("Scheduler disabled via DISABLE_SCHEDULER environment variable")
         return
     
+    from database import engine
+    leader_election = LeaderElection(engine)
+    leader_election.try_acquire()
+    
+    # Keep contending for leadership so a standby takes over when the leader dies
+    scheduler.add_job(
+        func=leader_election.try_acquire,
+        trigger=IntervalTrigger(seconds=LEADER_ELECTION_INTERVAL_SECONDS),
+        id='scheduler_leader_election',
+        name='Scheduler leader election',
+        replace_existing=True
+    )
+    
     # Schedule phone number standardization to run every night at 2 AM
     scheduler.add_job(
-        func=run_phone_standardization,
+        func=scheduled_phone_standardization,
         trigger=CronTrigger(hour=2, minute=0),  # 2:00 AM every day
         id='standardize_phone_numbers',
         name='Standardize phone numbers',
@@ -33,13 +114,46 @@ def init_scheduler():
     
     # Schedule email processor to check for due scheduled emails every 60 seconds
     scheduler.add_job(
-        func=process_scheduled_emails,
+        func=scheduled_process_scheduled_emails,
         trigger=IntervalTrigger(seconds=60),
         id='process_scheduled_emails',
         name='Process scheduled emails',
         replace_existing=True
     )
     
+    # Sync every connected O365/Google mailbox in the background
+    from mailbox_sync import MAILBOX_SYNC_INTERVAL_MINUTES
+    scheduler.add_job(
+        func=scheduled_mailbox_sync,
+        trigger=IntervalTrigger(minutes=MAILBOX_SYNC_INTERVAL_MINUTES),
+        id='sync_mailboxes',
+        name='Sync connected mailboxes',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+    
+    # Pre-generate every user's AI daily summary so the dashboard serves it from the table
+    from ai_service import DAILY_SUMMARY_HOUR
+    scheduler.add_job(
+        func=scheduled_daily_summaries,
+        trigger=CronTrigger(hour=DAILY_SUMMARY_HOUR, minute=0),
+        id='generate_daily_summaries',
+        name='Generate daily summaries',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+    
+    # Prune old job run history every night
+    scheduler.add_job(
+        func=prune_job_runs,
+        trigger=CronTrigger(hour=3, minute=0),
+        id='prune_scheduler_job_runs',
+        name='Prune scheduler job history',
+        replace_existing=True
+    )
+    
     # Start the scheduler
     scheduler.start()
     logger.info("Background scheduler started successfully")
@@ -48,6 +162,7 @@ def init_scheduler():
     jobs = scheduler.get_jobs()
     for job in jobs:
         logger.info(f"Scheduled job: {job.name} - Next run: {job.next_run_time}")
+    logger.info(f"Scheduler leader: {'this process' if leader_election.is_leader else 'another process'} ({WORKER_ID})")
 
 
 def run_phone_standardization(organization_id=None):
@@ -63,78 +178,119 @@ def run_phone_standardization(organization_id=None):
 
 
 def process_scheduled_emails():
-    """Check for and send any pending scheduled emails that are due."""
-    import asyncio
+    """Claim due scheduled emails and queue them for delivery by the outbox workers.
+    
+    Safe to run in every worker process: each scheduled email is claimed by
+    exactly one process, and its recipients are then sent in chunks by
+    whichever outbox workers are free.
+    """
+    import socket
     from database import SessionLocal
-    from models import ScheduledEmail
-    from datetime import datetime
+    from email_outbox import dispatch_due_scheduled_emails
     
     db = SessionLocal()
     try:
-        now = datetime.utcnow()
-        pending = db.query(ScheduledEmail).filter(
-            ScheduledEmail.status == "pending",
-            ScheduledEmail.scheduled_at <= now
-        ).all()
-        
-        if not pending:
-            return
-        
-        logger.info(f"Found {len(pending)} scheduled email(s) due for sending")
-        
-        # Create a new event loop for this background thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            for scheduled in pending:
-                try:
-                    scheduled.status = "sending"
-                    db.commit()
-                    
-                    # Import here to avoid circular imports
-                    from bulk_email_service import send_bulk_email
-                    
-                    result = loop.run_until_complete(
-                        send_bulk_email(
-                            db=db,
-                            organization_id=scheduled.organization_id,
-                            sender_user_id=scheduled.created_by,
-                            contact_ids=scheduled.contact_ids,
-                            subject=scheduled.subject,
-                            html_content=scheduled.html_content,
-                            from_email=scheduled.from_email,
-                            from_name=scheduled.from_name,
-                            text_content=scheduled.text_content,
-                            bcc_email=scheduled.bcc_email,
-                        )
-                    )
-                    
-                    scheduled.status = "sent"
-                    scheduled.sent_at = datetime.utcnow()
-                    scheduled.result = result
-                    db.commit()
-                    
-                    logger.info(f"Scheduled email {scheduled.id} sent successfully: {result.get('message', 'OK')}")
-                    
-                except Exception as e:
-                    scheduled.status = "failed"
-                    scheduled.result = {"error": str(e)}
-                    db.commit()
-                    logger.error(f"Scheduled email {scheduled.id} failed: {e}", exc_info=True)
-        finally:
-            loop.close()
+        worker_id = f"scheduler:{socket.gethostname()}:{os.getpid()}"
+        results = dispatch_due_scheduled_emails(db, worker_id=worker_id)
+        for result in results:
+            logger.info(f"Scheduled email {result['id']} queued as job {result['job_id']} ({result['recipients']} recipients)")
     except Exception as e:
         logger.error(f"Error in process_scheduled_emails: {e}", exc_info=True)
+        db.rollback()
     finally:
         db.close()
 
 
+@leader_only('standardize_phone_numbers', 'Standardize phone numbers')
+def scheduled_phone_standardization():
+    """Nightly phone standardization across all organizations (leader only)."""
+    return run_phone_standardization()
+
+
+@leader_only('process_scheduled_emails', 'Process scheduled emails')
+def scheduled_process_scheduled_emails():
+    """Scheduled email poll (leader only)."""
+    return process_scheduled_emails()
+
+
+@leader_only('sync_mailboxes', 'Sync connected mailboxes')
+def scheduled_mailbox_sync():
+    """Sync all active O365 and Google mailboxes concurrently (leader only)."""
+    from mailbox_sync import sync_all_mailboxes
+    from http_clients import close_http_clients
+    
+    async def run():
+        # This job runs on its own event loop, so it gets (and must close) its own client pools
+        try:
+            return await sync_all_mailboxes()
+        finally:
+            await close_http_clients()
+    
+    summary = asyncio.run(run())
+    logger.info(f"Mailbox sync completed: {summary}")
+    return summary
+
+
+@leader_only('generate_daily_summaries', 'Generate daily summaries')
+def scheduled_daily_summaries():
+    """Generate today's daily summary for every active user (leader only)."""
+    from ai_service import generate_all_daily_summaries
+    from http_clients import close_http_clients
+    
+    async def run():
+        # OpenAI calls go through this job's own loop's client pool, which it must close
+        try:
+            return await generate_all_daily_summaries()
+        finally:
+            await close_http_clients()
+    
+    results = asyncio.run(run())
+    logger.info(f"Daily summaries generated: {results}")
+    return results
+
+
+@leader_only('prune_scheduler_job_runs', 'Prune scheduler job history')
+def prune_job_runs():
+    """Delete job run history older than the retention window."""
+    from database import SessionLocal
+    from models import SchedulerJobRun
+    
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=JOB_RUN_RETENTION_DAYS)
+        deleted = db.query(SchedulerJobRun).filter(
+            SchedulerJobRun.started_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        return {"deleted": deleted}
+    finally:
+        db.close()
+
+
+def get_scheduler_status():
+    """Describe this process's scheduler and leadership state."""
+    return {
+        "worker_id": WORKER_ID,
+        "running": scheduler.running,
+        "is_leader": bool(leader_election and leader_election.is_leader),
+        "jobs": [
+            {
+                "id": job.id,
+                "name": job.name,
+                "next_run_time": job.next_run_time.isoformat() if job.next_run_time else None,
+            }
+            for job in scheduler.get_jobs()
+        ] if scheduler.running else [],
+    }
+
+
 def shutdown_scheduler():
     """Shutdown the scheduler gracefully."""
     if scheduler.running:
         scheduler.shutdown()
         logger.info("Background scheduler shut down")
+    if leader_election is not None:
+        leader_election.release()
 
 
 # Manual trigger functions for testing
@@ -0,0 +1,104 @@
+"""
+Leader election for background scheduler jobs
+Every app worker starts an APScheduler instance, but only the process holding
+a Postgres session-level advisory lock actually runs the jobs. The lock lives
+on a dedicated connection, so if the leader process dies its connection closes,
+Postgres releases the lock, and another process takes over on its next attempt.
+"""
+import logging
+import os
+import socket
+import threading
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary application-wide advisory lock key shared by all replicas
+SCHEDULER_LEADER_LOCK_KEY = int(os.environ.get("SCHEDULER_LEADER_LOCK_KEY", "7243019"))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaderElection:
+    """Holds (or keeps trying to take) the scheduler leader advisory lock"""
+
+    def __init__(self, engine: Engine, lock_key: int = SCHEDULER_LEADER_LOCK_KEY):
+        self.engine = engine
+        self.lock_key = lock_key
+        self._connection: Optional[Connection] = None
+        self._is_leader = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._is_leader
+
+    def try_acquire(self) -> bool:
+        """Confirm leadership is still held, or try to take it. Returns current leader status."""
+        with self._lock:
+            # Without Postgres (local SQLite) there is only ever one process
+            if self.engine.dialect.name != "postgresql":
+                self._is_leader = True
+                return True
+
+            if self._connection is not None:
+                try:
+                    # The session-level lock lives as long as this connection does
+                    self._connection.execute(text("SELECT 1"))
+                    self._connection.commit()
+                    return True
+                except Exception as e:
+                    logger.warning(f"Scheduler leader {WORKER_ID} lost its lock connection: {e}")
+                    self._drop_connection()
+
+            connection = None
+            try:
+                connection = self.engine.connect()
+                acquired = connection.execute(
+                    text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key}
+                ).scalar()
+                # End the implicit transaction; the advisory lock is session-scoped
+                connection.commit()
+            except Exception as e:
+                logger.error(f"Scheduler leader election failed: {e}")
+                if connection is not None:
+                    connection.close()
+                return False
+
+            if acquired:
+                self._connection = connection
+                self._is_leader = True
+                logger.info(f"Process {WORKER_ID} is now the scheduler leader")
+            else:
+                connection.close()
+            return self._is_leader
+
+    def release(self) -> None:
+        """Give up leadership (on shutdown)"""
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    self._connection.execute(
+                        text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key}
+                    )
+                    self._connection.commit()
+                    self._connection.close()
+                except Exception as e:
+                    logger.warning(f"Failed to release scheduler leader lock: {e}")
+                    self._drop_connection()
+                self._connection = None
+                logger.info(f"Process {WORKER_ID} released scheduler leadership")
+            self._is_leader = False
+
+    def _drop_connection(self) -> None:
+        """Discard a broken lock connection instead of returning it to the pool"""
+        try:
+            self._connection.invalidate()
+            self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+        self._is_leader = False
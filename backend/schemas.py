@@ -170,6 +170,15 @@ class EmailThreadResponse(EmailThreadBase, TimestampMixin):
     class Config:
         from_attributes = True
 
+class EmailThreadSummary(EmailThreadBase, TimestampMixin):
+    """Thread list entry; messages are paged separately via /api/email-threads/{id}/messages"""
+    id: int
+    message_count: int
+    preview: Optional[str] = None  # Start of the latest message
+    
+    class Config:
+        from_attributes = True
+
 class EmailMessageBase(BaseModel):
     sender: str = Field(..., max_length=255)
     content: str = Field(..., min_length=1)
@@ -188,6 +197,11 @@ class EmailMessageResponse(EmailMessageBase):
     class Config:
         from_attributes = True
 
+class EmailMessagePage(BaseModel):
+    messages: List[EmailMessageResponse]  # Newest first
+    has_more: bool
+    next_before_id: Optional[int] = None  # Pass as before_id to fetch older messages
+
 # Attachment schemas
 class AttachmentBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=255)
@@ -496,6 +510,8 @@ class CalendarEventResponse(CalendarEventBase, TimestampMixin):
     contact_name: Optional[str] = None  # Will be populated by API
     company_name: Optional[str] = None  # Will be populated by API
     creator_name: Optional[str] = None  # Will be populated by API
+    source: str = "crm"  # crm, google, o365
+    external_id: Optional[str] = None  # Provider event ID for synced events
     attendees: List[EventAttendeeResponse] = Field(default_factory=list)  # List of attendees
 
     class Config:
@@ -978,6 +994,7 @@ class EmailTrackingResponse(EmailTrackingBase, TimestampMixin):
     id: int
     organization_id: int
     sent_by: int
+    campaign_id: Optional[int] = None
     opened_at: Optional[datetime] = None
     open_count: int = 0
     first_clicked_at: Optional[datetime] = None
@@ -1026,6 +1043,7 @@ class SendGridEvent(BaseModel):
     contact_name: Optional[str] = None
     sender_name: Optional[str] = None
     source: Optional[str] = None
+    nhs_message_id: Optional[str] = None  # EmailTracking.message_id for bulk sends
 # Update forward references
 EmailThreadResponse.model_rebuild()
 
@@ -0,0 +1,254 @@
+"""
+AI chat streaming check against a local fake model server.
+
+Starts a fake OpenAI server that streams chat completion chunks with a delay
+per token (and stalls when the prompt contains STALL), points the SDK at it
+with OPENAI_BASE_URL, and serves the real FastAPI app with uvicorn on an
+in-memory SQLite database. It then:
+
+- runs concurrent chats (one per organization) while probing GET / to see how
+  long the event loop is blocked, first with the old blocking OpenAI call and
+  then with the streaming AsyncOpenAI path; it reports time to first token,
+  total time and the worst probe latency;
+- sends more chats to one organization than AI_CHAT_MAX_CONCURRENT_PER_ORG
+  allows and counts the 429s;
+- sends a chat the model stalls on and checks the error event arrives after
+  AI_CHAT_TIMEOUT_SECONDS;
+- generates daily summary insights through the same fake server.
+
+Usage:
+    cd backend
+    python scripts/benchmark_ai_chat_streaming.py --chats 8 --tokens 40 --token-delay 0.02
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """/v1/chat/completions answering with a fixed reply, streamed or whole"""
+    tokens = 40
+    token_delay = 0.02
+    stall_seconds = 30
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = " ".join(message["content"] for message in body["messages"])
+        words = [f"word{i} " for i in range(FakeOpenAIHandler.tokens)]
+        try:
+            if "STALL" in prompt:
+                time.sleep(FakeOpenAIHandler.stall_seconds)
+            if not body.get("stream"):
+                time.sleep(FakeOpenAIHandler.token_delay * len(words))
+                payload = json.dumps({
+                    "id": "chatcmpl-fake", "object": "chat.completion", "created": 0, "model": body["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "".join(words)}}],
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for word in words:
+                chunk = {
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(FakeOpenAIHandler.token_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def build_session_factory(organizations: int):
+    from models import Base, Contact, Organization, User
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    session = factory()
+    for org_id in range(1, organizations + 1):
+        session.add(Organization(id=org_id, name=f"Org {org_id}", slug=f"org-{org_id}"))
+        session.add(User(id=org_id, organization_id=org_id, email=f"u{org_id}@org.example", password_hash="x", first_name="Pat", last_name="Lee"))
+        session.add(Contact(organization_id=org_id, first_name="Maria", last_name="Lopez", email=f"maria{org_id}@example.com", phone="555-0100"))
+    session.commit()
+    session.close()
+    return factory
+
+
+def blocking_stream_reply(self, messages):
+    """The previous chat call: the sync OpenAI client inside the event loop"""
+    from openai import OpenAI
+    from http_clients import http_clients
+
+    async def reply():
+        client = OpenAI(api_key="fake-key", http_client=http_clients.get_sync("openai"))
+        response = client.chat.completions.create(model="gpt-4o-mini", messages=messages, max_tokens=300, temperature=0.3)
+        yield response.choices[0].message.content
+    return reply()
+
+
+async def chat(client, base_url, org_id, message):
+    """POST /api/ai/chat and read the event stream; returns (status, first token s, total s, last event)"""
+    started = time.perf_counter()
+    first_token, last_event = None, None
+    async with client.stream("POST", f"{base_url}/api/ai/chat", json={"message": message}, headers={"X-Org": str(org_id)}) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return response.status_code, None, time.perf_counter() - started, None
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - started
+                last_event = (event, json.loads(line[len("data: "):]))
+    return 200, first_token, time.perf_counter() - started, last_event
+
+
+async def probe(client, base_url, stop: asyncio.Event, latencies):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get(f"{base_url}/")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.02)
+
+
+async def concurrent_chats(client, base_url, chats):
+    stop, latencies = asyncio.Event(), []
+    prober = asyncio.create_task(probe(client, base_url, stop, latencies))
+    await asyncio.sleep(0.1)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(chat(client, base_url, org_id, "What is Maria Lopez's phone?") for org_id in range(1, chats + 1)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await prober
+    return results, wall, max(latencies)
+
+
+async def run(args, base_url):
+    import httpx
+    import ai_chat
+    from ai_service import DailySummaryService
+    from http_clients import close_http_clients
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        async_reply = ai_chat.AIChatService.stream_reply
+        for label, reply in (("Blocking OpenAI", blocking_stream_reply), ("Streaming AsyncOpenAI", async_reply)):
+            ai_chat.AIChatService.stream_reply = reply
+            results, wall, worst_probe = await concurrent_chats(client, base_url, args.chats)
+            first_tokens = [first for _, first, _, _ in results if first is not None]
+            completed = sum(1 for *_, last in results if last and last[0] == "done")
+            print(f"{label:<22} {args.chats} chats in {wall:5.2f}s, {completed} done, "
+                  f"first token avg {sum(first_tokens) / len(first_tokens):5.2f}s, worst GET / latency {worst_probe * 1000:7.1f}ms")
+        ai_chat.AIChatService.stream_reply = async_reply
+
+        # More chats than one organization is allowed at once
+        results = await asyncio.gather(*(chat(client, base_url, 1, "Any tasks due?") for _ in range(ai_chat.AI_CHAT_MAX_CONCURRENT_PER_ORG + 2)))
+        statuses = [status for status, *_ in results]
+        print(f"Per-org limit {ai_chat.AI_CHAT_MAX_CONCURRENT_PER_ORG}: statuses {sorted(statuses)}, "
+              f"{ai_chat.chat_limiter.in_flight(1)} slots still held afterwards")
+
+        # A model that never answers
+        status, _, elapsed, last = await chat(client, base_url, 2, "STALL please")
+        print(f"Timeout {ai_chat.AI_CHAT_TIMEOUT_SECONDS:.0f}s: status {status}, {last[0]} event after {elapsed:.2f}s: {last[1]['response']}")
+
+    # Daily summary insights go through AsyncOpenAI on this loop's pool
+    service = DailySummaryService(SimpleNamespace(), 1, 1)
+    sections = {
+        "tasks": {"overdue_count": 1, "today_count": 0, "pending_count": 1, "overdue": [], "today": []},
+        "contacts": {"total": 1, "with_tasks": 0, "with_overdue_tasks": 0},
+        "companies": {"total": 0, "active": 0},
+        "deals": {"total": 0, "active": 0, "high_value": 0, "high_value_top": []},
+    }
+    started = time.perf_counter()
+    insights = await service._generate_ai_insights(sections, "Pat")
+    print(f"Daily summary insights in {time.perf_counter() - started:.2f}s: {insights[:40]}...")
+    await close_http_clients()
+
+
+def main(args):
+    fake = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+    threading.Thread(target=fake.serve_forever, daemon=True).start()
+    FakeOpenAIHandler.tokens = args.tokens
+    FakeOpenAIHandler.token_delay = args.token_delay
+    os.environ.update({
+        "DISABLE_SCHEDULER": "true",
+        "OPENAI_API_KEY": "fake-key",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake.server_address[1]}/v1",
+        "AI_CHAT_MAX_CONCURRENT_PER_ORG": str(args.limit),
+        "AI_CHAT_TIMEOUT_SECONDS": str(args.timeout),
+    })
+
+    import uvicorn
+    from fastapi import Request
+    import main as app_module
+    from database import get_db
+
+    factory = build_session_factory(args.chats)
+
+    def session():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def current_user(request: Request):
+        # One user per organization, picked by the X-Org header
+        org_id = int(request.headers["X-Org"])
+        return SimpleNamespace(id=org_id, organization_id=org_id)
+
+    app_module.app.dependency_overrides[get_db] = session
+    app_module.app.dependency_overrides[app_module.get_current_active_user] = current_user
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, lifespan="off", log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    try:
+        asyncio.run(run(args, f"http://127.0.0.1:{port}"))
+    finally:
+        server.should_exit = True
+        fake.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check streaming AI chat against a local fake model server")
+    parser.add_argument("--chats", type=int, default=8, help="Concurrent chats, one per organization")
+    parser.add_argument("--tokens", type=int, default=40, help="Tokens per fake reply")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between fake tokens")
+    parser.add_argument("--limit", type=int, default=2, help="AI_CHAT_MAX_CONCURRENT_PER_ORG")
+    parser.add_argument("--timeout", type=float, default=3, help="AI_CHAT_TIMEOUT_SECONDS")
+    main(parser.parse_args())
@@ -0,0 +1,176 @@
+"""
+AI chat response cache benchmark.
+
+Seeds an in-memory SQLite database with contacts, companies, deals and tasks,
+replaces the model call with a fake one that sleeps --model-delay seconds and
+counts calls, then:
+
+- replays a skewed stream of questions (a few asked often, most rarely) through
+  stream_ai_chat, with the cache disabled and enabled, reporting model calls,
+  total time and hit rate;
+- checks that editing a contact the question mentions makes the next ask a
+  miss (ORM event), and that the same question over different retrieved
+  context is a different entry;
+- checks TTL expiry and LRU eviction with a small cache;
+- prints the stats GET /api/admin/ai-chat/cache would return.
+
+Usage:
+    cd backend
+    python scripts/benchmark_ai_response_cache.py --requests 300 --questions 40 --model-delay 0.05
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+MODEL_CALLS = 0
+
+
+def build_session(args):
+    from models import Base, Company, Contact, Deal, Organization, PipelineStage, Task, User
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    session.add(Organization(id=1, name="Org", slug="org"))
+    session.add(User(id=1, organization_id=1, email="me@org.example", password_hash="x", first_name="Me", last_name="Self"))
+    session.add(PipelineStage(id=1, organization_id=1, name="Proposal", position=1))
+    session.flush()
+    session.bulk_insert_mappings(Company, [
+        {"id": i + 1, "organization_id": 1, "name": f"Acme{i} Labs", "status": "Active"} for i in range(args.questions)
+    ])
+    session.bulk_insert_mappings(Contact, [
+        {"id": i + 1, "organization_id": 1, "first_name": f"Maria{i}", "last_name": "Lopez", "email": f"maria{i}@example.com",
+         "company_id": i + 1, "company_name": f"Acme{i} Labs", "phone": "555-0100", "notes": "Renewal pricing call next week"}
+        for i in range(args.questions)
+    ])
+    session.bulk_insert_mappings(Deal, [
+        {"id": i + 1, "organization_id": 1, "created_by": 1, "stage_id": 1, "title": f"Acme{i} renewal", "contact_id": i + 1,
+         "company_id": i + 1, "value": 1000 * (i + 1)}
+        for i in range(args.questions)
+    ])
+    session.bulk_insert_mappings(Task, [
+        {"organization_id": 1, "title": f"Call Maria{i}", "contact_id": i + 1, "status": "pending"} for i in range(args.questions)
+    ])
+    session.commit()
+    return session
+
+
+def questions(count):
+    return [f"What's the latest with Maria{i} Lopez and any tasks due?" for i in range(count)]
+
+
+def install_fake_model(delay):
+    """Replace the OpenAI call with a counted sleep"""
+    import ai_chat
+
+    async def fake_stream_reply(self, messages):
+        global MODEL_CALLS
+        MODEL_CALLS += 1
+        await asyncio.sleep(delay)
+        yield f"Answer #{MODEL_CALLS} for {messages[-1]['content'][-40:]}"
+
+    ai_chat.AIChatService.stream_reply = fake_stream_reply
+
+
+async def ask(session, message):
+    """Run stream_ai_chat and return the done event"""
+    from ai_chat import stream_ai_chat
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        events = [event async for event in stream_ai_chat(session, 1, 1, message)]
+    name, data = events[-1].split("\n")[:2]
+    return name[len("event: "):], json.loads(data[len("data: "):])
+
+
+async def replay(session, stream, enabled):
+    from ai_response_cache import response_cache
+
+    global MODEL_CALLS
+    MODEL_CALLS = 0
+    response_cache.invalidate()
+    original_get = response_cache.get
+    if not enabled:
+        response_cache.get = lambda organization_id, key: None
+    started = time.perf_counter()
+    try:
+        for message in stream:
+            await ask(session, message)
+    finally:
+        response_cache.get = original_get
+    return MODEL_CALLS, time.perf_counter() - started
+
+
+async def run(args):
+    from ai_response_cache import ResponseCache
+    import ai_chat
+    from models import Contact
+
+    session = build_session(args)
+    install_fake_model(args.model_delay)
+    rng = random.Random(7)
+    asked = questions(args.questions)
+    # Zipf-like: the first few questions are asked far more often than the rest
+    weights = [1 / (rank + 1) for rank in range(len(asked))]
+    stream = rng.choices(asked, weights=weights, k=args.requests)
+
+    for label, enabled in (("No cache", False), ("Response cache", True)):
+        before = ai_chat.response_cache.stats(1)
+        calls, elapsed = await replay(session, stream, enabled)
+        after = ai_chat.response_cache.stats(1)
+        hits = after["hits"] - before["hits"]
+        print(f"{label:<15} {args.requests} requests, {len(set(stream))} distinct: {calls} model calls in {elapsed:5.2f}s"
+              + (f", {hits} hits" if enabled else ""))
+
+    # An ORM edit to a mentioned contact drops the organization's answers
+    question = asked[0]
+    first = await ask(session, question)
+    repeat = await ask(session, question)
+    contact = session.get(Contact, 1)
+    contact.phone = "555-0199"
+    session.commit()
+    after_edit = await ask(session, question)
+    print(f"Invalidation: repeat cached {repeat[1].get('cached', False)}, "
+          f"after contact edit cached {after_edit[1].get('cached', False)} (new answer {after_edit[1]['response'] != first[1]['response']})")
+
+    # Same words, different retrieved context: different keys
+    service = ai_chat.AIChatService(session, 1, 1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, key_a = service.build_messages("What's the latest with Maria1 Lopez?")
+        _, key_b = service.build_messages("what's the LATEST with maria1 lopez")
+        _, key_c = service.build_messages("What's the latest with Maria2 Lopez?")
+    print(f"Keys: reworded question same key {key_a == key_b}, other contact same key {key_a == key_c}")
+
+    # TTL and LRU with a small cache
+    small = ResponseCache(ttl_seconds=0.2, max_entries=3)
+    for i in range(5):
+        small.put(2, f"q{i}", "answer")
+    small.get(2, "q2")
+    time.sleep(0.25)
+    expired = small.get(2, "q4")
+    stats = small.stats(2)
+    print(f"Small cache (ttl 0.2s, 3 entries): evictions {stats['evictions']}, expired lookup {expired!r}, "
+          f"expirations {stats['expirations']}")
+
+    print(f"Stats: {ai_chat.response_cache.stats(1)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the AI chat response cache")
+    parser.add_argument("--requests", type=int, default=300, help="Chat messages replayed")
+    parser.add_argument("--questions", type=int, default=40, help="Distinct questions (one contact each)")
+    parser.add_argument("--model-delay", type=float, default=0.05, help="Seconds per fake model call")
+    asyncio.run(run(parser.parse_args()))
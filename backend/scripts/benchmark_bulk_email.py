@@ -0,0 +1,136 @@
+"""
+Throughput benchmark for bulk email sending.
+
+Runs send_bulk_email against a local fake SendGrid server and an in-memory
+SQLite database, so no real emails are sent and no DATABASE_URL is needed.
+
+Usage:
+    cd backend
+    python scripts/benchmark_bulk_email.py --contacts 5000
+    python scripts/benchmark_bulk_email.py --contacts 200 --mode individual
+    python scripts/benchmark_bulk_email.py --contacts 5000 --latency-ms 80
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+class FakeSendGridHandler(BaseHTTPRequestHandler):
+    """Accepts /v3/mail/send and counts requests and personalizations"""
+    latency = 0.0
+    lock = threading.Lock()
+    requests = 0
+    personalizations = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != "/v3/mail/send":
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        payload = json.loads(body)
+        if self.latency:
+            time.sleep(self.latency)
+
+        with FakeSendGridHandler.lock:
+            FakeSendGridHandler.requests += 1
+            FakeSendGridHandler.personalizations += len(payload.get("personalizations", []))
+
+        self.send_response(202)
+        self.send_header("Content-Length", "0")
+        self.send_header("X-Message-Id", f"fake-{FakeSendGridHandler.requests}")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_sendgrid(latency_ms: float) -> ThreadingHTTPServer:
+    FakeSendGridHandler.latency = latency_ms / 1000.0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSendGridHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_session(contact_count: int):
+    from models import Base, Contact
+
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    session.bulk_insert_mappings(Contact, [
+        {
+            "id": i,
+            "organization_id": 1,
+            "first_name": f"First{i}",
+            "last_name": f"Last{i}",
+            "email": f"contact{i}@example.com",
+            "company_name": f"Company {i % 50}",
+            "title": "Director",
+        }
+        for i in range(1, contact_count + 1)
+    ])
+    session.commit()
+    return session
+
+
+async def run(args):
+    server = start_fake_sendgrid(args.latency_ms)
+    os.environ["SENDGRID_API_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["SENDGRID_API_KEY"] = "SG.fake-benchmark-key"
+
+    from bulk_email_service import send_bulk_email
+
+    session = build_session(args.contacts)
+    html = (
+        "<p>Hi {{first_name}},</p><p>News for {{company_name}}.</p>"
+        "<p><a href=\"{{unsubscribe_url}}\">Unsubscribe</a></p>"
+    )
+
+    started = time.perf_counter()
+    result = await send_bulk_email(
+        db=session,
+        organization_id=1,
+        sender_user_id=1,
+        contact_ids=list(range(1, args.contacts + 1)),
+        subject="Update for {{first_name}}",
+        html_content=html,
+        text_content="Hi {{first_name}}, unsubscribe: {{unsubscribe_url}}",
+        batch_mode=args.mode == "batch",
+    )
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    print(f"Mode:              {args.mode}")
+    print(f"Contacts:          {args.contacts}")
+    print(f"Sent:              {result['success_count']} ({result['error_count']} errors)")
+    print(f"API requests:      {FakeSendGridHandler.requests}")
+    print(f"Personalizations:  {FakeSendGridHandler.personalizations}")
+    print(f"Elapsed:           {elapsed:.2f}s")
+    print(f"Throughput:        {result['success_count'] / elapsed:,.0f} emails/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark bulk email throughput against a fake SendGrid server")
+    parser.add_argument("--contacts", type=int, default=5000, help="Number of contacts to send to")
+    parser.add_argument("--mode", choices=["batch", "individual"], default="batch", help="Send mode to benchmark")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Simulated SendGrid response latency")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,238 @@
+"""
+Calendar sync against local Google Calendar and Microsoft Graph stubs.
+
+Starts one fake server answering Google Calendar events.list (page tokens and
+syncToken) and Graph calendarView/delta (nextLink and deltaLink), then runs
+GoogleService.sync_calendar_events and O365Service.sync_calendar_events
+against an in-memory SQLite database. The first round copies every event;
+events are then changed, cancelled and added, and the second round should
+fetch and write only those. With --expire-tokens the stubs answer the second
+round with 410 Gone and both syncs start over without leaving duplicates.
+
+Usage:
+    cd backend
+    python scripts/benchmark_calendar_sync.py --events 2000
+    python scripts/benchmark_calendar_sync.py --events 2000 --expire-tokens
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+OWN_ADDRESS = "me@crm.example"
+
+
+class FakeCalendarHandler(BaseHTTPRequestHandler):
+    """Google /calendar/v3/calendars/primary/events and Graph /v1.0/me/calendarView/delta over one event log"""
+    lock = threading.Lock()
+    version = 0
+    events = {}  # id -> (version, event) with event in a provider-neutral shape
+    expire_tokens = False
+    requests = 0
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        with FakeCalendarHandler.lock:
+            FakeCalendarHandler.requests += 1
+        if parsed.path == "/calendar/v3/calendars/primary/events":
+            return self._google(query)
+        if parsed.path == "/v1.0/me/calendarView/delta":
+            return self._graph(parsed.path, query)
+        return self._send(404, {"error": {"code": 404}})
+
+    @classmethod
+    def _changes(cls, since):
+        """Events changed after version since (cancelled ones included), or every live event for a full sync"""
+        if since is None:
+            return [item for _, item in sorted(cls.events.values(), key=lambda pair: pair[1]["id"]) if not item["cancelled"]]
+        return [item for version, item in sorted(cls.events.values(), key=lambda pair: pair[0]) if version > since]
+
+    def _google(self, query):
+        if "syncToken" in query and FakeCalendarHandler.expire_tokens:
+            return self._send(410, {"error": {"code": 410, "message": "Sync token is no longer valid"}})
+        since = int(query["syncToken"]) if "syncToken" in query else None
+        changes = self._changes(since)
+        offset = int(query.get("pageToken", 0))
+        size = int(query.get("maxResults", 250))
+        items = []
+        for item in changes[offset:offset + size]:
+            if item["cancelled"]:
+                items.append({"id": item["id"], "status": "cancelled"})
+                continue
+            items.append({
+                "id": item["id"],
+                "status": "confirmed",
+                "summary": item["title"],
+                "location": item["location"],
+                "start": {"dateTime": item["start"].isoformat() + "+00:00"},
+                "end": {"dateTime": item["end"].isoformat() + "+00:00"},
+                "attendees": [{"email": OWN_ADDRESS, "self": True}, {"email": item["attendee"]}],
+            })
+        body = {"items": items}
+        if offset + size < len(changes):
+            body["nextPageToken"] = str(offset + size)
+        else:
+            body["nextSyncToken"] = str(FakeCalendarHandler.version)
+        return self._send(200, body)
+
+    def _graph(self, path, query):
+        if "$deltatoken" in query and FakeCalendarHandler.expire_tokens:
+            return self._send(410, {"error": {"code": "SyncStateNotFound"}})
+        since = query.get("$deltatoken", query.get("since"))
+        since = int(since) if since not in (None, "") else None
+        changes = self._changes(since)
+        offset = int(query.get("$skiptoken", 0))
+        size = int(self.headers.get("Prefer", "odata.maxpagesize=100").split("odata.maxpagesize=")[1].split(",")[0])
+        value = []
+        for item in changes[offset:offset + size]:
+            if item["cancelled"]:
+                value.append({"id": item["id"], "@removed": {"reason": "deleted"}})
+                continue
+            value.append({
+                "id": item["id"],
+                "subject": item["title"],
+                "bodyPreview": "",
+                "location": {"displayName": item["location"]},
+                "start": {"dateTime": item["start"].isoformat() + ".0000000", "timeZone": "UTC"},
+                "end": {"dateTime": item["end"].isoformat() + ".0000000", "timeZone": "UTC"},
+                "isAllDay": False,
+                "isCancelled": False,
+                "attendees": [{"emailAddress": {"address": item["attendee"]}}],
+            })
+        base = f"http://{self.headers['Host']}{path}"
+        body = {"value": value}
+        if offset + size < len(changes):
+            body["@odata.nextLink"] = f"{base}?{urlencode({'$skiptoken': offset + size, 'since': '' if since is None else since})}"
+        else:
+            body["@odata.deltaLink"] = f"{base}?$deltatoken={FakeCalendarHandler.version}"
+        return self._send(200, body)
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def put_event(event_id: str, i: int, contact_count: int, cancelled: bool = False, title: str = None):
+    start = datetime.utcnow().replace(microsecond=0) + timedelta(hours=i % 2000)
+    FakeCalendarHandler.version += 1
+    FakeCalendarHandler.events[event_id] = (FakeCalendarHandler.version, {
+        "id": event_id,
+        "title": title or f"Meeting {i}",
+        "location": f"Room {i % 9}",
+        "start": start,
+        "end": start + timedelta(minutes=30),
+        "attendee": f"Contact{i % (contact_count * 2)}@Example.com",  # Half the attendees are CRM contacts
+        "cancelled": cancelled,
+    })
+
+
+def build_session(contact_count: int):
+    from models import Base, Contact, GoogleUserConnection, O365UserConnection
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    expires = datetime.utcnow() + timedelta(hours=1)
+    google = GoogleUserConnection(
+        id=1, user_id=1, organization_id=1, org_config_id=1,
+        google_user_id="fake", google_email=OWN_ADDRESS,
+        access_token_encrypted="x", refresh_token_encrypted="x", token_expires_at=expires,
+        sync_error_count=0, connection_status="active",
+    )
+    o365 = O365UserConnection(
+        id=1, user_id=2, organization_id=1, org_config_id=1,
+        o365_user_id="fake", o365_email=OWN_ADDRESS,
+        access_token_encrypted="x", refresh_token_encrypted="x", token_expires_at=expires,
+    )
+    session.add_all([google, o365])
+    session.add_all([
+        Contact(organization_id=1, first_name="Contact", last_name=str(i), email=f"contact{i}@example.com", company_id=None)
+        for i in range(contact_count)
+    ])
+    session.commit()
+    return engine, session, google, o365
+
+
+async def run(args):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeCalendarHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["GOOGLE_API_BASE_URL"] = base_url
+    os.environ["MICROSOFT_GRAPH_API_URL"] = f"{base_url}/v1.0"
+
+    from google_service import GoogleService
+    from o365_service import O365Service
+    from http_clients import close_http_clients
+    from models import CalendarEvent
+
+    engine, session, google, o365 = build_session(args.contacts)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    for i in range(args.events):
+        put_event(f"e{i}", i, args.contacts)
+
+    for round_number in (1, 2):
+        if round_number == 2:
+            # Change, cancel and add a slice of the calendar
+            for i in range(0, args.changes, 3):
+                put_event(f"e{i}", i, args.contacts, title=f"Moved meeting {i}")
+                put_event(f"e{i + 1}", i + 1, args.contacts, cancelled=True)
+                put_event(f"n{i}", i, args.contacts)
+            FakeCalendarHandler.expire_tokens = args.expire_tokens
+
+        for label, service in (("Google", GoogleService(google)), ("O365", O365Service(o365, None))):
+            service.access_token = "fake-token"
+            FakeCalendarHandler.requests = 0
+            statements.clear()
+            started = time.perf_counter()
+            synced = await service.sync_calendar_events(session)
+            elapsed = time.perf_counter() - started
+            print(f"Round {round_number} {label:<6}: wrote {synced} events in {elapsed:.2f}s "
+                  f"({FakeCalendarHandler.requests} API requests, {len(statements)} SQL statements)")
+
+    await close_http_clients()
+    server.shutdown()
+
+    live = sum(1 for _, item in FakeCalendarHandler.events.values() if not item["cancelled"])
+    for source, user_id in (("google", 1), ("o365", 2)):
+        events = session.query(CalendarEvent).filter(CalendarEvent.source == source, CalendarEvent.created_by == user_id)
+        moved = events.filter(CalendarEvent.title.like("Moved meeting%")).count()
+        linked = events.filter(CalendarEvent.contact_id.isnot(None)).count()
+        distinct = session.query(func.count(func.distinct(CalendarEvent.external_id))).filter(
+            CalendarEvent.source == source, CalendarEvent.created_by == user_id
+        ).scalar()
+        print(f"{source:<6}: {events.count()} events stored ({distinct} distinct, {live} live upstream), "
+              f"{moved} updated titles, {linked} linked to a contact")
+    print(f"Google sync token: {google.calendar_sync_token}, O365 delta link: {o365.calendar_delta_link}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run Google/O365 calendar sync against local API stubs")
+    parser.add_argument("--events", type=int, default=2000, help="Events in each calendar for the first sync")
+    parser.add_argument("--changes", type=int, default=150, help="Events touched before the second sync (a third each moved, cancelled, added)")
+    parser.add_argument("--contacts", type=int, default=50, help="CRM contacts that attendees can match")
+    parser.add_argument("--expire-tokens", action="store_true", help="Answer the second round's sync token / deltaLink with 410")
+    asyncio.run(run(parser.parse_args()))
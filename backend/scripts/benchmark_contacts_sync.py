@@ -0,0 +1,218 @@
+"""
+Address book import against local Google People and Microsoft Graph stubs.
+
+Starts one fake server answering people.connections (page tokens and
+syncToken) and Graph contacts/delta (nextLink and deltaLink) over the same
+address book, seeds the CRM with some of those people under differently cased
+emails, and imports with GoogleService.sync_contacts and
+O365Service.sync_contacts into an in-memory SQLite database. The second round
+changes and adds a few people and should fetch and write only those. With
+--expire-tokens the stubs answer the second round with 410 Gone and the
+imports read the whole address book again without creating duplicates.
+
+Usage:
+    cd backend
+    python scripts/benchmark_contacts_sync.py --contacts 20000
+    python scripts/benchmark_contacts_sync.py --contacts 20000 --expire-tokens
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+class FakeAddressBookHandler(BaseHTTPRequestHandler):
+    """Google /people/v1/people/me/connections and Graph /v1.0/me/contacts/delta over one address book"""
+    lock = threading.Lock()
+    version = 0
+    people = {}  # id -> (version, person) in a provider-neutral shape
+    expire_tokens = False
+    requests = 0
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        with FakeAddressBookHandler.lock:
+            FakeAddressBookHandler.requests += 1
+        if parsed.path == "/people/v1/people/me/connections":
+            return self._google(query)
+        if parsed.path == "/v1.0/me/contacts/delta":
+            return self._graph(parsed.path, query)
+        return self._send(404, {"error": {"code": 404}})
+
+    @classmethod
+    def _changes(cls, since):
+        ordered = sorted(cls.people.values(), key=lambda pair: pair[0])
+        return [person for version, person in ordered if since is None or version > since]
+
+    def _google(self, query):
+        if "syncToken" in query and FakeAddressBookHandler.expire_tokens:
+            return self._send(410, {"error": {"code": 410, "status": "EXPIRED_SYNC_TOKEN"}})
+        changes = self._changes(int(query["syncToken"]) if "syncToken" in query else None)
+        offset = int(query.get("pageToken", 0))
+        size = int(query.get("pageSize", 100))
+        connections = [{
+            "resourceName": f"people/{person['id']}",
+            "names": [{"givenName": person["first"], "familyName": person["last"], "metadata": {"primary": True}}],
+            "emailAddresses": [{"value": "  " + person["email"].upper() + " ", "metadata": {"primary": True}}],
+            "phoneNumbers": [{"value": person["phone"], "canonicalForm": "+1" + person["phone"].replace("-", "")}],
+            "organizations": [{"name": person["company"], "title": person["title"]}],
+        } for person in changes[offset:offset + size]]
+        body = {"connections": connections, "totalPeople": len(FakeAddressBookHandler.people)}
+        if offset + size < len(changes):
+            body["nextPageToken"] = str(offset + size)
+        else:
+            body["nextSyncToken"] = str(FakeAddressBookHandler.version)
+        return self._send(200, body)
+
+    def _graph(self, path, query):
+        if "$deltatoken" in query and FakeAddressBookHandler.expire_tokens:
+            return self._send(410, {"error": {"code": "SyncStateNotFound"}})
+        since = query.get("$deltatoken", query.get("since"))
+        changes = self._changes(int(since) if since not in (None, "") else None)
+        offset = int(query.get("$skiptoken", 0))
+        size = int(self.headers.get("Prefer", "odata.maxpagesize=100").split("odata.maxpagesize=")[1])
+        value = [{
+            "id": person["id"],
+            "givenName": person["first"],
+            "surname": person["last"],
+            "emailAddresses": [{"address": person["email"].title()}],
+            "businessPhones": [person["phone"]],
+            "jobTitle": person["title"],
+            "companyName": person["company"],
+        } for person in changes[offset:offset + size]]
+        base = f"http://{self.headers['Host']}{path}"
+        body = {"value": value}
+        if offset + size < len(changes):
+            body["@odata.nextLink"] = f"{base}?{urlencode({'$skiptoken': offset + size, 'since': since or ''})}"
+        else:
+            body["@odata.deltaLink"] = f"{base}?$deltatoken={FakeAddressBookHandler.version}"
+        return self._send(200, body)
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def put_person(i: int, title: str = "Engineer"):
+    FakeAddressBookHandler.version += 1
+    FakeAddressBookHandler.people[f"p{i}"] = (FakeAddressBookHandler.version, {
+        "id": f"p{i}",
+        "first": "Person",
+        "last": str(i),
+        "email": f"person{i}@example.com",
+        "phone": f"555-{i % 1000:03d}-{i % 10000:04d}",
+        "title": title,
+        "company": f"Company {i % 500}",
+    })
+
+
+def build_session(existing: int):
+    from models import Base, Contact, GoogleUserConnection, O365UserConnection
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    expires = datetime.utcnow() + timedelta(hours=1)
+    google = GoogleUserConnection(
+        id=1, user_id=1, organization_id=1, org_config_id=1,
+        google_user_id="fake", google_email="me@crm.example",
+        access_token_encrypted="x", refresh_token_encrypted="x", token_expires_at=expires,
+        sync_error_count=0, connection_status="active",
+    )
+    o365 = O365UserConnection(
+        id=1, user_id=2, organization_id=1, org_config_id=1,
+        o365_user_id="fake", o365_email="me@crm.example",
+        access_token_encrypted="x", refresh_token_encrypted="x", token_expires_at=expires,
+    )
+    session.add_all([google, o365])
+    # People already in the CRM, entered by hand with mixed-case emails and no phone/title
+    session.add_all([
+        Contact(organization_id=1, first_name="Known", last_name=str(i), email=f"Person{i}@Example.com")
+        for i in range(0, existing * 2, 2)
+    ])
+    session.commit()
+    return engine, session, google, o365
+
+
+async def run(args):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAddressBookHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["GOOGLE_API_BASE_URL"] = base_url
+    os.environ["MICROSOFT_GRAPH_API_URL"] = f"{base_url}/v1.0"
+
+    from google_service import GoogleService
+    from o365_service import O365Service
+    from http_clients import close_http_clients
+    from models import Company, Contact
+
+    engine, session, google, o365 = build_session(args.existing)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    for i in range(args.contacts):
+        put_person(i)
+
+    for round_number in (1, 2):
+        if round_number == 2:
+            for i in range(args.changes):
+                put_person(i, title="Director")
+                put_person(args.contacts + i)
+            FakeAddressBookHandler.expire_tokens = args.expire_tokens
+
+        for label, service in (("Google", GoogleService(google)), ("O365", O365Service(o365, None))):
+            service.access_token = "fake-token"
+            FakeAddressBookHandler.requests = 0
+            statements.clear()
+            started = time.perf_counter()
+            stats = await service.sync_contacts(session)
+            elapsed = time.perf_counter() - started
+            print(f"Round {round_number} {label:<6}: {elapsed:.2f}s, {FakeAddressBookHandler.requests} API requests, "
+                  f"{len(statements)} SQL statements")
+            print(f"    {stats}")
+
+    await close_http_clients()
+    server.shutdown()
+
+    contacts = session.query(func.count(Contact.id)).scalar()
+    distinct = session.query(func.count(func.distinct(func.lower(Contact.email)))).scalar()
+    companies = session.query(func.count(Company.id)).scalar()
+    counted = session.query(func.sum(Company.contact_count)).scalar()
+    linked = session.query(func.count(Contact.id)).filter(Contact.company_id.isnot(None)).scalar()
+    kept = session.query(func.count(Contact.id)).filter(Contact.first_name == "Known").scalar()
+    print(f"Contacts: {contacts} ({distinct} distinct emails, {len(FakeAddressBookHandler.people)} upstream), "
+          f"{kept} hand-entered names kept")
+    print(f"Companies: {companies}, contact_count total {counted} for {linked} linked contacts")
+    sample = session.query(Contact).filter(Contact.email == "person1@example.com").first()
+    print(f"Sample: {sample.email} {sample.phone} {sample.title} {sample.company_name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import contacts from local Google People / Graph stubs")
+    parser.add_argument("--contacts", type=int, default=20000, help="People in the address book")
+    parser.add_argument("--existing", type=int, default=2000, help="Of those, people already in the CRM")
+    parser.add_argument("--changes", type=int, default=100, help="People changed and added before the second round")
+    parser.add_argument("--expire-tokens", action="store_true", help="Answer the second round's sync token / deltaLink with 410")
+    asyncio.run(run(parser.parse_args()))
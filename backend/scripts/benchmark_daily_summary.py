@@ -0,0 +1,186 @@
+"""
+Daily summary benchmark.
+
+Seeds an in-memory SQLite database with one organization's tasks, contacts,
+companies and deals, then compares the old per-request collection (every row
+loaded through get_tasks/get_contacts/get_companies/get_deals with
+limit=10000 and a contacts x tasks loop) with the SQL aggregate sections, and
+times serving the stored summary. It then refreshes with nothing changed,
+after a deal change, and after a task change, reporting which sections were
+re-collected and whether the AI insights were regenerated. The OpenAI call is
+replaced by a counter, so no API key is needed. Finally the scheduler job
+generates summaries for every user, collecting each section once per
+organization.
+
+Usage:
+    cd backend
+    python scripts/benchmark_daily_summary.py --tasks 3000 --contacts 3000
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import re
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+def build_sessions(args):
+    from models import Base, Company, Contact, Deal, Organization, PipelineStage, Task, User
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    # get_contacts' self-healing UPDATE uses Postgres' regexp_replace
+    event.listen(engine, "connect", lambda connection, _: connection.create_function(
+        "regexp_replace", 4, lambda value, pattern, replacement, flags: re.sub(pattern, replacement, value) if value else value
+    ))
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    session = factory()
+    rng = random.Random(11)
+    now = datetime.utcnow()
+
+    session.add(Organization(id=1, name="Org", slug="org"))
+    session.add_all([
+        User(id=i + 1, organization_id=1, email=f"user{i}@org.example", password_hash="x", first_name=f"User{i}", last_name="X")
+        for i in range(args.users)
+    ])
+    session.add(PipelineStage(id=1, organization_id=1, name="Proposal", position=1))
+    session.flush()
+    session.bulk_insert_mappings(Company, [
+        {"id": i + 1, "organization_id": 1, "name": f"Company {i}", "status": rng.choice(["Active", "Active", "Lead", "Inactive"]),
+         "contact_count": 0, "attachment_count": 0}
+        for i in range(args.companies)
+    ])
+    session.bulk_insert_mappings(Contact, [
+        {"id": i + 1, "organization_id": 1, "first_name": "Contact", "last_name": str(i), "email": f"c{i}@example.com",
+         "company_id": i % args.companies + 1}
+        for i in range(args.contacts)
+    ])
+    session.bulk_insert_mappings(Deal, [
+        {"id": i + 1, "organization_id": 1, "created_by": 1, "stage_id": 1, "title": f"Deal {i}",
+         "value": rng.randint(0, 20000), "probability": rng.randint(0, 100), "is_active": rng.random() < 0.8}
+        for i in range(args.deals)
+    ])
+    session.bulk_insert_mappings(Task, [
+        {"id": i + 1, "organization_id": 1, "title": f"Task {i}", "priority": rng.choice(["low", "medium", "high"]),
+         "status": rng.choice(["pending", "in_progress", "completed"]),
+         "due_date": now + timedelta(hours=rng.randint(-24 * 30, 24 * 30)),
+         "contact_id": rng.randint(1, args.contacts) if rng.random() < 0.7 else None}
+        for i in range(args.tasks)
+    ])
+    session.commit()
+    return engine, factory, session
+
+
+def old_collect(db):
+    """The previous _collect_summary_data, kept here for comparison"""
+    from crud import get_companies, get_contacts, get_deals, get_tasks
+
+    now = datetime.utcnow()
+    all_tasks = get_tasks(db, 1, limit=10000)
+    overdue_tasks, today_tasks = [], []
+    for t in all_tasks:
+        if t.due_date:
+            task_date = t.due_date.replace(tzinfo=None)
+            if task_date < now and t.status != 'completed':
+                overdue_tasks.append(t)
+            if task_date.date() == now.date():
+                today_tasks.append(t)
+    all_contacts = get_contacts(db, 1, limit=10000)
+    contacts_with_tasks = []
+    for contact in all_contacts:
+        contact_tasks = [t for t in all_tasks if t.contact_id == contact.id]
+        if contact_tasks:
+            contacts_with_tasks.append([t for t in contact_tasks if t in overdue_tasks])
+    all_companies = get_companies(db, 1, limit=10000)
+    all_deals = get_deals(db, 1, limit=10000)
+    active_deals = [deal for deal in all_deals if deal.is_active]
+    return {
+        "overdue_tasks": len(overdue_tasks),
+        "today_tasks": len(today_tasks),
+        "total_contacts": len(all_contacts),
+        "contacts_needing_attention": sum(1 for overdue in contacts_with_tasks if overdue),
+        "active_deals": len(active_deals),
+        "active_companies": len([c for c in all_companies if c.status == 'Active']),
+    }
+
+
+def main(args):
+    import ai_service
+    from ai_service import DailySummaryService, SECTION_SOURCES, generate_all_daily_summaries, generate_daily_summary
+    from models import DailySummary, Deal, Task
+
+    engine, factory, session = build_sessions(args)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    insight_calls = []
+
+    async def fake_insights(self, data, user_name="there"):
+        insight_calls.append(user_name)
+        return f"Insights for {user_name}"
+    ai_service.DailySummaryService._generate_ai_insights = fake_insights
+    collected = []
+    for name in SECTION_SOURCES:
+        original = getattr(DailySummaryService, f"_collect_{name}")
+        setattr(DailySummaryService, f"_collect_{name}",
+                lambda self, _name=name, _original=original: collected.append(_name) or _original(self))
+
+    def measure(label, call):
+        session.expire_all()
+        statements.clear()
+        collected.clear()
+        calls = len(insight_calls)
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = call()
+            if asyncio.iscoroutine(result):
+                result = asyncio.run(result)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{label:<34} {elapsed:8.1f}ms {len(statements):4} SQL  "
+              f"re-collected {collected or '-'}  insights {'regenerated' if len(insight_calls) > calls else 'kept'}")
+        return result
+
+    old_stats = measure("Old collection (per request)", lambda: old_collect(session))
+    first = measure("First request (generate + store)", lambda: generate_daily_summary(session, 1, 1))
+    measure("Stored summary", lambda: generate_daily_summary(session, 1, 1))
+    measure("Refresh, nothing changed", lambda: generate_daily_summary(session, 1, 1, refresh=True))
+
+    session.query(Deal).filter(Deal.id == 1).one().value = 99999
+    session.commit()
+    after_deal = measure("Refresh after a deal change", lambda: generate_daily_summary(session, 1, 1, refresh=True))
+
+    session.add(Task(organization_id=1, title="Urgent call", status="pending", priority="high",
+                     due_date=datetime.utcnow() - timedelta(hours=1), contact_id=1))
+    session.commit()
+    after_task = measure("Refresh after a new overdue task", lambda: generate_daily_summary(session, 1, 1, refresh=True))
+
+    session.query(DailySummary).delete()
+    session.commit()
+    results = measure(f"Scheduler job ({args.users} users)", lambda: generate_all_daily_summaries(factory))
+
+    print(f"Old quick stats:    {old_stats}")
+    print(f"Stored quick stats: {first['quick_stats']}")
+    print(f"After deal change:  top deal {after_deal['data_summary']['deals']['high_value_top'][0]}")
+    print(f"After new task:     {after_task['quick_stats']['overdue_tasks']} overdue tasks")
+    print(f"Scheduler job:      {results}, {session.query(DailySummary).count()} summaries stored")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-request daily summary collection with stored aggregate summaries")
+    parser.add_argument("--tasks", type=int, default=3000)
+    parser.add_argument("--contacts", type=int, default=3000)
+    parser.add_argument("--companies", type=int, default=2000)
+    parser.add_argument("--deals", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,162 @@
+"""
+AI chat entity lookup benchmark.
+
+Seeds an in-memory SQLite database with contacts, companies, deals and tasks,
+then finds the entities mentioned in a set of chat messages two ways: the old
+scan (get_contacts/get_companies/get_tasks with limit=10000 and substring
+loops) and AIChatService._get_relevant_crm_data backed by the per-organization
+entity matcher. Reports time and SQL statements per message. Then it checks
+that ORM writes (create, rename, delete) show up in the next match without a
+rebuild.
+
+Usage:
+    cd backend
+    python scripts/benchmark_entity_matcher.py --contacts 10000 --companies 2000
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import contextlib
+import io
+import random
+import re
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+FIRST_NAMES = ["James", "Maria", "Wei", "Aisha", "Carlos", "Olga", "Kenji", "Fatima", "Liam", "Priya"]
+LAST_NAMES = [f"Surname{i}" for i in range(400)]
+INDUSTRY_WORDS = ["Electric", "Plumbing", "Logistics", "Dental", "Roofing", "Analytics", "Bakery", "Legal"]
+
+
+def build_session(args):
+    from models import Base, Company, Contact, Deal, Organization, PipelineStage, Task, User
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    # get_contacts' self-healing UPDATE uses Postgres' regexp_replace
+    event.listen(engine, "connect", lambda connection, _: connection.create_function(
+        "regexp_replace", 4, lambda value, pattern, replacement, flags: re.sub(pattern, replacement, value) if value else value
+    ))
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    rng = random.Random(7)
+
+    session.add(Organization(id=1, name="Org", slug="org"))
+    session.add(User(id=1, organization_id=1, email="owner@org.example", password_hash="x", first_name="O", last_name="W"))
+    session.add(PipelineStage(id=1, organization_id=1, name="Proposal", position=1))
+    session.flush()
+    session.bulk_insert_mappings(Company, [
+        {"id": i + 1, "organization_id": 1, "name": f"Acme{i} {rng.choice(INDUSTRY_WORDS)}", "contact_count": 0, "attachment_count": 0}
+        for i in range(args.companies)
+    ])
+    session.bulk_insert_mappings(Contact, [
+        {"id": i + 1, "organization_id": 1, "first_name": rng.choice(FIRST_NAMES), "last_name": rng.choice(LAST_NAMES),
+         "email": f"c{i}@example.com", "company_id": i % args.companies + 1}
+        for i in range(args.contacts)
+    ])
+    session.bulk_insert_mappings(Deal, [
+        {"id": i + 1, "organization_id": 1, "created_by": 1, "stage_id": 1, "title": f"Expansion Order {i}", "value": 1000 * i}
+        for i in range(args.deals)
+    ])
+    session.bulk_insert_mappings(Task, [
+        {"organization_id": 1, "title": f"Follow up {i}", "status": "pending", "contact_id": i % args.contacts + 1}
+        for i in range(args.tasks)
+    ])
+    session.commit()
+    return engine, session
+
+
+def old_scan(db, message):
+    """The previous _get_relevant_crm_data lookup, kept here for comparison"""
+    from crud import get_companies, get_contacts, get_tasks
+
+    message_lower = message.lower()
+    contacts, companies = [], []
+    all_contacts = get_contacts(db, 1, limit=10000)
+    all_companies = get_companies(db, 1, limit=10000)
+    all_tasks = get_tasks(db, 1, limit=10000)
+    for contact in all_contacts:
+        first_name = (contact.first_name or "").lower()
+        last_name = (contact.last_name or "").lower()
+        if (first_name and first_name in message_lower) or (last_name and last_name in message_lower):
+            contacts.append(contact)
+    message_words = message_lower.split()
+    for company in all_companies:
+        name = company.name.lower()
+        if name in message_lower or any(word in name.split() for word in message_words if len(word) >= 2):
+            companies.append(company)
+    tasks = [t for t in all_tasks if contacts and t.contact_id in {c.id for c in contacts}]
+    return contacts[:5], companies[:5], tasks[:10]
+
+
+def main(args):
+    from ai_chat import AIChatService
+    from entity_matcher import entity_matchers
+    from models import Contact
+
+    engine, session = build_session(args)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    messages = [
+        "What's the phone number for Maria Surname12?",
+        "Any tasks due for Kenji Surname200 this week?",
+        "Tell me about Acme42 Electric",
+        "How is Expansion Order 17 going?",
+        "What should I focus on today?",
+    ]
+    service = AIChatService(session, 1, 1)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        statements.clear()
+        started = time.perf_counter()
+        entity_matchers.get(session, 1)
+        build_ms = (time.perf_counter() - started) * 1000
+        build_statements = len(statements)
+
+        results = []
+        for message in messages:
+            row = [message]
+            for lookup in (lambda: old_scan(session, message), lambda: service._get_relevant_crm_data(message)):
+                session.expire_all()
+                statements.clear()
+                started = time.perf_counter()
+                found = lookup()
+                elapsed = (time.perf_counter() - started) * 1000
+                counts = [len(v) for v in (found.values() if isinstance(found, dict) else found)]
+                row.append((elapsed, len(statements), counts))
+            results.append(row)
+
+    print(f"Matcher build: {build_ms:.0f}ms, {build_statements} SQL statements "
+          f"({args.contacts} contacts, {args.companies} companies, {args.deals} deals)")
+    for message, (old_ms, old_sql, old_counts), (new_ms, new_sql, new_counts) in results:
+        print(f"{message[:45]:<45} old {old_ms:8.1f}ms {old_sql:3} SQL {old_counts}  "
+              f"matcher {new_ms:6.1f}ms {new_sql:2} SQL {new_counts}")
+
+    # ORM writes reach the matcher through mapper events
+    contact = Contact(organization_id=1, first_name="Zebulon", last_name="Quixote", email="zq@example.com")
+    session.add(contact)
+    session.commit()
+    added = entity_matchers.get(session, 1).match("Call Zebulon Quixote")["contact"]
+    contact.last_name = "Marchetti"
+    session.commit()
+    renamed = entity_matchers.get(session, 1).match("Call Zebulon Marchetti")["contact"]
+    stale = entity_matchers.get(session, 1).match("Call Quixote")["contact"]
+    session.delete(contact)
+    session.commit()
+    deleted = entity_matchers.get(session, 1).match("Call Zebulon Marchetti")["contact"]
+    print(f"Writes: created -> {added}, renamed -> {renamed} (old name -> {stale}), deleted -> {deleted}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the old AI chat entity scan with the entity matcher")
+    parser.add_argument("--contacts", type=int, default=10000)
+    parser.add_argument("--companies", type=int, default=2000)
+    parser.add_argument("--deals", type=int, default=1000)
+    parser.add_argument("--tasks", type=int, default=5000)
+    main(parser.parse_args())
@@ -0,0 +1,228 @@
+"""
+Gmail sync against a local Gmail API stub.
+
+Starts a fake Gmail server (profile, messages.list with page tokens,
+messages.get with artificial latency, and history.list) and runs
+GoogleService.sync_gmail_messages against an in-memory SQLite database. The
+first round is a full sync; new mail then arrives and the second round syncs
+incrementally from the stored historyId, which should fetch only the new
+messages. With --expire-history the stub answers history.list with 404 and the
+sync falls back to a full resync without duplicating anything.
+
+Usage:
+    cd backend
+    python scripts/benchmark_gmail_sync.py --messages 1000
+    python scripts/benchmark_gmail_sync.py --messages 1000 --latency-ms 50 --expire-history
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import base64
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+OWN_ADDRESS = "me@crm.example"
+
+
+class FakeGmailHandler(BaseHTTPRequestHandler):
+    """Serves /gmail/v1/users/me/{profile,messages,messages/{id},history} from an in-memory mailbox"""
+    lock = threading.Lock()
+    latency = 0.02
+    messages = {}  # id -> full message
+    history = []  # (historyId, message id) in arrival order
+    history_id = 1000
+    expire_history = False
+    requests = 0
+    in_flight = 0
+    peak_in_flight = 0
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        parts = parsed.path.strip("/").split("/")
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        if parts[:4] != ["gmail", "v1", "users", "me"]:
+            return self._send(404, {"error": {"code": 404}})
+        resource = parts[4:]
+
+        with FakeGmailHandler.lock:
+            FakeGmailHandler.requests += 1
+
+        if resource == ["profile"]:
+            return self._send(200, {"emailAddress": OWN_ADDRESS, "historyId": str(FakeGmailHandler.history_id)})
+
+        if resource == ["messages"]:
+            # Newest first, like Gmail; the page token is an offset
+            ids = [message_id for _, message_id in reversed(FakeGmailHandler.history)]
+            offset = int(query.get("pageToken", 0))
+            size = int(query.get("maxResults", 100))
+            body = {"messages": [{"id": message_id, "threadId": message_id} for message_id in ids[offset:offset + size]]}
+            if offset + size < len(ids):
+                body["nextPageToken"] = str(offset + size)
+            return self._send(200, body)
+
+        if resource == ["history"]:
+            if FakeGmailHandler.expire_history:
+                return self._send(404, {"error": {"code": 404, "message": "Requested entity was not found."}})
+            start = int(query["startHistoryId"])
+            records = [
+                {"id": str(history_id), "messagesAdded": [{"message": {
+                    "id": message_id, "labelIds": FakeGmailHandler.messages[message_id]["labelIds"],
+                }}]}
+                for history_id, message_id in FakeGmailHandler.history if history_id > start
+            ]
+            offset = int(query.get("pageToken", 0))
+            size = int(query.get("maxResults", 100))
+            body = {"history": records[offset:offset + size], "historyId": str(FakeGmailHandler.history_id)}
+            if offset + size < len(records):
+                body["nextPageToken"] = str(offset + size)
+            return self._send(200, body)
+
+        if len(resource) == 2 and resource[0] == "messages":
+            with FakeGmailHandler.lock:
+                FakeGmailHandler.in_flight += 1
+                FakeGmailHandler.peak_in_flight = max(FakeGmailHandler.peak_in_flight, FakeGmailHandler.in_flight)
+            try:
+                time.sleep(FakeGmailHandler.latency)
+                message = FakeGmailHandler.messages.get(resource[1])
+                return self._send(200, message) if message else self._send(404, {"error": {"code": 404}})
+            finally:
+                with FakeGmailHandler.lock:
+                    FakeGmailHandler.in_flight -= 1
+
+        return self._send(404, {"error": {"code": 404}})
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def add_mail(count: int, contact_count: int, offset: int = 0):
+    """Append count messages, alternating received and sent; every third message replies to an earlier one"""
+    now = datetime.utcnow()
+    for i in range(offset, offset + count):
+        contact = i % contact_count
+        contact_address = f"Contact {contact} <Contact{contact}@Example.com>"
+        headers = [
+            {"name": "Subject", "value": f"Project {contact % 7}" if i % 3 else f"Re: Project {(contact + 1) % 7}"},
+            {"name": "Message-ID", "value": f"<gmail-{i}@example.com>"},
+        ]
+        if i % 2:
+            headers += [{"name": "From", "value": f"Me <{OWN_ADDRESS}>"}, {"name": "To", "value": contact_address}]
+            labels = ["SENT"]
+        else:
+            headers += [{"name": "From", "value": contact_address}, {"name": "To", "value": OWN_ADDRESS}]
+            labels = ["INBOX", "UNREAD"]
+        if i % 3 == 0 and i >= contact_count:
+            headers.append({"name": "In-Reply-To", "value": f"<gmail-{i - contact_count}@example.com>"})
+        text = base64.urlsafe_b64encode(f"Message {i} body\r\n".encode()).decode().rstrip("=")
+        FakeGmailHandler.messages[f"m{i}"] = {
+            "id": f"m{i}",
+            "threadId": f"t{contact}",
+            "labelIds": labels,
+            "snippet": f"Message {i}",
+            "internalDate": str(int((now - timedelta(minutes=count - i)).timestamp() * 1000)),
+            "payload": {
+                "mimeType": "multipart/alternative",
+                "headers": headers,
+                "parts": [
+                    {"mimeType": "text/plain", "body": {"data": text}},
+                    {"mimeType": "text/html", "body": {"data": base64.urlsafe_b64encode(b"<p>html</p>").decode()}},
+                ],
+            },
+        }
+        FakeGmailHandler.history_id += 1
+        FakeGmailHandler.history.append((FakeGmailHandler.history_id, f"m{i}"))
+
+
+def build_session():
+    from models import Base, GoogleUserConnection
+
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    connection = GoogleUserConnection(
+        id=1, user_id=1, organization_id=1, org_config_id=1,
+        google_user_id="fake", google_email=OWN_ADDRESS, google_display_name="Me",
+        access_token_encrypted="x", refresh_token_encrypted="x",
+        token_expires_at=datetime.utcnow() + timedelta(hours=1),
+        sync_only_crm_contacts=False, include_sent_emails=True,
+        excluded_email_domains=[], excluded_email_keywords=[],
+        sync_error_count=0, connection_status="active",
+    )
+    session.add(connection)
+    session.commit()
+    return engine, session, connection
+
+
+async def run(args):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGmailHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["GOOGLE_API_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    FakeGmailHandler.latency = args.latency_ms / 1000
+
+    from google_service import GoogleService, GMAIL_FETCH_CONCURRENCY
+    from http_clients import close_http_clients
+    from models import Contact, EmailMessage, EmailThread
+
+    engine, session, connection = build_session()
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    add_mail(args.messages, args.contacts)
+    for round_number, new_messages in ((1, args.messages), (2, args.new_messages)):
+        if round_number == 2:
+            add_mail(new_messages, args.contacts, offset=args.messages)
+            FakeGmailHandler.expire_history = args.expire_history
+        FakeGmailHandler.requests = 0
+        statements.clear()
+
+        service = GoogleService(connection)
+        service.access_token = "fake-token"
+        started = time.perf_counter()
+        synced = await service.sync_gmail_messages(session)
+        elapsed = time.perf_counter() - started
+
+        print(f"Round {round_number}: synced {synced} of {new_messages} new messages in {elapsed:.2f}s "
+              f"({FakeGmailHandler.requests} Gmail requests, {len(statements)} SQL statements)")
+
+    await close_http_clients()
+    server.shutdown()
+    print(f"Peak concurrent message fetches: {FakeGmailHandler.peak_in_flight} (limit {GMAIL_FETCH_CONCURRENCY})")
+    print(f"Contacts: {session.query(func.count(Contact.id)).scalar()}, "
+          f"threads: {session.query(func.count(EmailThread.id)).scalar()}, "
+          f"messages: {session.query(func.count(EmailMessage.id)).scalar()}")
+    print(f"Stored historyId: {connection.gmail_history_id} (mailbox at {FakeGmailHandler.history_id})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run Gmail sync against a local Gmail API stub")
+    parser.add_argument("--messages", type=int, default=1000, help="Messages in the mailbox for the first sync")
+    parser.add_argument("--new-messages", type=int, default=100, help="Messages arriving before the second sync")
+    parser.add_argument("--contacts", type=int, default=40, help="Distinct correspondents")
+    parser.add_argument("--latency-ms", type=int, default=20, help="Stub latency per message fetch")
+    parser.add_argument("--expire-history", action="store_true", help="Answer history.list with 404 in the second round")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,153 @@
+"""
+Outbound HTTP connection reuse benchmark.
+
+Starts a local HTTPS fake SendGrid (self-signed certificate, trusted through
+SSL_CERT_FILE) that counts TLS connections, then sends the same emails with
+email_service.send_email two ways: a new httpx client per email (the old
+behaviour) and the shared pooled client from http_clients. Finally checks that
+http_clients.override swaps in a mock transport.
+
+Usage:
+    cd backend
+    python scripts/benchmark_http_clients.py --emails 200
+    python scripts/benchmark_http_clients.py --emails 200 --concurrency 10
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import ssl
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+
+class FakeSendGridHandler(BaseHTTPRequestHandler):
+    """Keep-alive HTTPS /v3/mail/send that counts connections and requests"""
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    connections = 0
+    requests = 0
+
+    def setup(self):
+        super().setup()
+        with FakeSendGridHandler.lock:
+            FakeSendGridHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with FakeSendGridHandler.lock:
+            FakeSendGridHandler.requests += 1
+        self.send_response(202)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_self_signed_cert(directory: str):
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(hours=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+async def send_all(count: int, concurrency: int, per_email_client: bool) -> float:
+    from email_service import send_email
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send_one(i: int) -> bool:
+        async with semaphore:
+            if per_email_client:
+                async with httpx.AsyncClient() as client:
+                    return await send_email(f"user{i}@example.com", "Hello", "<p>Hi</p>", client=client)
+            return await send_email(f"user{i}@example.com", "Hello", "<p>Hi</p>")
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(send_one(i) for i in range(count)))
+    elapsed = time.perf_counter() - started
+    if not all(results):
+        raise SystemExit(f"{results.count(False)} sends failed")
+    return elapsed
+
+
+async def run(args):
+    from http_clients import close_http_clients, http_clients
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert_path, key_path = write_self_signed_cert(directory)
+        os.environ["SSL_CERT_FILE"] = cert_path
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSendGridHandler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        os.environ["SENDGRID_API_KEY"] = "fake-key"
+        os.environ["SENDGRID_API_URL"] = f"https://127.0.0.1:{server.server_address[1]}"
+
+        # send_email prints a few debug lines per email; keep the report readable
+        stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+        try:
+            timings = {}
+            for label, per_email_client in (("client per email", True), ("shared pool", False)):
+                FakeSendGridHandler.connections = FakeSendGridHandler.requests = 0
+                elapsed = await send_all(args.emails, args.concurrency, per_email_client)
+                timings[label] = (elapsed, FakeSendGridHandler.connections, FakeSendGridHandler.requests)
+
+            # Tests can swap the pool for a mock transport
+            mocked = []
+            mock = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: mocked.append(request) or httpx.Response(202)))
+            with http_clients.override("sendgrid", mock):
+                FakeSendGridHandler.requests = 0
+                await send_all(5, 1, per_email_client=False)
+            await mock.aclose()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+        await close_http_clients()
+        server.shutdown()
+
+    for label, (elapsed, connections, requests) in timings.items():
+        print(f"{label:<17} {requests} emails in {elapsed:.2f}s ({elapsed / requests * 1000:.1f} ms/email), "
+              f"{connections} TLS connections")
+    print(f"Override: mock received {len(mocked)} requests, server received {FakeSendGridHandler.requests}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-email httpx clients with the shared connection pool")
+    parser.add_argument("--emails", type=int, default=200, help="Emails per variant")
+    parser.add_argument("--concurrency", type=int, default=1, help="Emails in flight at once")
+    asyncio.run(run(parser.parse_args()))
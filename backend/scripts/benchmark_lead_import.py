@@ -0,0 +1,213 @@
+"""
+Lead import benchmark for the Clay, LinkedIn and Apollo webhooks.
+
+Seeds an in-memory SQLite database with companies and contacts, builds a push
+of --people rows (new people, people already in the CRM by email or by name,
+repeats within the push, rows without a name or with an invalid email) and
+imports it with lead_import.import_leads, as the lead import workers do. The
+same push is imported by the old per-row loop (a lookup,
+create_company/create_contact and a log commit per person) into a second
+database for comparison. For both it reports time, SQL statements and commits,
+and the resulting created / updated / skipped / error counts, contacts and
+companies. The push is then imported again, as a
+provider resend would be, and should create nothing.
+
+Usage:
+    cd backend
+    python scripts/benchmark_lead_import.py --people 500
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import contextlib
+import io
+import random
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+def build_database(args):
+    from models import Base, Company, Contact, LeadSourceIntegration, Organization
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    session = factory()
+    session.add(Organization(id=1, name="Org", slug="org"))
+    session.add(LeadSourceIntegration(organization_id=1, clay_enabled=True, clay_total_imported=0))
+    session.flush()
+    session.bulk_insert_mappings(Company, [
+        {"id": i + 1, "organization_id": 1, "name": f"Company {i}", "status": "Active", "contact_count": 0, "attachment_count": 0}
+        for i in range(args.existing // 10)
+    ])
+    session.bulk_insert_mappings(Contact, [
+        {"organization_id": 1, "first_name": f"Known{i}", "last_name": "Person", "email": f"known{i}@example.com",
+         "company_id": i % (args.existing // 10) + 1, "company_name": f"Company {i % (args.existing // 10)}"}
+        for i in range(args.existing)
+    ])
+    session.commit()
+    session.close()
+    return engine, factory
+
+
+def build_push(args):
+    """A Clay push mixing new, known and unusable people"""
+    rng = random.Random(3)
+    people = []
+    companies = args.existing // 10
+    for i in range(args.people):
+        kind = rng.random()
+        company = rng.randrange(companies * 2)  # Half of them are new companies
+        company_name = f"Company {company}" if company % 2 else f"company {company}".upper()
+        if kind < 0.6:
+            person = {"first_name": f"New{i}", "last_name": "Lead", "email": f"new{i}@example.com",
+                      "phone": "5551230000", "title": "Buyer", "company_name": company_name, "company_domain": "example.com"}
+        elif kind < 0.8:
+            known = rng.randrange(args.existing)
+            person = {"first_name": f"Known{known}", "last_name": "Person", "email": f"KNOWN{known}@example.com",
+                      "phone": "5559870000", "title": "Director"}
+        elif kind < 0.9:
+            known = rng.randrange(args.existing)
+            person = {"first_name": f"Known{known}", "last_name": "Person",
+                      "company_name": f"Company {known % companies}"}
+        elif kind < 0.95 and people:
+            person = dict(rng.choice(people))
+        elif kind < 0.98:
+            person = {"email": f"nameless{i}@example.com"}
+        else:
+            person = {"first_name": "Bad", "last_name": "Email", "email": "not-an-email"}
+        people.append(person)
+    return {"people": people}
+
+
+def old_import(db, integration, people_raw):
+    """The previous per-row clay_import_webhook loop, kept here for comparison"""
+    from crud import create_company, create_contact
+    from models import Company, Contact, LeadImportLog
+    from schemas import ClayPersonPayload, CompanyCreate, ContactCreate
+
+    def log(raw, contact_id, company_id, action, error=None):
+        db.add(LeadImportLog(organization_id=1, source="clay", event_type="import", raw_payload=raw,
+                             contact_id=contact_id, company_id=company_id, action=action, error_message=error))
+        db.commit()
+
+    counts = {"created": 0, "updated": 0, "skipped": 0, "errors": 0}
+    for raw in people_raw:
+        try:
+            p = ClayPersonPayload(**raw)
+            first, last = (p.first_name or "").strip(), (p.last_name or "").strip()
+            if not first and not last:
+                log(raw, None, None, "skipped", "No name provided")
+                counts["skipped"] += 1
+                continue
+            company = None
+            if p.company_name:
+                company = db.query(Company).filter(Company.organization_id == 1, Company.name == p.company_name).first()
+                if not company:
+                    company = create_company(db, CompanyCreate(name=p.company_name, website=p.company_domain, status="Lead"), 1)
+            existing, action = None, "created"
+            if p.email:
+                existing = db.query(Contact).filter(Contact.organization_id == 1, Contact.email == p.email).first()
+                if existing:
+                    if not existing.phone and p.phone:
+                        existing.phone = p.phone
+                    if not existing.title and p.title:
+                        existing.title = p.title
+                    db.commit()
+                    action = "updated"
+            if not existing:
+                query = db.query(Contact).filter(Contact.organization_id == 1, Contact.first_name == first, Contact.last_name == last)
+                if p.company_name:
+                    query = query.filter(Contact.company_name == p.company_name)
+                existing = query.first()
+                action = "skipped" if existing else "created"
+            if not existing:
+                existing = create_contact(db, ContactCreate(
+                    first_name=first, last_name=last, email=p.email, phone=p.phone, title=p.title,
+                    company_id=company.id if company else None, company_name=p.company_name, status="Lead",
+                    notes="Imported from Clay"), 1)
+            log(raw, existing.id, company.id if company else None, action)
+            counts[action] += 1
+        except Exception as e:
+            db.rollback()
+            log(raw, None, None, "error", str(e))
+            counts["errors"] += 1
+    integration.clay_total_imported += counts["created"]
+    db.commit()
+    return counts
+
+
+def measure(engine, label, run):
+    statements, commits = [], []
+    listeners = [
+        (engine, "before_cursor_execute", lambda *a: statements.append(a[2])),
+        (engine, "commit", lambda *a: commits.append(1)),
+    ]
+    for target, name, listener in listeners:
+        event.listen(target, name, listener)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run()
+    elapsed = time.perf_counter() - started
+    for target, name, listener in listeners:
+        event.remove(target, name, listener)
+    print(f"{label:<28} {elapsed * 1000:8.0f}ms {len(statements):6} SQL {len(commits):5} commits  {result}")
+    return result
+
+
+def totals(factory):
+    from models import Company, Contact, LeadImportLog
+
+    session = factory()
+    try:
+        return {
+            "contacts": session.query(Contact).count(),
+            "companies": session.query(Company).count(),
+            "logs": session.query(LeadImportLog).count(),
+        }
+    finally:
+        session.close()
+
+
+def main(args):
+    from lead_import import import_leads
+    from models import LeadSourceIntegration
+
+    push = build_push(args)
+
+    old_engine, old_factory = build_database(args)
+    old_session = old_factory()
+    integration = old_session.query(LeadSourceIntegration).first()
+    measure(old_engine, "Old per-row import", lambda: old_import(old_session, integration, push["people"]))
+    old_session.close()
+    print(f"{'':<28} {totals(old_factory)}")
+
+    engine, factory = build_database(args)
+
+    def batch():
+        db = factory()
+        try:
+            integration = db.query(LeadSourceIntegration).first()
+            result = import_leads(db, integration, "clay", push)
+            db.commit()
+            return {key: value for key, value in result.items() if key != "status"}
+        finally:
+            db.close()
+
+    measure(engine, "Batch import", batch)
+    print(f"{'':<28} {totals(factory)}")
+    measure(engine, "Same push again (retry)", batch)
+    print(f"{'':<28} {totals(factory)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the per-row lead import with the batch importer")
+    parser.add_argument("--people", type=int, default=500, help="People in the push")
+    parser.add_argument("--existing", type=int, default=5000, help="Contacts already in the CRM")
+    main(parser.parse_args())
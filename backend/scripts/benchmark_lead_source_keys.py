@@ -0,0 +1,155 @@
+"""
+Lead-source API key lookup benchmark.
+
+Seeds an in-memory SQLite database with --orgs lead source integrations, each
+with a Clay key, then times --lookups authentications of random keys three
+ways:
+
+- the old lookup: plaintext key column compared in SQL;
+- lead_source_keys.resolve_api_key with the cache disabled (one indexed
+  lookup of the key's SHA-256 digest);
+- resolve_api_key with the cache enabled.
+
+It then serves the lead source routes and checks that a generated key works
+on the Clay webhook, stops working (401) once it is regenerated, and stops
+working once Clay is disabled in settings, each on the next call rather than
+when the cache entry expires. Finally it checks no plaintext key is stored.
+
+Usage:
+    cd backend
+    python scripts/benchmark_lead_source_keys.py --orgs 2000 --lookups 5000
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+def build_database(args):
+    from lead_source_keys import hash_api_key
+    from models import Base, LeadSourceIntegration, Organization
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    session = factory()
+    session.bulk_insert_mappings(Organization, [
+        {"id": i + 1, "name": f"Org {i}", "slug": f"org-{i}"} for i in range(args.orgs)
+    ])
+    keys = [f"nhs_clay_benchmark{i}" for i in range(args.orgs)]
+    session.bulk_insert_mappings(LeadSourceIntegration, [
+        # The plaintext column is filled only so the old lookup has something to scan
+        {"organization_id": i + 1, "clay_enabled": True, "clay_api_key": key, "clay_api_key_hash": hash_api_key(key),
+         "clay_total_imported": 0, "surfe_enabled": False, "linkedin_enabled": False, "apollo_enabled": False}
+        for i, key in enumerate(keys)
+    ])
+    session.commit()
+    session.close()
+    return engine, factory, keys
+
+
+def measure(engine, label, lookups, resolve):
+    statements = []
+    listener = lambda *a: statements.append(a[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    started = time.perf_counter()
+    for key in lookups:
+        resolve(key)
+    elapsed = time.perf_counter() - started
+    event.remove(engine, "before_cursor_execute", listener)
+    print(f"{label:<32} {elapsed * 1000:8.0f}ms {elapsed / len(lookups) * 1e6:8.1f}us/lookup {len(statements):7} SQL")
+
+
+async def check_routes(factory):
+    import httpx
+    from fastapi import FastAPI
+
+    from auth import get_current_active_user, get_current_admin_user
+    from database import get_db
+    from lead_source_routes import router
+    from models import LeadSourceIntegration
+
+    app = FastAPI()
+    app.include_router(router)
+
+    def session():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    admin = SimpleNamespace(id=1, organization_id=1)
+    app.dependency_overrides[get_db] = session
+    app.dependency_overrides[get_current_active_user] = lambda: admin
+    app.dependency_overrides[get_current_admin_user] = lambda: admin
+
+    async def webhook(key):
+        response = await client.post("/api/webhooks/clay/import", json={"people": []},
+                                     headers={"Authorization": f"Bearer {key}"})
+        return response.status_code
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        first = (await client.post("/api/lead-source/generate-key/clay")).json()["api_key"]
+        print(f"Generated key: {await webhook(first)}, again (cached): {await webhook(first)}")
+
+        second = (await client.post("/api/lead-source/generate-key/clay")).json()["api_key"]
+        print(f"After regenerating: old key {await webhook(first)}, new key {await webhook(second)}")
+
+        await client.put("/api/lead-source/settings", json={"clay_enabled": False})
+        print(f"After disabling Clay: {await webhook(second)}")
+
+    db = factory()
+    stored = db.query(LeadSourceIntegration).filter(LeadSourceIntegration.clay_api_key.in_([first, second])).count()
+    print(f"Rows holding a generated key in plaintext: {stored}")
+    db.close()
+
+
+def main(args):
+    from lead_source_keys import LEAD_SOURCE_KEY_CACHE_TTL_SECONDS, api_key_cache, resolve_api_key
+    from models import LeadSourceIntegration
+
+    engine, factory, keys = build_database(args)
+    rng = random.Random(7)
+    # Mostly a few busy integrations, plus some unknown keys
+    busy = rng.sample(keys, max(1, len(keys) // 100))
+    lookups = [
+        rng.choice(busy) if rng.random() < 0.8 else rng.choice(keys) if rng.random() < 0.9 else f"nhs_clay_unknown{i}"
+        for i in range(args.lookups)
+    ]
+
+    db = factory()
+
+    def old_lookup(key):
+        return db.query(LeadSourceIntegration).filter(
+            LeadSourceIntegration.clay_api_key == key,
+            LeadSourceIntegration.clay_enabled == True
+        ).first()
+
+    measure(engine, "Old plaintext column", lookups, old_lookup)
+    # A zero TTL expires every entry as soon as it is stored
+    api_key_cache.ttl_seconds = 0
+    measure(engine, "Digest, indexed", lookups, lambda key: resolve_api_key(db, "clay", key))
+    api_key_cache.ttl_seconds = LEAD_SOURCE_KEY_CACHE_TTL_SECONDS
+    measure(engine, "Digest, indexed, cached", lookups, lambda key: resolve_api_key(db, "clay", key))
+    db.close()
+
+    api_key_cache.invalidate()
+    asyncio.run(check_routes(factory))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare plaintext and hashed lead-source API key lookups")
+    parser.add_argument("--orgs", type=int, default=2000, help="Organizations with a Clay key")
+    parser.add_argument("--lookups", type=int, default=5000, help="Webhook authentications to time")
+    main(parser.parse_args())
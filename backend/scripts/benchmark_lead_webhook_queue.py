@@ -0,0 +1,201 @@
+"""
+Lead-source webhook acceptance and background import check.
+
+Serves the lead source routes on a SQLite database file with the lead import
+worker pool running on the same event loop, then:
+
+- times importing one push inline (what each webhook request used to wait
+  for) against accepting it (202 with a batch ID);
+- posts --pushes Clay pushes with distinct X-Event-Id headers, reports the
+  accept latency and how long the workers take to drain them;
+- re-posts a push with the same event ID, and a body without an event ID
+  twice, and checks each retry returns the original batch;
+- makes the first import attempt of a batch fail and checks it is retried;
+- queues a Surfe enrichment event and checks it fills in the contact;
+- reads every batch back through GET /api/lead-source/imports/{batch_id}.
+
+Usage:
+    cd backend
+    python scripts/benchmark_lead_webhook_queue.py --pushes 10 --people 500
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import contextlib
+import io
+import tempfile
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+API_KEY = "nhs_clay_benchmark"
+
+
+def build_session_factory(path):
+    from lead_source_keys import hash_api_key
+    from models import Base, Company, Contact, LeadSourceIntegration, Organization
+
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    session = factory()
+    session.add(Organization(id=1, name="Org", slug="org"))
+    session.add(LeadSourceIntegration(organization_id=1, clay_enabled=True, clay_api_key_hash=hash_api_key(API_KEY), clay_total_imported=0,
+                                      surfe_enabled=True, surfe_total_enriched=0))
+    session.flush()
+    session.bulk_insert_mappings(Company, [
+        {"id": i + 1, "organization_id": 1, "name": f"Company {i}", "status": "Active", "contact_count": 0, "attachment_count": 0}
+        for i in range(100)
+    ])
+    session.bulk_insert_mappings(Contact, [
+        {"id": i + 1, "organization_id": 1, "first_name": f"Known{i}", "last_name": "Person", "email": f"known{i}@example.com"}
+        for i in range(1000)
+    ])
+    session.commit()
+    session.close()
+    return factory
+
+
+def push(number, people):
+    return {"people": [
+        {"first_name": f"Lead{number}x{i}", "last_name": "Person", "email": f"lead{number}x{i}@example.com",
+         "title": "Buyer", "company_name": f"Company {i % 150}"}
+        for i in range(people)
+    ]}
+
+
+async def wait_for(client, batch_ids, timeout=120):
+    """Poll the status endpoint until every batch is completed or failed"""
+    started = time.perf_counter()
+    statuses = {}
+    while time.perf_counter() - started < timeout:
+        statuses = {}
+        for batch_id in batch_ids:
+            response = await client.get(f"/api/lead-source/imports/{batch_id}")
+            statuses[batch_id] = response.json()
+        if all(status["status"] in ("completed", "failed") for status in statuses.values()):
+            break
+        await asyncio.sleep(0.05)
+    return statuses, time.perf_counter() - started
+
+
+async def run(args, factory):
+    import httpx
+    from fastapi import FastAPI
+
+    import lead_import_queue
+    from auth import get_current_active_user
+    from database import get_db
+    from lead_import import import_leads
+    from lead_source_routes import router
+    from models import Contact, LeadImportBatch, LeadSourceIntegration
+
+    app = FastAPI()
+    app.include_router(router)
+
+    def session():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = session
+    app.dependency_overrides[get_current_active_user] = lambda: SimpleNamespace(id=1, organization_id=1)
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+
+    # The import a webhook request used to run before answering
+    db = factory()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        import_leads(db, db.query(LeadSourceIntegration).first(), "clay", push(0, args.people))
+    inline = time.perf_counter() - started
+    db.rollback()
+    db.close()
+
+    lead_import_queue.start_lead_import_workers(args.workers)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        latencies, batch_ids = [], []
+        started = time.perf_counter()
+        for number in range(1, args.pushes + 1):
+            sent = time.perf_counter()
+            response = await client.post("/api/webhooks/clay/import", json=push(number, args.people),
+                                         headers={**headers, "X-Event-Id": f"evt-{number}"})
+            latencies.append(time.perf_counter() - sent)
+            batch_ids.append(response.json()["batch_id"])
+        statuses, _ = await wait_for(client, batch_ids)
+        drained = time.perf_counter() - started
+        print(f"Inline import of {args.people} people: {inline * 1000:.0f}ms per request")
+        print(f"Accepted {args.pushes} pushes: {response.status_code}, avg {sum(latencies) / len(latencies) * 1000:.1f}ms, "
+              f"max {max(latencies) * 1000:.1f}ms; {args.workers} workers drained them in {drained:.2f}s")
+        print(f"Batch {batch_ids[0]}: {statuses[batch_ids[0]]['status']} {statuses[batch_ids[0]]['result']}")
+
+        # Retries of the same event
+        retry = (await client.post("/api/webhooks/clay/import", json=push(1, args.people),
+                                   headers={**headers, "X-Event-Id": "evt-1"})).json()
+        body = push(99, 5)
+        first = (await client.post("/api/webhooks/clay/import", json=body, headers=headers)).json()
+        again = (await client.post("/api/webhooks/clay/import", json=body, headers=headers)).json()
+        print(f"Retry by event ID: duplicate {retry['duplicate']}, same batch {retry['batch_id'] == batch_ids[0]}; "
+              f"retry by body digest: duplicate {again['duplicate']}, same batch {again['batch_id'] == first['batch_id']}")
+
+        await wait_for(client, [first["batch_id"]])
+
+        # A failed attempt is retried
+        original = lead_import_queue.import_leads
+        failures = []
+
+        def flaky(*args, **kwargs):
+            if not failures:
+                failures.append(1)
+                raise RuntimeError("database went away")
+            return original(*args, **kwargs)
+
+        lead_import_queue.import_leads = flaky
+        flaky_batch = (await client.post("/api/webhooks/clay/import", json=push(100, 5),
+                                         headers={**headers, "X-Event-Id": "evt-flaky"})).json()["batch_id"]
+        statuses, _ = await wait_for(client, [flaky_batch])
+        lead_import_queue.import_leads = original
+        flaky_status = statuses[flaky_batch]
+        print(f"Flaky batch: {flaky_status['status']} after {flaky_status['attempts']} attempts, result {flaky_status['result']}")
+
+        # Surfe enrichment goes through the same queue
+        surfe = (await client.post("/api/webhooks/surfe/enrichment", json={
+            "eventType": "person.enrichment.completed",
+            "data": {"person": {"externalID": "1", "jobTitle": "VP Sales",
+                                "mobilePhones": [{"mobilePhone": "555-0142", "confidenceScore": 0.9}]}},
+        })).json()
+        statuses, _ = await wait_for(client, [surfe["batch_id"]])
+        db = factory()
+        contact = db.get(Contact, 1)
+        print(f"Surfe batch: {statuses[surfe['batch_id']]['status']} {statuses[surfe['batch_id']]['result']}, "
+              f"contact title {contact.title!r}, phone {contact.phone!r}")
+        print(f"Batches stored: {db.query(LeadImportBatch).count()}, contacts: {db.query(Contact).count()}")
+        db.close()
+    await lead_import_queue.stop_lead_import_workers()
+
+
+def main(args):
+    os.environ["LEAD_IMPORT_RETRY_BASE_SECONDS"] = "0"
+    os.environ["LEAD_IMPORT_POLL_SECONDS"] = "0.05"
+    import database
+
+    with tempfile.TemporaryDirectory() as directory:
+        factory = build_session_factory(os.path.join(directory, "leads.db"))
+        # The workers open their sessions from database.SessionLocal
+        database.SessionLocal = factory
+        asyncio.run(run(args, factory))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check asynchronous lead webhook acceptance")
+    parser.add_argument("--pushes", type=int, default=10, help="Clay pushes to accept")
+    parser.add_argument("--people", type=int, default=500, help="People per push")
+    parser.add_argument("--workers", type=int, default=2, help="LEAD_IMPORT_WORKERS")
+    main(parser.parse_args())
@@ -0,0 +1,214 @@
+"""
+Background mailbox sync against local Graph and Gmail stubs.
+
+Creates O365 and Google connections spread unevenly across organizations in a
+temporary SQLite database, starts one fake server that answers both Microsoft
+Graph mail/calendar delta queries and Gmail/Google Calendar listings (with artificial latency,
+optionally throttling each mailbox's first request with 429 + Retry-After),
+and runs mailbox_sync.sync_all_mailboxes. Reports wall time, the peak number
+of mailboxes syncing at once overall and per organization, and the order in
+which organizations got their first slot.
+
+Usage:
+    cd backend
+    python scripts/benchmark_mailbox_sync.py
+    python scripts/benchmark_mailbox_sync.py --orgs 4 --big-org-mailboxes 30 --latency-ms 200 --throttle
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+class FakeMailHandler(BaseHTTPRequestHandler):
+    """Graph mail/calendarView delta, Gmail /gmail/v1/users/me/messages and Calendar /calendar/v3/calendars/primary/events"""
+    lock = threading.Lock()
+    latency = 0.1
+    throttle = False
+    token_orgs = {}  # access token -> organization id
+    throttled = set()
+    in_flight = defaultdict(set)  # organization id -> tokens with a request in progress
+    peak_total = 0
+    peak_per_org = defaultdict(int)
+    first_seen = []  # organization ids in order of their first request
+    requests = 0
+
+    def do_GET(self):
+        token = self.headers.get("Authorization", "").replace("Bearer ", "")
+        org = FakeMailHandler.token_orgs.get(token)
+        if org is None:
+            return self._send(401, {"error": "unknown token"})
+
+        with FakeMailHandler.lock:
+            FakeMailHandler.requests += 1
+            if org not in FakeMailHandler.first_seen:
+                FakeMailHandler.first_seen.append(org)
+            if FakeMailHandler.throttle and token not in FakeMailHandler.throttled:
+                FakeMailHandler.throttled.add(token)
+                return self._send(429, {"error": "rate limited"}, {"Retry-After": "1"})
+            FakeMailHandler.in_flight[org].add(token)
+            FakeMailHandler.peak_total = max(
+                FakeMailHandler.peak_total, len(set().union(*FakeMailHandler.in_flight.values()))
+            )
+            FakeMailHandler.peak_per_org[org] = max(FakeMailHandler.peak_per_org[org], len(FakeMailHandler.in_flight[org]))
+
+        try:
+            time.sleep(FakeMailHandler.latency)
+            path = urlparse(self.path).path
+            if path.endswith("/messages/delta") or path.endswith("/calendarView/delta"):
+                base = f"http://{self.headers['Host']}{path}"
+                return self._send(200, {"value": [], "@odata.deltaLink": f"{base}?$deltatoken=1"})
+            if path.endswith("/users/me/profile"):
+                return self._send(200, {"historyId": "1"})
+            if path.endswith("/users/me/messages"):
+                return self._send(200, {"messages": []})
+            if path.endswith("/calendars/primary/events"):
+                return self._send(200, {"items": [], "nextSyncToken": "sync-1"})
+            return self._send(404, {"error": "not found"})
+        finally:
+            with FakeMailHandler.lock:
+                FakeMailHandler.in_flight[org].discard(token)
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def build_database(path: str, args):
+    from models import (
+        Base, GoogleOrganizationConfig, GoogleUserConnection, O365OrganizationConfig,
+        O365UserConnection, Organization, User,
+    )
+    from o365_encryption import encrypt_access_token as encrypt_o365_token
+    from google_encryption import encrypt_access_token as encrypt_google_token
+
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = factory()
+
+    # Every connection shares one token per provider; the stub tells them apart by connection id
+    o365_token = encrypt_o365_token("o365-token")
+    google_token = encrypt_google_token("google-token")
+    expires = datetime.utcnow() + timedelta(hours=1)
+
+    user_id = 0
+    for org in range(1, args.orgs + 1):
+        session.add(Organization(id=org, name=f"Org {org}", slug=f"org-{org}"))
+        session.add(O365OrganizationConfig(id=org, organization_id=org, client_id="x", tenant_id="x", is_configured=True))
+        session.add(GoogleOrganizationConfig(id=org, organization_id=org, is_configured=True))
+        mailboxes = args.big_org_mailboxes if org == 1 else args.mailboxes_per_org
+        for i in range(mailboxes):
+            user_id += 1
+            session.add(User(
+                id=user_id, organization_id=org, email=f"user{user_id}@org{org}.example",
+                password_hash="x", first_name="User", last_name=str(user_id), is_active=True,
+            ))
+            if i % 2 == 0:
+                session.add(O365UserConnection(
+                    id=user_id, user_id=user_id, organization_id=org, org_config_id=org,
+                    o365_user_id=f"o365-{user_id}", o365_email=f"user{user_id}@org{org}.example",
+                    access_token_encrypted=o365_token, refresh_token_encrypted=o365_token,
+                    token_expires_at=expires, sync_only_crm_contacts=False, is_active=True,
+                ))
+            else:
+                session.add(GoogleUserConnection(
+                    id=user_id, user_id=user_id, organization_id=org, org_config_id=org,
+                    google_user_id=f"google-{user_id}", google_email=f"user{user_id}@org{org}.example",
+                    access_token_encrypted=google_token, refresh_token_encrypted=google_token,
+                    token_expires_at=expires, connection_status="active",
+                ))
+    session.commit()
+    session.close()
+    return factory, user_id
+
+
+async def run(args):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeMailHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["MICROSOFT_GRAPH_API_URL"] = f"{base_url}/v1.0"
+    os.environ["GOOGLE_API_BASE_URL"] = base_url
+    FakeMailHandler.latency = args.latency_ms / 1000
+    FakeMailHandler.throttle = args.throttle
+
+    import mailbox_sync
+    from models import MailboxSyncStatus
+
+    with tempfile.TemporaryDirectory() as directory:
+        factory, total = build_database(os.path.join(directory, "mailbox_sync.db"), args)
+
+        # Each service decrypts its token to the same value, so tell the stub which org owns
+        # each request by pinning tokens per connection
+        from o365_service import O365Service
+        from google_service import GoogleService
+
+        db = factory()
+        owners = {}
+        for status_model in (mailbox_sync.O365UserConnection, mailbox_sync.GoogleUserConnection):
+            for connection in db.query(status_model):
+                owners[(status_model.__name__, connection.id)] = connection.organization_id
+        db.close()
+
+        async def pinned_token(self):
+            self.access_token = f"{type(self.user_connection).__name__}-{self.user_connection.id}"
+            FakeMailHandler.token_orgs[self.access_token] = owners[(type(self.user_connection).__name__, self.user_connection.id)]
+        O365Service.ensure_valid_token = pinned_token
+        GoogleService.ensure_valid_token = pinned_token
+
+        started = time.perf_counter()
+        summary = await mailbox_sync.sync_all_mailboxes(
+            session_factory=factory,
+            concurrency=args.concurrency,
+            per_org_concurrency=args.per_org_concurrency,
+        )
+        elapsed = time.perf_counter() - started
+
+        db = factory()
+        statuses = db.query(MailboxSyncStatus).all()
+        db.close()
+
+    server.shutdown()
+    print(f"Synced {summary['succeeded']} of {total} mailboxes ({summary['failed']} failed) in {elapsed:.2f}s, "
+          f"{FakeMailHandler.requests} provider requests")
+    print(f"Peak mailboxes in flight: {FakeMailHandler.peak_total} (limit {args.concurrency}); "
+          f"peak per org: {dict(sorted(FakeMailHandler.peak_per_org.items()))} (limit {args.per_org_concurrency})")
+    print(f"Organizations in order of first request: {FakeMailHandler.first_seen}")
+    durations = sorted(status.last_duration_ms for status in statuses)
+    print(f"Status rows: {len(statuses)}, duration ms min/median/max: "
+          f"{durations[0]}/{durations[len(durations) // 2]}/{durations[-1]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the background mailbox sync against local Graph/Gmail stubs")
+    parser.add_argument("--orgs", type=int, default=5, help="Organizations")
+    parser.add_argument("--big-org-mailboxes", type=int, default=40, help="Mailboxes in organization 1")
+    parser.add_argument("--mailboxes-per-org", type=int, default=4, help="Mailboxes in every other organization")
+    parser.add_argument("--concurrency", type=int, default=8, help="Global concurrent mailbox limit")
+    parser.add_argument("--per-org-concurrency", type=int, default=2, help="Concurrent mailbox limit per organization")
+    parser.add_argument("--latency-ms", type=int, default=100, help="Stub latency per request")
+    parser.add_argument("--throttle", action="store_true", help="Answer each mailbox's first request with 429 Retry-After")
+    asyncio.run(run(parser.parse_args()))
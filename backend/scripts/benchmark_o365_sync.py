@@ -0,0 +1,185 @@
+"""
+O365 mail sync against a local Microsoft Graph stub.
+
+Starts a fake Graph server that serves mail folder delta queries (paged with
+@odata.nextLink, ending in an @odata.deltaLink, optionally throttling with
+429 + Retry-After), then runs O365Service.sync_emails_to_crm against an
+in-memory SQLite database. A second round adds new mail to the stub and
+syncs again from the stored delta links, which should fetch only the new
+messages.
+
+Usage:
+    cd backend
+    python scripts/benchmark_o365_sync.py --messages 2000
+    python scripts/benchmark_o365_sync.py --messages 2000 --contacts 50 --throttle
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+class FakeGraphHandler(BaseHTTPRequestHandler):
+    """Serves /v1.0/me/mailFolders/{folder}/messages/delta from an in-memory mailbox"""
+    lock = threading.Lock()
+    mailbox = {"inbox": [], "sentitems": []}  # Messages in arrival order
+    throttle = False
+    throttled = set()
+    requests = 0
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        parts = parsed.path.strip("/").split("/")
+        # v1.0/me/mailFolders/{folder}/messages/delta
+        if len(parts) != 6 or parts[2] != "mailFolders" or parts[4:] != ["messages", "delta"]:
+            return self._send(404, {"error": {"code": "NotFound"}})
+        folder = parts[3]
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+
+        with FakeGraphHandler.lock:
+            FakeGraphHandler.requests += 1
+            if FakeGraphHandler.throttle and folder not in FakeGraphHandler.throttled:
+                FakeGraphHandler.throttled.add(folder)
+                return self._send(429, {"error": {"code": "TooManyRequests"}}, {"Retry-After": "1"})
+            messages = list(FakeGraphHandler.mailbox[folder])
+
+        page_size = 10
+        prefer = self.headers.get("Prefer", "")
+        if "odata.maxpagesize=" in prefer:
+            page_size = int(prefer.split("odata.maxpagesize=")[1].split(",")[0])
+
+        # A delta token is the mailbox length when it was issued; skip tokens are "<start>:<offset>"
+        if "$deltatoken" in query:
+            start, offset = int(query["$deltatoken"]), 0
+        elif "$skiptoken" in query:
+            start, offset = (int(value) for value in query["$skiptoken"].split(":"))
+        else:
+            start, offset = 0, 0
+
+        pending = messages[start:]
+        page = pending[offset:offset + page_size]
+        base = f"http://{self.headers['Host']}{parsed.path}"
+        body = {"value": page}
+        if offset + page_size < len(pending):
+            body["@odata.nextLink"] = f"{base}?$skiptoken={start}:{offset + page_size}"
+        else:
+            body["@odata.deltaLink"] = f"{base}?$deltatoken={len(messages)}"
+        self._send(200, body)
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def add_mail(count: int, contact_count: int, offset: int = 0):
+    """Append count messages to the stub mailbox, alternating inbox and sent items"""
+    now = datetime.utcnow()
+    for i in range(offset, offset + count):
+        contact = i % contact_count
+        address = {"emailAddress": {"address": f"Contact{contact}@Example.com", "name": f"Contact {contact}"}}
+        message = {
+            "id": f"msg-{i}",
+            "subject": f"{'Re: ' if i % 3 else ''}Project {contact % 7}",
+            "body": {"contentType": "html", "content": f"<p>Message {i} body</p>"},
+            "receivedDateTime": (now - timedelta(minutes=count - i)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "internetMessageId": f"<msg-{i}@example.com>",
+        }
+        if i % 2:
+            message.update({"from": {"emailAddress": {"address": "me@crm.example", "name": "Me"}}, "toRecipients": [address]})
+            FakeGraphHandler.mailbox["sentitems"].append(message)
+        else:
+            message.update({"from": address, "toRecipients": [{"emailAddress": {"address": "me@crm.example"}}]})
+            FakeGraphHandler.mailbox["inbox"].append(message)
+
+
+def build_session():
+    from models import Base, O365UserConnection
+
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    connection = O365UserConnection(
+        id=1, user_id=1, organization_id=1, org_config_id=1,
+        o365_user_id="fake", o365_email="me@crm.example", o365_display_name="Me",
+        access_token_encrypted="x", refresh_token_encrypted="x",
+        token_expires_at=datetime.utcnow() + timedelta(hours=1),
+        sync_only_crm_contacts=False, is_active=True,
+    )
+    session.add(connection)
+    session.commit()
+    return engine, session, connection
+
+
+async def run(args):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGraphHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["MICROSOFT_GRAPH_API_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1.0"
+    FakeGraphHandler.throttle = args.throttle
+
+    from o365_service import O365Service
+    from http_clients import close_http_clients
+    from models import Contact, EmailMessage, EmailThread
+
+    engine, session, connection = build_session()
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    add_mail(args.messages, args.contacts)
+    for round_number, new_messages in ((1, args.messages), (2, args.new_messages)):
+        if round_number == 2:
+            add_mail(new_messages, args.contacts, offset=args.messages)
+        FakeGraphHandler.requests = 0
+        statements.clear()
+
+        service = O365Service(connection, org_config=None)
+        service.access_token = "fake-token"
+        started = time.perf_counter()
+        synced = await service.sync_emails_to_crm(session, organization_id=1)
+        session.commit()
+        elapsed = time.perf_counter() - started
+
+        print(f"Round {round_number}: synced {synced} of {new_messages} new messages in {elapsed:.2f}s "
+              f"({FakeGraphHandler.requests} Graph requests, {len(statements)} SQL statements)")
+
+    await close_http_clients()
+    server.shutdown()
+    print(f"Contacts: {session.query(func.count(Contact.id)).scalar()}, "
+          f"threads: {session.query(func.count(EmailThread.id)).scalar()}, "
+          f"messages: {session.query(func.count(EmailMessage.id)).scalar()}")
+    print(f"Delta links stored for: {', '.join(sorted(connection.mail_delta_links))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run O365 mail sync against a local Graph stub")
+    parser.add_argument("--messages", type=int, default=2000, help="Messages in the mailbox for the first sync")
+    parser.add_argument("--new-messages", type=int, default=150, help="Messages arriving before the second sync")
+    parser.add_argument("--contacts", type=int, default=40, help="Distinct correspondents")
+    parser.add_argument("--throttle", action="store_true", help="Answer the first request per folder with 429 Retry-After")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,198 @@
+"""
+AI chat retrieval index benchmark.
+
+Seeds an in-memory SQLite database with contact and deal notes, deal and
+project updates, and email threads (some private to another user), then:
+
+- builds the organization's BM25 retrieval index and reports its size;
+- answers a set of questions with RetrievalIndex.search and with a LIKE scan
+  over the same columns, reporting time per question;
+- checks that passages from another user's private threads are not returned,
+  and that sharing the thread makes them visible;
+- checks that an ORM write (new deal update, edited contact note) is found by
+  the next search without a rebuild;
+- builds the AI chat prompt and reports the tokens spent on passages against
+  AI_CHAT_PASSAGE_TOKEN_BUDGET.
+
+Usage:
+    cd backend
+    python scripts/benchmark_retrieval_index.py --contacts 5000 --emails 20000
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import contextlib
+import io
+import random
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+TOPICS = [
+    "pricing", "renewal", "contract", "invoice", "onboarding", "integration", "security review", "budget",
+    "procurement", "legal", "discount", "pilot", "rollout", "training", "migration", "support escalation",
+]
+FILLER = ("we discussed next steps and agreed to follow up after the meeting with the wider team "
+          "about timelines and owners for each workstream").split()
+
+
+VOCABULARY = [f"term{i}" for i in range(20000)]
+
+
+def sentence(rng, topic):
+    """Filler, a few words from a long-tailed vocabulary, and the topic"""
+    words = rng.sample(FILLER, 8) + [VOCABULARY[min(int(rng.paretovariate(0.8)), len(VOCABULARY) - 1)] for _ in range(4)]
+    words.insert(rng.randint(0, len(words)), topic)
+    return " ".join(words).capitalize() + "."
+
+
+def text(rng, sentences):
+    """A document about one topic"""
+    topic = rng.choice(TOPICS)
+    return " ".join(sentence(rng, topic) for _ in range(sentences))
+
+
+def build_session(args):
+    from models import (Base, Contact, Deal, DealUpdate, EmailMessage, EmailThread, Organization, PipelineStage,
+                        Project, ProjectStage, ProjectUpdate, User)
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    rng = random.Random(5)
+
+    session.add(Organization(id=1, name="Org", slug="org"))
+    session.add_all([
+        User(id=1, organization_id=1, email="me@org.example", password_hash="x", first_name="Me", last_name="Self"),
+        User(id=2, organization_id=1, email="other@org.example", password_hash="x", first_name="Other", last_name="Rep"),
+    ])
+    session.add(PipelineStage(id=1, organization_id=1, name="Proposal", position=1))
+    session.add(ProjectStage(id=1, organization_id=1, name="Active", position=1))
+    session.flush()
+    session.bulk_insert_mappings(Contact, [
+        {"id": i + 1, "organization_id": 1, "first_name": "Contact", "last_name": str(i), "email": f"c{i}@example.com",
+         "notes": text(rng, rng.randint(1, 6))}
+        for i in range(args.contacts)
+    ])
+    session.bulk_insert_mappings(Deal, [
+        {"id": i + 1, "organization_id": 1, "created_by": 1, "stage_id": 1, "title": f"Deal {i}",
+         "notes": sentence(rng, rng.choice(TOPICS))}
+        for i in range(args.deals)
+    ])
+    session.bulk_insert_mappings(DealUpdate, [
+        {"organization_id": 1, "deal_id": i % args.deals + 1, "created_by": 1, "title": f"Update {i}",
+         "description": text(rng, 3)}
+        for i in range(args.updates)
+    ])
+    session.bulk_insert_mappings(Project, [
+        {"id": i + 1, "organization_id": 1, "created_by": 1, "stage_id": 1, "title": f"Project {i}"} for i in range(50)
+    ])
+    session.bulk_insert_mappings(ProjectUpdate, [
+        {"organization_id": 1, "project_id": i % 50 + 1, "created_by": 1, "title": f"Milestone {i}",
+         "description": sentence(rng, rng.choice(TOPICS))}
+        for i in range(args.updates // 2)
+    ])
+    threads = args.emails // 4
+    session.bulk_insert_mappings(EmailThread, [
+        {"id": i + 1, "organization_id": 1, "subject": f"Re: {rng.choice(TOPICS)} question", "contact_id": i % args.contacts + 1,
+         "owner_id": 2 if i % 10 == 0 else 1, "is_private": True}
+        for i in range(threads)
+    ])
+    session.bulk_insert_mappings(EmailMessage, [
+        {"thread_id": i % threads + 1, "sender": f"c{i % args.contacts}@example.com", "direction": "incoming",
+         "content": "<p>" + text(rng, rng.randint(2, 20)) + "</p>"}
+        for i in range(args.emails)
+    ])
+    # One passage only the other user may see
+    session.add(EmailThread(id=threads + 1, organization_id=1, subject="Confidential", contact_id=1, owner_id=2, is_private=True))
+    session.flush()
+    session.add(EmailMessage(thread_id=threads + 1, sender="ceo@example.com", direction="incoming",
+                             content="The zanzibar acquisition terms are confidential."))
+    session.commit()
+    return session, threads + 1
+
+
+def like_scan(db, question):
+    """Substring search over the same columns, for comparison"""
+    from models import Contact, Deal, DealUpdate, EmailMessage, ProjectUpdate
+    from retrieval_index import index_terms
+
+    results = []
+    for term in index_terms(question):
+        pattern = f"%{term}%"
+        results += db.query(Contact.id).filter(Contact.organization_id == 1, Contact.notes.ilike(pattern)).limit(8).all()
+        results += db.query(Deal.id).filter(Deal.organization_id == 1, Deal.notes.ilike(pattern)).limit(8).all()
+        results += db.query(DealUpdate.id).filter(DealUpdate.organization_id == 1, DealUpdate.description.ilike(pattern)).limit(8).all()
+        results += db.query(ProjectUpdate.id).filter(ProjectUpdate.organization_id == 1, ProjectUpdate.description.ilike(pattern)).limit(8).all()
+        results += db.query(EmailMessage.id).filter(EmailMessage.content.ilike(pattern)).limit(8).all()
+    return results
+
+
+def main(args):
+    from ai_chat import AI_CHAT_PASSAGE_TOKEN_BUDGET, AIChatService
+    from models import Contact, DealUpdate, EmailThread
+    from retrieval_index import estimate_tokens, retrieval_indexes
+
+    session, private_thread = build_session(args)
+
+    started = time.perf_counter()
+    index = retrieval_indexes.get(session, 1)
+    print(f"Index build: {len(index)} passages in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    questions = [
+        "What did we agree on pricing for the renewal?",
+        "Any security review concerns in recent emails?",
+        "Where are we with the procurement and legal steps?",
+        "Summarize the support escalation",
+    ]
+    for question in questions:
+        started = time.perf_counter()
+        hits = index.search(question, limit=8, user_id=1)
+        search_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        like_scan(session, question)
+        like_ms = (time.perf_counter() - started) * 1000
+        kinds = sorted({passage.source[0] for _, passage in hits})
+        print(f"{question[:48]:<48} BM25 {search_ms:6.2f}ms {len(hits)} hits {kinds}  LIKE scan {like_ms:7.1f}ms")
+
+    # Privacy: another user's private thread stays hidden until shared
+    hidden = index.search("zanzibar acquisition", user_id=1)
+    owner = index.search("zanzibar acquisition", user_id=2)
+    thread = session.get(EmailThread, private_thread)
+    thread.shared_with = [1]
+    session.commit()
+    shared = index.search("zanzibar acquisition", user_id=1)
+    print(f"Private thread: visible to me {bool(hidden)}, to owner {bool(owner)}, to me after sharing {bool(shared)}")
+
+    # ORM writes reach the index through mapper events
+    session.add(DealUpdate(organization_id=1, deal_id=1, created_by=1, title="Kickoff", description="Customer wants a quokka themed launch event"))
+    contact = session.get(Contact, 1)
+    contact.notes = "Prefers to be contacted about the wombat project on Fridays"
+    session.commit()
+    update_hit = index.search("quokka launch", user_id=1)
+    note_hit = index.search("wombat project", user_id=1)
+    print(f"Writes: new deal update found {update_hit[0][1].label if update_hit else None!r}, "
+          f"edited note found {note_hit[0][1].label if note_hit else None!r}")
+
+    # Prompt built from passages within the token budget
+    service = AIChatService(session, 1, 1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        crm_data = service._get_relevant_crm_data(questions[0])
+    prompt = service._build_chat_prompt(questions[0], crm_data)
+    section = prompt.split("RELEVANT NOTES, UPDATES AND EMAILS:\n", 1)[1].split("\n\n", 1)[0]
+    print(f"Prompt: {section.count(chr(10)) + 1} passages, ~{estimate_tokens(section)} tokens "
+          f"(budget {AI_CHAT_PASSAGE_TOKEN_BUDGET}), prompt ~{estimate_tokens(prompt)} tokens")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the AI chat retrieval index")
+    parser.add_argument("--contacts", type=int, default=5000)
+    parser.add_argument("--deals", type=int, default=1000)
+    parser.add_argument("--updates", type=int, default=4000)
+    parser.add_argument("--emails", type=int, default=20000)
+    main(parser.parse_args())
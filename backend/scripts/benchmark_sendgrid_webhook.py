@@ -0,0 +1,114 @@
+"""
+Throughput benchmark for SendGrid event webhook ingestion.
+
+Feeds batches of synthetic SendGrid events (opens, clicks, deliveries, plus
+redelivered duplicates) through ingest_sendgrid_events against an in-memory
+SQLite database, then checks the resulting open/click counts.
+
+Usage:
+    cd backend
+    python scripts/benchmark_sendgrid_webhook.py --events 50000
+    python scripts/benchmark_sendgrid_webhook.py --events 50000 --batch-size 3000
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import random
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+def build_session(tracking_count: int):
+    from models import Base, EmailTracking
+
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    session.bulk_insert_mappings(EmailTracking, [
+        {
+            "id": i,
+            "organization_id": 1,
+            "message_id": f"bulk_1700000000.0_{i}",
+            "to_email": f"contact{i}@example.com",
+            "from_email": "sender@example.com",
+            "subject": "Benchmark",
+            "contact_id": i,
+            "sent_by": 1,
+            "sent_at": datetime.utcnow(),
+            "open_count": 0,
+            "click_count": 0,
+        }
+        for i in range(1, tracking_count + 1)
+    ])
+    session.commit()
+    return session
+
+
+def make_events(count: int, tracking_count: int):
+    now = int(time.time())
+    events = []
+    for i in range(count):
+        tracking_id = random.randint(1, tracking_count)
+        events.append({
+            "event": random.choice(("open", "open", "click", "delivered")),
+            "email": f"contact{tracking_id}@example.com",
+            "timestamp": now - random.randint(0, 3600),
+            "sg_message_id": f"sgid{tracking_id}.filterdrecv-1",
+            "sg_event_id": f"evt-{i}",
+            "nhs_message_id": f"bulk_1700000000.0_{tracking_id}",
+            "useragent": "Mozilla/5.0",
+            "ip": "203.0.113.7",
+            "url": "https://example.com/" if i % 4 == 2 else None,
+        })
+    return events
+
+
+def main(args):
+    from models import EmailEvent, EmailTracking
+    from sendgrid_events import ingest_sendgrid_events
+
+    random.seed(7)
+    session = build_session(args.tracking_rows)
+    events = make_events(args.events, args.tracking_rows)
+    # SendGrid redelivers whole batches on timeouts; resend the first batch
+    batches = [events[i:i + args.batch_size] for i in range(0, len(events), args.batch_size)]
+    batches.append(batches[0])
+
+    started = time.perf_counter()
+    duplicates = 0
+    for batch in batches:
+        duplicates += ingest_sendgrid_events(session, batch)["duplicates"]
+    elapsed = time.perf_counter() - started
+
+    total_events = sum(len(batch) for batch in batches)
+    stored = session.query(func.count(EmailEvent.id)).scalar()
+    opens = session.query(func.sum(EmailTracking.open_count)).scalar()
+    clicks = session.query(func.sum(EmailTracking.click_count)).scalar()
+    expected_opens = sum(1 for event in events if event["event"] == "open")
+    expected_clicks = sum(1 for event in events if event["event"] == "click")
+
+    print(f"Events posted:     {total_events} in {len(batches)} requests")
+    print(f"Stored events:     {stored} ({duplicates} duplicates dropped)")
+    print(f"Opens / clicks:    {opens} / {clicks} (expected {expected_opens} / {expected_clicks})")
+    print(f"Elapsed:           {elapsed:.2f}s")
+    print(f"Throughput:        {total_events / elapsed:,.0f} events/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SendGrid event webhook ingestion")
+    parser.add_argument("--events", type=int, default=50000, help="Number of unique events to ingest")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Events per webhook request")
+    parser.add_argument("--tracking-rows", type=int, default=5000, help="Number of tracked emails")
+    main(parser.parse_args())
@@ -0,0 +1,145 @@
+"""
+Query-count check for the email thread endpoints.
+
+Seeds an in-memory SQLite database with many threads and messages, calls the
+thread list, message page and contact messages endpoints through FastAPI's TestClient, and fails
+(exit code 1) if any endpoint issues more SQL queries than its budget or ships
+message bodies in the thread list. The budgets do not depend on how many
+threads or messages exist, so an N+1 regression shows up immediately.
+
+Usage:
+    cd backend
+    python scripts/check_email_thread_queries.py
+    python scripts/check_email_thread_queries.py --threads 500 --messages 20
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DISABLE_SCHEDULER", "true")
+
+import argparse
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Maximum SQL statements per request (auth is overridden, so this is endpoint work only)
+QUERY_BUDGETS = {
+    "/api/email-threads": 1,
+    "/api/contacts/{contact_id}/email-threads": 2,
+    "/api/email-threads/{thread_id}/messages": 2,
+    "/api/contacts/{contact_id}/email-messages": 2,
+}
+
+
+def build_session(thread_count: int, messages_per_thread: int):
+    from models import Base, Contact, EmailMessage, EmailThread, Organization, User
+
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    session.add(Organization(id=1, name="Check Org", slug="check-org"))
+    session.add(User(
+        id=1, organization_id=1, email="owner@example.com", password_hash="x",
+        first_name="Owner", last_name="User", is_active=True,
+    ))
+    session.add(Contact(id=1, organization_id=1, first_name="Pat", last_name="Lee", email="pat@example.com"))
+    session.bulk_insert_mappings(EmailThread, [
+        {
+            "id": t,
+            "organization_id": 1,
+            "contact_id": 1,
+            "subject": f"Thread {t}",
+            "message_count": messages_per_thread,
+            "preview": "Latest message...",
+        }
+        for t in range(1, thread_count + 1)
+    ])
+    session.bulk_insert_mappings(EmailMessage, [
+        {
+            "thread_id": t,
+            "sender": "Pat Lee",
+            "content": "Body " * 200,
+            "direction": "incoming",
+        }
+        for t in range(1, thread_count + 1)
+        for _ in range(messages_per_thread)
+    ])
+    session.commit()
+    return engine, session
+
+
+def main(args):
+    from fastapi.testclient import TestClient
+    from main import app
+    from database import get_db
+    from auth import get_current_active_user
+    from models import User
+
+    engine, session = build_session(args.threads, args.messages)
+    user = session.get(User, 1)
+
+    app.dependency_overrides[get_db] = lambda: session
+    app.dependency_overrides[get_current_active_user] = lambda: user
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    client = TestClient(app)
+    failures = []
+
+    def check(route: str, url: str):
+        # Start from a cold identity map, except for the (already authenticated) user
+        session.expire_all()
+        session.refresh(user)
+        statements.clear()
+        response = client.get(url)
+        count = len(statements)
+        status = "ok" if response.status_code == 200 and count <= QUERY_BUDGETS[route] else "FAIL"
+        print(f"{status:<5} {url:<55} {count} queries (budget {QUERY_BUDGETS[route]}), HTTP {response.status_code}")
+        if status == "FAIL":
+            failures.append(url)
+        return response.json()
+
+    threads = check("/api/email-threads", f"/api/email-threads?limit={args.threads}")
+    if any("messages" in thread for thread in threads):
+        print("FAIL  thread list includes messages")
+        failures.append("thread list messages")
+
+    check("/api/contacts/{contact_id}/email-threads", "/api/contacts/1/email-threads")
+
+    latest = check("/api/contacts/{contact_id}/email-messages", "/api/contacts/1/email-messages?per_thread=5")
+    expected = args.threads * min(5, args.messages)
+    if len(latest) != expected:
+        print(f"FAIL  contact messages returned {len(latest)} of {expected} messages")
+        failures.append("contact messages")
+
+    page = check("/api/email-threads/{thread_id}/messages", "/api/email-threads/1/messages?limit=5")
+    seen = len(page["messages"])
+    while page["has_more"]:
+        page = check(
+            "/api/email-threads/{thread_id}/messages",
+            f"/api/email-threads/1/messages?limit=5&before_id={page['next_before_id']}",
+        )
+        seen += len(page["messages"])
+    if seen != args.messages:
+        print(f"FAIL  paged through {seen} of {args.messages} messages")
+        failures.append("message pagination")
+
+    app.dependency_overrides.clear()
+    if failures:
+        sys.exit(1)
+    print("All email thread query budgets met")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check SQL query counts for the email thread endpoints")
+    parser.add_argument("--threads", type=int, default=200, help="Number of threads to seed")
+    parser.add_argument("--messages", type=int, default=12, help="Messages per thread")
+    main(parser.parse_args())
@@ -0,0 +1,43 @@
+"""
+Re-encrypt stored O365/Google client secrets and OAuth tokens under the current SECRET_KEY.
+
+Rotation steps:
+1. Deploy with the new secret in SECRET_KEY and the old one in PREVIOUS_SECRET_KEYS
+   (both keys decrypt, new values use the new key).
+2. Run this script (safe to interrupt and re-run; values already under the new key are skipped).
+3. Remove the old secret from PREVIOUS_SECRET_KEYS.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import logging
+
+from database import SessionLocal
+from encryption_keyring import ROTATION_BATCH_SIZE, rotate_encrypted_columns
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-encrypt integration secrets under the current SECRET_KEY")
+    parser.add_argument("--batch-size", type=int, default=ROTATION_BATCH_SIZE, help="Rows per committed batch")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        results = rotate_encrypted_columns(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+
+    for table, stats in results.items():
+        logger.info(f"{table}: {stats['rows']} rows, {stats['rotated']} values re-encrypted, "
+                    f"{stats['current']} already current, {stats['failed']} undecryptable")
+    if any(stats["failed"] for stats in results.values()):
+        sys.exit(1)
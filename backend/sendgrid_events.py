@@ -0,0 +1,219 @@
+"""
+SendGrid event webhook ingestion for NotHubSpot CRM
+SendGrid posts events as JSON arrays (up to thousands per request). A batch is
+resolved against EmailTracking in one query, inserted in bulk with duplicate
+sg_event_ids dropped, and rolled up into one UPDATE per tracking row and one
+campaign stats upsert per campaign-day. The matched tracking rows are locked
+for the batch, so concurrent batches never count a unique open twice.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import bindparam, case, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from email_analytics import EVENT_STAT_FIELDS, apply_stat_increments, new_increments
+from models import EmailEvent, EmailTracking
+from schemas import SendGridEvent
+
+logger = logging.getLogger(__name__)
+
+
+def _tracking_keys(event: SendGridEvent) -> List[str]:
+    """Candidate EmailTracking.message_id values for an event, most specific first"""
+    keys = []
+    # custom_args set by bulk email (see bulk_email_service._send_batched)
+    if event.nhs_message_id:
+        keys.append(event.nhs_message_id)
+    keys.append(event.sg_message_id)
+    # sg_message_id is "<X-Message-Id>.<filter suffix>"; we may have stored the header value
+    base_id = event.sg_message_id.split(".", 1)[0]
+    if base_id != event.sg_message_id:
+        keys.append(base_id)
+    return keys
+
+
+def _insert_events(db: Session, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Bulk insert event rows, skipping sg_event_ids already stored. Returns the inserted rows."""
+    if not rows:
+        return []
+
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("postgresql", "sqlite"):
+        existing = {
+            sg_event_id for (sg_event_id,) in db.query(EmailEvent.sg_event_id).filter(
+                EmailEvent.sg_event_id.in_([row["sg_event_id"] for row in rows if row["sg_event_id"]])
+            )
+        }
+        rows = [row for row in rows if row["sg_event_id"] not in existing]
+        db.bulk_insert_mappings(EmailEvent, rows)
+        return rows
+
+    # ON CONFLICT DO NOTHING also covers a concurrent delivery of the same batch
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert(EmailEvent.__table__).on_conflict_do_nothing(
+        index_elements=["sg_event_id"]
+    ).returning(EmailEvent.__table__.c.sg_event_id)
+    inserted_ids = set(db.connection().execute(statement, rows).scalars())
+
+    # Events without an sg_event_id can never conflict
+    return [row for row in rows if row["sg_event_id"] is None or row["sg_event_id"] in inserted_ids]
+
+
+def _apply_tracking_counts(db: Session, inserted: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """Roll inserted open/click events up into one UPDATE per tracking row. Returns the per-row totals."""
+    totals: Dict[int, Dict[str, Any]] = defaultdict(
+        lambda: {"b_opens": 0, "b_first_open": None, "b_clicks": 0, "b_first_click": None}
+    )
+    for row in inserted:
+        if row["event_type"] == "open":
+            counts = totals[row["tracking_id"]]
+            counts["b_opens"] += 1
+            if counts["b_first_open"] is None or row["timestamp"] < counts["b_first_open"]:
+                counts["b_first_open"] = row["timestamp"]
+        elif row["event_type"] == "click":
+            counts = totals[row["tracking_id"]]
+            counts["b_clicks"] += 1
+            if counts["b_first_click"] is None or row["timestamp"] < counts["b_first_click"]:
+                counts["b_first_click"] = row["timestamp"]
+
+    if not totals:
+        return totals
+
+    table = EmailTracking.__table__
+    first_open = bindparam("b_first_open")
+    first_click = bindparam("b_first_click")
+    statement = table.update().where(table.c.id == bindparam("b_id")).values(
+        open_count=func.coalesce(table.c.open_count, 0) + bindparam("b_opens"),
+        click_count=func.coalesce(table.c.click_count, 0) + bindparam("b_clicks"),
+        # Keep the earliest timestamp; events within and across batches arrive out of order
+        opened_at=case(
+            (first_open.is_(None), table.c.opened_at),
+            (table.c.opened_at.is_(None), first_open),
+            (first_open < table.c.opened_at, first_open),
+            else_=table.c.opened_at,
+        ),
+        first_clicked_at=case(
+            (first_click.is_(None), table.c.first_clicked_at),
+            (table.c.first_clicked_at.is_(None), first_click),
+            (first_click < table.c.first_clicked_at, first_click),
+            else_=table.c.first_clicked_at,
+        ),
+    )
+    db.connection().execute(statement, [
+        {"b_id": tracking_id, **counts} for tracking_id, counts in totals.items()
+    ])
+    return totals
+
+
+def _apply_campaign_stats(db: Session, inserted: List[Dict[str, Any]], tracking: Dict[int, Any], totals: Dict[int, Dict[str, Any]]) -> None:
+    """Add inserted events to their campaigns' daily counters"""
+    increments = new_increments()
+    for row in inserted:
+        info = tracking[row["tracking_id"]]
+        field = EVENT_STAT_FIELDS.get(row["event_type"])
+        if info.campaign_id is None or field is None:
+            continue
+        increments[(info.organization_id, info.campaign_id, row["timestamp"].date())][field] += 1
+
+    # A recipient counts as a unique open/click on the day of their first one;
+    # tracking was read under a row lock, so this batch alone saw it unset
+    for tracking_id, counts in totals.items():
+        info = tracking[tracking_id]
+        if info.campaign_id is None:
+            continue
+        if counts["b_first_open"] is not None and info.opened_at is None:
+            increments[(info.organization_id, info.campaign_id, counts["b_first_open"].date())]["unique_open_count"] += 1
+        if counts["b_first_click"] is not None and info.first_clicked_at is None:
+            increments[(info.organization_id, info.campaign_id, counts["b_first_click"].date())]["unique_click_count"] += 1
+
+    apply_stat_increments(db, increments)
+
+
+def ingest_sendgrid_events(db: Session, payload: Any) -> Dict[str, Any]:
+    """
+    Store a SendGrid event webhook payload (a JSON array of events, or a single event).
+
+    Commits once for the whole batch.
+    """
+    raw_events = payload if isinstance(payload, list) else [payload]
+
+    events = []
+    invalid = 0
+    for raw in raw_events:
+        try:
+            events.append((SendGridEvent.model_validate(raw), raw))
+        except ValidationError:
+            invalid += 1
+
+    # Resolve every message ID in the batch with a single query. The rows stay
+    # locked until commit: a recipient's unique open/click is counted by
+    # whichever batch first sees opened_at/first_clicked_at unset, so a
+    # concurrent batch for the same recipients must wait and re-read them.
+    # Locking in id order keeps two such batches from deadlocking.
+    keys = {key for event, _ in events for key in _tracking_keys(event)}
+    tracking_ids: Dict[str, int] = {}
+    tracking: Dict[int, Any] = {}
+    if keys:
+        for info in db.query(
+            EmailTracking.id,
+            EmailTracking.message_id,
+            EmailTracking.organization_id,
+            EmailTracking.campaign_id,
+            EmailTracking.opened_at,
+            EmailTracking.first_clicked_at,
+        ).filter(EmailTracking.message_id.in_(keys)).order_by(EmailTracking.id).with_for_update(of=EmailTracking):
+            tracking_ids[info.message_id] = info.id
+            tracking[info.id] = info
+
+    rows = []
+    seen_event_ids = set()
+    duplicates = 0
+    unmatched = 0
+    for event, raw in events:
+        if event.sg_event_id:
+            if event.sg_event_id in seen_event_ids:
+                duplicates += 1
+                continue
+            seen_event_ids.add(event.sg_event_id)
+
+        tracking_id: Optional[int] = next(
+            (tracking_ids[key] for key in _tracking_keys(event) if key in tracking_ids), None
+        )
+        if tracking_id is None:
+            unmatched += 1
+            continue
+
+        rows.append({
+            "tracking_id": tracking_id,
+            "sg_event_id": event.sg_event_id,
+            "event_type": event.event,
+            "timestamp": datetime.utcfromtimestamp(event.timestamp),
+            "ip_address": event.ip,
+            "user_agent": event.useragent,
+            "url": event.url,
+            "raw_data": raw,
+        })
+
+    inserted = _insert_events(db, rows)
+    duplicates += len(rows) - len(inserted)
+    totals = _apply_tracking_counts(db, inserted)
+    _apply_campaign_stats(db, inserted, tracking, totals)
+    db.commit()
+
+    if unmatched:
+        logger.info(f"SendGrid webhook: {unmatched} events had no matching email tracking record")
+
+    return {
+        "status": "processed",
+        "received": len(raw_events),
+        "inserted": len(inserted),
+        "duplicates": duplicates,
+        "unmatched": unmatched,
+        "invalid": invalid,
+        "tracking_updated": len(totals),
+    }
@@ -0,0 +1,99 @@
+"""
+Email template engine for NotHubSpot CRM
+Parses {{variable}} placeholders once into a compiled list of segments, then
+renders each recipient in a single pass. Shared by bulk email and the email
+template CRUD.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set
+
+# {{ name }} with optional surrounding whitespace; names may not contain braces
+PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*([^{}]+?)\s*\}\}')
+
+# Variables available in bulk emails (see bulk_email_service.get_template_variables)
+BULK_EMAIL_VARIABLES = frozenset({
+    "contact.first_name",
+    "contact.last_name",
+    "contact.email",
+    "contact.company_name",
+    "contact.title",
+    "contact.phone",
+    "first_name",
+    "last_name",
+    "email",
+    "company_name",
+    "unsubscribe_url",
+})
+
+
+class CompiledTemplate:
+    """A template split into literal text and variable segments"""
+
+    __slots__ = ("source", "literals", "names", "tokens")
+
+    def __init__(self, source: str):
+        self.source = source
+        # Rendering interleaves literals[i] and the value of names[i]; there is
+        # always exactly one more literal than there are names
+        self.literals: List[str] = []
+        self.names: List[str] = []
+        # Placeholder text as written (e.g. "{{ first_name }}"), parallel to names
+        self.tokens: List[str] = []
+
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(source):
+            self.literals.append(source[position:match.start()])
+            self.names.append(match.group(1))
+            self.tokens.append(match.group(0))
+            position = match.end()
+        self.literals.append(source[position:])
+
+    @property
+    def variables(self) -> Set[str]:
+        return set(self.names)
+
+    @property
+    def placeholders(self) -> Dict[str, str]:
+        """Placeholder text as written -> variable name"""
+        return dict(zip(self.tokens, self.names))
+
+    def render(self, values: Dict[str, str]) -> str:
+        """Render in one pass; placeholders without a value are left as written"""
+        if not self.names:
+            return self.source
+
+        parts = [self.literals[0]]
+        for i, name in enumerate(self.names):
+            value = values.get(name)
+            parts.append(self.tokens[i] if value is None else value)
+            parts.append(self.literals[i + 1])
+        return "".join(parts)
+
+
+@lru_cache(maxsize=256)
+def compile_template(source: str) -> CompiledTemplate:
+    """Compile template text, reusing the result for identical text"""
+    return CompiledTemplate(source or "")
+
+
+def render_template(source: Optional[str], values: Dict[str, str]) -> Optional[str]:
+    """Compile (cached) and render template text"""
+    if not source:
+        return source
+    return compile_template(source).render(values)
+
+
+def extract_variables(*sources: Optional[str]) -> List[str]:
+    """List the distinct variable names used across one or more template texts"""
+    names: Set[str] = set()
+    for source in sources:
+        if source:
+            names |= compile_template(source).variables
+    return sorted(names)
+
+
+def find_unknown_variables(*sources: Optional[str], known: Iterable[str] = BULK_EMAIL_VARIABLES) -> List[str]:
+    """Return variables used in the given texts that the renderer will not fill in"""
+    known = set(known)
+    return [name for name in extract_variables(*sources) if name not in known]
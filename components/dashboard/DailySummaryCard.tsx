@@ -37,11 +37,11 @@ export default function DailySummaryCard() {
     loadDailySummary()
   }, [])
 
-  const loadDailySummary = async () => {
+  const loadDailySummary = async (refresh = false) => {
     try {
       setLoading(true)
       setError(null)
-      const data = await dashboardAPI.getDailySummary()
+      const data = await dashboardAPI.getDailySummary(refresh)
       setSummary(data)
     } catch (err) {
       setError(handleAPIError(err))
@@ -97,6 +97,12 @@ export default function DailySummaryCard() {
     setChatInput("")
     setChatLoading(true)
 
+    let replyStarted = false
+    const setReply = (content: string) => setChatMessages(prev => [
+      ...prev.slice(0, -1),
+      { ...prev[prev.length - 1], content }
+    ])
+
     try {
       // Call the AI chat endpoint with context
       const response = await fetch('/api/ai/chat', {
@@ -112,24 +118,42 @@ export default function DailySummaryCard() {
         })
       })
 
-      if (!response.ok) throw new Error('Failed to get AI response')
+      if (!response.ok || !response.body) throw new Error('Failed to get AI response')
 
-      const data = await response.json()
-      
-      const aiMessage: ChatMessage = {
-        role: 'assistant',
-        content: data.response,
-        timestamp: new Date()
-      }
+      // The reply streams in as Server-Sent Events: token deltas, then done (or error) with the full text
+      setChatMessages(prev => [...prev, { role: 'assistant', content: '', timestamp: new Date() }])
+      replyStarted = true
 
-      setChatMessages(prev => [...prev, aiMessage])
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      let reply = ''
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        const frames = buffer.split('\n\n')
+        buffer = frames.pop() || ''
+        for (const frame of frames) {
+          const event = frame.match(/^event: (.*)$/m)?.[1]
+          const data = frame.match(/^data: (.*)$/m)?.[1]
+          if (!data) continue
+          const payload = JSON.parse(data)
+          if (event === 'token') {
+            reply += payload.delta
+            setReply(reply)
+          } else {
+            setReply(payload.response)
+          }
+        }
+      }
     } catch (err) {
-      const errorMessage: ChatMessage = {
-        role: 'assistant', 
-        content: "Sorry, I couldn't process that request. Please try again.",
-        timestamp: new Date()
+      const errorText = "Sorry, I couldn't process that request. Please try again."
+      if (replyStarted) {
+        setReply(errorText)
+      } else {
+        setChatMessages(prev => [...prev, { role: 'assistant', content: errorText, timestamp: new Date() }])
       }
-      setChatMessages(prev => [...prev, errorMessage])
     } finally {
       setChatLoading(false)
     }
@@ -157,7 +181,7 @@ export default function DailySummaryCard() {
         <div className="flex items-center justify-between mb-4">
           <h2 className="text-base font-semibold text-red-900">Daily Summary</h2>
           <button
-            onClick={loadDailySummary}
+            onClick={() => loadDailySummary()}
             className="text-sm text-red-600 hover:text-red-800 underline"
           >
             Retry
@@ -296,7 +320,7 @@ export default function DailySummaryCard() {
       {/* Actions */}
       <div className="mt-3 flex justify-end">
         <button
-          onClick={loadDailySummary}
+          onClick={() => loadDailySummary(true)}
           disabled={loading}
           className="text-xs text-blue-600 hover:text-blue-800 disabled:opacity-50 flex items-center gap-1"
         >
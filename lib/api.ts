@@ -552,7 +552,7 @@ export const dashboardAPI = {
     }),
 
   // Get AI-powered daily summary
-  getDailySummary: (): Promise<{
+  getDailySummary: (refresh = false): Promise<{
     generated_at: string
     user_id: number
     ai_insights: string
@@ -564,7 +564,7 @@ export const dashboardAPI = {
       active_companies: number
     }
   }> =>
-    apiRequest('/api/dashboard/daily-summary'),
+    apiRequest(`/api/dashboard/daily-summary${refresh ? '?refresh=true' : ''}`),
 }
 
 // Error handling utility
@@ -1331,7 +1331,6 @@ export interface EmailThread {
   preview: string
   created_at: string
   updated_at: string
-  messages: EmailMessage[]
 }
 
 export interface EmailMessage {
@@ -1344,6 +1343,12 @@ export interface EmailMessage {
   created_at: string
 }
 
+export interface EmailMessagePage {
+  messages: EmailMessage[] // Newest first
+  has_more: boolean
+  next_before_id?: number | null
+}
+
 export interface EmailThreadCreate {
   subject: string
   contact_id: number
@@ -1376,6 +1381,10 @@ export const emailThreadAPI = {
   getByContact: (contactId: number): Promise<EmailThread[]> =>
     apiRequest(`/api/contacts/${contactId}/email-threads`),
 
+  // Get the latest messages of all of a contact's threads in one request (newest first)
+  getContactMessages: (contactId: number, perThread: number = 100): Promise<EmailMessage[]> =>
+    apiRequest(`/api/contacts/${contactId}/email-messages?per_thread=${perThread}`),
+
   // Create new email thread
   create: (thread: EmailThreadCreate): Promise<EmailThread> =>
     apiRequest('/api/email-threads', {
@@ -1383,6 +1392,15 @@ export const emailThreadAPI = {
       body: JSON.stringify(thread),
     }),
 
+  // Get a page of a thread's messages (newest first); pass next_before_id as beforeId for older ones
+  getMessages: (threadId: number, params?: { limit?: number; beforeId?: number }): Promise<EmailMessagePage> => {
+    const searchParams = new URLSearchParams()
+    if (params?.limit) searchParams.append('limit', params.limit.toString())
+    if (params?.beforeId) searchParams.append('before_id', params.beforeId.toString())
+    
+    return apiRequest(`/api/email-threads/${threadId}/messages?${searchParams}`)
+  },
+
   // Add message to thread
   addMessage: (threadId: number, message: EmailMessageCreate): Promise<EmailMessage> =>
     apiRequest(`/api/email-threads/${threadId}/messages`, {